@@ -0,0 +1,91 @@
+"""
+Сравнение поиска по каталогу: построчный перебор против колоночного индекса.
+Запуск: python scripts/benchmark_catalog.py [количество товаров]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.catalog_index import CatalogIndex, parse_price
+
+FLOWERS = ['Розы', 'Тюльпаны', 'Пионы', 'Хризантемы', 'Лилии', 'Гортензии', 'Ромашки', 'Орхидеи']
+COLORS = ['красные', 'белые', 'розовые', 'желтые', 'микс']
+OCCASIONS = ['день рождения', 'свадьба', 'юбилей', '8 марта', 'без повода']
+CATEGORIES = ['Букеты', 'Моно букеты', 'Композиции', 'Корзины', 'Разное']
+
+
+def make_inventory(size: int):
+    random.seed(42)
+    inventory = []
+    for i in range(size):
+        flower = random.choice(FLOWERS)
+        inventory.append({
+            'name': f"{flower} {random.choice(COLORS)} №{i}",
+            'price': f"{random.randrange(3000, 150000, 500):,} тг".replace(',', ' '),
+            'quantity': random.randint(0, 20),
+            'description': f"Букет на {random.choice(OCCASIONS)}",
+            'category': random.choice(CATEGORIES)
+        })
+    return inventory
+
+
+def naive_query(inventory, price_min, price_max, flower_type, occasion):
+    """Прежний способ: разбор цены и поиск подстрок в каждой строке на каждый запрос"""
+    result = []
+    for item in inventory:
+        price = parse_price(item['price'])
+        if price_min is not None and price < price_min:
+            continue
+        if price_max is not None and price > price_max:
+            continue
+        if flower_type and flower_type.lower() not in item['name'].lower():
+            continue
+        if occasion and occasion.lower() not in item['description'].lower():
+            continue
+        result.append(item)
+    return sorted(result, key=lambda item: parse_price(item['price']))
+
+
+def measure(label, func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    print(f"{label:<40} {elapsed:10.3f} мс")
+    return elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    inventory = make_inventory(size)
+    print(f"Товаров: {size}\n")
+
+    start = time.perf_counter()
+    catalog = CatalogIndex(inventory)
+    print(f"{'Построение индекса':<40} {(time.perf_counter() - start) * 1000:10.3f} мс\n")
+
+    queries = [
+        ('Цена 10 000 - 20 000', dict(price_min=10000, price_max=20000)),
+        ('Розы до 30 000', dict(price_max=30000, flower_type='роз')),
+        ('Пионы на свадьбу', dict(flower_type='пион', occasion='свадьб')),
+    ]
+
+    for label, params in queries:
+        naive = naive_query(inventory, params.get('price_min'), params.get('price_max'),
+                            params.get('flower_type', ''), params.get('occasion', ''))
+        indexed = catalog.query(sort_by='price', **params)
+        assert len(naive) == len(indexed), f"{label}: {len(naive)} != {len(indexed)}"
+
+        print(f"{label} ({len(indexed)} найдено)")
+        before = measure('  построчный перебор', lambda: naive_query(
+            inventory, params.get('price_min'), params.get('price_max'),
+            params.get('flower_type', ''), params.get('occasion', '')), 5)
+        after = measure('  колоночный индекс', lambda: catalog.query(sort_by='price', **params), 50)
+        print(f"  ускорение: x{before / after:.1f}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Производительность определения зоны доставки.
+Запуск: python scripts/benchmark_delivery.py [количество точек]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.delivery_service import DeliveryService
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    service = DeliveryService()
+    grid = service.grid
+    print(f"Зон: {len(grid.zones)}, сетка {grid.rows}x{grid.cols}, точек: {count}\n")
+
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(50.90, 51.35, count)
+    lons = rng.uniform(71.10, 71.80, count)
+
+    # Без индекса: каждая точка проверяется по всем полигонам
+    start = time.perf_counter()
+    brute = [next((i for i, zone in enumerate(grid.zones) if zone.contains(lat, lon)), -1)
+             for lat, lon in zip(lats.tolist(), lons.tolist())]
+    brute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [grid.locate(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = grid.locate_many(lats, lons)
+    batch_time = time.perf_counter() - start
+
+    single_indexes = [grid.zones.index(zone) if zone else -1 for zone in single]
+    assert single_indexes == brute == batch.tolist()
+
+    for label, elapsed in [('Перебор полигонов', brute_time),
+                           ('Сетка, по одной точке', single_time),
+                           ('Пакетная проверка', batch_time)]:
+        print(f"{label:<25} {elapsed * 1000:10.1f} мс  {elapsed / count * 1e6:8.2f} мкс/точка")
+
+    print()
+    for index, zone in enumerate(grid.zones):
+        print(f"{zone.name:<12} {int(np.sum(batch == index)):>8}")
+    print(f"{'Вне зон':<12} {int(np.sum(batch < 0)):>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Микробенчмарки функций, которые выполняются на каждом сообщении:
+поиск в базе знаний (DocsService, KnowledgeBaseService), похожие вопросы
+в кэше ответов (CacheService), контекст диалога (DialogueManager),
+анализ эмоций (EmotionAnalyzer) и форматирование остатков для промпта
+(SheetsService). Данные генерируются и масштабируются: размер базы знаний,
+инвентаря, кэша ответов и истории диалога.
+
+Время - на один вызов: лучший и медианный из нескольких раундов, число
+вызовов в раунде подбирается так, чтобы раунд длился не меньше --min-time.
+--save записывает результат как базовый JSON, --compare сравнивает с ним и
+завершается с кодом 1, если какой-то случай медленнее базового больше чем
+на --threshold. Случаи, модули которых не импортируются в этом окружении,
+пропускаются.
+
+Запуск:
+  python scripts/benchmark_hot_paths.py --save benchmark_baseline.json
+  python scripts/benchmark_hot_paths.py --compare benchmark_baseline.json --threshold 0.2
+  python scripts/benchmark_hot_paths.py --quick --filter dialogue
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from itertools import cycle
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Сервисы импортируют друг друга как services.*, поэтому в путь добавляется src
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+SCALES = {
+    'kb_sections': [10, 50, 200],
+    'inventory': [50, 500, 5000],
+    'cache_size': [100, 1000, 10000],
+    'history': [10, 100, 1000],
+}
+
+QUERIES = [
+    "Сколько стоит доставка по городу?",
+    "Где вы находитесь и до скольки работаете?",
+    "Можно оплатить через каспи?",
+    "Хочу заказать букет роз на день рождения",
+    "Есть ли скидки на пионы?",
+]
+
+WORDS = ("букет розы тюльпаны пионы доставка курьер самовывоз оплата карта каспи скидка акция "
+         "адрес телефон whatsapp время работы график выходные упаковка открытка свежие цветы "
+         "заказ праздник свадьба юбилей свидание подарок корзина композиция гортензии").split()
+SECTION_TITLES = ["Основная информация", "Каталог и цены", "Доставка", "Оплата",
+                  "Специальные предложения", "FAQ", "Уход за цветами", "Примеры диалогов"]
+FLOWERS = ['Розы', 'Тюльпаны', 'Пионы', 'Хризантемы', 'Лилии', 'Гортензии', 'Ромашки', 'Орхидеи']
+CATEGORIES = ['Букеты', 'Моно букеты', 'Композиции', 'Корзины', 'Разное']
+
+
+def run_coroutine(coro):
+    """Выполняет корутину, которая ничего не ждет, без накладных расходов event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Benchmarked coroutine is waiting for I/O")
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def make_kb_text(sections: int) -> str:
+    """База знаний в markdown: разделы ## с подразделами ###"""
+    rng = random.Random(42)
+    lines = ["# База знаний"]
+    for number in range(1, sections + 1):
+        title = SECTION_TITLES[(number - 1) % len(SECTION_TITLES)]
+        lines.append(f"## {number}. {title}")
+        if number == 1:
+            lines += ["Адрес: г. Алматы, ул. Абая 10", "WhatsApp: +7 700 000 00 00"]
+        for sub in range(1, 4):
+            lines.append(f"### {number}.{sub} {rng.choice(WORDS).capitalize()}")
+            lines += [sentence(rng) for _ in range(3)]
+    return '\n'.join(lines)
+
+
+def make_docs_document(text: str) -> Dict[str, Any]:
+    """Документ в формате ответа Google Docs API"""
+    content = [{'paragraph': {'elements': [{'textRun': {'content': line + '\n'}}]}}
+               for line in text.split('\n')]
+    return {'body': {'content': content}}
+
+
+def make_inventory(size: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    return [{'name': f"{rng.choice(FLOWERS)} №{number}",
+             'price': f"{rng.randrange(3000, 150000, 500)} тг",
+             'quantity': rng.randint(0, 20),
+             'description': sentence(rng, 6) if number % 2 else '',
+             'category': rng.choice(CATEGORIES)} for number in range(size)]
+
+
+def make_history(size: int) -> List[Dict[str, Any]]:
+    rng = random.Random(42)
+    now = time.time()
+    types = ['order', 'question', 'preference', 'confirmation', 'greeting', 'default']
+    return [{'role': 'user' if number % 2 else 'assistant', 'content': sentence(rng, 8),
+             'type': rng.choice(types), 'timestamp': now - rng.uniform(0, 20 * 3600)}
+            for number in range(size)]
+
+
+class FakeDocsClient:
+    """Клиент Google Docs, отдающий готовый документ (documents().get().execute())"""
+
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+
+    def documents(self):
+        return self
+
+    def get(self, documentId: str):
+        return self
+
+    def execute(self) -> Dict[str, Any]:
+        return self.document
+
+
+class StaticKnowledgeBase:
+    """Источник текста базы знаний для KnowledgeBaseService"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def get_knowledge_base(self) -> str:
+        return self.text
+
+
+# Случай: (имя, параметр масштаба, построитель) ; построитель получает размер
+# и возвращает (вызов, подготовка перед каждым вызовом или None)
+Case = Tuple[str, Optional[str], Callable[[int], Tuple[Callable[[], Any], Optional[Callable[[], None]]]]]
+
+
+def docs_relevant_knowledge(size: int):
+    from services.docs_service import DocsService
+    # Конструктор подключается к базе и Google Docs - объект собирается вручную
+    docs = DocsService.__new__(DocsService)
+    docs.knowledge_base_doc_id = 'benchmark'
+    docs.service = FakeDocsClient(make_docs_document(make_kb_text(size)))
+    queries = cycle(QUERIES)
+    return lambda: run_coroutine(docs.get_relevant_knowledge(next(queries))), None
+
+
+def docs_find_section(size: int):
+    from services.docs_service import DocsService
+    docs = DocsService.__new__(DocsService)
+    docs.sections = {}
+    current = None
+    for line in make_kb_text(size).split('\n'):
+        if line.startswith('## '):
+            current = line
+            docs.sections[current] = ''
+        elif current:
+            docs.sections[current] += line + '\n'
+    # Запросы без особых случаев (адрес, WhatsApp) - полный проход по разделам
+    queries = cycle([query for query in QUERIES if 'где' not in query.lower()])
+    return lambda: docs.find_relevant_section(next(queries)), None
+
+
+def kb_find_content(size: int):
+    from services.knowledge_base_service import KnowledgeBaseService
+    service = KnowledgeBaseService(docs_service=StaticKnowledgeBase(make_kb_text(size)))
+    # Первый вызов загружает кэш разделов; дальше измеряется поиск по кэшу
+    run_coroutine(service.find_relevant_content(QUERIES[0]))
+    queries = cycle(QUERIES)
+    return lambda: run_coroutine(service.find_relevant_content(next(queries))), None
+
+
+def cache_similar_scan(size: int):
+    from services.cache_service import CacheService
+    cache = CacheService(db=object())
+    rng = random.Random(42)
+    cached = [{'question': sentence(rng, 6)} for _ in range(size)]
+    queries = cycle(QUERIES)
+
+    def scan():
+        # Как в get_cached_response при промахе точного совпадения: проход по всем вопросам
+        normalized = cache._normalize_query(next(queries))
+        for row in cached:
+            if cache._is_similar_query(normalized, cache._normalize_query(row['question'])):
+                return row
+        return None
+    return scan, None
+
+
+def cache_normalize(size: int):
+    from services.cache_service import CacheService
+    cache = CacheService(db=object())
+    queries = cycle(QUERIES)
+    return lambda: cache._normalize_query(next(queries)), None
+
+
+def dialogue_relevant_context(size: int):
+    from services.dialogue_manager import DialogueManager
+    manager = DialogueManager()
+    history = make_history(size)
+    queries = cycle(QUERIES)
+
+    def setup():
+        # get_relevant_context заменяет timestamp у выбранных сообщений - история восстанавливается
+        manager.conversations[1] = [dict(message) for message in history]
+    return lambda: run_coroutine(manager.get_relevant_context(1, next(queries))), setup
+
+
+def emotion_analyze(size: int):
+    from services.emotion_analyzer import EmotionAnalyzer
+    analyzer = EmotionAnalyzer()
+    texts = cycle(["Очень срочно нужен букет!!! Спасибо", "Не понимаю, почему так дорого?",
+                   "Хочу заказать розы на завтра"])
+    return lambda: run_coroutine(analyzer.analyze(next(texts))), None
+
+
+def sheets_format_inventory(size: int):
+    from services.sheets_service import SheetsService
+    # Конструктор подключается к конфигурации и Google Sheets - объект собирается вручную
+    sheets = SheetsService.__new__(SheetsService)
+    sheets.inventory_version = None
+    sheets._last_inventory = None
+    inventory = make_inventory(size)
+    return lambda: run_coroutine(sheets.format_inventory_for_openai(inventory)), None
+
+
+CASES: List[Case] = [
+    ('docs.get_relevant_knowledge', 'kb_sections', docs_relevant_knowledge),
+    ('docs.find_relevant_section', 'kb_sections', docs_find_section),
+    ('kb.find_relevant_content', 'kb_sections', kb_find_content),
+    ('cache.similar_query_scan', 'cache_size', cache_similar_scan),
+    ('cache._normalize_query', None, cache_normalize),
+    ('dialogue.get_relevant_context', 'history', dialogue_relevant_context),
+    ('emotion.analyze', None, emotion_analyze),
+    ('sheets.format_inventory_for_openai', 'inventory', sheets_format_inventory),
+]
+
+
+def run_round(call: Callable[[], Any], setup: Optional[Callable[[], None]], number: int) -> float:
+    if setup is None:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        return time.perf_counter() - start
+    elapsed = 0.0
+    for _ in range(number):
+        setup()
+        start = time.perf_counter()
+        call()
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def measure(call: Callable[[], Any], setup: Optional[Callable[[], None]], min_time: float,
+            repeat: int) -> Dict[str, float]:
+    """Время одного вызова в микросекундах: лучший и медианный раунд"""
+    number = 1
+    while run_round(call, setup, number) < min_time and number < 10 ** 6:
+        number *= 2
+    rounds = [run_round(call, setup, number) / number * 1e6 for _ in range(repeat)]
+    return {'best_us': round(min(rounds), 3), 'median_us': round(statistics.median(rounds), 3),
+            'loops': number, 'rounds': repeat}
+
+
+def run_cases(args) -> Tuple[Dict[str, Dict[str, float]], Dict[str, str]]:
+    results: Dict[str, Dict[str, float]] = {}
+    skipped: Dict[str, str] = {}
+    for name, scale, build in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        sizes = SCALES[scale][:1] if scale and args.quick else SCALES[scale] if scale else [0]
+        for size in sizes:
+            case_id = f"{name}[{scale}={size}]" if scale else name
+            try:
+                call, setup = build(size)
+            except Exception as e:
+                # Нет зависимостей модуля или его окружения (переменные, учетные данные)
+                skipped[name] = f"{type(e).__name__}: {e}"
+                print(f"{case_id:<60} пропущен: {e}")
+                break
+            results[case_id] = measure(call, setup, args.min_time, args.repeat)
+            print(f"{case_id:<60} {results[case_id]['best_us']:>12.1f} мкс  "
+                  f"(медиана {results[case_id]['median_us']:.1f})")
+    return results, skipped
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Dict[str, float]], metric: str,
+            threshold: float, skipped: Optional[Dict[str, str]] = None,
+            name_filter: Optional[str] = None) -> List[str]:
+    """
+    Случаи, ставшие медленнее базовых больше чем на threshold, и случаи базового
+    прогона, которых нет в текущем (пропущены или удалены): их время неизвестно,
+    поэтому они тоже считаются провалом
+    """
+    regressions = []
+    print(f"\nСравнение с базовым прогоном {baseline.get('commit')} ({baseline.get('created_at')}), "
+          f"порог {threshold * 100:.0f}% по {metric}:")
+    for case_id, current in results.items():
+        before = baseline['results'].get(case_id)
+        if not before:
+            print(f"  {case_id:<58} нет в базовом прогоне")
+            continue
+        change = current[metric] / before[metric] - 1 if before[metric] else 0.0
+        mark = ''
+        if change > threshold:
+            regressions.append(case_id)
+            mark = '  РЕГРЕССИЯ'
+        print(f"  {case_id:<58} {before[metric]:>10.1f} -> {current[metric]:<10.1f} {change * 100:+6.1f}%{mark}")
+    for case_id in baseline['results']:
+        name = case_id.split('[')[0]
+        if case_id in results or (name_filter and name_filter not in name):
+            continue
+        regressions.append(case_id)
+        reason = (skipped or {}).get(name, "нет в текущем прогоне")
+        print(f"  {case_id:<58} пропущен: {reason}  ПРОВАЛ")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    import subprocess
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки функций обработки сообщения")
+    parser.add_argument('--save', help="Записать результат как базовый JSON")
+    parser.add_argument('--compare', help="Сравнить с базовым JSON; код 1 при регрессии или пропуске "
+                             "базового случая (базовый прогон - с тем же --quick)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Допустимое замедление (0.2 = 20%%)")
+    parser.add_argument('--metric', choices=['best_us', 'median_us'], default='best_us',
+                        help="По какому времени сравнивать с базовым прогоном")
+    parser.add_argument('--min-time', type=float, default=0.05, help="Минимальная длительность раунда, секунд")
+    parser.add_argument('--repeat', type=int, default=5, help="Раундов на случай")
+    parser.add_argument('--quick', action='store_true', help="Только наименьший размер каждого масштаба")
+    parser.add_argument('--filter', help="Только случаи, в имени которых есть подстрока")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Сервисы пишут в лог на каждом вызове; вывод не должен попадать в замеры
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    results, skipped = run_cases(args)
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+        'skipped': skipped,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовый прогон записан в {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.metric, args.threshold, skipped, args.filter)
+        if regressions:
+            print(f"\nРегрессий и пропущенных случаев: {len(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
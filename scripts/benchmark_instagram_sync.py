@@ -0,0 +1,116 @@
+"""
+Производительность и память выгрузки истории Instagram.
+Выгрузка идет из локального сервера, имитирующего Graph API, в базу в памяти,
+которая хранит только счетчики: замеряется память самой выгрузки.
+Запуск: python scripts/benchmark_instagram_sync.py [диалогов] [сообщений в диалоге]
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.http_client import http_client
+from src.services.instagram_sync import ConversationSync, GraphPager
+
+PAGE_ID = 'page'
+
+
+def fake_graph(conversations: int, messages: int, latency: float) -> web.Application:
+    """Graph API: сообщения генерируются на лету, курсор - смещение"""
+
+    def page(request, total, make):
+        limit = int(request.query['limit'])
+        offset = int(request.query.get('after', 0))
+        body = {'data': [make(i) for i in range(offset, min(offset + limit, total))]}
+        if offset + limit < total:
+            body['paging'] = {'cursors': {'after': str(offset + limit)}, 'next': 'more'}
+        return web.json_response(body)
+
+    async def handle_conversations(request):
+        await asyncio.sleep(latency)
+        return page(request, conversations,
+                    lambda i: {'id': f"c{i}", 'updated_time': '2024-03-01T10:00:00+0000'})
+
+    async def handle_messages(request):
+        await asyncio.sleep(latency)
+        cid = request.match_info['conversation_id']
+        return page(request, messages, lambda i: {
+            'id': f"{cid}-m{i}", 'message': f"Здравствуйте, есть ли розы? #{i}",
+            'from': {'id': f"u-{cid}", 'username': f"client_{cid}"},
+            'created_time': '2024-03-01T10:00:00+0000'
+        })
+
+    app = web.Application()
+    app.router.add_get(f'/{PAGE_ID}/conversations', handle_conversations)
+    app.router.add_get('/{conversation_id}/messages', handle_messages)
+    return app
+
+
+class CountingDb:
+    """База, которая только считает строки и хранит курсоры"""
+
+    def __init__(self):
+        self.rows = 0
+        self.state = {}
+
+    async def fetch_all(self, query, *args):
+        return []
+
+    async def fetch_one(self, query, *args):
+        self.rows += len(args[0])
+        for cid, cursor, updated_time, completed in zip(*args[8:12]):
+            self.state[cid] = (cursor, updated_time, completed)
+        return {'inserted': len(args[0])}
+
+
+async def run(conversations: int, messages: int, concurrency: int, latency: float):
+    runner = web.AppRunner(fake_graph(conversations, messages, latency))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    async def token():
+        return 'page-token'
+
+    db = CountingDb()
+    pager = GraphPager(token, page_size=100, graph_url=f"http://127.0.0.1:{port}")
+    sync = ConversationSync(db, pager, PAGE_ID, concurrency=concurrency, batch_size=500)
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        stats = await sync.run()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+    assert db.rows == conversations * messages
+    return stats, elapsed, peak, pager.requests
+
+
+def main():
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    latency = 0.02
+    print(f"Задержка Graph API: {latency * 1000:.0f} мс, страница: 100 сообщений\n")
+
+    # Память не должна расти вместе с историей, время - падать с параллельностью
+    for label, conv, msgs, concurrency in [
+        ('История x1, 1 поток', conversations, messages // 4, 1),
+        ('История x1, 8 потоков', conversations, messages // 4, 8),
+        ('История x4, 8 потоков', conversations, messages, 8),
+    ]:
+        stats, elapsed, peak, requests = asyncio.run(run(conv, msgs, concurrency, latency))
+        print(f"{label:<24} {stats['messages']:>8} сообщ.  {requests:>5} запр.  {stats['batches']:>4} пачек  "
+              f"{elapsed:7.2f} с  {stats['messages'] / elapsed:9.0f} сообщ./с  пик памяти {peak / 1024 / 1024:6.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
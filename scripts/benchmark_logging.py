@@ -0,0 +1,99 @@
+"""
+Стоимость логирования на одно сообщение клиента.
+Повторяет записи, которые делает обработка сообщения: инвентарь из кэша,
+чтение настроек, запрос, найденные знания и ответ.
+
+Прежняя схема: f-строки с json.dumps(indent=2) на уровне INFO и синхронный
+вывод в обработчике. Новая: большие данные на DEBUG через LazyJson, частые
+записи прореживаются, вывод в отдельном потоке через очередь.
+Время измеряется в вызывающем потоке - столько логирование занимает event loop.
+Запуск: python scripts/benchmark_logging.py [сообщений] [товаров]
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.logger_config import LazyJson, setup_logging, stop_logging
+
+
+def make_inventory(size):
+    return [{'name': f"Роза {i}", 'price': f"{1000 + i} тг", 'quantity': i % 50,
+             'description': 'Свежие цветы из Эквадора', 'category': 'Розы'} for i in range(size)]
+
+
+def old_message(logger, inventory, knowledge, answer):
+    logger.info(f"Получены данные из кэша: {json.dumps(inventory, ensure_ascii=False, indent=2)}")
+    for key in ('api_key', 'model', 'trace_sample_rate'):
+        logger.info(f"Getting config for key: {key}, service: openai")
+        logger.info(f"Retrieved credentials for service openai: {['api_key', 'model']}")
+        logger.warning(f"No value found for key {key} in service openai")
+    logger.info("Получен запрос: сколько стоят розы?")
+    logger.info(f"Данные инвентаря:\n{inventory}")
+    logger.info(f"Найденные знания:\n{knowledge}")
+    logger.info(f"Ответ бота:\n{answer}")
+
+
+def new_message(logger, inventory, knowledge, answer):
+    logger.info("Получены данные из кэша: %s товаров", len(inventory), extra={'sample': 'inventory_cache_hit'})
+    logger.debug("Инвентарь из кэша: %s", LazyJson(inventory, indent=2))
+    for key in ('api_key', 'model', 'trace_sample_rate'):
+        logger.info("No value found for key %s in service %s", key, 'openai',
+                    extra={'sample': f"config_missing:openai:{key}"})
+    logger.info("Получен запрос: %s", 'сколько стоят розы?')
+    logger.debug("Данные инвентаря:\n%s", inventory)
+    logger.info("Получено товаров: %s, знаний: %s символов", len(inventory), len(knowledge))
+    logger.debug("Найденные знания:\n%s", knowledge)
+    logger.debug("Ответ бота:\n%s", answer)
+
+
+def measure(label, count, handle):
+    start = time.perf_counter()
+    for _ in range(count):
+        handle()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / count * 1e6:9.1f} мкс/сообщение")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    inventory = make_inventory(items)
+    knowledge = "## 3. Доставка\nДоставка по городу 2000 тг, бесплатно от 20000 тг.\n" * 20
+    answer = "Розы красные - 1500 тг\nРозы белые - 1200 тг"
+    logger = logging.getLogger('benchmark')
+    root = logging.getLogger()
+    print(f"Сообщений: {count}, товаров в инвентаре: {items}\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Прежняя схема: синхронный вывод в файл на event loop
+        handler = logging.FileHandler(os.path.join(directory, 'old.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+        measure('f-строки, синхронный обработчик', count,
+                lambda: old_message(logger, inventory, knowledge, answer))
+        handler.close()
+
+        # Новая схема: очередь, вывод в файл в отдельном потоке
+        # (консольный обработчик слушателя пишет в /dev/null)
+        stream = open(os.devnull, 'w')
+        sys.stderr, stderr = stream, sys.stderr
+        try:
+            setup_logging(logging.INFO, log_file=os.path.join(directory, 'new.log'), structured=False)
+            measure('ленивые записи, очередь', count,
+                    lambda: new_message(logger, inventory, knowledge, answer))
+            start = time.perf_counter()
+            stop_logging()
+            print(f"{'  дописать очередь при остановке':<40} {(time.perf_counter() - start) * 1000:9.1f} мс")
+        finally:
+            sys.stderr = stderr
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Стоимость записи метрики на горячем пути.
+Сравнивается агрегация в памяти с прежней схемой - вызовом create_time_series
+на каждую точку (имитируется задержкой RPC). Отдельно измеряется ответ /metrics
+для набора серий, как у бота в работе.
+Запуск: python scripts/benchmark_metrics.py [количество записей]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.metrics import MetricsPublisher, MetricsRegistry, render_prometheus
+
+# Типичная задержка одного вызова create_time_series
+RPC_LATENCY = 0.05
+
+
+class NullExporter:
+    min_interval = 0.0
+
+    async def export(self, samples, timestamp):
+        await asyncio.sleep(RPC_LATENCY)
+
+
+def measure(label, count, record):
+    start = time.perf_counter()
+    for i in range(count):
+        record(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / count * 1e9:8.0f} нс/запись")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    registry = MetricsRegistry()
+    labels = {'scenario': 'catalog'}
+    print(f"Записей: {count}\n")
+
+    measure('counter без меток', count, lambda i: registry.counter('updates'))
+    measure('counter с меткой', count, lambda i: registry.counter('tokens', 120, labels))
+    measure('gauge', count, lambda i: registry.gauge('queue_depth', i))
+    measure('histogram', count, lambda i: registry.observe('latency', (i % 1000) / 100, labels))
+
+    publisher = MetricsPublisher(registry, [NullExporter()])
+    start = time.perf_counter()
+    asyncio.run(publisher.flush())
+    flush_time = time.perf_counter() - start
+    print(f"\nВыгрузка {publisher.stats['samples']} серий одним пакетом: {flush_time * 1000:.1f} мс")
+    print(f"Прежняя схема (RPC на каждую точку): {RPC_LATENCY * 1e9:,.0f} нс/запись")
+
+    # /metrics: этапы, кэши, токены, очереди; гистограммы заполнены за интервал и с момента старта
+    for stage in ('receive', 'inventory', 'kb', 'cache_lookup', 'llm', 'answer', 'telegram_send', 'log_post'):
+        for i in range(10000):
+            registry.observe('stage_seconds', (i % 5000) / 1000, {'stage': stage})
+    for cache in ('answers', 'inventory', 'kb', 'catalog'):
+        registry.counter('cache_requests_total', labels={'cache': cache, 'result': 'hit'})
+    registry.collect()
+    registry.observe('stage_seconds', 0.2, {'stage': 'llm'})
+    scrapes = 200
+    start = time.perf_counter()
+    for _ in range(scrapes):
+        text = render_prometheus(registry)
+    scrape_time = (time.perf_counter() - start) / scrapes
+    print(f"Ответ /metrics: {scrape_time * 1000:.2f} мс, {len(text.splitlines())} строк, {len(text) // 1024} КБ")
+
+
+if __name__ == '__main__':
+    main()
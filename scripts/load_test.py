@@ -0,0 +1,611 @@
+"""
+Нагрузочный тест обработки сообщений без сети.
+Синтетические обновления Telegram (вопросы клиентов на русском) подаются
+в TelegramBot.webhook_handler с заданной частотой и конкурентностью.
+Внешние сервисы заменены фейками внутри процесса с настраиваемым
+распределением задержки и долей ошибок:
+  telegram - Bot API (через свой BaseRequest, планировщик исходящих настоящий),
+  openai   - генерация ответа на вопросы не о товарах,
+  sheets   - чтение остатков из Google Sheets при промахе кэша,
+  docs     - чтение базы знаний из Google Docs,
+  postgres - кэш остатков и остальные запросы к базе.
+Модули config/postgres/sheets/docs/openai подменяются до импорта бота,
+остальной код (конвейер ответа, каталог, сводка логов, трассировка) настоящий.
+
+Отчет: пропускная способность, перцентили задержки от момента поступления
+(ожидание свободного слота входит в задержку), этапы обработки, глубина
+очередей, доли ошибок; результат пишется в JSON для сравнения между коммитами.
+
+Запуск:
+  python scripts/load_test.py --rate 20 --duration 30 --pattern poisson
+  python scripts/load_test.py --pattern closed --concurrency 50 --openai lognormal:800:4000
+  python scripts/load_test.py --blocking docs --compare load-test-abc123.json
+Задержка задается как const:мс, uniform:от:до, exp:среднее или lognormal:медиана:p99.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import types
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Бот импортирует модули как services.*, поэтому в путь добавляется src
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from telegram.request import BaseRequest
+
+from services.metrics import Histogram, metrics
+
+# Вопросы клиентов с весами: о товарах (каталог), весь ассортимент,
+# база знаний (docs + openai) и короткие реплики
+QUESTIONS: List[Tuple[str, int]] = [
+    ("Какая цена на розы красные?", 8),
+    ("Хочу купить тюльпаны, сколько стоит?", 6),
+    ("Есть ли в наличии пионы?", 6),
+    ("Какая стоимость гортензии?", 4),
+    ("Можно заказать хризантемы на завтра?", 4),
+    ("Что есть в наличии?", 3),
+    ("Покажите, что есть из цветов сегодня", 2),
+    ("Как оформить доставку?", 6),
+    ("Вы работаете в выходные?", 4),
+    ("Где находится ваш магазин?", 4),
+    ("Можно ли оплатить картой или Kaspi?", 4),
+    ("Как ухаживать за букетом, чтобы дольше стоял?", 3),
+    ("Можно добавить открытку к букету?", 3),
+    ("Здравствуйте!", 2),
+    ("Спасибо большое!", 1),
+]
+
+PRODUCTS = ["Розы красные", "Розы белые", "Тюльпаны", "Пионы", "Хризантемы", "Гортензии", "Лилии", "Эустомы"]
+FIRST_NAMES = ["Айгерим", "Алия", "Данияр", "Екатерина", "Ержан", "Мария", "Нурлан", "Ольга", "Сауле", "Тимур"]
+
+KNOWLEDGE = {
+    'доставк': "## Доставка\nДоставка по Алматы 2000 тг, бесплатно от 20000 тг. Время доставки - от 2 часов.",
+    'выходн': "## Режим работы\nМагазин работает ежедневно с 9:00 до 21:00 без выходных.",
+    'магазин': "## Адрес\nг. Алматы, ул. Абая 10. Самовывоз с 9:00 до 21:00.",
+    'оплат': "## Оплата\nПринимаем наличные, карты и Kaspi перевод.",
+    'ухажива': "## Уход\nПодрезайте стебли каждые 2 дня и меняйте воду.",
+    'открытк': "## Дополнительно\nОткрытка к букету - бесплатно, текст пишет флорист.",
+}
+
+ERROR_REPLY = "Извините, произошла ошибка"
+
+
+class Latency:
+    """Распределение задержки фейка; строка вида lognormal:медиана:p99 (мс)"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, *values = spec.split(':')
+        params = [float(value) / 1000 for value in values]
+        expected = {'const': 1, 'uniform': 2, 'exp': 1, 'lognormal': 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Unknown latency spec: {spec}")
+        self.kind = kind
+        self.params = params
+        if kind == 'lognormal':
+            median, p99 = params
+            # 2.326 - квантиль 0.99 стандартного нормального распределения
+            self.mu = math.log(median)
+            self.sigma = math.log(max(p99, median) / median) / 2.326
+
+    def sample(self) -> float:
+        if self.kind == 'const':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return random.uniform(*self.params)
+        if self.kind == 'exp':
+            return random.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        return random.lognormvariate(self.mu, self.sigma)
+
+
+class FakeServiceError(Exception):
+    pass
+
+
+class FakeBackend:
+    """
+    Внешний сервис: задержка из распределения, случайные ошибки и учет
+    одновременных вызовов. blocking - задержка через time.sleep, как у
+    синхронных клиентов (googleapiclient, psycopg2), которые держат event loop.
+    """
+
+    def __init__(self, name: str, latency: Latency, error_rate: float = 0.0, blocking: bool = False):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.blocking = blocking
+        self.inflight = 0
+        self.max_inflight = 0
+        self.calls = 0
+        self.errors = 0
+        self.histogram = Histogram()
+
+    async def call(self) -> None:
+        self.calls += 1
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        delay = self.latency.sample()
+        try:
+            if self.blocking:
+                time.sleep(delay)
+            else:
+                await asyncio.sleep(delay)
+        finally:
+            self.inflight -= 1
+            self.histogram.record(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise FakeServiceError(f"{self.name} unavailable")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'latency': self.latency.spec, 'blocking': self.blocking, 'calls': self.calls,
+                'errors': self.errors, 'max_inflight': self.max_inflight,
+                'latency_ms': latency_summary(self.histogram)}
+
+
+def latency_summary(histogram: Histogram) -> Dict[str, float]:
+    return {
+        'count': histogram.count,
+        'mean': round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0.0,
+        'p50': round(histogram.percentile(50) * 1000, 2),
+        'p90': round(histogram.percentile(90) * 1000, 2),
+        'p99': round(histogram.percentile(99) * 1000, 2),
+        'max': round(histogram.max * 1000, 2) if histogram.count else 0.0,
+    }
+
+
+def make_inventory(size: int) -> List[Dict[str, Any]]:
+    names = PRODUCTS + [f"Букет №{number}" for number in range(1, max(size - len(PRODUCTS), 0) + 1)]
+    return [{'name': name, 'price': f"{1500 + 100 * (index % 40)} тг", 'quantity': index % 30,
+             'description': 'Свежие цветы, доставка в день заказа' if index % 3 else '',
+             'category': 'Букеты' if name.startswith('Букет') else 'Цветы'}
+            for index, name in enumerate(names[:size])]
+
+
+def install_fakes(backends: Dict[str, FakeBackend], inventory: List[Dict[str, Any]],
+                  cache_hit_ratio: float) -> None:
+    """Подменяет модули внешних сервисов фейками; вызывается до импорта бота"""
+    from services.catalog_index import get_catalog, inventory_version
+
+    class ConfigService:
+        values = {
+            'telegram': {'bot_token_dev': '123456:LOADTEST', 'log_digest_window': '5'},
+            'cache': {'update_interval': '300'},
+        }
+
+        def get_config(self, key, service_name=None):
+            return self.values.get(service_name or 'telegram', {}).get(key)
+
+        async def get_config_async(self, key, service=None):
+            return self.get_config(key, service)
+
+        async def get_google_credentials(self):
+            return {}
+
+    class PostgresService:
+        def __init__(self):
+            self.pool = None
+
+        async def execute(self, query, *args):
+            await backends['postgres'].call()
+            return True
+
+        async def fetch_one(self, query, *args):
+            await backends['postgres'].call()
+            return None
+
+        async def fetch_all(self, query, *args):
+            await backends['postgres'].call()
+            return []
+
+        def get_pool_stats(self):
+            return {'size': 0, 'idle': 0, 'in_use': backends['postgres'].inflight}
+
+    class SheetsService:
+        """Остатки: кэш в базе, при промахе - чтение таблицы и запись в кэш"""
+
+        def __init__(self):
+            self.db = PostgresService()
+            self.inventory_version = inventory_version(inventory)
+
+        async def initialize(self):
+            pass
+
+        async def get_inventory_data(self):
+            await self.db.fetch_one("SELECT data FROM cache WHERE source = $1", 'inventory')
+            hit = random.random() < cache_hit_ratio
+            metrics.counter('cache_requests_total', labels={'cache': 'inventory', 'result': 'hit' if hit else 'miss'})
+            if not hit:
+                await backends['sheets'].call()
+                await self.db.execute("INSERT INTO cache ...", 'inventory')
+            return inventory
+
+        def get_catalog(self, items):
+            return get_catalog(items or [], self.inventory_version if items is inventory else None)
+
+    class DocsService:
+        """База знаний и ответ: вопросы о товарах - по каталогу, остальные - через LLM"""
+
+        async def get_relevant_knowledge(self, query: str) -> str:
+            await backends['docs'].call()
+            lower = query.lower()
+            return '\n\n'.join(text for key, text in KNOWLEDGE.items() if key in lower) or "## Общее\nЦветочный магазин"
+
+        async def get_response(self, query: str, inventory_data: list = None, catalog=None) -> str:
+            lower = query.lower()
+            if 'что есть' in lower or 'покажи' in lower:
+                return ''.join(f"🌸 {item['name']}: {item['price']}\n" for item in inventory_data or [])
+            for item in catalog.names_in_text(query) if catalog else []:
+                return f"🌸 {item['name']}\n💰 Цена: {item['price']}\n📦 В наличии: {item['quantity']} шт."
+            await backends['openai'].call()
+            return "Спасибо за вопрос! Доставка по городу от 2 часов, оплата картой или Kaspi."
+
+    class OpenAIService:
+        async def get_response(self, *args, **kwargs) -> str:
+            await backends['openai'].call()
+            return "Ответ модели"
+
+    modules = {
+        'services.config_service': {'ConfigService': ConfigService, 'config_service': ConfigService()},
+        'services.postgres_service': {'PostgresService': PostgresService},
+        'services.sheets_service': {'SheetsService': SheetsService},
+        'services.docs_service': {'DocsService': DocsService},
+        'services.openai_service': {'OpenAIService': OpenAIService},
+    }
+    for name, attrs in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Bot API внутри процесса: отвечает как Telegram, с задержкой и ошибками фейка"""
+
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+        self.message_id = 0
+        self.methods: Counter = Counter()
+        self.error_replies = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'Load test', 'username': 'load_test_bot'}
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'forwardMessage'):
+            self.message_id += 1
+            chat_id = int(params.get('chat_id', 0))
+            text = params.get('text', '')
+            if text.startswith(ERROR_REPLY):
+                self.error_replies += 1
+            return {'message_id': self.message_id, 'date': int(time.time()), 'text': text,
+                    'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}}
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.methods[api_method] += 1
+        try:
+            await self.backend.call()
+        except FakeServiceError:
+            return 500, b'{"ok": false, "error_code": 500, "description": "Internal Server Error"}'
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({'ok': True, 'result': self._result(api_method, params)}).encode()
+
+
+class SyntheticRequest:
+    """Минимальный aiohttp-запрос для webhook_handler"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+
+    async def json(self) -> Dict[str, Any]:
+        return self.payload
+
+
+class UpdateFactory:
+    def __init__(self, users: int):
+        self.users = users
+        self.update_id = 0
+        self.texts = [text for text, _ in QUESTIONS]
+        self.weights = [weight for _, weight in QUESTIONS]
+
+    def next(self) -> Dict[str, Any]:
+        self.update_id += 1
+        user_id = 100000 + random.randrange(self.users)
+        first_name = FIRST_NAMES[user_id % len(FIRST_NAMES)]
+        user = {'id': user_id, 'is_bot': False, 'first_name': first_name}
+        return {
+            'update_id': self.update_id,
+            'message': {
+                'message_id': self.update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private', 'first_name': first_name},
+                'from': user,
+                'text': random.choices(self.texts, self.weights)[0],
+            },
+        }
+
+
+def arrival_delays(pattern: str, rate: float, burst: int):
+    """Интервалы между поступлениями для открытой модели нагрузки"""
+    while True:
+        if pattern == 'constant':
+            yield 1 / rate
+        elif pattern == 'poisson':
+            yield random.expovariate(rate)
+        elif pattern == 'burst':
+            # burst сообщений подряд, затем пауза, чтобы средняя частота была rate
+            for _ in range(burst - 1):
+                yield 0.0
+            yield burst / rate
+        else:
+            raise ValueError(f"Unknown arrival pattern: {pattern}")
+
+
+class LoadTest:
+    def __init__(self, args, backends: Dict[str, FakeBackend]):
+        self.args = args
+        self.backends = backends
+        self.factory = UpdateFactory(args.users)
+        self.latency = Histogram()
+        self.statuses: Counter = Counter()
+        self.exceptions: Counter = Counter()
+        self.inflight = 0
+        self.waiting = 0
+        self.queue_samples: Dict[str, List[float]] = {}
+        self.bot = None
+        self.telegram: Optional[FakeTelegramRequest] = None
+
+    async def setup(self) -> None:
+        from telegram.ext import Application
+        from services.telegram_outbound import outbound_scheduler
+        from telegram_bot import TelegramBot
+        from utils.logger_config import setup_logging
+
+        # Бот при импорте включает подробный лог; во время теста - только предупреждения
+        setup_logging(logging.WARNING, structured=False)
+
+        self.telegram = FakeTelegramRequest(self.backends['telegram'])
+        self.bot = TelegramBot()
+        self.bot.log_group_id = -1001234567890
+        self.bot.log_digest.window = self.args.digest_window
+        self.bot.application = (Application.builder().token('123456:LOADTEST')
+                                .request(self.telegram).get_updates_request(self.telegram)
+                                .rate_limiter(outbound_scheduler).build())
+        from services.feedback_service import FeedbackService
+        self.bot.feedback = FeedbackService(self.bot.application.bot)
+        await self.bot.application.initialize()
+
+    async def handle(self, payload: Dict[str, Any], arrived: float) -> None:
+        self.inflight += 1
+        try:
+            response = await self.bot.webhook_handler(SyntheticRequest(payload))
+            self.statuses[response.status] += 1
+        except Exception as e:
+            self.exceptions[type(e).__name__] += 1
+        finally:
+            self.inflight -= 1
+            # От поступления, а не от начала обработки: ожидание слота тоже задержка
+            self.latency.record(time.perf_counter() - arrived)
+
+    async def admit(self, slots: asyncio.Semaphore, payload: Dict[str, Any], arrived: float) -> None:
+        self.waiting += 1
+        async with slots:
+            self.waiting -= 1
+            await self.handle(payload, arrived)
+
+    async def open_loop(self, deadline: float) -> int:
+        slots = asyncio.Semaphore(self.args.concurrency)
+        tasks = set()
+        next_arrival = time.perf_counter()
+        for delay in arrival_delays(self.args.pattern, self.args.rate, self.args.burst):
+            if next_arrival >= deadline:
+                break
+            pause = next_arrival - time.perf_counter()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            task = asyncio.create_task(self.admit(slots, self.factory.next(), next_arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_arrival += delay
+        if tasks:
+            await asyncio.wait(tasks)
+        return self.factory.update_id
+
+    async def closed_loop(self, deadline: float) -> int:
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.handle(self.factory.next(), time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return self.factory.update_id
+
+    async def sample_queues(self) -> None:
+        from services.telegram_outbound import outbound_scheduler
+        while True:
+            outbound = outbound_scheduler.get_stats()
+            depths = {
+                'handlers_inflight': self.inflight,
+                'admission_waiting': self.waiting,
+                'outbound_queued': sum(lane.get('queued', 0) for lane in outbound.values()),
+            }
+            for name, backend in self.backends.items():
+                depths[f"{name}_inflight"] = backend.inflight
+            for name, depth in depths.items():
+                self.queue_samples.setdefault(name, []).append(depth)
+            await asyncio.sleep(0.1)
+
+    async def run(self) -> Dict[str, Any]:
+        from services.loop_monitor import loop_monitor
+        from services.telegram_outbound import outbound_scheduler
+
+        await self.setup()
+        loop_monitor.interval = 0.05
+        loop_monitor.start()
+        sampler = asyncio.create_task(self.sample_queues())
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        if self.args.pattern == 'closed':
+            sent = await self.closed_loop(deadline)
+        else:
+            sent = await self.open_loop(deadline)
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        # Сводка логов отправляется после окна; в результат входит и она
+        await self.bot.log_digest.close()
+        await loop_monitor.stop()
+        await self.bot.application.shutdown()
+        return self.results(sent, elapsed, outbound_scheduler.get_stats(), loop_monitor.get_stats())
+
+    def results(self, sent: int, elapsed: float, outbound: Dict[str, Any], loop: Dict[str, Any]) -> Dict[str, Any]:
+        completed = self.latency.count
+        failed = sum(count for status, count in self.statuses.items() if status >= 500)
+        failed += sum(self.exceptions.values())
+        stages = {}
+        for (name, labels), histogram in metrics.cumulative_histograms().items():
+            if name == 'stage_seconds':
+                stages[dict(labels)['stage']] = latency_summary(histogram)
+        return {
+            'requests': sent,
+            'completed': completed,
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_rps': round(completed / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': latency_summary(self.latency),
+            'status': {str(status): count for status, count in sorted(self.statuses.items())},
+            'exceptions': dict(self.exceptions),
+            'error_rate': round(failed / completed, 4) if completed else 0.0,
+            # Обработчик ловит ошибки сам и отвечает клиенту извинением со статусом 200
+            'error_replies': self.telegram.error_replies,
+            'error_reply_rate': round(self.telegram.error_replies / completed, 4) if completed else 0.0,
+            'stages_ms': stages,
+            'queues': {name: {'max': max(values), 'mean': round(sum(values) / len(values), 2)}
+                       for name, values in self.queue_samples.items()},
+            'telegram_methods': dict(self.telegram.methods),
+            'outbound': outbound,
+            'event_loop': loop,
+            'fakes': {name: backend.get_stats() for name, backend in self.backends.items()},
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    print(f"\nСравнение с {previous['run'].get('commit')} ({previous['run'].get('started_at')}):")
+    rows = [
+        ('пропускная способность, rps', ('throughput_rps',)),
+        ('задержка p50, мс', ('latency_ms', 'p50')),
+        ('задержка p99, мс', ('latency_ms', 'p99')),
+        ('доля ошибок', ('error_rate',)),
+        ('доля извинений', ('error_reply_rate',)),
+        ('задержка цикла max, мс', ('event_loop', 'max_lag_ms')),
+    ]
+    for label, path in rows:
+        before, after = previous['results'], current['results']
+        for key in path:
+            before, after = before.get(key, 0), after.get(key, 0)
+        change = f"{(after - before) / before * 100:+.1f}%" if before else ''
+        print(f"  {label:<32} {before:>10} -> {after:<10} {change}")
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    latency = results['latency_ms']
+    print(f"Сообщений: {results['completed']} за {results['elapsed_seconds']} с, "
+          f"{results['throughput_rps']} в секунду")
+    print(f"Задержка, мс: p50 {latency['p50']}, p90 {latency['p90']}, p99 {latency['p99']}, max {latency['max']}")
+    print(f"Ошибки: {results['error_rate'] * 100:.2f}% ответов 5xx, "
+          f"{results['error_reply_rate'] * 100:.2f}% извинений клиенту")
+    for stage, summary in sorted(results['stages_ms'].items()):
+        print(f"  этап {stage:<16} p50 {summary['p50']:>9} мс   p99 {summary['p99']:>9} мс")
+    for name, depth in results['queues'].items():
+        print(f"  очередь {name:<20} max {depth['max']:>5}   mean {depth['mean']}")
+    print(f"Задержка event loop max: {results['event_loop']['max_lag_ms']} мс")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook_handler с фейками внешних сервисов")
+    parser.add_argument('--pattern', choices=['constant', 'poisson', 'burst', 'closed'], default='poisson',
+                        help="Поступление сообщений; closed - concurrency клиентов без пауз")
+    parser.add_argument('--rate', type=float, default=20.0, help="Сообщений в секунду (открытая модель)")
+    parser.add_argument('--burst', type=int, default=20, help="Размер пачки для pattern=burst")
+    parser.add_argument('--duration', type=float, default=30.0, help="Длительность подачи, секунд")
+    parser.add_argument('--concurrency', type=int, default=100, help="Максимум одновременно обрабатываемых")
+    parser.add_argument('--users', type=int, default=500, help="Сколько разных клиентов пишут")
+    parser.add_argument('--items', type=int, default=200, help="Товаров в инвентаре")
+    parser.add_argument('--cache-hit-ratio', type=float, default=0.95, help="Доля попаданий в кэш остатков")
+    parser.add_argument('--digest-window', type=float, default=5.0, help="Окно сводки логов, секунд")
+    parser.add_argument('--telegram', default='lognormal:60:300', help="Задержка Bot API")
+    parser.add_argument('--openai', default='lognormal:900:4000', help="Задержка генерации ответа")
+    parser.add_argument('--sheets', default='lognormal:400:1500', help="Задержка чтения таблицы")
+    parser.add_argument('--docs', default='lognormal:300:1200', help="Задержка чтения базы знаний")
+    parser.add_argument('--postgres', default='lognormal:5:40', help="Задержка запроса к базе")
+    parser.add_argument('--error-rate', action='append', default=[], metavar='SERVICE=RATE',
+                        help="Доля ошибок сервиса, например openai=0.02 (можно повторять)")
+    parser.add_argument('--blocking', default='', help="Сервисы с синхронной задержкой через запятую, например docs,sheets")
+    parser.add_argument('--seed', type=int, default=None, help="Зерно генератора для повторяемых прогонов")
+    parser.add_argument('--output', default=None, help="JSON с результатом (по умолчанию load-test-<коммит>-<время>.json)")
+    parser.add_argument('--compare', default=None, help="JSON прошлого прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def build_backends(args) -> Dict[str, FakeBackend]:
+    error_rates = {}
+    for item in args.error_rate:
+        name, _, rate = item.partition('=')
+        error_rates[name] = float(rate)
+    blocking = {name for name in args.blocking.split(',') if name}
+    return {name: FakeBackend(name, Latency(getattr(args, name)), error_rates.get(name, 0.0), name in blocking)
+            for name in ('telegram', 'openai', 'sheets', 'docs', 'postgres')}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    backends = build_backends(args)
+    install_fakes(backends, make_inventory(args.items), args.cache_hit_ratio)
+
+    started_at = datetime.now().isoformat(timespec='seconds')
+    results = asyncio.run(LoadTest(args, backends).run())
+    commit = git_commit()
+    report = {
+        'run': {'commit': commit, 'started_at': started_at, 'python': platform.python_version(),
+                'args': vars(args)},
+        'results': results,
+    }
+    print_summary(results)
+
+    output = args.output or f"load-test-{commit or 'nogit'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультат записан в {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+"""
+Воспроизведение истории вопросов клиентов через конвейер ответа.
+Показывает, как изменение нормализации в CacheService, ранжирования базы
+знаний или промпта повлияло бы на реальный трафик.
+
+Вопросы читаются потоком - из chat_statistics / message_logs курсором
+(строки подгружаются пачками) или из JSONL-экспорта построчно, поэтому
+память не зависит от длины истории. Внешние вызовы заменены:
+  Google Sheets/Docs - снимки остатков (JSON) и базы знаний (markdown),
+  OpenAI - клиент, который возвращает записанный в истории ответ
+           (--llm recorded) или фиксированный текст (--llm stub)
+           и оценивает число токенов промпта.
+Кэш ответов моделируется в памяти логикой CacheService (нормализация,
+хеш, похожие вопросы) с ограничением размера.
+
+Отчет: доля попаданий в кэш ответов, доля ответов без LLM, число вызовов
+LLM, токены промпта и ответа, оценка стоимости, доля ответов «нет
+информации», совпадение с ответом из истории и задержка по этапам.
+
+Запуск:
+  python scripts/replay_conversations.py --jsonl history.jsonl --inventory inventory.json --kb kb.md
+  python scripts/replay_conversations.py --table chat_statistics --since 2026-09-01 --pipeline openai
+JSONL: по объекту в строке с полем question (или message_text) и, по желанию,
+answer (response_text) и user_id.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Сервисы импортируют друг друга как services.*, поэтому в путь добавляется src
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from services.metrics import Histogram, metrics
+from services.token_usage import estimate_cost
+from services.tracing import span
+
+# Ответы, которые означают, что бот не смог ответить по существу
+NO_ANSWER_MARKERS = ('Нет информации', 'не нашел', 'Извините', 'Произошла ошибка')
+
+# Запросы истории: вопрос, записанный ответ и клиент, в порядке поступления
+SOURCES = {
+    'chat_statistics': """
+        SELECT question, answer, user_id
+        FROM public.chat_statistics
+        WHERE answered_at >= $1
+        ORDER BY id
+    """,
+    'message_logs': """
+        SELECT message_text AS question, response_text AS answer, user_id
+        FROM public.message_logs
+        WHERE message_type = 'text' AND created_at >= $1
+        ORDER BY id
+    """,
+}
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            question = row.get('question') or row.get('message_text')
+            if question:
+                yield {'question': question, 'answer': row.get('answer') or row.get('response_text'),
+                       'user_id': row.get('user_id')}
+
+
+async def stream_jsonl(path: str) -> AsyncIterator[Dict[str, Any]]:
+    for row in iter_jsonl(path):
+        yield row
+
+
+async def stream_table(table: str, since: datetime, prefetch: int) -> AsyncIterator[Dict[str, Any]]:
+    """Строки истории серверным курсором: в памяти не больше prefetch строк"""
+    from services.postgres_service import PostgresService
+    db = PostgresService()
+    await db.connect()
+    try:
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                async for record in conn.cursor(SOURCES[table], since, prefetch=prefetch):
+                    if record['question']:
+                        yield dict(record)
+    finally:
+        await db.close()
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Токены текста: tiktoken, если установлен, иначе оценка ~4 байта UTF-8 на токен"""
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(model).encode(text))
+        except KeyError:
+            return len(tiktoken.get_encoding('cl100k_base').encode(text))
+    return max(1, len(text.encode('utf-8')) // 4)
+
+
+class ReplayLLMClient:
+    """
+    Заменяет AsyncOpenAI: client.chat.completions.create(...) возвращает
+    записанный ответ текущего вопроса (или фиксированный текст) и usage
+    с оценкой токенов промпта, включая описание инструментов.
+    """
+
+    def __init__(self, mode: str = 'recorded', stub_answer: str = "Нет информации"):
+        self.mode = mode
+        self.stub_answer = stub_answer
+        self.recorded: Optional[str] = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def create(self, model: str, messages: List[Dict[str, Any]], tools=None, **kwargs):
+        self.calls += 1
+        prompt = json.dumps(messages, ensure_ascii=False) + (json.dumps(tools, ensure_ascii=False) if tools else '')
+        # Служебные токены разметки - около 4 на сообщение
+        prompt_tokens = count_tokens(prompt, model) + 4 * len(messages)
+        content = self.recorded if self.mode == 'recorded' and self.recorded else self.stub_answer
+        completion_tokens = count_tokens(content, model)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens, prompt_tokens_details=None),
+        )
+
+
+class AnswerCacheSimulator:
+    """
+    Кэш ответов в памяти по правилам CacheService.get_cached_response:
+    точное совпадение хеша нормализованного вопроса, затем похожий вопрос.
+    Хранит не больше max_size вопросов, вытесняя давно не использованные.
+    """
+
+    def __init__(self, cache_service, max_size: int = 1000):
+        self.cache = cache_service
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def lookup(self, question: str) -> Tuple[str, Optional[str]]:
+        normalized = self.cache._normalize_query(question)
+        key = self.cache._generate_hash(normalized)
+        entry = self.entries.get(key)
+        if entry is None:
+            for cached_key, (cached_question, answer) in self.entries.items():
+                if self.cache._is_similar_query(normalized, cached_question):
+                    key, entry = cached_key, (cached_question, answer)
+                    self.similar_hits += 1
+                    break
+        if entry is None:
+            self.misses += 1
+            return key, None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return key, entry[1]
+
+    def store(self, key: str, question: str, answer: str) -> None:
+        self.entries[key] = (self.cache._normalize_query(question), answer)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def build_snapshots(inventory: List[Dict[str, Any]], kb_text: str):
+    """Сервисы Google на снимках: логика настоящая, чтение данных - из памяти"""
+    from services.catalog_index import inventory_version
+    from services.docs_service import DocsService
+    from services.sheets_service import SheetsService
+
+    class DocumentSnapshot:
+        """documents().get(documentId=...).execute() возвращает снимок документа"""
+
+        def __init__(self, text: str):
+            lines = text.split('\n')
+            self.document = {'body': {'content': [
+                {'paragraph': {'elements': [{'textRun': {'content': line + '\n'}}]}} for line in lines
+            ]}}
+
+        def documents(self):
+            return self
+
+        def get(self, documentId: str):
+            return self
+
+        def execute(self) -> Dict[str, Any]:
+            return self.document
+
+    class DocsSnapshot(DocsService):
+        def __init__(self):
+            self.knowledge_base_doc_id = 'replay'
+            self.service = DocumentSnapshot(kb_text)
+            self.sections = {}
+            self._load_document()
+
+        async def get_knowledge_base(self) -> str:
+            return kb_text
+
+    class SheetsSnapshot(SheetsService):
+        def __init__(self):
+            self.inventory_version = inventory_version(inventory)
+            self._last_inventory = inventory
+
+        async def get_inventory_data(self):
+            return inventory
+
+        async def get_data(self):
+            return inventory
+
+    return SheetsSnapshot(), DocsSnapshot()
+
+
+class Replay:
+    def __init__(self, args):
+        self.args = args
+        self.llm = ReplayLLMClient(args.llm)
+        self.total = Histogram()
+        self.stats = {'questions': 0, 'cache_hits': 0, 'pipeline_runs': 0, 'deterministic': 0,
+                      'llm_answered': 0, 'no_answer': 0, 'with_history': 0, 'same_as_history': 0,
+                      'errors': 0}
+
+    def build(self):
+        from services.cache_service import CacheService
+
+        inventory = []
+        if self.args.inventory:
+            with open(self.args.inventory, encoding='utf-8') as f:
+                inventory = json.load(f)
+        kb_text = ''
+        if self.args.kb:
+            with open(self.args.kb, encoding='utf-8') as f:
+                kb_text = f.read()
+        sheets, docs = build_snapshots(inventory, kb_text)
+
+        if self.args.pipeline == 'openai':
+            from services.openai_service import OpenAIService
+            service = OpenAIService(client=self.llm, docs_service=docs, sheets_service=sheets,
+                                    model=self.args.model)
+            answer = service.get_response
+        else:
+            from services.answer_pipeline import AnswerPipeline
+            pipeline = AnswerPipeline(sheets, docs)
+
+            async def answer(question: str) -> str:
+                return (await pipeline.answer(question)).text
+
+        self.answer = answer
+        self.cache = AnswerCacheSimulator(CacheService(db=object()), self.args.cache_size)
+
+    async def replay_one(self, row: Dict[str, Any]) -> None:
+        question, recorded = row['question'], row.get('answer')
+        self.stats['questions'] += 1
+        started = time.perf_counter()
+        with span('answer_cache'):
+            key, cached = self.cache.lookup(question)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            response = cached
+        else:
+            self.stats['pipeline_runs'] += 1
+            self.llm.recorded = recorded
+            calls_before = self.llm.calls
+            try:
+                response = await self.answer(question) or ''
+            except Exception as e:
+                self.stats['errors'] += 1
+                response = f"Произошла ошибка: {type(e).__name__}"
+            if self.llm.calls == calls_before:
+                self.stats['deterministic'] += 1
+            else:
+                self.stats['llm_answered'] += 1
+            self.cache.store(key, question, response)
+        self.total.record(time.perf_counter() - started)
+
+        if any(marker in response for marker in NO_ANSWER_MARKERS):
+            self.stats['no_answer'] += 1
+        if recorded:
+            self.stats['with_history'] += 1
+            if response.strip() == recorded.strip():
+                self.stats['same_as_history'] += 1
+
+    async def run(self, rows: AsyncIterator[Dict[str, Any]]) -> Dict[str, Any]:
+        self.build()
+        started = time.perf_counter()
+        async for row in rows:
+            await self.replay_one(row)
+            count = self.stats['questions']
+            if self.args.progress and count % self.args.progress == 0:
+                print(f"  {count} вопросов, попаданий в кэш {self.stats['cache_hits'] / count * 100:.1f}%",
+                      file=sys.stderr)
+            if self.args.limit and count >= self.args.limit:
+                break
+        return self.results(time.perf_counter() - started)
+
+    def results(self, elapsed: float) -> Dict[str, Any]:
+        stats = self.stats
+        questions = stats['questions'] or 1
+        runs = stats['pipeline_runs'] or 1
+        stages = {}
+        for (name, labels), histogram in metrics.cumulative_histograms().items():
+            if name == 'stage_seconds':
+                stages[dict(labels)['stage']] = summarize(histogram)
+        return {
+            **stats,
+            'elapsed_seconds': round(elapsed, 2),
+            'cache_hit_rate': round(stats['cache_hits'] / questions, 4),
+            'cache_similar_hits': self.cache.similar_hits,
+            'deterministic_rate': round(stats['deterministic'] / runs, 4),
+            'no_answer_rate': round(stats['no_answer'] / questions, 4),
+            'same_as_history_rate': round(stats['same_as_history'] / stats['with_history'], 4)
+            if stats['with_history'] else None,
+            'llm_calls': self.llm.calls,
+            'prompt_tokens': self.llm.prompt_tokens,
+            'completion_tokens': self.llm.completion_tokens,
+            'prompt_tokens_per_call': round(self.llm.prompt_tokens / self.llm.calls, 1) if self.llm.calls else 0.0,
+            'estimated_cost_usd': round(estimate_cost(self.args.model, self.llm.prompt_tokens,
+                                                      self.llm.completion_tokens), 4),
+            'token_counter': 'tiktoken' if tiktoken is not None else 'estimate',
+            'latency_ms': summarize(self.total),
+            'stages_ms': stages,
+        }
+
+
+def summarize(histogram: Histogram) -> Dict[str, float]:
+    return {
+        'count': histogram.count,
+        'p50': round(histogram.percentile(50) * 1000, 3),
+        'p90': round(histogram.percentile(90) * 1000, 3),
+        'p99': round(histogram.percentile(99) * 1000, 3),
+        'max': round(histogram.max * 1000, 3) if histogram.count else 0.0,
+    }
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    print(f"Вопросов: {results['questions']} за {results['elapsed_seconds']} с")
+    print(f"Попаданий в кэш ответов: {results['cache_hit_rate'] * 100:.1f}% "
+          f"(из них по похожему вопросу: {results['cache_similar_hits']})")
+    print(f"Ответов без LLM: {results['deterministic_rate'] * 100:.1f}% из {results['pipeline_runs']} прогонов")
+    print(f"Вызовов LLM: {results['llm_calls']}, токенов промпта: {results['prompt_tokens']} "
+          f"({results['prompt_tokens_per_call']} на вызов, {results['token_counter']}), "
+          f"ответа: {results['completion_tokens']}, ~${results['estimated_cost_usd']}")
+    print(f"Ответов «нет информации»: {results['no_answer_rate'] * 100:.1f}%")
+    if results['same_as_history_rate'] is not None:
+        print(f"Совпадает с ответом из истории: {results['same_as_history_rate'] * 100:.1f}%")
+    for stage, summary in sorted(results['stages_ms'].items()):
+        print(f"  этап {stage:<14} p50 {summary['p50']:>9} мс   p99 {summary['p99']:>9} мс   ({summary['count']})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение истории вопросов через конвейер ответа")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--jsonl', help="Экспорт истории: JSONL с полями question/answer/user_id")
+    source.add_argument('--table', choices=sorted(SOURCES), help="Таблица истории в базе")
+    parser.add_argument('--since', default='1970-01-01', help="Начало периода для --table (YYYY-MM-DD)")
+    parser.add_argument('--prefetch', type=int, default=1000, help="Строк за одну подгрузку курсора")
+    parser.add_argument('--pipeline', choices=['answers', 'openai'], default='answers',
+                        help="answers - конвейер ответов Telegram/Instagram, openai - OpenAIService.get_response")
+    parser.add_argument('--inventory', help="Снимок остатков: JSON-список товаров")
+    parser.add_argument('--kb', help="Снимок базы знаний: markdown с разделами ##")
+    parser.add_argument('--llm', choices=['recorded', 'stub'], default='recorded',
+                        help="Ответ LLM: записанный в истории или фиксированный")
+    parser.add_argument('--model', default='gpt-4-turbo-preview', help="Модель для подсчета токенов и стоимости")
+    parser.add_argument('--cache-size', type=int, default=1000, help="Вопросов в моделируемом кэше ответов")
+    parser.add_argument('--limit', type=int, default=0, help="Остановиться после N вопросов")
+    parser.add_argument('--progress', type=int, default=10000, help="Печатать прогресс каждые N вопросов")
+    parser.add_argument('--output', help="JSON с результатом")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Конвейер пишет в лог на каждый вопрос; при воспроизведении нужны только ошибки
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.jsonl:
+        rows = stream_jsonl(args.jsonl)
+    else:
+        rows = stream_table(args.table, datetime.fromisoformat(args.since), args.prefetch)
+    results = asyncio.run(Replay(args).run(rows))
+    print_summary(results)
+
+    if args.output:
+        report = {'created_at': datetime.now().isoformat(timespec='seconds'),
+                  'python': platform.python_version(), 'args': vars(args), 'results': results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат записан в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Отчет по этапам обработки сообщений: p50/p95/p99 длительности каждого этапа
+за окно времени по сохраненным трассам.
+
+Примеры:
+    python scripts/trace_report.py --file traces.jsonl --since 1h
+    python scripts/trace_report.py --db --since 24h --name message
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.services.tracing import TRACE_CATEGORY, stage_report
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_window(value: str) -> float:
+    """'15m', '2h', '1d' -> секунды"""
+    if value[-1] in UNITS:
+        return float(value[:-1]) * UNITS[value[-1]]
+    return float(value)
+
+
+def read_file(path: str, since: float) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                trace = json.loads(line)
+                if trace['time'] >= since:
+                    yield trace
+
+
+async def read_db(since: float) -> List[Dict[str, Any]]:
+    sys.path.insert(0, os.path.join(project_root, 'src'))
+    from services.postgres_service import PostgresService
+
+    db = PostgresService()
+    try:
+        rows = await db.fetch_all(
+            """
+            SELECT metadata FROM public.bot_logs
+            WHERE category = $1 AND created_at >= to_timestamp($2)
+            """,
+            TRACE_CATEGORY, since
+        )
+    finally:
+        await db.close()
+    return [json.loads(row['metadata']) if isinstance(row['metadata'], str) else row['metadata'] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перцентили этапов обработки сообщений')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help='JSONL-файл трасс (TRACE_FILE)')
+    source.add_argument('--db', action='store_true', help='Трассы из таблицы bot_logs')
+    parser.add_argument('--since', default='1h', help='Окно: 30m, 6h, 1d (по умолчанию 1h)')
+    parser.add_argument('--name', help='Только трассы с этим именем (message, instagram)')
+    args = parser.parse_args()
+
+    since = time.time() - parse_window(args.since)
+    traces = read_file(args.file, since) if args.file else asyncio.run(read_db(since))
+    if args.name:
+        traces = (trace for trace in traces if trace['name'] == args.name)
+
+    report = stage_report(traces)
+    if not report:
+        print('Трасс за указанное окно нет')
+        return
+
+    print(f"{'Этап':<16} {'кол-во':>8} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'max, мс':>10}")
+    # Этапы по убыванию p95, итог по трассе - последней строкой
+    total = report.pop('total')
+    for name, row in sorted(report.items(), key=lambda item: -item[1]['p95']) + [('total', total)]:
+        print(f"{name:<16} {row['count']:>8} {row['p50']:>10.1f} {row['p95']:>10.1f} "
+              f"{row['p99']:>10.1f} {row['max']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
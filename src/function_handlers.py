@@ -1,9 +1,13 @@
 import json
 import logging
-from typing import Dict, Any, List
-from datetime import datetime
+import math
+from typing import Dict, Any, List, Optional
 
 from services.sheets_service import SheetsService
+from services.order_service import order_service
+from services.catalog_index import parse_price
+from services.delivery_service import delivery_service
+from services.tool_engine import ToolEngine
 
 # Setup logging
 logging.basicConfig(
@@ -15,208 +19,219 @@ logger = logging.getLogger(__name__)
 # Initialize services
 sheets_service = SheetsService()
 
-# Определение инструментов для OpenAI
-TOOL_DEFINITIONS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_bouquet_info",
-            "description": "Получить информацию о букете по его названию",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "bouquet_id": {
-                        "type": "string",
-                        "description": "Название букета"
-                    }
-                },
-                "required": ["bouquet_id"]
-            }
+# Сколько секунд версия инвентаря считается актуальной без повторного чтения
+INVENTORY_VERSION_TTL = 10.0
+
+
+async def current_inventory_version() -> Optional[str]:
+    """
+    Версия инвентаря для кэша инструментов. Остатки перечитываются не чаще
+    раза в INVENTORY_VERSION_TTL секунд; любой вызов обработчика, читающего
+    инвентарь, тоже обновляет версию
+    """
+    return await sheets_service.current_inventory_version(INVENTORY_VERSION_TTL)
+
+
+# Результаты инструментов, зависящих только от каталога, живут до смены версии инвентаря
+tool_engine = ToolEngine(version_provider=current_inventory_version)
+
+
+async def get_bouquet_info(bouquet_id: str) -> str:
+    """Получает информацию о букете из Google Sheets"""
+    inventory = await sheets_service.get_inventory_data()
+    item = sheets_service.get_catalog(inventory).find_by_name(bouquet_id)
+
+    if item:
+        return json.dumps({
+            "name": item["name"],
+            "price": item["price"],
+            "description": item["description"],
+            "available": item["quantity"] > 0
+        }, ensure_ascii=False)
+    return "Букет не найден"
+
+
+async def search_bouquets(price_min: Optional[float] = None, price_max: Optional[float] = None,
+                          flower_type: str = "", occasion: str = "") -> str:
+    """Поиск букетов по параметрам в Google Sheets"""
+    inventory = await sheets_service.get_inventory_data()
+
+    # Фильтры выполняются масками по колоночному индексу каталога
+    matching = sheets_service.get_catalog(inventory).query(
+        price_min=price_min or None,
+        price_max=price_max or None,
+        flower_type=flower_type,
+        occasion=occasion,
+        limit=5
+    )
+
+    return json.dumps([
+        {
+            "name": item["name"],
+            "price": item["price"],
+            "description": item["description"]
         }
+        for item in matching
+    ], ensure_ascii=False)
+
+
+async def check_delivery(address: str, delivery_time: Optional[str] = None) -> str:
+    """Проверка возможности доставки по локальным зонам и таблице адресов"""
+    return json.dumps(delivery_service.check(address, delivery_time), ensure_ascii=False)
+
+
+async def create_order(bouquet_name: str, customer_name: str, customer_phone: str,
+                       delivery_address: str, delivery_time: Optional[str] = None,
+                       idempotency_key: Optional[str] = None) -> str:
+    """Создание нового заказа"""
+    # Ищем букет в каталоге, чтобы зарезервировать его под точным названием
+    inventory = await sheets_service.get_inventory_data()
+    item = sheets_service.get_catalog(inventory).find_by_name(bouquet_name)
+
+    if not item:
+        return "Букет не найден"
+
+    delivery = delivery_service.check(delivery_address, delivery_time)
+    if delivery.get('available') is False:
+        return json.dumps({"status": "rejected", "message": delivery.get('message')}, ensure_ascii=False)
+
+    price = parse_price(item.get("price"))
+
+    # Резерв, заказ и уведомления персоналу пишутся одной транзакцией в базе;
+    # повтор вызова с теми же данными вернет уже созданный заказ
+    result = await order_service.place_order({
+        "bouquet_name": item["name"],
+        "quantity": 1,
+        "price": None if math.isnan(price) else price,
+        "delivery_price": delivery.get('price'),
+        "customer_name": customer_name,
+        "customer_phone": customer_phone,
+        "delivery_address": delivery_address,
+        "delivery_time": delivery_time
+    }, idempotency_key=idempotency_key)
+
+    if result is None:
+        return "Не удалось оформить заказ, попробуйте позже"
+    if result["status"] == "out_of_stock":
+        return "К сожалению, этот букет сейчас недоступен"
+
+    return json.dumps({
+        "order_id": str(result["order_number"]),
+        "status": result["status"],
+        "message": "Заказ успешно создан" if result["created"] else "Заказ уже был оформлен ранее"
+    }, ensure_ascii=False)
+
+
+# Регистрация инструментов для OpenAI
+tool_engine.register(
+    name="get_bouquet_info",
+    description="Получить информацию о букете по его названию",
+    parameters={
+        "type": "object",
+        "properties": {
+            "bouquet_id": {
+                "type": "string",
+                "description": "Название букета"
+            }
+        },
+        "required": ["bouquet_id"]
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "search_bouquets",
-            "description": "Поиск букетов по параметрам",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "price_min": {
-                        "type": "number",
-                        "description": "Минимальная цена"
-                    },
-                    "price_max": {
-                        "type": "number",
-                        "description": "Максимальная цена"
-                    },
-                    "flower_type": {
-                        "type": "string",
-                        "description": "Тип цветов (розы, тюльпаны и т.д.)"
-                    },
-                    "occasion": {
-                        "type": "string",
-                        "description": "Повод (день рождения, свадьба и т.д.)"
-                    }
-                }
+    handler=get_bouquet_info,
+    cacheable=True
+)
+
+tool_engine.register(
+    name="search_bouquets",
+    description="Поиск букетов по параметрам",
+    parameters={
+        "type": "object",
+        "properties": {
+            "price_min": {
+                "type": "number",
+                "description": "Минимальная цена"
+            },
+            "price_max": {
+                "type": "number",
+                "description": "Максимальная цена"
+            },
+            "flower_type": {
+                "type": "string",
+                "description": "Тип цветов (розы, тюльпаны и т.д.)"
+            },
+            "occasion": {
+                "type": "string",
+                "description": "Повод (день рождения, свадьба и т.д.)"
             }
         }
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "check_delivery",
-            "description": "Проверить возможность доставки по адресу",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "address": {
-                        "type": "string",
-                        "description": "Адрес доставки"
-                    },
-                    "delivery_time": {
-                        "type": "string",
-                        "description": "Желаемое время доставки (формат: YYYY-MM-DD HH:MM)"
-                    }
-                },
-                "required": ["address"]
+    handler=search_bouquets,
+    cacheable=True
+)
+
+tool_engine.register(
+    name="check_delivery",
+    description="Проверить возможность доставки по адресу",
+    parameters={
+        "type": "object",
+        "properties": {
+            "address": {
+                "type": "string",
+                "description": "Адрес доставки"
+            },
+            "delivery_time": {
+                "type": "string",
+                "description": "Желаемое время доставки (формат: YYYY-MM-DD HH:MM)"
             }
-        }
+        },
+        "required": ["address"]
     },
-    {
-        "type": "function",
-        "function": {
-            "name": "create_order",
-            "description": "Создать новый заказ",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "bouquet_name": {
-                        "type": "string",
-                        "description": "Название букета"
-                    },
-                    "customer_name": {
-                        "type": "string",
-                        "description": "Имя заказчика"
-                    },
-                    "customer_phone": {
-                        "type": "string",
-                        "description": "Телефон заказчика"
-                    },
-                    "delivery_address": {
-                        "type": "string",
-                        "description": "Адрес доставки"
-                    },
-                    "delivery_time": {
-                        "type": "string",
-                        "description": "Время доставки (формат: YYYY-MM-DD HH:MM)"
-                    }
-                },
-                "required": ["bouquet_name", "customer_name", "customer_phone", "delivery_address"]
+    handler=check_delivery
+)
+
+tool_engine.register(
+    name="create_order",
+    description="Создать новый заказ",
+    parameters={
+        "type": "object",
+        "properties": {
+            "bouquet_name": {
+                "type": "string",
+                "description": "Название букета"
+            },
+            "customer_name": {
+                "type": "string",
+                "description": "Имя заказчика"
+            },
+            "customer_phone": {
+                "type": "string",
+                "description": "Телефон заказчика"
+            },
+            "delivery_address": {
+                "type": "string",
+                "description": "Адрес доставки"
+            },
+            "delivery_time": {
+                "type": "string",
+                "description": "Время доставки (формат: YYYY-MM-DD HH:MM)"
+            },
+            "idempotency_key": {
+                "type": "string",
+                "description": "Ключ повторной отправки: тот же ключ не создаст второй заказ"
             }
-        }
-    }
-]
+        },
+        "required": ["bouquet_name", "customer_name", "customer_phone", "delivery_address"]
+    },
+    handler=create_order,
+    timeout=10.0
+)
+
+# Определение инструментов для OpenAI
+TOOL_DEFINITIONS = tool_engine.definitions()
+
 
 async def execute_function(function_name: str, arguments: Dict[str, Any]) -> str:
     """
     Выполнить функцию с заданными аргументами
     """
-    try:
-        logger.info(f"Executing function {function_name} with arguments: {arguments}")
-        
-        if function_name == "get_bouquet_info":
-            # Получаем информацию о букете из Google Sheets
-            bouquet_name = arguments.get("bouquet_id")
-            inventory = sheets_service.get_inventory_data()
-            
-            for item in inventory:
-                if item["name"].lower() == bouquet_name.lower():
-                    return json.dumps({
-                        "name": item["name"],
-                        "price": item["price"],
-                        "description": item["description"],
-                        "available": item["quantity"] > 0
-                    }, ensure_ascii=False)
-            return "Букет не найден"
-
-        elif function_name == "search_bouquets":
-            # Поиск букетов по параметрам в Google Sheets
-            inventory = sheets_service.get_inventory_data()
-            matching_bouquets = []
-            
-            price_min = arguments.get("price_min")
-            price_max = arguments.get("price_max")
-            flower_type = arguments.get("flower_type", "").lower()
-            occasion = arguments.get("occasion", "").lower()
-            
-            for item in inventory:
-                # Получаем числовое значение цены
-                try:
-                    price = float(item["price"].split()[0])
-                except (ValueError, IndexError):
-                    price = 0
-                
-                # Проверяем соответствие параметрам
-                if price_min and price < price_min:
-                    continue
-                if price_max and price > price_max:
-                    continue
-                if flower_type and flower_type not in item["name"].lower():
-                    continue
-                if occasion and occasion not in item["description"].lower():
-                    continue
-                
-                matching_bouquets.append({
-                    "name": item["name"],
-                    "price": item["price"],
-                    "description": item["description"]
-                })
-            
-            return json.dumps(matching_bouquets[:5], ensure_ascii=False)
-
-        elif function_name == "check_delivery":
-            # Проверка возможности доставки
-            address = arguments.get("address")
-            delivery_time = arguments.get("delivery_time")
-            
-            # Здесь должна быть логика проверки доставки
-            # Пока возвращаем заглушку
-            return json.dumps({
-                "available": True,
-                "price": 1500,
-                "estimated_time": "1-2 часа"
-            }, ensure_ascii=False)
-
-        elif function_name == "create_order":
-            # Создание нового заказа
-            required_fields = ["bouquet_name", "customer_name", "customer_phone", "delivery_address"]
-            if not all(field in arguments for field in required_fields):
-                return "Не все обязательные поля заполнены"
-            
-            # Проверяем наличие букета
-            inventory = sheets_service.get_inventory_data()
-            bouquet_exists = False
-            for item in inventory:
-                if item["name"].lower() == arguments["bouquet_name"].lower():
-                    bouquet_exists = True
-                    if item["quantity"] <= 0:
-                        return "К сожалению, этот букет сейчас недоступен"
-                    break
-            
-            if not bouquet_exists:
-                return "Букет не найден"
-            
-            # В реальном приложении здесь должно быть сохранение заказа
-            return json.dumps({
-                "order_id": "TEST-" + datetime.now().strftime("%Y%m%d-%H%M%S"),
-                "status": "created",
-                "message": "Заказ успешно создан"
-            }, ensure_ascii=False)
-
-        else:
-            return f"Неизвестная функция: {function_name}"
-
-    except Exception as e:
-        logger.error(f"Error executing function {function_name}: {str(e)}", exc_info=True)
-        return f"Произошла ошибка при выполнении функции: {str(e)}"
+    logger.info(f"Executing function {function_name} with arguments: {arguments}")
+    return await tool_engine.execute(function_name, arguments)
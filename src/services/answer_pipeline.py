@@ -0,0 +1,53 @@
+"""
+Общий конвейер ответа клиенту: остатки, релевантные знания и генерация ответа.
+Используется всеми каналами (Telegram, Instagram), чтобы клиент получал
+одинаковый ответ независимо от того, откуда написал.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Answer:
+    """Ответ клиенту и знания, на которых он основан"""
+    text: str
+    knowledge: str
+
+
+class AnswerPipeline:
+    def __init__(self, sheets, docs):
+        self.sheets = sheets
+        self.docs = docs
+
+    async def _inventory(self):
+        with span('inventory') as stage:
+            inventory_data = await self.sheets.get_inventory_data()
+            stage.attrs['items'] = len(inventory_data) if inventory_data else 0
+            return inventory_data
+
+    async def _knowledge(self, text: str) -> str:
+        with span('kb'):
+            return await self.docs.get_relevant_knowledge(text)
+
+    async def answer(self, text: str) -> Answer:
+        """Готовит ответ на вопрос клиента"""
+        # Остатки и знания не зависят друг от друга - запрашиваем одновременно
+        inventory_data, relevant_knowledge = await asyncio.gather(
+            self._inventory(),
+            self._knowledge(text)
+        )
+        logger.info("Получено товаров: %s, знаний: %s символов",
+                    len(inventory_data) if inventory_data else 0, len(relevant_knowledge or ''))
+        logger.debug("Найденные знания:\n%s", relevant_knowledge)
+
+        with span('answer'):
+            response = await self.docs.get_response(
+                text, inventory_data, catalog=self.sheets.get_catalog(inventory_data)
+            )
+        logger.debug("Ответ бота:\n%s", response)
+        return Answer(response, relevant_knowledge)
@@ -7,13 +7,18 @@ from typing import Optional, Dict, Any
 from datetime import datetime, timezone
 from psycopg2.extras import Json
 
-from services.supabase_service import SupabaseService
+from services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class CacheService:
-    def __init__(self):
-        self.db = SupabaseService()
+    def __init__(self, db=None):
+        if db is None:
+            # Модуль supabase_service подключается к базе при импорте - импортируем,
+            # только если база не передана (бенчмарки и тесты работают без нее)
+            from services.supabase_service import SupabaseService
+            db = SupabaseService()
+        self.db = db
         self.similarity_threshold = 0.8
 
     def _normalize_query(self, query: str) -> str:
@@ -66,6 +71,7 @@ class CacheService:
                     result = cached
                     break
 
+        metrics.counter('cache_requests_total', labels={'cache': 'answers', 'result': 'hit' if result else 'miss'})
         if result:
             # Обновляем счетчик использования
             self.db.execute_query(
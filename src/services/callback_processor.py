@@ -0,0 +1,96 @@
+"""
+Быстрая обработка нажатий на кнопки.
+Сначала отвечаем на callback query (у оператора пропадает индикатор загрузки),
+затем пересылки, комментарии и смена кнопок выполняются в фоне.
+
+Повторные нажатия отсекаются: Telegram выдает новый id на каждое нажатие,
+поэтому ключом служит сама кнопка (чат, сообщение, данные кнопки), а id
+запроса дополнительно защищает от повторной доставки того же обновления.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Фоновая работа: True - успех
+CallbackJob = Callable[[], Awaitable[bool]]
+# Сообщить об ошибке: (описание) -> None
+ErrorHandler = Callable[[str], Awaitable[None]]
+
+
+class CallbackProcessor:
+    """
+    Фоновое выполнение работы по нажатию кнопки с защитой от двойных нажатий.
+
+    Args:
+        dedupe_ttl: Сколько секунд помнить обработанные нажатия
+        max_keys: Сколько ключей держать в памяти
+    """
+
+    def __init__(self, dedupe_ttl: float = 600.0, max_keys: int = 10000):
+        self.dedupe_ttl = dedupe_ttl
+        self.max_keys = max_keys
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {'accepted': 0, 'duplicates': 0, 'succeeded': 0, 'failed': 0}
+
+    def _expire(self, now: float) -> None:
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.dedupe_ttl and len(self._seen) <= self.max_keys:
+                break
+            del self._seen[key]
+
+    def claim(self, query_id: str, key: str) -> bool:
+        """Отмечает нажатие; False - такое нажатие уже принято"""
+        now = time.monotonic()
+        self._expire(now)
+        if query_id in self._seen or key in self._seen:
+            self.stats['duplicates'] += 1
+            return False
+        self._seen[query_id] = now
+        self._seen[key] = now
+        self.stats['accepted'] += 1
+        return True
+
+    def release(self, key: str) -> None:
+        """Снимает отметку, чтобы кнопку можно было нажать еще раз (после ошибки)"""
+        self._seen.pop(key, None)
+
+    def submit(self, key: str, job: CallbackJob, on_error: Optional[ErrorHandler] = None) -> asyncio.Task:
+        """Запускает работу в фоне; при ошибке освобождает кнопку и вызывает on_error"""
+        task = asyncio.create_task(self._run(key, job, on_error))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, key: str, job: CallbackJob, on_error: Optional[ErrorHandler]) -> None:
+        try:
+            ok = await job()
+            error = None if ok else "операция не выполнена"
+        except Exception as e:
+            logger.error(f"Callback job {key} failed: {e}", exc_info=True)
+            error = str(e)
+
+        if error is None:
+            self.stats['succeeded'] += 1
+            return
+
+        self.stats['failed'] += 1
+        self.release(key)
+        if on_error:
+            try:
+                await on_error(error)
+            except Exception as e:
+                logger.error(f"Failed to report callback error for {key}: {e}")
+
+    async def drain(self) -> None:
+        """Дожидается фоновых работ (при остановке бота)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'running': len(self._tasks)}
@@ -0,0 +1,280 @@
+"""
+Колоночное представление каталога для быстрых фильтров.
+Строится один раз на версию инвентаря: цены и остатки хранятся в массивах NumPy,
+категории интернированы в коды, по ценам есть отсортированный индекс,
+а по словам из названий и описаний - инвертированный индекс.
+"""
+import hashlib
+import json
+import logging
+import math
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Окончания, которые отбрасываются у слова из запроса: "розы" -> "роз", "тюльпанами" -> "тюльпан"
+RU_ENDINGS = ('ами', 'ями', 'ов', 'ев', 'ей', 'ий', 'ый', 'ая', 'ое', 'ые',
+              'ы', 'и', 'а', 'я', 'е', 'о', 'у', 'ю')
+
+# Сколько каталогов разных версий держим в памяти
+CATALOG_CACHE_SIZE = 4
+
+
+def parse_price(value: Any) -> float:
+    """
+    Разбирает цену из таблицы в число.
+    Понимает "1 500 тг", "1 500 тенге", "1,500", "1500.50", "₸ 2 000".
+    Возвращает NaN, если цену разобрать нельзя.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return math.nan
+
+    text = re.sub(r'[^\d.,]', '', str(value))
+    if not text:
+        return math.nan
+
+    if ',' in text and '.' in text:
+        # "1,500.50" - запятая разделяет тысячи
+        text = text.replace(',', '')
+    elif ',' in text:
+        integer, _, fraction = text.rpartition(',')
+        # "1,500" - тысячи, "1500,5" - дробная часть
+        text = text.replace(',', '') if len(fraction) == 3 else f"{integer.replace(',', '')}.{fraction}"
+
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова в нижнем регистре"""
+    return TOKEN_RE.findall(str(text).lower().replace('ё', 'е'))
+
+
+def stem(word: str) -> str:
+    """Грубое отсечение окончания, чтобы "розы" находили "роза" и "розовые" """
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def inventory_version(inventory: List[Dict[str, Any]]) -> str:
+    """Хеш содержимого инвентаря - меняется только при изменении данных"""
+    payload = json.dumps(inventory, ensure_ascii=False, sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+class TokenIndex:
+    """Инвертированный индекс: слово -> отсортированный массив номеров строк"""
+
+    def __init__(self, texts: Iterable[str]):
+        postings: Dict[str, List[int]] = {}
+        for row, text in enumerate(texts):
+            for token in set(tokenize(text)):
+                postings.setdefault(token, []).append(row)
+
+        self.vocabulary = sorted(postings)
+        self.postings = {token: np.array(rows, dtype=np.int64) for token, rows in postings.items()}
+
+    def rows_for_prefix(self, prefix: str) -> np.ndarray:
+        """Строки, где есть слово, начинающееся с prefix (бинарный поиск по словарю)"""
+        start = bisect_left(self.vocabulary, prefix)
+        matched = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matched.append(self.postings[token])
+
+        if not matched:
+            return np.empty(0, dtype=np.int64)
+        if len(matched) == 1:
+            return matched[0]
+        return np.unique(np.concatenate(matched))
+
+    def rows_for_exact(self, token: str) -> np.ndarray:
+        """Строки, где есть ровно это слово"""
+        return self.postings.get(token, np.empty(0, dtype=np.int64))
+
+
+class CatalogIndex:
+    """Каталог в колоночном виде с векторными фильтрами"""
+
+    def __init__(self, items: List[Dict[str, Any]], version: Optional[str] = None):
+        self.items = list(items)
+        self.version = version
+        self.size = len(self.items)
+
+        self.names = [str(item.get('name', '')) for item in self.items]
+        self.prices = np.array([parse_price(item.get('price')) for item in self.items], dtype=np.float64)
+        self.quantities = np.array([self._parse_quantity(item.get('quantity')) for item in self.items],
+                                   dtype=np.int64)
+
+        # Интернированные категории: коды в порядке первого появления
+        self.category_names: List[str] = []
+        category_codes: Dict[str, int] = {}
+        codes = []
+        for item in self.items:
+            category = item.get('category', 'Разное')
+            code = category_codes.get(category)
+            if code is None:
+                code = category_codes[category] = len(self.category_names)
+                self.category_names.append(category)
+            codes.append(code)
+        self.category_codes = np.array(codes, dtype=np.int32)
+        self._category_lookup = {str(name).lower(): code for name, code in category_codes.items()}
+
+        # Индекс по цене: NaN уходят в конец и не попадают ни в один диапазон
+        self.price_order = np.argsort(self.prices, kind='stable')
+        self.sorted_prices = self.prices[self.price_order]
+
+        self.name_index = TokenIndex(self.names)
+        self.description_index = TokenIndex(str(item.get('description', '')) for item in self.items)
+        self._rows_by_name = {}
+        for row, name in enumerate(self.names):
+            self._rows_by_name.setdefault(name.lower(), row)
+
+    @staticmethod
+    def _parse_quantity(value: Any) -> int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def find_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """Товар по точному названию без учета регистра"""
+        row = self._rows_by_name.get(str(name).lower())
+        return self.items[row] if row is not None else None
+
+    def price_mask(self, price_min: Optional[float] = None, price_max: Optional[float] = None) -> np.ndarray:
+        """Маска строк с ценой в диапазоне [price_min, price_max] через searchsorted"""
+        low = np.searchsorted(self.sorted_prices, price_min if price_min is not None else -np.inf, side='left')
+        high = np.searchsorted(self.sorted_prices, price_max if price_max is not None else np.inf, side='right')
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.price_order[low:high]] = True
+        return mask
+
+    def text_mask(self, query: str, field: str = 'name') -> np.ndarray:
+        """Маска строк, где есть все слова запроса (по префиксу основы слова)"""
+        index = self.name_index if field == 'name' else self.description_index
+        mask = np.ones(self.size, dtype=bool)
+        for word in tokenize(query):
+            word_mask = np.zeros(self.size, dtype=bool)
+            word_mask[index.rows_for_prefix(stem(word))] = True
+            mask &= word_mask
+        return mask
+
+    def category_mask(self, category: str) -> np.ndarray:
+        code = self._category_lookup.get(str(category).lower())
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.category_codes == code
+
+    def query(self, price_min: Optional[float] = None, price_max: Optional[float] = None,
+              flower_type: Optional[str] = None, occasion: Optional[str] = None,
+              category: Optional[str] = None, in_stock: Optional[bool] = None,
+              sort_by: Optional[str] = None, descending: bool = False,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Фильтрация и сортировка каталога масками NumPy.
+
+        Args:
+            price_min, price_max: Диапазон цены
+            flower_type: Слова, которые должны быть в названии
+            occasion: Слова, которые должны быть в описании
+            category: Категория (без учета регистра)
+            in_stock: True - только товары в наличии
+            sort_by: 'price', 'quantity' или None (порядок таблицы)
+            descending: Сортировка по убыванию
+            limit: Максимальное количество результатов
+        """
+        mask = np.ones(self.size, dtype=bool)
+        if price_min is not None or price_max is not None:
+            mask &= self.price_mask(price_min, price_max)
+        if flower_type:
+            mask &= self.text_mask(flower_type, 'name')
+        if occasion:
+            mask &= self.text_mask(occasion, 'description')
+        if category:
+            mask &= self.category_mask(category)
+        if in_stock:
+            mask &= self.quantities > 0
+
+        if sort_by == 'price':
+            # Готовый порядок по цене: фильтруем его маской вместо новой сортировки
+            rows = self.price_order[mask[self.price_order]]
+            if descending:
+                rows = rows[::-1]
+        else:
+            rows = np.flatnonzero(mask)
+            if sort_by == 'quantity':
+                keys = -self.quantities[rows] if descending else self.quantities[rows]
+                rows = rows[np.argsort(keys, kind='stable')]
+
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.items[row] for row in rows]
+
+    def rows_matching_any(self, words: Iterable[str]) -> np.ndarray:
+        """Строки, в названии которых есть слово с любой из основ"""
+        mask = np.zeros(self.size, dtype=bool)
+        for word in words:
+            mask[self.name_index.rows_for_prefix(stem(word.lower()))] = True
+        return np.flatnonzero(mask)
+
+    def names_in_text(self, text: str) -> List[Dict[str, Any]]:
+        """Товары, чье полное название встречается в тексте"""
+        text_lower = text.lower()
+        candidates = set()
+        for token in set(tokenize(text)):
+            candidates.update(self.name_index.rows_for_exact(token).tolist())
+        return [self.items[row] for row in sorted(candidates) if self.names[row].lower() in text_lower]
+
+    def group_by_category(self) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Товары, сгруппированные по категориям в порядке их первого появления"""
+        if not self.size:
+            return []
+        order = np.argsort(self.category_codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(self.category_codes[order])) + 1
+        groups = []
+        for rows in np.split(order, boundaries):
+            category = self.category_names[self.category_codes[rows[0]]]
+            groups.append((category, [self.items[row] for row in rows]))
+        return groups
+
+
+_catalog_cache: "OrderedDict[str, CatalogIndex]" = OrderedDict()
+
+
+def get_catalog(inventory: List[Dict[str, Any]], version: Optional[str] = None) -> CatalogIndex:
+    """
+    Каталог для инвентаря. Индекс строится один раз на версию инвентаря,
+    повторные вызовы с той же версией возвращают готовый объект.
+    """
+    if version is None:
+        version = inventory_version(inventory)
+
+    catalog = _catalog_cache.get(version)
+    metrics.counter('cache_requests_total', labels={'cache': 'catalog', 'result': 'miss' if catalog is None else 'hit'})
+    if catalog is not None:
+        _catalog_cache.move_to_end(version)
+        return catalog
+
+    catalog = CatalogIndex(inventory, version)
+    _catalog_cache[version] = catalog
+    if len(_catalog_cache) > CATALOG_CACHE_SIZE:
+        _catalog_cache.popitem(last=False)
+    logger.info(f"Построен индекс каталога версии {version[:8]}: {catalog.size} товаров")
+    return catalog
@@ -1,8 +1,9 @@
 import logging
-from telegram import Bot
 from telegram.constants import ParseMode
+from telegram.ext import ExtBot
 from services.config_service import config_service
-import asyncio
+from services.telegram_outbound import Priority, outbound_scheduler
+from services.log_digest import LogDigest
 
 logger = logging.getLogger(__name__)
 
@@ -11,69 +12,39 @@ class ChannelLogger:
         """Initialize the channel logger."""
         try:
             config = config_service
-            self.bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
+            # Темп отправки задает общий планировщик исходящих сообщений
+            self.bot = ExtBot(token=config.TELEGRAM_BOT_TOKEN, rate_limiter=outbound_scheduler)
             self.log_channel_id = config.TELEGRAM_LOG_CHANNEL_ID
-            self._message_queue = asyncio.Queue()
-            self._is_processing = False
+            # Записи копятся и уходят в канал сводками, а не по одной
+            self.digest = LogDigest(self._send, window=30.0)
             logger.info(f"ChannelLogger initialized with channel ID: {self.log_channel_id}")
         except Exception as e:
             logger.error(f"Error initializing ChannelLogger: {e}")
             raise
     
-    async def _process_queue(self):
-        """Process messages in the queue."""
-        if self._is_processing:
-            logger.debug("Queue is already being processed")
-            return
-        
-        self._is_processing = True
-        logger.info("Starting to process message queue")
-        try:
-            while not self._message_queue.empty():
-                message = await self._message_queue.get()
-                try:
-                    logger.info(f"Attempting to send message to channel {self.log_channel_id}")
-                    result = await self.bot.send_message(
-                        chat_id=self.log_channel_id,
-                        text=message,
-                        parse_mode=ParseMode.HTML
-                    )
-                    logger.info(f"Message sent successfully: {result.message_id}")
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"Failed to send message to channel: {str(e)}")
-                    try:
-                        error_message = (
-                            "⚠️ Error in bot logging system:\n"
-                            f"Channel ID: {self.log_channel_id}\n"
-                            f"Error: {str(e)}\n"
-                            "Please check bot permissions in the channel"
-                        )
-                        await self.bot.send_message(
-                            chat_id=self.log_channel_id,
-                            text=error_message
-                        )
-                    except Exception as inner_e:
-                        logger.error(f"Failed to send error message: {str(inner_e)}")
-                finally:
-                    self._message_queue.task_done()
-        finally:
-            self._is_processing = False
-            logger.info("Finished processing message queue")
+    async def _send(self, topic_id, text: str, reply_markup=None):
+        """Send a digest message to the channel."""
+        result = await self.bot.send_message(
+            chat_id=self.log_channel_id,
+            text=text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup,
+            rate_limit_args={'priority': Priority.LOG}
+        )
+        logger.info(f"Message sent successfully: {result.message_id}")
+        return result.message_id
     
     async def log_message(self, user_message, bot_response):
         """Log a message to the channel."""
         try:
             user = user_message.from_user
             log_text = (
-                f"👤 <b>User:</b> {user.first_name} ({user.id})\n"
-                f"📝 <b>Message:</b> {user_message.text}\n"
-                f"🤖 <b>Response:</b> {bot_response}\n"
-                f"⏰ <b>Time:</b> {user_message.date.strftime('%Y-%m-%d %H:%M:%S')}"
+                f"📝 Message: {user_message.text}\n"
+                f"🤖 Response: {bot_response}\n"
+                f"⏰ Time: {user_message.date.strftime('%Y-%m-%d %H:%M:%S')}"
             )
             
-            await self._message_queue.put(log_text)
-            asyncio.create_task(self._process_queue())
+            await self.digest.add(None, title=f"👤 {user.first_name} ({user.id})", text=log_text, with_buttons=False)
             logger.info(f"Message from user {user.id} queued for logging")
             
         except Exception as e:
@@ -113,22 +113,21 @@ class ConfigService:
             Optional[str]: Значение конфигурации или None, если не найдено
         """
         try:
-            logger.info(f"Getting config for key: {key}, service: {service_name}")
-            
             if not service_name:
                 logger.warning(f"Service name not provided for key {key}")
                 return None
             
             # Получаем учетные данные сервиса
             credentials = self._get_service_credentials(service_name)
-            logger.info(f"Retrieved credentials for service {service_name}: {list(credentials.keys())}")
             
             # Возвращаем значение по ключу
             value = credentials.get(key)
             if value is None:
-                logger.warning(f"No value found for key {key} in service {service_name}")
+                # Необязательные настройки читаются на каждом запросе - без повторов в логе
+                logger.info("No value found for key %s in service %s", key, service_name,
+                            extra={'sample': f"config_missing:{service_name}:{key}"})
             else:
-                logger.info(f"Successfully retrieved value for key {key}")
+                logger.debug("Retrieved value for key %s in service %s", key, service_name)
             
             return value
             
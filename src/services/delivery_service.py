@@ -0,0 +1,287 @@
+"""
+Зоны доставки и расчет стоимости без внешнего геокодера.
+Полигоны зон и тарифы загружаются из src/config/delivery_zones.json,
+адреса Астаны - из локальной таблицы src/config/astana_addresses.json.
+По зонам строится равномерная сетка: ячейка хранит только те зоны,
+которые ее пересекают, поэтому точка определяется за несколько микросекунд.
+"""
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
+ZONES_FILE = os.path.join(CONFIG_DIR, 'delivery_zones.json')
+ADDRESSES_FILE = os.path.join(CONFIG_DIR, 'astana_addresses.json')
+
+# Казахские буквы приводим к русским, чтобы "Қосшы" и "Косшы" совпадали
+KAZAKH_LETTERS = str.maketrans('әғқңөұүһіё', 'агкноуухие')
+
+# Слова, которые не входят в название улицы
+STREET_PREFIXES = re.compile(
+    r'\b(г|город|астана|нур-султан|ул|улица|пр|пр-т|просп|проспект|шоссе|ш|мкр|микрорайон|'
+    r'даңғылы|дангылы|кошеси|көшесі|д|дом|кв|квартира)\b\.?'
+)
+COORDINATES_RE = re.compile(r'(-?\d{1,2}\.\d+)\s*[,; ]\s*(-?\d{1,3}\.\d+)')
+HOUSE_RE = re.compile(r'\d+\S*')
+
+
+@dataclass
+class DeliveryZone:
+    """Зона доставки: полигон из точек (широта, долгота) и тариф"""
+    name: str
+    price: int
+    estimated_time: str
+    polygon: np.ndarray
+
+    def __post_init__(self):
+        self.polygon = np.asarray(self.polygon, dtype=np.float64)
+        self.lat_min, self.lon_min = self.polygon.min(axis=0)
+        self.lat_max, self.lon_max = self.polygon.max(axis=0)
+        # Ребра полигона в виде массивов для векторной проверки
+        self._lat1 = self.polygon[:, 0]
+        self._lon1 = self.polygon[:, 1]
+        self._lat2 = np.roll(self._lat1, -1)
+        self._lon2 = np.roll(self._lon1, -1)
+        self._edges = list(zip(self._lat1.tolist(), self._lon1.tolist(),
+                               self._lat2.tolist(), self._lon2.tolist()))
+
+    def contains(self, lat: float, lon: float) -> bool:
+        """Проверка точки методом луча"""
+        if not (self.lat_min <= lat <= self.lat_max and self.lon_min <= lon <= self.lon_max):
+            return False
+        inside = False
+        for lat1, lon1, lat2, lon2 in self._edges:
+            if (lat1 > lat) != (lat2 > lat):
+                if lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                    inside = not inside
+        return inside
+
+    def contains_many(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Векторная проверка массива точек методом луча"""
+        inside = np.zeros(len(lats), dtype=bool)
+        for lat1, lon1, lat2, lon2 in self._edges:
+            if lat1 == lat2:
+                continue
+            crosses = (lat1 > lats) != (lat2 > lats)
+            edge_lon = lon1 + (lats - lat1) * (lon2 - lon1) / (lat2 - lat1)
+            inside ^= crosses & (lons < edge_lon)
+        return inside
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'zone': self.name,
+            'price': self.price,
+            'estimated_time': self.estimated_time
+        }
+
+
+class ZoneGrid:
+    """
+    Равномерная сетка над зонами. Зоны упорядочены по приоритету
+    (первая в конфиге - самая приоритетная), вложенная зона "Центр"
+    перекрывает внешнюю "Город".
+    """
+
+    def __init__(self, zones: List[DeliveryZone], cell_size: float = 0.01):
+        self.zones = zones
+        self.cell_size = cell_size
+
+        if zones:
+            self.lat_min = min(zone.lat_min for zone in zones)
+            self.lon_min = min(zone.lon_min for zone in zones)
+            lat_max = max(zone.lat_max for zone in zones)
+            lon_max = max(zone.lon_max for zone in zones)
+        else:
+            self.lat_min = self.lon_min = lat_max = lon_max = 0.0
+
+        self.rows = int((lat_max - self.lat_min) / cell_size) + 1
+        self.cols = int((lon_max - self.lon_min) / cell_size) + 1
+
+        # Для каждой ячейки - кандидаты по пересечению с рамкой зоны и номер зоны,
+        # целиком покрывающей ячейку (-1, если такой нет). Кандидаты после нее не нужны.
+        self.cells: List[Tuple[Tuple[int, ...], int]] = []
+        for row in range(self.rows):
+            for col in range(self.cols):
+                self.cells.append(self._cell_candidates(row, col))
+
+    def _cell_candidates(self, row: int, col: int) -> Tuple[Tuple[int, ...], int]:
+        lat0 = self.lat_min + row * self.cell_size
+        lon0 = self.lon_min + col * self.cell_size
+        lat1, lon1 = lat0 + self.cell_size, lon0 + self.cell_size
+
+        candidates = []
+        for index, zone in enumerate(self.zones):
+            if zone.lat_max < lat0 or zone.lat_min > lat1 or zone.lon_max < lon0 or zone.lon_min > lon1:
+                continue
+            candidates.append(index)
+            if self._covers_cell(zone, lat0, lon0, lat1, lon1):
+                return tuple(candidates), index
+        return tuple(candidates), -1
+
+    @staticmethod
+    def _covers_cell(zone: DeliveryZone, lat0: float, lon0: float, lat1: float, lon1: float) -> bool:
+        """Ячейка целиком внутри зоны: все углы внутри и ни одна вершина полигона не попала в ячейку"""
+        corners = [(lat0, lon0), (lat0, lon1), (lat1, lon0), (lat1, lon1)]
+        if not all(zone.contains(lat, lon) for lat, lon in corners):
+            return False
+        vertices = zone.polygon
+        return not np.any((vertices[:, 0] >= lat0) & (vertices[:, 0] <= lat1) &
+                          (vertices[:, 1] >= lon0) & (vertices[:, 1] <= lon1))
+
+    def locate(self, lat: float, lon: float) -> Optional[DeliveryZone]:
+        """Зона, в которую попадает точка, или None"""
+        row = int((lat - self.lat_min) // self.cell_size)
+        col = int((lon - self.lon_min) // self.cell_size)
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+
+        candidates, covering = self.cells[row * self.cols + col]
+        for index in candidates:
+            # Зона, покрывающая ячейку целиком, не требует проверки полигона
+            if index == covering or self.zones[index].contains(lat, lon):
+                return self.zones[index]
+        return None
+
+    def locate_many(self, lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+        """
+        Номера зон для массива точек (-1 - вне зон доставки).
+        Точки проверяются векторно, зона за зоной в порядке приоритета.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), -1, dtype=np.int32)
+
+        for index, zone in enumerate(self.zones):
+            pending = np.flatnonzero(
+                (result < 0) &
+                (lats >= zone.lat_min) & (lats <= zone.lat_max) &
+                (lons >= zone.lon_min) & (lons <= zone.lon_max)
+            )
+            if not len(pending):
+                continue
+            inside = zone.contains_many(lats[pending], lons[pending])
+            result[pending[inside]] = index
+        return result
+
+
+class AddressBook:
+    """Локальная таблица адрес -> координаты для Астаны"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.streets: Dict[str, Tuple[float, float]] = {}
+        for entry in entries:
+            point = (float(entry['lat']), float(entry['lon']))
+            for name in [entry['street']] + entry.get('aliases', []):
+                self.streets[self.normalize(name)] = point
+        # Длинные названия проверяем первыми: "керей жанибек хандар" раньше "керей"
+        self._by_length = sorted(self.streets, key=len, reverse=True)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Нижний регистр, без казахских букв, типов улиц и номеров домов"""
+        text = str(text).lower().translate(KAZAKH_LETTERS)
+        text = STREET_PREFIXES.sub(' ', text)
+        text = HOUSE_RE.sub(' ', text)
+        text = re.sub(r'[^\w\s-]', ' ', text)
+        return ' '.join(text.split())
+
+    def geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """Координаты по адресу или None, если улицы нет в таблице"""
+        match = COORDINATES_RE.search(address)
+        if match:
+            return float(match.group(1)), float(match.group(2))
+
+        normalized = self.normalize(address)
+        if not normalized:
+            return None
+        if normalized in self.streets:
+            return self.streets[normalized]
+
+        # Адрес с лишними словами ("Астана, Кабанбай батыра 11, ЖК Highvill")
+        padded = f" {normalized} "
+        for street in self._by_length:
+            if f" {street} " in padded:
+                return self.streets[street]
+        return None
+
+
+class DeliveryService:
+    """Проверка доставки по адресу или координатам"""
+
+    def __init__(self, zones_file: str = ZONES_FILE, addresses_file: str = ADDRESSES_FILE):
+        with open(zones_file, encoding='utf-8') as f:
+            config = json.load(f)
+        with open(addresses_file, encoding='utf-8') as f:
+            addresses = json.load(f)
+
+        zones = [
+            DeliveryZone(zone['name'], int(zone['price']), zone['estimated_time'], zone['polygon'])
+            for zone in config.get('zones', [])
+        ]
+        self.grid = ZoneGrid(zones, config.get('grid_cell_size', 0.01))
+        self.addresses = AddressBook(addresses)
+
+        # Время доставки клиент указывает по часам магазина, а не сервера
+        self.timezone = ZoneInfo(config.get('timezone', 'Asia/Almaty'))
+        hours = config.get('working_hours', {})
+        self.work_start = datetime.strptime(hours.get('start', '00:00'), '%H:%M').time()
+        self.work_end = datetime.strptime(hours.get('end', '23:59'), '%H:%M').time()
+        logger.info(f"Загружено зон доставки: {len(zones)}, адресов: {len(self.addresses.streets)}")
+
+    def zone_for_point(self, lat: float, lon: float) -> Optional[DeliveryZone]:
+        return self.grid.locate(lat, lon)
+
+    def zones_for_points(self, points: Sequence[Tuple[float, float]]) -> List[Optional[Dict[str, Any]]]:
+        """Пакетный расчет для планирования маршрутов: зона и тариф для каждой точки"""
+        if not len(points):
+            return []
+        coords = np.asarray(points, dtype=np.float64)
+        indexes = self.grid.locate_many(coords[:, 0], coords[:, 1])
+        return [self.grid.zones[i].to_dict() if i >= 0 else None for i in indexes.tolist()]
+
+    def _check_time(self, delivery_time: Optional[str]) -> Optional[str]:
+        """Текст причины отказа или None, если время подходит"""
+        if not delivery_time:
+            return None
+        try:
+            requested = datetime.strptime(delivery_time, '%Y-%m-%d %H:%M').replace(tzinfo=self.timezone)
+        except ValueError:
+            return "Неверный формат времени, нужен YYYY-MM-DD HH:MM"
+        if requested < datetime.now(self.timezone):
+            return "Указанное время уже прошло"
+        if not (self.work_start <= requested.time() <= self.work_end):
+            return (f"Доставляем с {self.work_start.strftime('%H:%M')} "
+                    f"до {self.work_end.strftime('%H:%M')}")
+        return None
+
+    def check(self, address: str, delivery_time: Optional[str] = None) -> Dict[str, Any]:
+        """Возможность, стоимость и срок доставки по адресу"""
+        point = self.addresses.geocode(address)
+        if point is None:
+            return {
+                'available': None,
+                'message': "Не удалось определить адрес, менеджер уточнит стоимость доставки"
+            }
+
+        zone = self.grid.locate(*point)
+        if zone is None:
+            return {'available': False, 'message': "Адрес вне зоны доставки"}
+
+        result = {'available': True, **zone.to_dict()}
+        reason = self._check_time(delivery_time)
+        if reason:
+            result.update(available=False, message=reason)
+        return result
+
+
+# Создаем глобальный экземпляр
+delivery_service = DeliveryService()
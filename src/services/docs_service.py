@@ -10,6 +10,7 @@ from googleapiclient.discovery import build
 import psycopg2
 from psycopg2.extras import DictCursor
 from typing import Optional
+from services.catalog_index import CatalogIndex, get_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -747,11 +748,15 @@ class DocsService:
             logger.error(f"Error getting relevant knowledge: {e}")
             return "Произошла ошибка при поиске информации"
 
-    async def get_response(self, query: str, inventory_data: list = None) -> str:
-        """Получает ответ на запрос пользователя"""
+    async def get_response(self, query: str, inventory_data: list = None, catalog: CatalogIndex = None) -> str:
+        """Получает ответ на запрос пользователя
+
+        catalog - готовый индекс каталога для inventory_data; если не передан,
+        берется из кэша индексов по версии инвентаря.
+        """
         try:
-            logger.info(f"Получен запрос: {query}")
-            logger.info(f"Данные инвентаря:\n{inventory_data}")
+            logger.info("Получен запрос: %s", query)
+            logger.debug("Данные инвентаря:\n%s", inventory_data)
 
             # Проверяем запрос на наличие ключевых слов о товарах
             product_keywords = ['цена', 'стоимость', 'сколько стоит', 'купить', 'заказать', 'есть ли в наличии', 'остаток', 'что есть']
@@ -773,17 +778,18 @@ class DocsService:
                         response += "\n\n"
                     return response
                 
-                # Если запрос о конкретном товаре
-                for item in inventory_data or []:
-                    if item['name'].lower() in query.lower():
-                        response = (
-                            f"🌸 {item['name']}\n"
-                            f"💰 Цена: {item['price']}\n"
-                            f"📦 В наличии: {item['quantity']} шт."
-                        )
-                        if item['description']:
-                            response += f"\n📝 Описание: {item['description']}"
-                        return response
+                # Если запрос о конкретном товаре - кандидаты берем из индекса слов названий
+                if inventory_data and catalog is None:
+                    catalog = get_catalog(inventory_data)
+                for item in catalog.names_in_text(query) if catalog else []:
+                    response = (
+                        f"🌸 {item['name']}\n"
+                        f"💰 Цена: {item['price']}\n"
+                        f"📦 В наличии: {item['quantity']} шт."
+                    )
+                    if item['description']:
+                        response += f"\n📝 Описание: {item['description']}"
+                    return response
                 
                 return "Извините, я не нашел такой товар в нашем каталоге. Хотите посмотреть весь ассортимент?"
             
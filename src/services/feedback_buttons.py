@@ -1,7 +1,8 @@
-import requests
 import logging
 import json
 import time
+from services.http_client import http_client
+from services.telegram_outbound import telegram_request
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,7 +29,8 @@ class FeedbackService:
 
         try:
             # Сначала удаляем старое сообщение, если оно есть
-            response = requests.post(
+            response = http_client.sync_request(
+                "POST",
                 f"{self.base_url}/sendMessage",
                 json={
                     "chat_id": self.chat_id,
@@ -46,6 +48,30 @@ class FeedbackService:
         except Exception as e:
             logger.error(f"Исключение при отправке сообщения: {str(e)}")
 
+    async def send_message_with_buttons_async(self, topic_id: int, text: str) -> None:
+        """Асинхронная версия send_message_with_buttons через общий HTTP-пул"""
+        keyboard = {
+            "inline_keyboard": [[
+                {"text": "👍", "callback_data": f"like_{topic_id}"},
+                {"text": "👎", "callback_data": f"dislike_{topic_id}"}
+            ]]
+        }
+
+        try:
+            result = await telegram_request(self.base_url, "sendMessage", {
+                "chat_id": self.chat_id,
+                "message_thread_id": topic_id,
+                "text": f"{text}\n\n_Пожалуйста, оцените это сообщение:_",
+                "reply_markup": keyboard,
+                "parse_mode": "Markdown"
+            })
+            if result.get("ok"):
+                logger.info(f"Сообщение с кнопками отправлено в тему {topic_id}")
+            else:
+                logger.error(f"Ошибка при отправке сообщения: {result}")
+        except Exception as e:
+            logger.error(f"Исключение при отправке сообщения: {str(e)}")
+
 def main():
     service = FeedbackService()
     
@@ -1,42 +1,33 @@
+import asyncio
 import logging
 from typing import Dict, Optional, Tuple
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from services.config_service import ConfigService
 from services.postgres_service import PostgresService
+from services.telegram_metadata import TelegramMetadata, telegram_metadata
 
 logger = logging.getLogger(__name__)
 
 class FeedbackService:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, metadata: Optional[TelegramMetadata] = None):
         self.bot = bot
         self.config = ConfigService()
         self.db = PostgresService()
-        self.topics = {}  # Инициализируем пустым словарем
+        # Темы форума берутся из общего реестра метаданных
+        self.metadata = metadata or telegram_metadata
+
+    @property
+    def topics(self) -> Dict[str, int]:
+        return self.metadata.topics
 
     async def initialize(self):
         """Асинхронная инициализация"""
         await self._load_topics()
 
     async def _load_topics(self):
-        """Загрузка тем форума напрямую из Telegram"""
-        try:
-            chat_id = await self.config.get_config_async('log_group_id', service='telegram')
-            forum_topics = await self.bot.get_forum_topics(chat_id=chat_id)
-            
-            logger.info(f"Получаем темы из группы {chat_id}")
-            self.topics = {}
-            
-            for topic in forum_topics:
-                self.topics[topic.name] = topic.message_thread_id
-                logger.info(f"Загружена тема: {topic.name} (ID: {topic.message_thread_id})")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке тем форума: {str(e)}", exc_info=True)
-            # Если не удалось загрузить из Telegram, используем темы из базы
-            query = "SELECT topic_id, name FROM forum_topics;"
-            result = await self.db.fetch_all(query)
-            self.topics = {row['name']: row['topic_id'] for row in result}
-            logger.info(f"Загружены темы из базы: {self.topics}")
+        """Загрузка тем форума из реестра метаданных"""
+        await self.metadata.ensure_loaded()
+        logger.info(f"Загружены темы: {self.topics}")
 
     async def add_feedback_buttons(self, chat_id: str, topic_id: Optional[int], message_id: int) -> None:
         """Добавляет кнопки для оценки к сообщению в логах"""
@@ -191,9 +182,59 @@ class FeedbackService:
             logger.error(f"Ошибка при обработке дизлайка: {str(e)}", exc_info=True)
             return False, "Произошла ошибка при обработке оценки"
 
+    async def apply_feedback(self, chat_id: str, message_id: int, orig_message_id: int,
+                             topic_id: Optional[int], action: str) -> bool:
+        """
+        Пересылка с комментарием и смена кнопок выполняются одновременно.
+        Кнопки меняются сразу, не дожидаясь пересылки; при ошибке вызывающий их восстанавливает.
+        """
+        handler = self.handle_like if action == "like" else self.handle_dislike
+        forwarded, edited = await asyncio.gather(
+            handler(chat_id, orig_message_id, topic_id),
+            self.update_message_buttons(chat_id, message_id, topic_id, action),
+            return_exceptions=True
+        )
+        # Результат определяет только пересылка; сбой смены кнопок лишь логируем
+        if isinstance(edited, BaseException):
+            logger.error(f"Ошибка при обновлении кнопок: {str(edited)}")
+        if isinstance(forwarded, BaseException):
+            raise forwarded
+        success, _ = forwarded
+        return success
+
+    async def handle_entry_feedback(self, chat_id: str, action: str, entry_html: str) -> Tuple[bool, str]:
+        """Обрабатывает оценку записи из сводки логов: копирует запись в нужную тему"""
+        try:
+            if action == "like":
+                topic_name, comment = '🎓 Обучение бота', "✅ Хороший пример ответа"
+                response_text = "Спасибо за положительную оценку! 👍"
+            else:
+                topic_name, comment = '🐛 Ошибки и баги', "❌ Ответ требует доработки"
+                response_text = "Спасибо за отзыв! Мы улучшим ответы 👍"
+
+            topic_id = await self.get_topic_id(topic_name)
+            if not topic_id:
+                logger.error(f"Не найдена тема '{topic_name}'")
+                return False, "Ошибка: тема не найдена"
+
+            # Сводку целиком пересылать нельзя - в ней чужие записи, поэтому
+            # отправляем только оцененную запись одним сообщением
+            await self.bot.send_message(
+                chat_id=chat_id,
+                message_thread_id=topic_id,
+                text=f"{comment}\n\n{entry_html}",
+                parse_mode="HTML"
+            )
+            logger.info(f"Запись из сводки отправлена в тему {topic_name}")
+            return True, response_text
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке оценки записи: {str(e)}", exc_info=True)
+            return False, "Произошла ошибка при обработке оценки"
+
     async def send_to_logs(self, message: str) -> None:
         """Отправка сообщения в тему логов"""
-        log_topic_id = self.topics.get('📝 Логи')
+        log_topic_id = self.metadata.topic_id('📝 Логи')
         if not log_topic_id:
             logger.error("ID темы логов не найден")
             return
@@ -202,10 +243,4 @@ class FeedbackService:
 
     async def get_topic_id(self, topic_name: str) -> Optional[int]:
         """Получает ID темы по её имени"""
-        try:
-            if not self.topics:
-                await self._load_topics()
-            return self.topics.get(topic_name)
-        except Exception as e:
-            logger.error(f"Ошибка при получении ID темы: {str(e)}")
-            return None
+        return self.metadata.topic_id(topic_name)
@@ -0,0 +1,274 @@
+"""
+Общий HTTP-клиент для обращений к внешним API (Telegram Bot API, Graph API).
+Одна aiohttp-сессия на процесс: пул соединений с ограничением на хост,
+keep-alive, кэш DNS, таймауты на соединение и чтение, повтор запроса
+при сетевых ошибках и 5xx. По умолчанию повторяются только идемпотентные
+методы: POST мог дойти до сервера, и его повтор отправит сообщение дважды.
+Для синхронных утилит - requests.Session с тем же пулом и таймаутами.
+
+Статистика по хостам: число запросов, новые и переиспользованные
+соединения, задержка (среднее, p95), повторы и ошибки.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, FrozenSet, List, Mapping, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+
+# Методы, которые можно повторять без риска выполнить действие дважды
+IDEMPOTENT_METHODS: FrozenSet[str] = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+# Хук повтора: (attempt, method, url, reason) -> None
+RetryHook = Callable[[int, str, str, str], None]
+
+
+@dataclass
+class HttpResponse:
+    """Прочитанный ответ; соединение к этому моменту уже вернулось в пул"""
+    status: int
+    headers: Mapping[str, str]
+    body: bytes
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    @property
+    def text(self) -> str:
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        """Тело как JSON; None, если тело не JSON"""
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+
+@dataclass
+class HostStats:
+    """Счетчики запросов к одному хосту"""
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    # Последние задержки в секундах
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.latencies)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        connections = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_rate': round(self.connections_reused / connections, 3) if connections else 0.0,
+            'avg_ms': round(sum(recent) / len(recent) * 1000, 1) if recent else 0.0,
+            'p95_ms': round(p95 * 1000, 1)
+        }
+
+
+class HttpClient:
+    """
+    Фабрика общей HTTP-сессии.
+
+    Args:
+        limit: Всего соединений в пуле
+        limit_per_host: Соединений на один хост
+        connect_timeout: Таймаут установки соединения, секунд
+        read_timeout: Таймаут чтения между пакетами, секунд
+        total_timeout: Общий таймаут запроса, секунд
+        dns_ttl: Сколько секунд кэшировать DNS
+        keepalive_timeout: Сколько держать простаивающее соединение
+        max_retries: Повторов идемпотентного запроса после сетевой ошибки или статуса из RETRY_STATUSES
+        backoff: Базовая пауза между повторами (удваивается)
+        max_retry_delay: Потолок паузы, в том числе из заголовка Retry-After
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, connect_timeout: float = 5.0,
+                 read_timeout: float = 20.0, total_timeout: float = 30.0, dns_ttl: int = 300,
+                 keepalive_timeout: float = 30.0, max_retries: int = 2, backoff: float = 0.5,
+                 max_retry_delay: float = 30.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout,
+                                             sock_read=read_timeout)
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_delay = max_retry_delay
+
+        self.retry_hooks: List[RetryHook] = []
+        self.stats: Dict[str, HostStats] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_session: Optional[requests.Session] = None
+
+    def _host_stats(self, host: Optional[str]) -> HostStats:
+        host = host or 'unknown'
+        if host not in self.stats:
+            self.stats[host] = HostStats()
+        return self.stats[host]
+
+    def add_retry_hook(self, hook: RetryHook) -> None:
+        """Хук вызывается перед каждым повтором запроса"""
+        self.retry_hooks.append(hook)
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx: SimpleNamespace, params):
+            ctx.host = params.url.host
+
+        async def on_connection_create_end(session, ctx: SimpleNamespace, params):
+            self._host_stats(getattr(ctx, 'host', None)).connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx: SimpleNamespace, params):
+            self._host_stats(getattr(ctx, 'host', None)).connections_reused += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Общая сессия текущего event loop; создается при первом обращении"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Сессия привязана к loop, в котором создана: в новом loop (asyncio.run в утилитах
+            # и тестах) старая сессия непригодна, закрыть ее там уже нельзя
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()]
+            )
+            self._loop = loop
+        return self._session
+
+    def _retry_delay(self, attempt: int, headers: Optional[Mapping[str, str]] = None) -> float:
+        retry_after = (headers or {}).get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_retry_delay)
+            except ValueError:
+                pass
+        return min(self.backoff * (2 ** attempt), self.max_retry_delay)
+
+    def _notify_retry(self, attempt: int, method: str, url: str, reason: str) -> None:
+        for hook in self.retry_hooks:
+            try:
+                hook(attempt, method, url, reason)
+            except Exception as e:
+                logger.error(f"Retry hook failed: {e}")
+
+    async def request(self, method: str, url: str, *, retries: Optional[int] = None,
+                      retry_statuses: FrozenSet[int] = RETRY_STATUSES, **kwargs) -> HttpResponse:
+        """
+        Выполняет запрос и читает тело целиком.
+        Без явного retries повторяются только методы из IDEMPOTENT_METHODS;
+        POST повторяется, только если вызывающий передал retries сам.
+        Сетевые ошибки после последней попытки пробрасываются (aiohttp.ClientError, asyncio.TimeoutError);
+        ответ с ошибочным статусом возвращается как есть.
+        """
+        if retries is None:
+            retries = self.max_retries if method.upper() in IDEMPOTENT_METHODS else 0
+        session = await self.session()
+        host = URL(url).host
+        stats = self._host_stats(host)
+
+        for attempt in range(retries + 1):
+            started = time.monotonic()
+            stats.requests += 1
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    body = await response.read()
+                    result = HttpResponse(response.status, response.headers, body, time.monotonic() - started)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats.errors += 1
+                if attempt == retries:
+                    logger.error(f"{method} {host} failed after {attempt + 1} attempts: {e!r}")
+                    raise
+                stats.retries += 1
+                self._notify_retry(attempt + 1, method, url, repr(e))
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+
+            stats.latencies.append(result.elapsed)
+            if result.status not in retry_statuses or attempt == retries:
+                return result
+
+            stats.retries += 1
+            self._notify_retry(attempt + 1, method, url, f"HTTP {result.status}")
+            await asyncio.sleep(self._retry_delay(attempt, result.headers))
+        return result
+
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request('POST', url, **kwargs)
+
+    def sync_session(self) -> requests.Session:
+        """requests.Session с пулом соединений для синхронных утилит"""
+        if self._sync_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.limit, pool_maxsize=self.limit_per_host)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._sync_session = session
+        return self._sync_session
+
+    def sync_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Синхронный запрос через общий пул; таймауты те же, что у aiohttp-сессии"""
+        kwargs.setdefault('timeout', (self.timeout.connect, self.timeout.sock_read))
+        started = time.monotonic()
+        stats = self._host_stats(requests.utils.urlparse(url).hostname)
+        stats.requests += 1
+        try:
+            response = self.sync_session().request(method, url, **kwargs)
+        except requests.RequestException:
+            stats.errors += 1
+            raise
+        stats.latencies.append(time.monotonic() - started)
+        return response
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
+        if self._sync_session:
+            self._sync_session.close()
+            self._sync_session = None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {host: stats.to_dict() for host, stats in self.stats.items()}
+
+
+# Создаем глобальный экземпляр
+http_client = HttpClient()
@@ -4,19 +4,31 @@
 """
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
 
-import requests
 from supabase import create_client, Client
 
+from services.http_client import http_client
+from services.instagram_sync import ConversationSync, GraphPager
+from services.instagram_tokens import InstagramTokenCache, instagram_tokens
+
 logger = logging.getLogger(__name__)
 
 class InstagramService:
-    def __init__(self):
+    def __init__(self, tokens: Optional[InstagramTokenCache] = None):
         """Инициализация сервиса Instagram"""
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self._supabase: Optional[Client] = None
+        # Токены страниц - только в общем для процесса кэше, где известен их срок;
+        # синхронные методы берут оттуда еще действующий токен, а своего кэша не держат
+        self.tokens = tokens or instagram_tokens
+
+    @property
+    def supabase(self) -> Client:
+        if self._supabase is None:
+            self._supabase = create_client(self.supabase_url, self.supabase_key)
+        return self._supabase
 
     def get_credentials(self) -> Dict[str, str]:
         """Получение учетных данных Instagram из базы"""
@@ -32,6 +44,9 @@ class InstagramService:
 
     def get_page_access_token(self, page_id: str) -> Optional[str]:
         """Получение токена доступа к странице Instagram"""
+        cached = self.tokens.cached_page_token(page_id)
+        if cached:
+            return cached
         try:
             credentials = self.get_credentials()
             access_token = credentials.get("access_token")
@@ -46,7 +61,7 @@ class InstagramService:
                 "access_token": access_token
             }
             
-            response = requests.get(url, params=params)
+            response = http_client.sync_request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("access_token")
@@ -71,7 +86,7 @@ class InstagramService:
                 "access_token": access_token
             }
             
-            response = requests.get(url, params=params)
+            response = http_client.sync_request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json().get("instagram_business_account", {}).get("id")
@@ -93,7 +108,7 @@ class InstagramService:
                 "fields": "messages{message,from,created_time}"
             }
             
-            response = requests.get(url, params=params)
+            response = http_client.sync_request("GET", url, params=params)
             response.raise_for_status()
             
             return response.json()
@@ -116,7 +131,9 @@ class InstagramService:
                     "credential_value": value,
                     "description": f"Instagram {key}"
                 }).execute()
-                
+            
+            # Старые токены больше не действительны
+            self.tokens.invalidate()
             return True
             
         except Exception as e:
@@ -135,9 +152,71 @@ class InstagramService:
             url = "https://graph.facebook.com/v18.0/me"
             params = {"access_token": access_token}
             
-            response = requests.get(url, params=params)
+            response = http_client.sync_request("GET", url, params=params)
             return response.status_code == 200
             
         except Exception as e:
             logger.error(f"Ошибка при проверке учетных данных: {e}")
             return False
+
+    async def get_page_access_token_async(self, page_id: Optional[str] = None) -> Optional[str]:
+        """Токен страницы из общего кэша; Graph API вызывается только при первом запросе и перед истечением"""
+        return await self.tokens.page_token(page_id)
+
+    async def get_instagram_business_id_async(self, page_id: Optional[str] = None) -> Optional[str]:
+        """ID бизнес-аккаунта из общего кэша"""
+        return await self.tokens.business_id(page_id)
+
+    async def get_page_messages_async(self, page_id: str) -> Optional[Dict[str, Any]]:
+        """Асинхронная версия get_page_messages"""
+        try:
+            page_token = await self.get_page_access_token_async(page_id)
+            if not page_token:
+                return None
+                
+            response = await http_client.get(f"https://graph.facebook.com/v18.0/{page_id}/conversations", params={
+                "access_token": page_token,
+                "fields": "messages{message,from,created_time}"
+            })
+            if response.status in (400, 401):
+                # Токен отозван раньше срока
+                self.tokens.invalidate(page_id)
+            if not response.ok:
+                raise RuntimeError(f"Graph API {response.status}: {response.text}")
+            return response.json()
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении сообщений: {e}")
+            return None
+
+    def pager(self, page_size: int = 100) -> GraphPager:
+        """Постраничное чтение Graph API с токеном страницы из кэша"""
+        return GraphPager(self.tokens.page_token, page_size=page_size)
+
+    async def iter_page_messages(self, page_id: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Все сообщения страницы по одной странице за раз: (conversation_id, message)"""
+        async for item in self.pager().iter_messages(page_id):
+            yield item
+
+    async def sync_conversations(self, db, page_id: str, concurrency: int = 4,
+                                 batch_size: int = 500) -> Dict[str, int]:
+        """Выгрузка истории диалогов в базу; повторный вызов продолжает с сохраненных курсоров"""
+        sync = ConversationSync(db, self.pager(), page_id, concurrency=concurrency, batch_size=batch_size)
+        return await sync.run()
+
+    async def check_credentials_async(self) -> bool:
+        """Асинхронная версия check_credentials"""
+        try:
+            credentials = await self.tokens.credentials()
+            access_token = credentials.get("access_token")
+            
+            if not access_token:
+                return False
+                
+            response = await http_client.get("https://graph.facebook.com/v18.0/me",
+                                              params={"access_token": access_token})
+            return response.status == 200
+            
+        except Exception as e:
+            logger.error(f"Ошибка при проверке учетных данных: {e}")
+            return False
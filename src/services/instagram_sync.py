@@ -0,0 +1,281 @@
+"""
+Потоковая выгрузка истории диалогов Instagram в Postgres.
+Диалоги и сообщения читаются постранично по курсорам Graph API, несколько
+диалогов обрабатываются параллельно, строки пишутся в базу пачками.
+В памяти одновременно держатся только текущие страницы и одна пачка,
+поэтому расход памяти не зависит от объема истории.
+
+После каждой записанной страницы сохраняется курсор диалога: прерванная
+выгрузка продолжается с места остановки, а полностью выгруженные диалоги
+без новых сообщений пропускаются.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = "https://graph.facebook.com/v21.0"
+
+TokenProvider = Callable[[], Awaitable[Optional[str]]]
+
+
+def parse_graph_time(value: Optional[str]) -> Optional[datetime]:
+    """Время Graph API: 2024-03-04T10:09:53+0000"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        return None
+
+
+class GraphPager:
+    """
+    Постраничное чтение Graph API.
+
+    Args:
+        token: Функция, возвращающая токен страницы (например, InstagramTokenCache.page_token)
+        page_size: Сколько элементов запрашивать на страницу
+        graph_url: Адрес Graph API
+    """
+
+    def __init__(self, token: TokenProvider, page_size: int = 100, graph_url: str = GRAPH_API_URL):
+        self.token = token
+        self.page_size = page_size
+        self.graph_url = graph_url
+        self.requests = 0
+
+    async def iter_pages(self, path: str, fields: str, after: Optional[str] = None,
+                         **params) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """Страницы (элементы, курсор следующей страницы); курсор None - страница последняя"""
+        while True:
+            query = {'fields': fields, 'limit': self.page_size, 'access_token': await self.token(), **params}
+            if after:
+                query['after'] = after
+            response = await http_client.get(f"{self.graph_url}/{path}", params=query)
+            self.requests += 1
+            data = response.json() or {}
+            if not response.ok:
+                raise RuntimeError(f"Graph API {response.status}: {data.get('error', response.text)}")
+
+            paging = data.get('paging') or {}
+            after = (paging.get('cursors') or {}).get('after') if paging.get('next') else None
+            yield data.get('data', []), after
+            if not after:
+                return
+
+    async def iter_conversations(self, page_id: str) -> AsyncIterator[Dict[str, Any]]:
+        async for items, _ in self.iter_pages(f"{page_id}/conversations", 'id,updated_time', platform='instagram'):
+            for conversation in items:
+                yield conversation
+
+    def iter_message_pages(self, conversation_id: str, after: Optional[str] = None):
+        """Страницы сообщений диалога, от новых к старым"""
+        return self.iter_pages(f"{conversation_id}/messages", 'id,message,from,created_time', after=after)
+
+    async def iter_messages(self, page_id: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Все сообщения страницы по одному: (conversation_id, message)"""
+        async for conversation in self.iter_conversations(page_id):
+            async for items, _ in self.iter_message_pages(conversation['id']):
+                for message in items:
+                    yield conversation['id'], message
+
+
+@dataclass
+class _Chunk:
+    """Страница сообщений и курсор, который сохраняется после ее записи"""
+    conversation_id: str
+    rows: List[tuple]
+    cursor: Optional[str]
+    updated_time: Optional[str]
+    completed: bool
+
+
+class ConversationSync:
+    """
+    Выгрузка диалогов страницы в instagram_messages.
+
+    Args:
+        db: Сервис базы данных (PostgresService)
+        pager: GraphPager
+        page_id: ID страницы
+        concurrency: Сколько диалогов читать одновременно
+        batch_size: Сколько сообщений записывать одним запросом
+    """
+
+    def __init__(self, db, pager: GraphPager, page_id: str, concurrency: int = 4, batch_size: int = 500):
+        self.db = db
+        self.pager = pager
+        self.page_id = page_id
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.stats = {'conversations': 0, 'skipped': 0, 'pages': 0, 'messages': 0, 'inserted': 0, 'batches': 0}
+
+    async def load_checkpoints(self) -> Dict[str, Dict[str, Any]]:
+        rows = await self.db.fetch_all(
+            """
+            SELECT conversation_id, cursor, updated_time, completed
+            FROM public.instagram_sync_state WHERE page_id = $1
+            """,
+            self.page_id
+        )
+        return {row['conversation_id']: row for row in rows}
+
+    def _row(self, conversation_id: str, message: Dict[str, Any]) -> tuple:
+        sender = message.get('from') or {}
+        return (message['id'], conversation_id, self.page_id, sender.get('id'),
+                sender.get('username') or sender.get('name'), message.get('message'),
+                parse_graph_time(message.get('created_time')))
+
+    async def _read_conversation(self, conversation: Dict[str, Any], checkpoint: Optional[Dict[str, Any]],
+                                 out: "asyncio.Queue[Optional[_Chunk]]") -> None:
+        conversation_id = conversation['id']
+        updated_time = conversation.get('updated_time')
+        # Незавершенный диалог продолжаем с сохраненного курсора, завершенный
+        # с новыми сообщениями читаем с начала до первой уже выгруженной страницы
+        resumed = bool(checkpoint and not checkpoint['completed'] and checkpoint['cursor'])
+        after = checkpoint['cursor'] if resumed else None
+        known = bool(checkpoint and checkpoint['completed'])
+        # Пока продолжали с курсора, в диалог могли прийти новые сообщения:
+        # время не сохраняем, и следующая выгрузка дочитает их с начала
+        final_time = None if resumed else updated_time
+
+        async for items, cursor in self.pager.iter_message_pages(conversation_id, after=after):
+            self.stats['pages'] += 1
+            self.stats['messages'] += len(items)
+            rows = [self._row(conversation_id, message) for message in items]
+            if known and rows and await self._all_known([row[0] for row in rows]):
+                await out.put(_Chunk(conversation_id, [], None, final_time, True))
+                return
+            done = cursor is None
+            if known:
+                # Курсор не сохраняем: после сбоя диалог снова дочитывается с начала
+                # до выгруженных сообщений, а не проходится целиком от курсора
+                await out.put(_Chunk(conversation_id, rows, None,
+                                     final_time if done else checkpoint['updated_time'], True))
+            else:
+                await out.put(_Chunk(conversation_id, rows, cursor, final_time if done else None, done))
+
+    async def _all_known(self, message_ids: List[str]) -> bool:
+        row = await self.db.fetch_one(
+            "SELECT COUNT(*) AS known FROM public.instagram_messages WHERE message_id = ANY($1::text[])",
+            message_ids
+        )
+        return bool(row) and row['known'] == len(message_ids)
+
+    async def _write(self, chunks: List[_Chunk]) -> None:
+        """
+        Строки пачки и курсоры диалогов пишутся одним запросом: курсор
+        не может опередить данные, на которые указывает.
+        """
+        rows = [row for chunk in chunks for row in chunk.rows]
+        columns = [list(column) for column in zip(*rows)] if rows else [[]] * 7
+        # Для каждого диалога важен последний курсор пачки
+        latest = list({chunk.conversation_id: chunk for chunk in chunks}.values())
+        result = await self.db.fetch_one(
+            """
+            WITH inserted AS (
+                INSERT INTO public.instagram_messages
+                    (message_id, conversation_id, page_id, sender_id, sender_name, text, created_time)
+                SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[],
+                                     $6::text[], $7::timestamptz[])
+                ON CONFLICT (message_id) DO NOTHING
+                RETURNING 1
+            ), state AS (
+                INSERT INTO public.instagram_sync_state
+                    (conversation_id, page_id, cursor, updated_time, completed, synced_at)
+                SELECT conversation_id, $8, cursor, updated_time, completed, NOW()
+                FROM unnest($9::text[], $10::text[], $11::text[], $12::boolean[])
+                    AS s(conversation_id, cursor, updated_time, completed)
+                ON CONFLICT (conversation_id) DO UPDATE
+                SET cursor = EXCLUDED.cursor,
+                    updated_time = EXCLUDED.updated_time,
+                    completed = EXCLUDED.completed,
+                    synced_at = NOW()
+            )
+            SELECT COUNT(*) AS inserted FROM inserted
+            """,
+            *columns,
+            self.page_id,
+            [chunk.conversation_id for chunk in latest],
+            [chunk.cursor for chunk in latest],
+            [chunk.updated_time for chunk in latest],
+            [chunk.completed for chunk in latest]
+        )
+        if result is None:
+            # PostgresService уже записал ошибку в лог; курсоры не сдвинулись
+            raise RuntimeError("Не удалось записать пачку сообщений Instagram")
+        self.stats['inserted'] += result['inserted']
+        self.stats['batches'] += 1
+
+    async def _writer(self, chunks: "asyncio.Queue[Optional[_Chunk]]") -> None:
+        batch: List[_Chunk] = []
+        size = 0
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            batch.append(chunk)
+            size += len(chunk.rows)
+            if size >= self.batch_size:
+                await self._write(batch)
+                batch, size = [], 0
+        if batch:
+            await self._write(batch)
+
+    async def run(self) -> Dict[str, int]:
+        """Выгружает все диалоги страницы; повторный запуск продолжает прерванную выгрузку"""
+        started = time.monotonic()
+        checkpoints = await self.load_checkpoints()
+        # Очереди ограничены: чтение из Graph API не обгоняет запись в базу
+        conversations: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+        chunks: "asyncio.Queue[Optional[_Chunk]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def reader():
+            while True:
+                conversation = await conversations.get()
+                if conversation is None:
+                    return
+                await self._read_conversation(conversation, checkpoints.get(conversation['id']), chunks)
+
+        async def feed():
+            readers = [asyncio.create_task(reader()) for _ in range(self.concurrency)]
+            try:
+                async for conversation in self.pager.iter_conversations(self.page_id):
+                    self.stats['conversations'] += 1
+                    checkpoint = checkpoints.get(conversation['id'])
+                    if (checkpoint and checkpoint['completed']
+                            and checkpoint['updated_time'] == conversation.get('updated_time')):
+                        self.stats['skipped'] += 1
+                        continue
+                    await conversations.put(conversation)
+                for _ in readers:
+                    await conversations.put(None)
+                await asyncio.gather(*readers)
+            finally:
+                for task in readers:
+                    task.cancel()
+                await asyncio.gather(*readers, return_exceptions=True)
+            await chunks.put(None)
+
+        # Ошибка записи останавливает чтение, иначе читатели вечно ждали бы места в очереди
+        tasks = [asyncio.create_task(feed()), asyncio.create_task(self._writer(chunks))]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        logger.info(f"Instagram sync finished in {time.monotonic() - started:.1f}s: {self.stats}")
+        return dict(self.stats)
@@ -0,0 +1,243 @@
+"""
+Кэш учетных данных Instagram и токенов страниц Graph API.
+Учетные данные читаются из базы один раз, токен страницы и ID бизнес-аккаунта
+запрашиваются один раз и живут до истечения срока, который берется из
+debug_token. Токен обновляется заранее - за refresh_margin секунд до истечения,
+поэтому на входящее сообщение приходится только один вызов Graph API - отправка ответа.
+Если обновление не удалось или не продлило срок (доступ к данным истекает
+раньше токена, и обмен его не продлевает), следующая попытка - не раньше чем
+через refresh_backoff секунд; до тех пор отдается прежний, еще рабочий токен.
+Один экземпляр на процесс разделяют все воркеры.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = "https://graph.facebook.com/v21.0"
+
+# Ключи сервиса instagram в таблице credentials
+CREDENTIAL_KEYS = ('access_token', 'page_access_token', 'page_id', 'app_id', 'app_secret', 'verify_token')
+
+CredentialsLoader = Callable[[], Awaitable[Dict[str, str]]]
+
+
+@dataclass
+class CachedToken:
+    """Токен и момент его истечения (unix time; None - бессрочный)"""
+    value: str
+    expires_at: Optional[float] = None
+
+    def expires_within(self, seconds: float, now: Optional[float] = None) -> bool:
+        if self.expires_at is None:
+            return False
+        return self.expires_at - (time.time() if now is None else now) < seconds
+
+
+async def load_config_credentials() -> Dict[str, str]:
+    """Учетные данные Instagram из таблицы credentials через ConfigService"""
+    from services.config_service import ConfigService
+
+    config = ConfigService()
+    credentials = {}
+    for key in CREDENTIAL_KEYS:
+        value = await config.get_config_async(key, service='instagram')
+        if value:
+            credentials[key] = value
+    return credentials
+
+
+class InstagramTokenCache:
+    """
+    Args:
+        load_credentials: Загрузка учетных данных (по умолчанию - из таблицы credentials)
+        refresh_margin: За сколько секунд до истечения обновлять токен
+        check_interval: Как часто фоновая задача проверяет сроки, секунд
+        refresh_backoff: Пауза до следующей попытки после неудачного или бесполезного обновления, секунд
+        graph_url: Адрес Graph API
+    """
+
+    def __init__(self, load_credentials: Optional[CredentialsLoader] = None,
+                 refresh_margin: float = 24 * 3600, check_interval: float = 3600,
+                 refresh_backoff: float = 600, graph_url: str = GRAPH_API_URL):
+        self.load_credentials = load_credentials or load_config_credentials
+        self.graph_url = graph_url
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.refresh_backoff = refresh_backoff
+
+        self._credentials: Optional[Dict[str, str]] = None
+        self.page_tokens: Dict[str, CachedToken] = {}
+        self.business_ids: Dict[str, str] = {}
+        # Когда можно снова пытаться обновить токен страницы (time.monotonic)
+        self._retry_at: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'credential_loads': 0, 'token_exchanges': 0, 'debug_calls': 0, 'hits': 0,
+                      'backoffs': 0}
+
+    async def credentials(self, refresh: bool = False) -> Dict[str, str]:
+        """Учетные данные; из базы читаются только при первом обращении или refresh"""
+        if self._credentials is None or refresh:
+            self._credentials = await self.load_credentials() or {}
+            self.stats['credential_loads'] += 1
+        return self._credentials
+
+    async def _graph_get(self, path: str, params: Dict[str, str]) -> Dict:
+        response = await http_client.get(f"{self.graph_url}/{path}", params=params)
+        data = response.json() or {}
+        if not response.ok:
+            raise RuntimeError(f"Graph API {response.status}: {data.get('error', response.text)}")
+        return data
+
+    async def _expires_at(self, token: str) -> Optional[float]:
+        """Срок действия токена по debug_token; None - бессрочный или неизвестен"""
+        credentials = await self.credentials()
+        app_token = token
+        if credentials.get('app_id') and credentials.get('app_secret'):
+            app_token = f"{credentials['app_id']}|{credentials['app_secret']}"
+        try:
+            self.stats['debug_calls'] += 1
+            data = (await self._graph_get('debug_token', {'input_token': token, 'access_token': app_token})).get('data', {})
+        except Exception as e:
+            logger.warning(f"Failed to debug Instagram token: {e}")
+            return None
+        expires_at = data.get('expires_at') or None
+        # Доступ к данным истекает отдельно от самого токена
+        data_access = data.get('data_access_expires_at') or None
+        candidates = [value for value in (expires_at, data_access) if value]
+        return float(min(candidates)) if candidates else None
+
+    async def _fetch_page_token(self, page_id: Optional[str]) -> Optional[CachedToken]:
+        credentials = await self.credentials()
+        if page_id:
+            user_token = credentials.get('access_token')
+            if not user_token:
+                logger.error("Токен доступа не найден")
+                return None
+            # Обмен пользовательского токена на токен страницы
+            data = await self._graph_get(page_id, {'fields': 'access_token', 'access_token': user_token})
+            self.stats['token_exchanges'] += 1
+            token = data.get('access_token')
+        else:
+            token = credentials.get('page_access_token') or credentials.get('access_token')
+        if not token:
+            return None
+        return CachedToken(token, await self._expires_at(token))
+
+    def _default_page_id(self) -> Optional[str]:
+        return (self._credentials or {}).get('page_id')
+
+    def _usable(self, key: str, cached: Optional[CachedToken]) -> bool:
+        """Токен можно отдать без обновления: до истечения далеко или обновление на паузе"""
+        if not cached:
+            return False
+        if not cached.expires_within(self.refresh_margin):
+            return True
+        return not cached.expires_within(0) and time.monotonic() < self._retry_at.get(key, 0.0)
+
+    async def page_token(self, page_id: Optional[str] = None) -> Optional[str]:
+        """Токен страницы из кэша; при отсутствии или скором истечении запрашивается заново"""
+        await self.credentials()
+        page_id = page_id or self._default_page_id()
+        key = page_id or ''
+        cached = self.page_tokens.get(key)
+        if self._usable(key, cached):
+            self.stats['hits'] += 1
+            return cached.value
+
+        # Одновременные запросы воркеров ждут один обмен токена
+        async with self._lock:
+            cached = self.page_tokens.get(key)
+            if self._usable(key, cached):
+                self.stats['hits'] += 1
+                return cached.value
+            try:
+                fresh = await self._fetch_page_token(page_id)
+            except Exception as e:
+                logger.error(f"Ошибка при получении токена страницы: {e}")
+                fresh = None
+            if fresh:
+                self.page_tokens[key] = cached = fresh
+            if cached and cached.expires_within(self.refresh_margin) and not cached.expires_within(0):
+                # Обновление не продлило срок - не повторяем его на каждом сообщении
+                self._retry_at[key] = time.monotonic() + self.refresh_backoff
+                self.stats['backoffs'] += 1
+                logger.warning(f"Instagram page token {key or 'default'} expires soon and was not extended, "
+                               f"next refresh in {self.refresh_backoff:.0f}s")
+        # Обновить не удалось - старый токен еще годится, пока не истек
+        if cached and not cached.expires_within(0):
+            return cached.value
+        return None
+
+    def cached_page_token(self, page_id: Optional[str] = None) -> Optional[str]:
+        """Токен страницы, если он уже есть в кэше и еще годится; без обращения к сети (для синхронного кода)"""
+        key = page_id or self._default_page_id() or ''
+        cached = self.page_tokens.get(key)
+        if self._usable(key, cached):
+            self.stats['hits'] += 1
+            return cached.value
+        return None
+
+    async def business_id(self, page_id: Optional[str] = None) -> Optional[str]:
+        """ID бизнес-аккаунта Instagram страницы; не меняется, кэшируется навсегда"""
+        await self.credentials()
+        page_id = page_id or self._default_page_id()
+        if not page_id:
+            return None
+        if page_id in self.business_ids:
+            self.stats['hits'] += 1
+            return self.business_ids[page_id]
+
+        token = (await self.credentials()).get('access_token') or await self.page_token(page_id)
+        try:
+            data = await self._graph_get(page_id, {'fields': 'instagram_business_account', 'access_token': token})
+        except Exception as e:
+            logger.error(f"Ошибка при получении ID бизнес-аккаунта: {e}")
+            return None
+        business_id = data.get('instagram_business_account', {}).get('id')
+        if business_id:
+            self.business_ids[page_id] = business_id
+        return business_id
+
+    def invalidate(self, page_id: Optional[str] = None) -> None:
+        """Сброс после ошибки авторизации: следующий запрос перечитает учетные данные и токен"""
+        self._credentials = None
+        if page_id is None:
+            self.page_tokens.clear()
+            self._retry_at.clear()
+        else:
+            self.page_tokens.pop(page_id, None)
+            self._retry_at.pop(page_id, None)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for key, cached in list(self.page_tokens.items()):
+                if not self._usable(key, cached):
+                    logger.info(f"Refreshing Instagram page token {key or 'default'} before expiry")
+                    await self.page_token(key or None)
+
+    def start(self) -> asyncio.Task:
+        """Фоновое обновление токенов до истечения"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Создаем глобальный экземпляр
+instagram_tokens = InstagramTokenCache()
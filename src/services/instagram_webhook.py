@@ -0,0 +1,258 @@
+"""
+Прием вебхуков Instagram Messaging на aiohttp-сервере бота.
+Запрос проверяется по подписи, сообщения кладутся в очередь, и Meta сразу
+получает 200: медленные ответы вебхуку Meta ограничивает и присылает повторно.
+Одна доставка может содержать сообщения нескольких клиентов: они
+обрабатываются параллельно, а сообщения одного клиента - строго по порядку,
+потому что клиент всегда попадает в одну и ту же очередь воркера.
+Ответы уходят через общий HTTP-пул с ограничением частоты отправки в Graph API.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+from .http_client import http_client
+from .log_digest import split_text
+from .telegram_outbound import TokenBucket
+from .webhook_dedupe import WebhookDeduper
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = "https://graph.facebook.com/v21.0"
+
+# Лимит длины текстового сообщения Instagram
+MESSAGE_LIMIT = 1000
+
+
+@dataclass
+class IncomingMessage:
+    """Текстовое сообщение клиента из вебхука"""
+    sender_id: str
+    text: str
+    mid: Optional[str] = None
+    timestamp: Optional[int] = None
+    # Момент получения вебхука (time.monotonic)
+    received_at: float = 0.0
+
+
+def verify_signature(app_secret: str, payload: bytes, signature: str) -> bool:
+    """Проверка заголовка X-Hub-Signature-256"""
+    if not signature or not app_secret:
+        return False
+    expected = hmac.new(app_secret.encode('utf-8'), msg=payload, digestmod=hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f"sha256={expected}", signature)
+
+
+def extract_messages(data: Dict[str, Any]) -> List[IncomingMessage]:
+    """Текстовые сообщения клиентов из тела вебхука; эхо собственных ответов пропускаются"""
+    if not isinstance(data, dict) or data.get('object') != 'instagram':
+        return []
+    messages = []
+    for entry in data.get('entry', []):
+        for messaging in entry.get('messaging', []):
+            message = messaging.get('message') or {}
+            sender_id = (messaging.get('sender') or {}).get('id')
+            if not sender_id or not message.get('text') or message.get('is_echo'):
+                continue
+            messages.append(IncomingMessage(sender_id, message['text'], message.get('mid'),
+                                            messaging.get('timestamp'), time.monotonic()))
+    return messages
+
+
+class GraphSender:
+    """
+    Отправка сообщений через Graph API с ограничением частоты.
+
+    Args:
+        tokens: Кэш токенов страницы (InstagramTokenCache)
+        rate: Сообщений в секунду на аккаунт
+        per_recipient_interval: Минимальный интервал между сообщениями одному клиенту, секунд
+    """
+
+    def __init__(self, tokens, rate: float = 10.0, per_recipient_interval: float = 1.0):
+        self.tokens = tokens
+        self.bucket = TokenBucket(rate=rate, capacity=rate)
+        self.per_recipient_interval = per_recipient_interval
+        self._last_sent: Dict[str, float] = {}
+
+    async def _acquire(self, recipient_id: str) -> None:
+        # Слот резервируется сразу (без await, поэтому атомарно в цикле событий),
+        # а ждать его каждый отправитель будет сам: пауза между сообщениями
+        # одному клиенту не задерживает ответы остальным
+        now = time.monotonic()
+        slot = max(now + self.bucket.delay(now),
+                   self._last_sent.get(recipient_id, float('-inf')) + self.per_recipient_interval)
+        # Токен списывается в долг: следующий вызов получит слот после этого
+        self.bucket.consume(now)
+        self._last_sent[recipient_id] = slot
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def send_text(self, recipient_id: str, text: str) -> bool:
+        """Отправляет ответ, длинный текст делится на несколько сообщений"""
+        for part in split_text(text, MESSAGE_LIMIT):
+            await self._acquire(recipient_id)
+            # Токен берется из кэша без обращения к Graph API
+            access_token = await self.tokens.page_token()
+            if not access_token:
+                logger.error("Instagram page token not available")
+                return False
+            # POST не повторяется: после таймаута сообщение могло уже уйти клиенту
+            response = await http_client.post(
+                f"{GRAPH_API_URL}/me/messages",
+                params={"access_token": access_token},
+                json={"recipient": {"id": recipient_id}, "message": {"text": part}}
+            )
+            if ((response.json() or {}).get('error') or {}).get('code') == 190:
+                # Токен отозван раньше срока - следующая отправка получит новый
+                self.tokens.invalidate()
+            if not response.ok:
+                logger.error(f"Instagram send failed: {response.status} {response.text}")
+                return False
+        return True
+
+
+# Обработчик сообщения клиента
+MessageHandler = Callable[[IncomingMessage], Awaitable[None]]
+
+
+class InstagramWebhook:
+    """
+    Маршруты вебхука и пул воркеров.
+
+    Args:
+        handler: Обработка одного сообщения (ответ клиенту)
+        app_secret: Секрет приложения для проверки подписи
+        verify_token: Токен подтверждения подписки
+        workers: Сколько клиентов обслуживать одновременно
+        queue_size: Сколько сообщений может ждать обработки; при переполнении
+            Meta получает 503 и повторит доставку
+        deduper: Отсев повторных доставок (по умолчанию - только в памяти)
+    """
+
+    def __init__(self, handler: MessageHandler, app_secret: str, verify_token: str,
+                 workers: int = 4, queue_size: int = 1000, deduper: Optional[WebhookDeduper] = None):
+        self.handler = handler
+        self.app_secret = app_secret
+        self.verify_token = verify_token
+        self.workers = workers
+        self.queue_size = queue_size
+        self.deduper = deduper or WebhookDeduper()
+        # У каждого воркера своя очередь: сообщения клиента не обгоняют друг друга
+        self.queues: List["asyncio.Queue[IncomingMessage]"] = [asyncio.Queue() for _ in range(workers)]
+        self._pending = 0
+        self._tasks: List[asyncio.Task] = []
+        # Время от получения вебхука до отправленного ответа, секунды
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        self.stats = {'received': 0, 'duplicates': 0, 'rejected': 0, 'processed': 0, 'failed': 0}
+
+    @property
+    def pending(self) -> int:
+        """Сообщений в очередях и в обработке"""
+        return self._pending
+
+    def _queue_for(self, sender_id: str) -> "asyncio.Queue[IncomingMessage]":
+        return self.queues[zlib.crc32(sender_id.encode('utf-8')) % self.workers]
+
+    def add_routes(self, app: web.Application, path: str = '/webhook/instagram') -> None:
+        app.router.add_get(path, self.handle_verify)
+        app.router.add_post(path, self.handle_event)
+
+    async def handle_verify(self, request: web.Request) -> web.Response:
+        """Подтверждение подписки на вебхук"""
+        mode = request.query.get('hub.mode')
+        token = request.query.get('hub.verify_token')
+        if mode == 'subscribe' and token and hmac.compare_digest(token, self.verify_token or ''):
+            logger.info("Instagram webhook verified")
+            return web.Response(text=request.query.get('hub.challenge', ''))
+        return web.Response(text='Forbidden', status=403)
+
+    async def handle_event(self, request: web.Request) -> web.Response:
+        """Проверяет подпись, ставит сообщения в очереди и сразу отвечает 200"""
+        body = await request.read()
+        if not verify_signature(self.app_secret, body, request.headers.get('X-Hub-Signature-256', '')):
+            logger.warning("Instagram webhook: invalid signature")
+            return web.Response(text='Invalid signature', status=403)
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(text='Bad Request', status=400)
+
+        messages = extract_messages(data)
+        if self.queue_size and self.pending + len(messages) > self.queue_size:
+            # Не принимаем часть пачки и не отмечаем mid: Meta пришлет ее целиком повторно
+            self.stats['rejected'] += len(messages)
+            logger.error(f"Instagram queue is full, rejected {len(messages)} messages")
+            return web.Response(text='Busy', status=503)
+
+        # Повторы отсекаются по mid; порядок сообщений в доставке сохраняется
+        claimed = await asyncio.gather(*[self.deduper.claim(message.mid) for message in messages])
+        accepted = 0
+        for message, is_new in zip(messages, claimed):
+            if not is_new:
+                self.stats['duplicates'] += 1
+                continue
+            self._queue_for(message.sender_id).put_nowait(message)
+            self._pending += 1
+            accepted += 1
+        self.stats['received'] += accepted
+        return web.Response(text='OK')
+
+    async def _worker(self, queue: "asyncio.Queue[IncomingMessage]") -> None:
+        while True:
+            message = await queue.get()
+            try:
+                await self.handler(message)
+                self.stats['processed'] += 1
+                latency = time.monotonic() - message.received_at
+                self.latencies.append(latency)
+                logger.debug(f"Instagram message {message.mid} answered in {latency * 1000:.0f} ms")
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Failed to process Instagram message from {message.sender_id}: {e}", exc_info=True)
+            finally:
+                self._pending -= 1
+                queue.task_done()
+
+    async def join(self) -> None:
+        """Дожидается обработки всех принятых сообщений"""
+        await asyncio.gather(*[queue.join() for queue in self.queues])
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+            self.deduper.start()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дообрабатывает очереди (не дольше timeout) и останавливает воркеров"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Instagram queue not drained: {self.pending} messages left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.deduper.stop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        recent = sorted(self.latencies)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            **self.stats,
+            'queued': self.pending,
+            'reply_avg_ms': round(sum(recent) / len(recent) * 1000, 1) if recent else 0.0,
+            'reply_p95_ms': round(p95 * 1000, 1),
+            'dedupe': self.deduper.get_stats()
+        }
@@ -5,12 +5,13 @@ from datetime import datetime
 from collections import defaultdict
 import asyncio
 from services.docs_service import DocsService
+from services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 class KnowledgeBaseService:
-    def __init__(self):
-        self.docs_service = DocsService()
+    def __init__(self, docs_service: DocsService = None):
+        self.docs_service = docs_service or DocsService()
         self.knowledge_cache = {}
         self.last_update = None
         self.cache_ttl = 3600  # 1 час
@@ -48,8 +49,9 @@ class KnowledgeBaseService:
     async def _update_cache_if_needed(self) -> None:
         """Обновляет кэш, если он устарел."""
         current_time = datetime.now().timestamp()
-        if (not self.last_update or 
-            current_time - self.last_update > self.cache_ttl):
+        expired = not self.last_update or current_time - self.last_update > self.cache_ttl
+        metrics.counter('cache_requests_total', labels={'cache': 'kb', 'result': 'miss' if expired else 'hit'})
+        if expired:
             try:
                 content = await self.docs_service.get_knowledge_base()
                 self.knowledge_cache = self._parse_content(content)
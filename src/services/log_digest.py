@@ -0,0 +1,294 @@
+"""
+Сводки логов для группы персонала.
+Записи копятся по темам и уходят одним сообщением раз в window секунд
+или при накоплении max_entries записей. Кнопки оценки прикладываются
+к сводке сразу при отправке: в callback_data только короткий номер записи,
+поэтому отдельный вызов edit_message_reply_markup больше не нужен.
+В тихие часы первая запись после паузы отправляется сразу, как раньше.
+
+add() ничего не отправляет сам: готовые сообщения уходят из фоновой задачи,
+поэтому лимит группы (20 сообщений в минуту) и ошибки Telegram не задерживают
+и не ломают ответ клиенту.
+"""
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Префикс callback_data кнопок оценки записей сводки: "lg:l:123" / "lg:d:123"
+CALLBACK_PREFIX = 'lg'
+
+# Отправка сообщения: (topic_id, text, reply_markup) -> message_id
+SendFunc = Callable[[Optional[int], str, Optional[InlineKeyboardMarkup]], Awaitable[Optional[int]]]
+
+
+@dataclass
+class LogEntry:
+    """Запись лога"""
+    entry_id: int
+    topic_id: Optional[int]
+    title: str
+    text: str
+    with_buttons: bool = True
+    created: float = field(default_factory=time.monotonic)
+    message_id: Optional[int] = None
+
+    def render(self, number: Optional[int] = None) -> str:
+        """HTML-текст записи; номер нужен, чтобы сопоставить запись с ее кнопками"""
+        header = f"<b>#{number} {html.escape(self.title)}</b>" if number else f"<b>{html.escape(self.title)}</b>"
+        return f"{header}\n{html.escape(self.text)}"
+
+
+def split_text(text: str, limit: int) -> List[str]:
+    """Делит текст на части не длиннее limit, по возможности по границам строк"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+            # Не разрезаем HTML-сущность вроде &amp;
+            amp = text.rfind('&', 0, cut)
+            if amp > 0 and cut - amp < 8 and ';' not in text[amp:cut]:
+                cut = amp
+        parts.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        parts.append(text)
+    return parts
+
+
+def feedback_keyboard(entries: List[LogEntry], numbers: Dict[int, int]) -> Optional[InlineKeyboardMarkup]:
+    """Ряд кнопок 👍/👎 на каждую запись; numbers - номера записей в сводке"""
+    rows = []
+    for entry in entries:
+        if not entry.with_buttons:
+            continue
+        number = numbers.get(entry.entry_id)
+        suffix = f" #{number}" if number else ""
+        rows.append([
+            InlineKeyboardButton(f"👍{suffix}", callback_data=f"{CALLBACK_PREFIX}:l:{entry.entry_id}"),
+            InlineKeyboardButton(f"👎{suffix}", callback_data=f"{CALLBACK_PREFIX}:d:{entry.entry_id}")
+        ])
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+def parse_callback(data: str) -> Optional[tuple]:
+    """Разбирает callback_data кнопки сводки в (action, entry_id)"""
+    parts = data.split(':')
+    if len(parts) != 3 or parts[0] != CALLBACK_PREFIX or parts[1] not in ('l', 'd'):
+        return None
+    try:
+        return ('like' if parts[1] == 'l' else 'dislike'), int(parts[2])
+    except ValueError:
+        return None
+
+
+class LogDigest:
+    """
+    Агрегатор логов по темам.
+
+    Args:
+        send: Функция отправки сообщения в тему
+        window: Сколько секунд копить записи (0 - отправлять каждую запись сразу)
+        max_entries: После скольких записей сводка отправляется досрочно
+        max_chars: Лимит длины одного сообщения
+        history_size: Сколько последних записей помнить для обработки оценок
+    """
+
+    def __init__(self, send: SendFunc, window: float = 30.0, max_entries: int = 10,
+                 max_chars: int = MESSAGE_LIMIT, history_size: int = 2000):
+        self.send = send
+        self.window = window
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.history_size = history_size
+
+        self.pending: Dict[Optional[int], List[LogEntry]] = {}
+        # Сводки, которые пора отправить: (topic_id, записи)
+        self.ready: Deque[Tuple[Optional[int], List[LogEntry]]] = deque()
+        self.entries: "OrderedDict[int, LogEntry]" = OrderedDict()
+        self._last_sent: Dict[Optional[int], float] = {}
+        # Номера зависят от времени запуска, чтобы кнопки старых сводок
+        # после перезапуска не указывали на новые записи
+        self._next_id = int(time.time()) % 1000000 * 1000
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'entries': 0, 'messages': 0}
+
+    def _remember(self, entry: LogEntry) -> None:
+        self.entries[entry.entry_id] = entry
+        while len(self.entries) > self.history_size:
+            self.entries.popitem(last=False)
+
+    def get_entry(self, entry_id: int) -> Optional[LogEntry]:
+        return self.entries.get(entry_id)
+
+    async def add(self, topic_id: Optional[int], title: str, text: str, with_buttons: bool = True) -> LogEntry:
+        """
+        Добавляет запись и сразу возвращается, не дожидаясь отправки.
+        Запись уйдет отдельным сообщением, если тема давно молчала или сводки выключены.
+        """
+        self._next_id += 1
+        entry = LogEntry(self._next_id, topic_id, title, text, with_buttons)
+        self._remember(entry)
+        self.stats['entries'] += 1
+
+        now = time.monotonic()
+        quiet = now - self._last_sent.get(topic_id, float('-inf')) >= self.window
+        if self.window <= 0 or (quiet and not self.pending.get(topic_id)):
+            # Тихие часы: запись уходит сразу отдельным сообщением
+            self._schedule(topic_id, [entry])
+            return entry
+
+        self.pending.setdefault(topic_id, []).append(entry)
+        if len(self.pending[topic_id]) >= self.max_entries:
+            self._schedule(topic_id, self.pending.pop(topic_id))
+        else:
+            self._ensure_flusher()
+        return entry
+
+    def _schedule(self, topic_id: Optional[int], entries: List[LogEntry]) -> None:
+        """Ставит сводку в очередь отправки и будит фоновую задачу"""
+        self._last_sent[topic_id] = time.monotonic()
+        self.ready.append((topic_id, entries))
+        self._ensure_flusher()
+        self._wakeup.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """Отправляет готовые сводки и сводки, у которых истекло окно"""
+        while self.ready or any(self.pending.values()):
+            self._wakeup.clear()
+            await self._send_ready()
+
+            now = time.monotonic()
+            deadlines = []
+            for topic_id, entries in list(self.pending.items()):
+                if not entries:
+                    continue
+                deadline = entries[0].created + self.window
+                if deadline <= now:
+                    await self.flush(topic_id)
+                else:
+                    deadlines.append(deadline)
+            if deadlines and not self.ready:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.0, min(deadlines) - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _send_ready(self) -> None:
+        while self.ready:
+            topic_id, entries = self.ready.popleft()
+            async with self._lock:
+                await self._send_entries(topic_id, entries)
+
+    async def flush(self, topic_id: Optional[int] = None) -> None:
+        """Отправляет накопленные записи темы одной или несколькими сводками"""
+        async with self._lock:
+            entries = self.pending.pop(topic_id, [])
+            if not entries:
+                return
+            self._last_sent[topic_id] = time.monotonic()
+            await self._send_entries(topic_id, entries)
+
+    async def flush_all(self) -> None:
+        await self._send_ready()
+        for topic_id in list(self.pending):
+            await self.flush(topic_id)
+
+    async def close(self) -> None:
+        """Отправляет все накопленное и останавливает фоновую отправку"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_all()
+
+    def build_messages(self, entries: List[LogEntry]) -> List[tuple]:
+        """
+        Раскладывает записи по сообщениям не длиннее max_chars.
+        Запись не разрывается между сообщениями, если сама помещается в лимит;
+        слишком длинная запись делится по строкам, кнопки - у последней части.
+        Возвращает [(text, entries_with_buttons)].
+        """
+        numbered = len(entries) > 1
+        messages = []
+        chunk: List[str] = []
+        chunk_entries: List[LogEntry] = []
+        size = 0
+        header = f"📋 <b>Сводка: {len(entries)}</b>\n\n" if numbered else ""
+
+        def close_chunk():
+            nonlocal chunk, chunk_entries, size
+            if chunk:
+                messages.append(("\n\n".join(chunk), chunk_entries))
+            chunk, chunk_entries, size = [], [], 0
+
+        for number, entry in enumerate(entries, start=1):
+            rendered = entry.render(number if numbered else None)
+            if not messages and not chunk:
+                rendered = header + rendered
+            if len(rendered) > self.max_chars:
+                close_chunk()
+                parts = split_text(rendered, self.max_chars)
+                for part in parts[:-1]:
+                    messages.append((part, []))
+                messages.append((parts[-1], [entry]))
+                continue
+            if size + len(rendered) + 2 > self.max_chars:
+                close_chunk()
+            chunk.append(rendered)
+            chunk_entries.append(entry)
+            size += len(rendered) + 2
+        close_chunk()
+        return messages
+
+    async def _send_entries(self, topic_id: Optional[int], entries: List[LogEntry]) -> None:
+        # Номера на кнопках совпадают с номерами записей в тексте сводки
+        numbers = {entry.entry_id: number for number, entry in enumerate(entries, start=1)} if len(entries) > 1 else {}
+        for text, message_entries in self.build_messages(entries):
+            markup = feedback_keyboard(message_entries, numbers)
+            try:
+                message_id = await self.send(topic_id, text, markup)
+                self.stats['messages'] += 1
+                for entry in message_entries:
+                    entry.message_id = message_id
+            except Exception as e:
+                logger.error(f"Failed to send log digest to topic {topic_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'pending': sum(len(entries) for entries in self.pending.values())
+                       + sum(len(entries) for _, entries in self.ready)
+        }
+
+
+def mark_rated(markup: InlineKeyboardMarkup, entry_id: int, label: str) -> InlineKeyboardMarkup:
+    """Заменяет кнопки оцененной записи на одну неактивную"""
+    rows = []
+    for row in markup.inline_keyboard:
+        data = parse_callback(row[0].callback_data or '') if row else None
+        if data and data[1] == entry_id:
+            rows.append([InlineKeyboardButton(label, callback_data=f"{CALLBACK_PREFIX}:done:{entry_id}")])
+        else:
+            rows.append(list(row))
+    return InlineKeyboardMarkup(rows)
@@ -0,0 +1,240 @@
+"""
+Задержка event loop и поиск блокирующих вызовов.
+Фоновая задача засыпает на interval секунд и измеряет, насколько позже она
+проснулась: разница - время, когда цикл был занят синхронным кодом и не
+обслуживал другие задачи (ответы клиентам, вебхуки, /health).
+Задержка пишется в гистограмму event_loop_lag_seconds реестра метрик.
+
+Пока цикл не отвечает дольше block_threshold, сторожевой поток снимает стек
+потока цикла. Стек сводится к месту вызова - самому глубокому кадру кода
+бота (src/), из которого ушли в блокирующую библиотеку (psycopg2,
+googleapiclient, requests, time.sleep). Время блокировки делится между
+местами пропорционально снимкам и накапливается; отчет ранжирует места
+по суммарному времени блокировки.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import metrics
+from .profiler import frame_label, frame_stack
+
+logger = logging.getLogger(__name__)
+
+# Код бота: кадры из этого каталога считаются местами вызова
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+UNKNOWN_SITE = 'unknown'
+OTHER_SITE = 'other'
+
+
+@dataclass
+class BlockingSite:
+    """Накопленные блокировки одного места вызова"""
+    site: str
+    blocked_seconds: float = 0.0
+    count: int = 0
+    max_seconds: float = 0.0
+    leaf: str = ''
+    stack: List[str] = field(default_factory=list)
+
+    def add(self, seconds: float) -> None:
+        self.blocked_seconds += seconds
+        self.count += 1
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+def blocking_site(frame) -> Dict[str, Any]:
+    """Место вызова, последний кадр и стек потока цикла в момент блокировки"""
+    site, leaf = None, None
+    current = frame
+    while current is not None:
+        filename = current.f_code.co_filename
+        if leaf is None:
+            leaf = frame_label(current)
+        if filename.startswith(SOURCE_ROOT) and filename != __file__:
+            site = frame_label(current)
+            break
+        current = current.f_back
+    return {'site': site or leaf or UNKNOWN_SITE, 'leaf': leaf or '', 'stack': frame_stack(frame)}
+
+
+class LoopLagMonitor:
+    """
+    Args:
+        interval: Как часто измерять задержку, секунд
+        warn_threshold: Задержка, о которой пишется предупреждение в лог, секунд
+        block_threshold: С какой задержки снимать стек блокирующего кода, секунд
+        sample_interval: Как часто сторожевой поток проверяет цикл, секунд
+        report_interval: Как часто отправлять отчет о блокировках, секунд
+        max_sites: Сколько разных мест хранить; остальные учитываются как other
+        on_report: Куда отправить отчет (например, в тему ошибок); без него - в лог
+    """
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.5,
+                 block_threshold: float = 0.1, sample_interval: float = 0.02,
+                 report_interval: float = 3600.0, max_sites: int = 100,
+                 on_report: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.block_threshold = block_threshold
+        self.sample_interval = sample_interval
+        self.report_interval = report_interval
+        self.max_sites = max_sites
+        self.on_report = on_report
+        self.sites: Dict[str, BlockingSite] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._loop_thread: Optional[int] = None
+        # Когда цикл должен был разбудить задачу измерения
+        self._expected_wake: Optional[float] = None
+        # Снимки текущей блокировки: место -> число снимков
+        self._samples: Counter = Counter()
+        self._sampled: Dict[str, Dict[str, Any]] = {}
+        self._reported_seconds = 0.0
+        self.stats = {'checks': 0, 'slow': 0, 'max_lag_ms': 0.0, 'last_lag_ms': 0.0,
+                      'blocks': 0, 'blocked_seconds': 0.0, 'stack_samples': 0}
+
+    def sample(self, frame) -> None:
+        """Снимок стека потока цикла во время блокировки (из сторожевого потока)"""
+        captured = blocking_site(frame)
+        with self._lock:
+            self._samples[captured['site']] += 1
+            self._sampled[captured['site']] = captured
+        self.stats['stack_samples'] += 1
+
+    def record(self, lag: float) -> None:
+        lag = max(lag, 0.0)
+        metrics.observe('event_loop_lag_seconds', lag)
+        self.stats['checks'] += 1
+        self.stats['last_lag_ms'] = round(lag * 1000, 1)
+        self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], self.stats['last_lag_ms'])
+
+        with self._lock:
+            samples, self._samples = self._samples, Counter()
+            sampled, self._sampled = self._sampled, {}
+        if lag >= self.block_threshold:
+            self.attribute(lag, samples, sampled)
+
+        if lag >= self.warn_threshold:
+            self.stats['slow'] += 1
+            top = samples.most_common(1)
+            logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms"
+                           + (f" at {top[0][0]}" if top else ""))
+
+    def attribute(self, lag: float, samples: Counter, sampled: Dict[str, Dict[str, Any]]) -> None:
+        """Делит время блокировки между местами пропорционально снимкам"""
+        self.stats['blocks'] += 1
+        self.stats['blocked_seconds'] += lag
+        if not samples:
+            # Блокировка закончилась раньше, чем сторожевой поток успел снять стек
+            samples = Counter({UNKNOWN_SITE: 1})
+        total = sum(samples.values())
+        for site, count in samples.items():
+            seconds = lag * count / total
+            if site not in self.sites and len(self.sites) >= self.max_sites:
+                site = OTHER_SITE
+            entry = self.sites.get(site)
+            if entry is None:
+                captured = sampled.get(site, {})
+                entry = self.sites[site] = BlockingSite(site, leaf=captured.get('leaf', ''),
+                                                        stack=captured.get('stack', []))
+            entry.add(seconds)
+            metrics.counter('event_loop_blocked_seconds_total', seconds, {'site': site})
+
+    def top(self, limit: int = 10) -> List[BlockingSite]:
+        return sorted(self.sites.values(), key=lambda entry: entry.blocked_seconds, reverse=True)[:limit]
+
+    def report(self, limit: int = 10) -> str:
+        """Места блокировки цикла по убыванию суммарного времени"""
+        if not self.sites:
+            return "Блокировок event loop не было"
+        lines = [f"Блокировки event loop: {self.stats['blocks']}, "
+                 f"всего {self.stats['blocked_seconds']:.1f} с"]
+        for number, entry in enumerate(self.top(limit), 1):
+            line = (f"{number}. {entry.blocked_seconds:.2f} с, {entry.count} раз, "
+                    f"макс {entry.max_seconds * 1000:.0f} мс - {entry.site}")
+            if entry.leaf and entry.leaf != entry.site:
+                line += f" -> {entry.leaf}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def _watch(self) -> None:
+        frames = sys._current_frames
+        while not self._stop.wait(self.sample_interval):
+            expected = self._expected_wake
+            if expected is None or time.perf_counter() - expected < self.block_threshold:
+                continue
+            frame = frames().get(self._loop_thread)
+            if frame is not None:
+                self.sample(frame)
+
+    async def send_report(self) -> None:
+        """Отчет, если с прошлого отчета были новые блокировки"""
+        if self.stats['blocked_seconds'] <= self._reported_seconds:
+            return
+        self._reported_seconds = self.stats['blocked_seconds']
+        text = self.report()
+        if self.on_report:
+            try:
+                await self.on_report(text)
+                return
+            except Exception as e:
+                logger.error(f"Failed to send blocking report: {e}")
+        logger.warning(text)
+
+    async def run(self) -> None:
+        next_report = time.monotonic() + self.report_interval
+        while True:
+            started = time.perf_counter()
+            self._expected_wake = started + self.interval
+            await asyncio.sleep(self.interval)
+            self._expected_wake = None
+            self.record(time.perf_counter() - started - self.interval)
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + self.report_interval
+                await self.send_report()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._loop_thread = threading.get_ident()
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._stop.set()
+            self._watchdog.join()
+            self._watchdog = None
+        self._expected_wake = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['blocked_seconds'] = round(stats['blocked_seconds'], 3)
+        stats['top_sites'] = [
+            {'site': entry.site, 'leaf': entry.leaf, 'blocked_seconds': round(entry.blocked_seconds, 3),
+             'count': entry.count, 'max_ms': round(entry.max_seconds * 1000, 1)}
+            for entry in self.top(5)
+        ]
+        return stats
+
+
+# Создаем глобальный экземпляр
+loop_monitor = LoopLagMonitor()
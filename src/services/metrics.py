@@ -0,0 +1,425 @@
+"""
+Метрики бота: счетчики, значения и гистограммы, агрегированные в памяти.
+Запись метрики - это одно обновление словаря без ввода-вывода, поэтому ее
+можно вызывать на каждом сообщении. Фоновый MetricsPublisher раз в interval
+секунд забирает накопленные серии и отправляет их одним пакетом в каждый
+экспортер: Cloud Monitoring, таблицу bot_metrics или локальный файл.
+
+Счетчики накапливаются с момента старта, гистограммы отдаются за интервал
+между выгрузками. Запись рассчитана на вызовы из потока event loop.
+
+render_prometheus отдает те же серии в текстовом формате Prometheus для /metrics:
+гистограммы - накопленные с момента старта, значения, которые живут в других
+сервисах (очереди, пул базы), снимаются сборщиками в момент запроса.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ключ серии: (имя, отсортированные пары меток)
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+PERCENTILES = (50, 95, 99)
+
+# Границы корзин гистограмм в /metrics: степени четверки совпадают с границами
+# корзин Histogram, поэтому счетчики le не зависят от точности гистограммы
+# (только значение, в точности равное границе, уходит в следующую корзину).
+# Покрывают от 0.25 мс до 16384 (секунды, токены, штуки).
+PROMETHEUS_BOUNDS = tuple(4.0 ** power for power in range(-6, 8))
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Сборщик: обновляет значения в реестре перед выгрузкой или запросом /metrics
+Collector = Callable[["MetricsRegistry"], None]
+
+
+def series_key(name: str, labels: Optional[Dict[str, str]]) -> SeriesKey:
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+class Histogram:
+    """
+    Гистограмма в духе HDR: корзины растут по степеням двойки, и каждая степень
+    делится на subbuckets равных частей. Относительная ошибка перцентиля не больше
+    1 / subbuckets при любом разбросе значений, а память зависит только от разброса.
+    """
+    __slots__ = ('subbuckets', 'buckets', 'count', 'sum', 'min', 'max', 'zeros')
+
+    def __init__(self, subbuckets: int = 32):
+        self.subbuckets = subbuckets
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        # Значения <= 0 (например, нулевая задержка) в логарифмические корзины не попадают
+        self.zeros = 0
+
+    def record(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zeros += 1
+            return
+        mantissa, exponent = math.frexp(value)
+        index = exponent * self.subbuckets + int((mantissa - 0.5) * 2 * self.subbuckets)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def bucket_bounds(self, index: int) -> Tuple[float, float]:
+        exponent, sub = divmod(index, self.subbuckets)
+        width = math.ldexp(1.0, exponent) / (2 * self.subbuckets)
+        lower = math.ldexp(0.5, exponent) + sub * width
+        return lower, lower + width
+
+    def merge(self, other: "Histogram") -> None:
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.zeros += other.zeros
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> "Histogram":
+        result = Histogram(self.subbuckets)
+        result.merge(self)
+        return result
+
+    def cumulative_counts(self, bounds: Sequence[float]) -> List[int]:
+        """Сколько значений не больше каждой границы (границы по возрастанию)"""
+        counts = [0] * len(bounds)
+        for index, count in self.buckets.items():
+            _, upper = self.bucket_bounds(index)
+            for position, bound in enumerate(bounds):
+                if upper <= bound:
+                    counts[position] += count
+                    break
+        total = self.zeros
+        for position, count in enumerate(counts):
+            total += count
+            counts[position] = total
+        return counts
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        if rank <= self.zeros:
+            return min(self.min, 0.0)
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                lower, upper = self.bucket_bounds(index)
+                return min(max((lower + upper) / 2, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        result = {'count': self.count, 'sum': self.sum,
+                  'min': self.min if self.count else 0.0, 'max': self.max if self.count else 0.0}
+        for percent in PERCENTILES:
+            result[f"p{percent}"] = self.percentile(percent)
+        return result
+
+
+@dataclass
+class Sample:
+    """Серия на момент выгрузки"""
+    name: str
+    labels: Dict[str, str]
+    kind: str  # counter, gauge, histogram
+    value: float
+    histogram: Optional[Histogram] = None
+
+    def points(self) -> Iterator[Tuple[str, float]]:
+        """Плоские точки для хранилищ без гистограмм: гистограмма - count, сумма и перцентили"""
+        if self.histogram is None:
+            yield self.name, self.value
+            return
+        for field_name, value in self.histogram.summary().items():
+            yield f"{self.name}_{field_name}", value
+
+
+class MetricsRegistry:
+    """
+    Args:
+        subbuckets: Точность гистограмм (корзин на каждую степень двойки)
+    """
+
+    def __init__(self, subbuckets: int = 32):
+        self.subbuckets = subbuckets
+        self.counters: Dict[SeriesKey, float] = {}
+        self.gauges: Dict[SeriesKey, float] = {}
+        # Гистограммы текущего интервала и накопленные с момента старта
+        self.interval: Dict[SeriesKey, Histogram] = {}
+        self.histograms: Dict[SeriesKey, Histogram] = {}
+        self.collectors: List[Collector] = []
+
+    def counter(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        key = series_key(name, labels)
+        self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        self.gauges[series_key(name, labels)] = value
+
+    def set_counter(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Значение счетчика, который ведет другой сервис (для сборщиков)"""
+        self.counters[series_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = series_key(name, labels)
+        histogram = self.interval.get(key)
+        if histogram is None:
+            histogram = self.interval[key] = Histogram(self.subbuckets)
+        histogram.record(value)
+
+    def add_collector(self, collector: Collector) -> None:
+        self.collectors.append(collector)
+
+    def run_collectors(self) -> None:
+        for collector in self.collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+    def cumulative_histograms(self) -> Dict[SeriesKey, Histogram]:
+        """Гистограммы с момента старта, включая текущий интервал (интервал не сбрасывается)"""
+        result = dict(self.histograms)
+        for key, histogram in self.interval.items():
+            total = result.get(key)
+            if total is None:
+                result[key] = histogram
+            else:
+                total = total.copy()
+                total.merge(histogram)
+                result[key] = total
+        return result
+
+    def collect(self) -> List[Sample]:
+        """Снимок серий; гистограммы интервала переносятся в накопленные"""
+        self.run_collectors()
+        interval, self.interval = self.interval, {}
+        samples = [Sample(name, dict(labels), 'counter', value) for (name, labels), value in self.counters.items()]
+        samples += [Sample(name, dict(labels), 'gauge', value) for (name, labels), value in self.gauges.items()]
+        for key, histogram in interval.items():
+            total = self.histograms.get(key)
+            if total is None:
+                total = self.histograms[key] = Histogram(self.subbuckets)
+            total.merge(histogram)
+            name, labels = key
+            samples.append(Sample(name, dict(labels), 'histogram', histogram.count, histogram))
+        return samples
+
+
+def _metric_name(name: str) -> str:
+    return ''.join(char if char.isalnum() or char in '_:' else '_' for char in name)
+
+
+def _label_text(labels: Sequence[Tuple[str, str]], le: Optional[str] = None) -> str:
+    parts = []
+    for key, value in labels if le is None else (*labels, ('le', le)):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{_metric_name(key)}="{escaped}"')
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def render_prometheus(registry: MetricsRegistry) -> str:
+    """Текстовый формат Prometheus (version 0.0.4)"""
+    registry.run_collectors()
+    lines: List[str] = []
+
+    def by_name(series: Dict[SeriesKey, Any]) -> Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], Any]]]:
+        grouped: Dict[str, List[Tuple[Tuple[Tuple[str, str], ...], Any]]] = {}
+        for (name, labels), value in series.items():
+            grouped.setdefault(_metric_name(name), []).append((labels, value))
+        return grouped
+
+    for kind, series in (('counter', registry.counters), ('gauge', registry.gauges)):
+        for name, items in sorted(by_name(series).items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_label_text(labels)} {float(value)!r}" for labels, value in items)
+
+    for name, items in sorted(by_name(registry.cumulative_histograms()).items()):
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in items:
+            for bound, count in zip(PROMETHEUS_BOUNDS, histogram.cumulative_counts(PROMETHEUS_BOUNDS)):
+                lines.append(f"{name}_bucket{_label_text(labels, repr(bound))} {count}")
+            lines.append(f"{name}_bucket{_label_text(labels, '+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum!r}")
+            lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+    return '\n'.join(lines) + '\n'
+
+
+class FileMetricsExporter:
+    """Выгрузка в JSONL-файл - замена Cloud Monitoring при локальной разработке"""
+    min_interval = 0.0
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+
+    async def export(self, samples: Sequence[Sample], timestamp: float) -> None:
+        lines = []
+        for sample in samples:
+            record: Dict[str, Any] = {'time': timestamp, 'name': sample.name, 'labels': sample.labels,
+                                      'kind': sample.kind}
+            if sample.histogram is not None:
+                record.update(sample.histogram.summary())
+            else:
+                record['value'] = sample.value
+            lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        await asyncio.to_thread(self._write, lines)
+
+
+class PostgresMetricsExporter:
+    """Выгрузка в таблицу bot_metrics одним запросом"""
+    min_interval = 0.0
+
+    def __init__(self, db):
+        self.db = db
+
+    async def export(self, samples: Sequence[Sample], timestamp: float) -> None:
+        names, values, tags = [], [], []
+        for sample in samples:
+            labels = json.dumps(sample.labels, ensure_ascii=False)
+            for name, value in sample.points():
+                names.append(name)
+                values.append(float(value))
+                tags.append(labels)
+        saved = await self.db.execute(
+            """
+            INSERT INTO public.bot_metrics (name, value, tags, timestamp)
+            SELECT name, value, tags::jsonb, to_timestamp($4)
+            FROM unnest($1::text[], $2::float8[], $3::text[]) AS m(name, value, tags)
+            """,
+            names, values, tags, timestamp
+        )
+        if not saved:
+            raise RuntimeError("Не удалось записать метрики в bot_metrics")
+
+
+class CloudMonitoringExporter:
+    """
+    Выгрузка в Cloud Monitoring: все точки одного сбора уходят пачками по 200 серий
+    (лимит create_time_series). Клиент синхронный, поэтому вызов идет в отдельном потоке.
+    """
+    # Cloud Monitoring не принимает точки одной серии чаще раза в 5 секунд
+    min_interval = 5.0
+    batch_size = 200
+
+    def __init__(self, project_id: str, client=None, prefix: str = 'custom.googleapis.com/flower_shop_bot/'):
+        self.project_name = f"projects/{project_id}"
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import monitoring_v3
+            self._client = monitoring_v3.MetricServiceClient()
+        return self._client
+
+    def _time_series(self, samples: Sequence[Sample], timestamp: float) -> List[Any]:
+        from google.cloud import monitoring_v3
+
+        series_list = []
+        for sample in samples:
+            for name, value in sample.points():
+                series = monitoring_v3.TimeSeries()
+                series.metric.type = f"{self.prefix}{name}"
+                series.metric.labels.update(sample.labels)
+                series.resource.type = "global"
+                point = monitoring_v3.Point()
+                point.value.double_value = float(value)
+                point.interval.end_time.seconds = int(timestamp)
+                point.interval.end_time.nanos = int((timestamp % 1) * 1e9)
+                series.points = [point]
+                series_list.append(series)
+        return series_list
+
+    def _send(self, samples: Sequence[Sample], timestamp: float) -> None:
+        series_list = self._time_series(samples, timestamp)
+        for start in range(0, len(series_list), self.batch_size):
+            self.client.create_time_series(request={
+                "name": self.project_name,
+                "time_series": series_list[start:start + self.batch_size]
+            })
+
+    async def export(self, samples: Sequence[Sample], timestamp: float) -> None:
+        await asyncio.to_thread(self._send, samples, timestamp)
+
+
+class MetricsPublisher:
+    """
+    Фоновая выгрузка метрик.
+
+    Args:
+        registry: Реестр метрик
+        exporters: Куда выгружать; ошибка одного экспортера не мешает остальным
+        interval: Период выгрузки, секунд (не чаще, чем допускает самый строгий экспортер)
+    """
+
+    def __init__(self, registry: MetricsRegistry, exporters: Sequence[Any], interval: float = 60.0):
+        self.registry = registry
+        self.exporters = list(exporters)
+        self.interval = max([interval] + [exporter.min_interval for exporter in self.exporters])
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'flushes': 0, 'samples': 0, 'failures': 0, 'last_flush_ms': 0.0}
+
+    async def flush(self) -> None:
+        samples = self.registry.collect()
+        if not samples:
+            return
+        started = time.perf_counter()
+        timestamp = time.time()
+        results = await asyncio.gather(*[exporter.export(samples, timestamp) for exporter in self.exporters],
+                                       return_exceptions=True)
+        for exporter, result in zip(self.exporters, results):
+            if isinstance(result, Exception):
+                self.stats['failures'] += 1
+                logger.error(f"Failed to export metrics via {type(exporter).__name__}: {result}")
+        self.stats['flushes'] += 1
+        self.stats['samples'] += len(samples)
+        self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Останавливает выгрузку и отправляет накопленное"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+# Создаем глобальный экземпляр
+metrics = MetricsRegistry()
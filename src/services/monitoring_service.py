@@ -1,26 +1,18 @@
+import asyncio
 import logging
 from datetime import datetime, date, timedelta
 from typing import Dict, Optional, List
 from uuid import UUID
 import json
 from dataclasses import dataclass
-from google.cloud import monitoring_v3
-import time
 
 from services.supabase_service import supabase_service
 from services.config_service import config_service
+from services.metrics import CloudMonitoringExporter, metrics
+from services.token_usage import TokenUsage, token_recorder
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class TokenUsage:
-    prompt_tokens: int
-    completion_tokens: int
-    total_tokens: int
-    cost_usd: float
-    scenario: str
-    message_id: Optional[str]
-
 @dataclass
 class ResponseQuality:
     message_id: Optional[str]
@@ -37,66 +29,16 @@ class MonitoringService:
     def __init__(self):
         self.config = config_service
         self.project_id = self.config.get_config('project_id', service_name='google')
-        if self.project_id:
-            self.client = monitoring_v3.MetricServiceClient()
-            self.project_name = f"projects/{self.project_id}"
+        # Точки копятся в реестре метрик, в Cloud Monitoring их пачками выгружает MetricsPublisher
+        self.exporter = CloudMonitoringExporter(self.project_id) if self.project_id else None
         
     def record_metric(self, metric_type: str, value: float, labels: Dict[str, str] = None):
-        """Записывает метрику в Cloud Monitoring."""
-        try:
-            if not self.project_id:
-                return
-
-            series = monitoring_v3.TimeSeries()
-            series.metric.type = f"custom.googleapis.com/flower_shop_bot/{metric_type}"
-            
-            if labels:
-                series.metric.labels.update(labels)
-            
-            series.resource.type = "global"
-            point = series.points.add()
-            point.value.double_value = value
-            now = time.time()
-            point.interval.end_time.seconds = int(now)
-            
-            self.client.create_time_series(
-                request={
-                    "name": self.project_name,
-                    "time_series": [series]
-                }
-            )
-            logger.debug(f"Recorded metric {metric_type}: {value}")
-        except Exception as e:
-            logger.error(f"Failed to record metric: {e}")
+        """Записывает точку метрики в реестр (без обращения к Cloud Monitoring)."""
+        metrics.observe(metric_type, value, labels)
         
     async def log_token_usage(self, usage: TokenUsage) -> None:
-        """Логирует использование токенов."""
-        try:
-            current_time = datetime.now().isoformat()
-            await supabase_service.execute_query(
-                """
-                INSERT INTO token_usage (
-                    prompt_tokens, completion_tokens, total_tokens,
-                    cost_usd, scenario, message_id, created_at
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    usage.prompt_tokens,
-                    usage.completion_tokens,
-                    usage.total_tokens,
-                    usage.cost_usd,
-                    usage.scenario,
-                    usage.message_id,  
-                    current_time  
-                )
-            )
-            # Записываем метрики
-            self.record_metric("token_usage_total", usage.total_tokens, {"scenario": usage.scenario})
-            self.record_metric("token_cost_usd", usage.cost_usd, {"scenario": usage.scenario})
-            
-            logger.info(f"Token usage logged for message {usage.message_id}")
-        except Exception as e:
-            logger.error(f"Failed to log token usage: {e}")
+        """Логирует использование токенов (в token_usage пишется пачками в фоне)."""
+        token_recorder.record(usage)
 
     async def log_response_quality(self, quality: ResponseQuality) -> None:
         """Логирует качество ответа."""
@@ -104,7 +46,8 @@ class MonitoringService:
             current_time = datetime.now().isoformat()
             flags_json = json.dumps(quality.flags, ensure_ascii=False)
             
-            await supabase_service.execute_query(
+            await asyncio.to_thread(
+                supabase_service.execute_query,
                 """
                 INSERT INTO response_quality (
                     message_id, scenario, response_relevance,
@@ -124,7 +67,8 @@ class MonitoringService:
                     quality.completed_order,
                     quality.processing_time_ms,
                     current_time  
-                )
+                ),
+                False
             )
             # Записываем метрики
             self.record_metric("response_quality", quality.response_relevance, {"scenario": quality.scenario})
@@ -138,36 +82,40 @@ class MonitoringService:
             logger.error(f"Failed to log response quality: {e}")
 
     async def get_daily_token_usage(self, day: date) -> Dict[str, int]:
-        """Получает статистику использования токенов за день."""
+        """Получает статистику использования токенов за день (из дневной сводки)."""
         try:
-            day_str = day.isoformat()
-            result = await supabase_service.execute_query(
+            result = await asyncio.to_thread(
+                supabase_service.execute_query,
                 """
                 SELECT 
                     SUM(prompt_tokens) as prompt_tokens,
                     SUM(completion_tokens) as completion_tokens,
-                    SUM(total_tokens) as total_tokens,
+                    SUM(cached_tokens) as cached_tokens,
                     SUM(cost_usd) as total_cost
-                FROM token_usage
-                WHERE DATE(created_at) = %s
+                FROM token_usage_daily
+                WHERE day = %s
                 """,
-                (day_str,)
+                (day.isoformat(),)
             )
             
             if not result or not result[0]:
                 return {
                     'prompt_tokens': 0,
                     'completion_tokens': 0,
+                    'cached_tokens': 0,
                     'total_tokens': 0,
                     'total_cost': 0.0
                 }
                 
             row = result[0]
+            prompt_tokens = int(row['prompt_tokens'] or 0)
+            completion_tokens = int(row['completion_tokens'] or 0)
             return {
-                'prompt_tokens': row[0] or 0,
-                'completion_tokens': row[1] or 0,
-                'total_tokens': row[2] or 0,
-                'total_cost': float(row[3] or 0)
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'cached_tokens': int(row['cached_tokens'] or 0),
+                'total_tokens': prompt_tokens + completion_tokens,
+                'total_cost': float(row['total_cost'] or 0)
             }
             
         except Exception as e:
@@ -175,6 +123,7 @@ class MonitoringService:
             return {
                 'prompt_tokens': 0,
                 'completion_tokens': 0,
+                'cached_tokens': 0,
                 'total_tokens': 0,
                 'total_cost': 0.0
             }
@@ -183,7 +132,8 @@ class MonitoringService:
         """Получает статистику производительности сценария."""
         try:
             cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
-            result = await supabase_service.execute_query(
+            result = await asyncio.to_thread(
+                supabase_service.execute_query,
                 """
                 SELECT 
                     AVG(response_relevance) as avg_relevance,
@@ -212,12 +162,12 @@ class MonitoringService:
                 
             row = result[0]
             return {
-                'avg_relevance': float(row[0] or 0),
-                'avg_compliance': float(row[1] or 0),
-                'avg_emotional': float(row[2] or 0),
-                'avg_rating': float(row[3] or 0),
-                'completion_rate': float(row[4] or 0),
-                'avg_processing_time': float(row[5] or 0)
+                'avg_relevance': float(row['avg_relevance'] or 0),
+                'avg_compliance': float(row['avg_compliance'] or 0),
+                'avg_emotional': float(row['avg_emotional'] or 0),
+                'avg_rating': float(row['avg_rating'] or 0),
+                'completion_rate': float(row['completion_rate'] or 0),
+                'avg_processing_time': float(row['avg_processing_time'] or 0)
             }
             
         except Exception as e:
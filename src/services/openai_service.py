@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import time
@@ -6,21 +7,36 @@ from openai import AsyncOpenAI
 from services.config_service import config_service
 from services.docs_service import DocsService
 from services.sheets_service import SheetsService
+from function_handlers import tool_engine
+from services.tracing import span
+from services.metrics import metrics
+from services.token_usage import DEFAULT_SCENARIO, token_recorder, usage_from_response
 
 logger = logging.getLogger(__name__)
 
 class OpenAIService:
-    def __init__(self):
-        # Получаем учетные данные из базы
-        self.api_key = config_service.get_config('api_key', service_name='openai')
-        self.model = config_service.get_config('model', service_name='openai') or "gpt-4-turbo-preview"
+    def __init__(self, client=None, docs_service: DocsService = None,
+                 sheets_service: SheetsService = None, model: str = None):
+        """
+        client, docs_service и sheets_service подставляются при воспроизведении
+        истории и в тестах; по умолчанию создаются настоящие клиенты
+        """
+        self.model = model or config_service.get_config('model', service_name='openai') or "gpt-4-turbo-preview"
         
-        self.client = AsyncOpenAI(
-            api_key=self.api_key
-        )
+        if client is None:
+            # Получаем учетные данные из базы
+            self.api_key = config_service.get_config('api_key', service_name='openai')
+            client = AsyncOpenAI(
+                api_key=self.api_key
+            )
+        self.client = client
         
-        self.docs_service = DocsService()
-        self.sheets_service = SheetsService()
+        self.docs_service = docs_service or DocsService()
+        self.sheets_service = sheets_service or SheetsService()
+        
+        # Инструменты, доступные модели, и ограничение на число раундов их вызова
+        self.tool_engine = tool_engine
+        self.max_tool_rounds = 3
         
         # Параметры модели
         self.model_config = {
@@ -65,7 +81,7 @@ class OpenAIService:
     def _get_topic(self, query: str) -> Optional[str]:
         """Определяет тему вопроса"""
         query = query.lower()
-        logger.info(f"Определяем тему для вопроса: {query}")
+        logger.debug("Определяем тему для вопроса: %s", query)
         
         for topic, keywords in self.topics.items():
             found_keywords = [word for word in keywords if word in query]
@@ -109,6 +125,60 @@ class OpenAIService:
         
         return response
 
+    async def _create_completion(self, messages: List[Dict], scenario: str = DEFAULT_SCENARIO) -> Optional[str]:
+        """
+        Запрос к модели с циклом вызова инструментов.
+        Все вызовы из одного ответа модели выполняются параллельно,
+        после max_tool_rounds раундов модель обязана ответить текстом.
+        Расход токенов каждого раунда учитывается по сценарию (теме вопроса).
+        """
+        messages = list(messages)
+        
+        for round_number in range(self.max_tool_rounds + 1):
+            tool_choice = "auto" if round_number < self.max_tool_rounds else "none"
+            with span('llm', model=self.model, round=round_number + 1) as stage:
+                metrics.counter('llm_requests_total', labels={'model': self.model})
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        tools=self.tool_engine.definitions(),
+                        tool_choice=tool_choice,
+                        temperature=0.7,
+                        max_tokens=500,
+                        presence_penalty=0.1,
+                        frequency_penalty=0.1
+                    )
+                except Exception as e:
+                    metrics.counter('llm_errors_total', labels={'model': self.model, 'error': type(e).__name__})
+                    raise
+                if response.usage:
+                    usage = usage_from_response(response.usage, self.model, scenario)
+                    stage.attrs['prompt_tokens'] = usage.prompt_tokens
+                    stage.attrs['completion_tokens'] = usage.completion_tokens
+                    stage.attrs['cached_tokens'] = usage.cached_tokens
+                    token_recorder.record(usage)
+            
+            if not response.choices:
+                return None
+            
+            message = response.choices[0].message
+            if not message.tool_calls:
+                return message.content.strip() if message.content else None
+            
+            logger.info(
+                f"Раунд {round_number + 1}: модель вызвала инструменты "
+                f"{[call.function.name for call in message.tool_calls]}"
+            )
+            messages.append({
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": [call.model_dump() for call in message.tool_calls]
+            })
+            messages.extend(await self.tool_engine.execute_tool_calls(message.tool_calls))
+        
+        return None
+
     async def get_response(self, user_message: str, inventory_info: str = None, user_id: int = None):
         """Получает ответ от OpenAI с учетом информации о товарах и базы знаний"""
         max_retries = 3
@@ -120,9 +190,9 @@ class OpenAIService:
             if requested_flowers:
                 logger.info(f"Запрошены цветы: {requested_flowers}")
                 # Получаем информацию о цветах
-                flower_info = self.sheets_service.get_specific_flowers(requested_flowers)
+                flower_info = await self.sheets_service.get_specific_flowers(requested_flowers)
                 if flower_info:
-                    logger.info(f"Найдена информация о цветах: {flower_info}")
+                    logger.debug("Найдена информация о цветах: %s", flower_info)
                     return flower_info
                 else:
                     logger.warning("Информация о запрошенных цветах не найдена")
@@ -144,7 +214,7 @@ class OpenAIService:
                 logger.info("Тема не определена")
                 context = []
 
-            logger.info(f"Итоговый контекст для OpenAI: {context}")
+            logger.debug("Итоговый контекст для OpenAI: %s", context)
 
             while retry_count < max_retries:
                 try:
@@ -179,19 +249,10 @@ class OpenAIService:
                     ]
 
                     # Получаем ответ от OpenAI
-                    response = await self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=500,
-                        presence_penalty=0.1,
-                        frequency_penalty=0.1
-                    )
+                    response = await self._create_completion(messages, topic or DEFAULT_SCENARIO)
 
                     # Получаем ответ
-                    if response.choices and response.choices[0].message.content:
-                        response = response.choices[0].message.content.strip()
-                        
+                    if response:
                         # Валидируем ответ
                         validated_response = self._validate_response(response, user_message)
                         if validated_response is None:
@@ -204,16 +265,8 @@ class OpenAIService:
                                     f"Вопрос клиента: {user_message}"
                                 )}
                             ]
-                            response = await self.client.chat.completions.create(
-                                model=self.model,
-                                messages=messages,
-                                temperature=0.7,
-                                max_tokens=500,
-                                presence_penalty=0.1,
-                                frequency_penalty=0.1
-                            )
-                            response = response.choices[0].message.content.strip()
-                            validated_response = self._validate_response(response, user_message)
+                            response = await self._create_completion(messages, topic or DEFAULT_SCENARIO)
+                            validated_response = self._validate_response(response, user_message) if response else None
                             
                         return validated_response if validated_response else "Нет информации"
                     else:
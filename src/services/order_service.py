@@ -0,0 +1,335 @@
+"""
+Оформление заказов и фоновая рассылка уведомлений через outbox.
+Клиент получает подтверждение после одного обращения к базе (функция place_order),
+а уведомления в группу персонала и запись в Google Sheets отправляет диспетчер.
+Просроченные резервы товара возвращает на склад ReservationReleaser.
+"""
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Обработчик пачки событий одного типа: получает payload заказов, при ошибке бросает исключение
+OutboxHandler = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+def make_idempotency_key(bouquet_name: str, customer_phone: str, delivery_address: str,
+                         delivery_time: Optional[str] = None, day: Optional[date] = None) -> str:
+    """
+    Ключ идемпотентности по содержимому заказа.
+    Повтор вызова моделью или повторная доставка вебхука дают тот же ключ,
+    а тот же букет на тот же адрес в другой день - новый заказ.
+    """
+    phone = re.sub(r'\D', '', customer_phone or '')[-10:]
+    parts = [
+        (bouquet_name or '').strip().lower(),
+        phone,
+        ' '.join((delivery_address or '').lower().split()),
+        (delivery_time or '').strip(),
+        (day or date.today()).isoformat()
+    ]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+class OrderService:
+    """Запись заказов в базу"""
+
+    def __init__(self, db=None):
+        self._db = db
+        self.dispatcher: Optional['OutboxDispatcher'] = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            from services.postgres_service import PostgresService
+            self._db = PostgresService()
+        return self._db
+
+    async def place_order(self, order: Dict[str, Any], idempotency_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Оформляет заказ: резерв товара, заказ и события outbox в одной транзакции.
+
+        Args:
+            order: bouquet_name, quantity, price, delivery_price, customer_name,
+                customer_phone, delivery_address, delivery_time
+            idempotency_key: Ключ от клиента; если не передан, считается по содержимому заказа
+
+        Returns:
+            Optional[Dict]: order_id, order_number, status, created или None при ошибке базы
+        """
+        key = idempotency_key or make_idempotency_key(
+            order['bouquet_name'], order['customer_phone'],
+            order['delivery_address'], order.get('delivery_time')
+        )
+        row = await self.db.fetch_one(
+            """
+            SELECT order_id, order_number, status, created
+            FROM public.place_order($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            """,
+            key,
+            order['bouquet_name'],
+            order.get('quantity', 1),
+            order.get('price'),
+            order.get('delivery_price'),
+            order['customer_name'],
+            order['customer_phone'],
+            order['delivery_address'],
+            order.get('delivery_time')
+        )
+        if row is None:
+            logger.error(f"Failed to place order for {order['bouquet_name']}")
+            return None
+
+        if row['created']:
+            logger.info(f"Order #{row['order_number']} created")
+            if self.dispatcher:
+                self.dispatcher.wake()
+        elif row['order_id']:
+            logger.info(f"Duplicate order request, returning order #{row['order_number']}")
+        return row
+
+
+class OutboxDispatcher:
+    """
+    Фоновая отправка событий из order_outbox.
+    События забираются пачками (SKIP LOCKED, можно запускать несколько экземпляров)
+    и группируются по типу. Обработчик получает пачку своего типа частями по
+    chunk_sizes[тип] (по умолчанию - всю сразу); каждая часть отмечается
+    отправленной сразу после успеха, поэтому ошибка на середине пачки
+    не повторяет уже отправленные части.
+
+    Если отметка 'sent' не записалась, id событий запоминаются: при следующем
+    проходе отметка повторяется, а такие события, забранные повторно, не
+    отправляются второй раз.
+    """
+
+    def __init__(self, db, handlers: Dict[str, OutboxHandler],
+                 batch_size: int = 50, poll_interval: float = 5.0,
+                 max_attempts: int = 5, retry_delay: int = 30,
+                 chunk_sizes: Optional[Dict[str, int]] = None):
+        self.db = db
+        self.handlers = handlers
+        self.chunk_sizes = chunk_sizes or {}
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Доставленные события, отметку 'sent' для которых записать не удалось
+        self._unacked: Set[int] = set()
+
+    def wake(self) -> None:
+        """Разбудить диспетчер, не дожидаясь следующего опроса"""
+        self._wakeup.set()
+
+    async def run_once(self) -> int:
+        """Обрабатывает одну пачку событий, возвращает их количество"""
+        if self._unacked:
+            await self._mark_sent(list(self._unacked))
+
+        events = await self.db.fetch_all(
+            "SELECT * FROM public.claim_order_outbox($1)", self.batch_size
+        )
+        if not events:
+            return 0
+
+        # Уже доставленные события вернулись из-за несохраненной отметки - только отмечаем
+        delivered = {event['id'] for event in events if event['id'] in self._unacked}
+        if delivered:
+            await self._mark_sent(list(delivered))
+
+        by_type: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for event in events:
+            if event['id'] not in delivered:
+                by_type[event['event_type']].append(event)
+
+        for event_type, group in by_type.items():
+            handler = self.handlers.get(event_type)
+            if handler is None:
+                await self._mark_failed([event['id'] for event in group],
+                                        f"no handler for {event_type}", retry=False)
+                continue
+
+            chunk_size = self.chunk_sizes.get(event_type) or len(group)
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                ids = [event['id'] for event in chunk]
+                payloads = [
+                    json.loads(event['payload']) if isinstance(event['payload'], str) else event['payload']
+                    for event in chunk
+                ]
+                try:
+                    await handler(payloads)
+                except Exception as e:
+                    # Отправленные части уже отмечены; в очередь возвращается остаток пачки
+                    rest = [event['id'] for event in group[start:]]
+                    logger.error(f"Outbox {event_type}: failed to send {len(rest)} events: {e}")
+                    await self._mark_failed(rest, str(e))
+                    break
+
+                await self._mark_sent(ids)
+                logger.info(f"Outbox {event_type}: sent {len(ids)} events")
+
+        return len(events)
+
+    async def _mark_sent(self, ids: List[int]) -> bool:
+        """Отмечает события отправленными; при ошибке базы запоминает их до следующего прохода"""
+        if await self.db.execute(
+            "UPDATE public.order_outbox SET status = 'sent', sent_at = NOW() WHERE id = ANY($1::bigint[])",
+            ids
+        ):
+            self._unacked.difference_update(ids)
+            return True
+        logger.error(f"Outbox: failed to mark {len(ids)} events as sent, will retry")
+        self._unacked.update(ids)
+        return False
+
+    async def _mark_failed(self, ids: List[int], error: str, retry: bool = True) -> None:
+        """Возвращает события в очередь с нарастающей задержкой или помечает как failed"""
+        await self.db.execute(
+            """
+            UPDATE public.order_outbox
+            SET status = CASE WHEN $2 AND attempts < $3 THEN 'pending' ELSE 'failed' END,
+                available_at = NOW() + make_interval(secs => $4 * attempts),
+                last_error = $5
+            WHERE id = ANY($1::bigint[])
+            """,
+            ids, retry, self.max_attempts, self.retry_delay, error
+        )
+
+    async def run(self) -> None:
+        """Цикл диспетчера: опрос outbox раз в poll_interval или по wake()"""
+        logger.info("Order outbox dispatcher started")
+        while True:
+            try:
+                # Полная пачка - сразу забираем следующую
+                while await self.run_once() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Order outbox dispatcher error: {e}", exc_info=True)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ReservationReleaser:
+    """
+    Периодический возврат на склад товаров из просроченных резервов.
+    reserve_products освобождает их только при следующем резервировании,
+    а без заказов товар оставался бы списанным до первого нового заказа.
+    """
+
+    def __init__(self, db, interval: float = 60.0):
+        self.db = db
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'runs': 0, 'released': 0, 'errors': 0}
+
+    async def run_once(self) -> Optional[int]:
+        """Освобождает просроченные резервы; None - ошибка базы"""
+        row = await self.db.fetch_one("SELECT public.release_expired_reservations() AS released")
+        self.stats['runs'] += 1
+        if row is None:
+            self.stats['errors'] += 1
+            return None
+        released = row['released'] or 0
+        if released:
+            self.stats['released'] += released
+            logger.info(f"Released {released} expired reservations")
+        return released
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Failed to release expired reservations: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+def format_orders_message(orders: List[Dict[str, Any]]) -> str:
+    """
+    Одно сообщение в группу персонала на пачку заказов (parse_mode="HTML").
+    Поля заказа вводит клиент, поэтому они экранируются: символы разметки
+    в адресе или имени иначе ломают сообщение (Telegram отвечает 400).
+    """
+    def field(value: Any) -> str:
+        return html.escape(str(value))
+
+    lines = [f"🛒 <b>Новые заказы: {len(orders)}</b>" if len(orders) > 1 else "🛒 <b>Новый заказ</b>"]
+    for order in orders:
+        lines.append(
+            f"\n<b>№{field(order.get('order_number'))}</b> - {field(order.get('bouquet_name'))} "
+            f"x{field(order.get('quantity', 1))}\n"
+            f"👤 {field(order.get('customer_name'))}, {field(order.get('customer_phone'))}\n"
+            f"📍 {field(order.get('delivery_address'))}"
+            + (f"\n🕐 {field(order['delivery_time'])}" if order.get('delivery_time') else "")
+        )
+    return "\n".join(lines)
+
+
+def order_sheet_row(order: Dict[str, Any]) -> List[str]:
+    """Строка заказа для листа Заказы"""
+    return [
+        str(order.get('order_number', '')),
+        str(order.get('created_at', '')),
+        order.get('bouquet_name', ''),
+        str(order.get('quantity', 1)),
+        str(order.get('price') or ''),
+        str(order.get('delivery_price') or ''),
+        order.get('customer_name', ''),
+        order.get('customer_phone', ''),
+        order.get('delivery_address', ''),
+        order.get('delivery_time') or ''
+    ]
+
+
+# Создаем глобальный экземпляр
+order_service = OrderService()
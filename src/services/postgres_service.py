@@ -101,6 +101,14 @@ class PostgresService:
             await self.pool.close()
             self.pool = None
 
+    def get_pool_stats(self) -> Dict[str, int]:
+        """Заполненность пула соединений; пустой словарь, пока пул не создан"""
+        if not self.pool:
+            return {}
+        size = self.pool.get_size()
+        return {'size': size, 'idle': self.pool.get_idle_size(), 'in_use': size - self.pool.get_idle_size(),
+                'max': self.pool.get_max_size()}
+
     async def save_to_cache(self, source: str, data: dict) -> bool:
         """Сохранение данных в кэш"""
         query = """
@@ -19,11 +19,10 @@ class ProductService:
     def get_product_by_name(self, name: str) -> Optional[Dict]:
         """Получить продукт по названию."""
         try:
-            products = self.db.get_products()
-            for product in products:
-                if product['name'].lower() == name.lower():
-                    return product
-            return None
+            return self.db.execute_query_single(
+                "SELECT * FROM products WHERE LOWER(name) = LOWER(%s)",
+                (name,)
+            )
         except Exception as e:
             logger.error(f"Error getting product by name: {str(e)}")
             return None
@@ -36,11 +35,33 @@ class ProductService:
             logger.error(f"Error getting products by category: {str(e)}")
             return []
 
-    def check_availability(self, product_name: str, quantity: int) -> Dict:
-        """Проверить наличие продукта в указанном количестве."""
+    def check_availability(self, product_name: str, quantity: int, reserve: bool = False,
+                           ttl_seconds: int = 900) -> Dict:
+        """Проверить наличие продукта в указанном количестве.
+
+        При reserve=True товар сразу резервируется атомарным списанием,
+        поэтому между проверкой и заказом его не сможет забрать другой клиент.
+        """
         try:
-            product = self.get_product_by_name(product_name)
-            if not product:
+            if reserve:
+                # Остаток приходит из того же запроса, что и резерв
+                reservation_id, remaining = self.db.reserve_products_with_stock(
+                    {product_name: quantity}, ttl_seconds
+                )
+                available_quantity = next(iter(remaining.values()), None)
+                result = {
+                    "available": reservation_id is not None,
+                    "product_name": product_name,
+                    "requested_quantity": quantity,
+                    "available_quantity": available_quantity or 0,
+                    "reservation_id": reservation_id
+                }
+                if available_quantity is None:
+                    result["error"] = "Product not found"
+                return result
+
+            available_quantity = self.db.get_product_quantity(product_name)
+            if available_quantity is None:
                 return {
                     "available": False,
                     "product_name": product_name,
@@ -50,10 +71,10 @@ class ProductService:
                 }
 
             return {
-                "available": product['quantity'] >= quantity,
+                "available": available_quantity >= quantity,
                 "product_name": product_name,
                 "requested_quantity": quantity,
-                "available_quantity": product['quantity']
+                "available_quantity": available_quantity
             }
         except Exception as e:
             logger.error(f"Error checking product availability: {str(e)}")
@@ -65,6 +86,30 @@ class ProductService:
                 "error": str(e)
             }
 
+    def reserve_products(self, items: Dict[str, int], ttl_seconds: int = 900) -> Optional[str]:
+        """Зарезервировать несколько продуктов одним запросом. Возвращает ID резерва или None."""
+        try:
+            return self.db.reserve_products(items, ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error reserving products: {str(e)}")
+            return None
+
+    def confirm_reservation(self, reservation_id: str) -> bool:
+        """Подтвердить резерв после оформления заказа."""
+        try:
+            return self.db.confirm_reservation(reservation_id)
+        except Exception as e:
+            logger.error(f"Error confirming reservation: {str(e)}")
+            return False
+
+    def release_reservation(self, reservation_id: str) -> bool:
+        """Отменить резерв и вернуть товары на склад."""
+        try:
+            return self.db.release_reservation(reservation_id)
+        except Exception as e:
+            logger.error(f"Error releasing reservation: {str(e)}")
+            return False
+
     def update_product_quantity(self, product_name: str, quantity_change: int) -> bool:
         """Обновить количество продукта (положительное значение для добавления, отрицательное для вычитания)."""
         try:
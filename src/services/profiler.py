@@ -0,0 +1,165 @@
+"""
+Выборочный профилировщик работающего бота.
+Отдельный поток с заданной частотой снимает стеки всех потоков
+(sys._current_frames) и стеки ожидания asyncio-задач. Поток не зависит
+от event loop, поэтому видно и то, чем занят заблокированный цикл.
+
+Одинаковые стеки складываются в счетчики и отдаются в свернутом формате
+(«кадр;кадр;кадр число» в строке) - его читают flamegraph.pl, speedscope
+и inferno. Снимок включается по запросу и ничего не стоит, пока не запущен.
+"""
+import asyncio
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ограничения снимка, чтобы случайный запрос не нагрузил бот
+MAX_SECONDS = 120.0
+MIN_INTERVAL = 0.001
+MAX_DEPTH = 128
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def frame_stack(frame: Optional[FrameType]) -> List[str]:
+    """Кадры от внешнего к текущему"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def task_stack(task: asyncio.Task) -> List[str]:
+    """Цепочка await задачи: от корутины задачи до точки, где она ждет"""
+    labels = []
+    coro = task.get_coro()
+    while coro is not None and len(labels) < MAX_DEPTH:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            break
+        labels.append(frame_label(frame))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return labels
+
+
+def _label(text: str) -> str:
+    # В свернутом формате ';' разделяет кадры, а число отделено последним пробелом
+    return text.replace(';', ',').replace('\n', ' ')
+
+
+@dataclass
+class Profile:
+    """Результат снимка"""
+    stacks: Counter = field(default_factory=Counter)
+    samples: int = 0
+    duration: float = 0.0
+    interval: float = 0.0
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_frames(self, limit: int = 10, prefix: str = 'thread:') -> List[Tuple[str, int]]:
+        """Чаще всего выполнявшиеся кадры (вершины стеков) среди стеков с префиксом"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if stack.startswith(prefix):
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def summary(self, limit: int = 5) -> str:
+        lines = [f"Профиль: {self.duration:.1f} с, {self.samples} снимков каждые {self.interval * 1000:.0f} мс"]
+        for frame, count in self.top_frames(limit):
+            lines.append(f"{count / self.samples * 100:5.1f}%  {frame}" if self.samples else frame)
+        return '\n'.join(lines)
+
+
+class SamplingProfiler:
+    """
+    Args:
+        interval: Пауза между снимками, секунд
+        include_tasks: Снимать ли стеки ожидания asyncio-задач
+    """
+
+    def __init__(self, interval: float = 0.01, include_tasks: bool = True):
+        self.interval = max(interval, MIN_INTERVAL)
+        self.include_tasks = include_tasks
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, profile: Profile, loop: Optional[asyncio.AbstractEventLoop],
+                thread_names: Dict[int, str]) -> None:
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            name = thread_names.get(ident, str(ident))
+            stack = frame_stack(frame)
+            profile.stacks[';'.join([f"thread:{_label(name)}", *map(_label, stack)])] += 1
+
+        if loop is not None:
+            try:
+                tasks = asyncio.all_tasks(loop)
+            except RuntimeError:
+                # Набор задач меняется в потоке цикла; снимок пропускается
+                tasks = ()
+            for task in tasks:
+                stack = task_stack(task)
+                if stack:
+                    profile.stacks[';'.join([f"task:{_label(task.get_name())}", *map(_label, stack)])] += 1
+        profile.samples += 1
+
+    def _run(self, profile: Profile, seconds: float, loop: Optional[asyncio.AbstractEventLoop],
+             stop: threading.Event) -> None:
+        deadline = time.monotonic() + seconds
+        while not stop.is_set() and time.monotonic() < deadline:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self._sample(profile, loop, thread_names)
+            stop.wait(profile.interval)
+
+    async def capture(self, seconds: float, interval: Optional[float] = None) -> Profile:
+        """
+        Снимает профиль за seconds секунд; одновременно идет только один снимок.
+        Бесконечность и NaN отклоняются (ValueError): NaN проходит через min/max.
+        """
+        if not math.isfinite(seconds) or (interval is not None and not math.isfinite(interval)):
+            raise ValueError("seconds and interval must be finite numbers")
+        interval = max(interval or self.interval, MIN_INTERVAL)
+        seconds = min(max(seconds, interval), MAX_SECONDS)
+        async with self._lock:
+            profile = Profile(interval=interval)
+            loop = asyncio.get_running_loop() if self.include_tasks else None
+            stop = threading.Event()
+            started = time.monotonic()
+            sampler = threading.Thread(target=self._run, args=(profile, seconds, loop, stop),
+                                       name='profiler', daemon=True)
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                # Поток завершается после текущего снимка; ждем его, не блокируя цикл
+                await asyncio.to_thread(sampler.join)
+            profile.duration = time.monotonic() - started
+            logger.info(f"Profile captured: {profile.samples} samples, {len(profile.stacks)} stacks")
+            return profile
+
+
+# Создаем глобальный экземпляр
+profiler = SamplingProfiler()
@@ -1,7 +1,6 @@
-import requests
 import logging
-import time
-from typing import Dict, List, Optional, Tuple
+from typing import Optional
+from services.telegram_outbound import Priority, sync_sender, telegram_request
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,42 +16,15 @@ class ReactionAnalyzer:
         self.chat_id = chat_id
         self.learning_topic_id = 145  # ID темы "Обучение бота"
 
-    def get_message_reactions(self, message_id: int) -> Tuple[int, int]:
-        """
-        Получает количество лайков и дизлайков для сообщения
-        Возвращает (likes, dislikes)
-        """
-        try:
-            response = requests.get(
-                f"{self.base_url}/getMessage",
-                params={
-                    "chat_id": self.chat_id,
-                    "message_id": message_id
-                }
-            )
-            
-            if response.status_code == 200:
-                message = response.json()["result"]
-                if "reactions" in message:
-                    reactions = message["reactions"]
-                    likes = sum(1 for r in reactions if r["type"] == "emoji" and r["emoji"] == "👍")
-                    dislikes = sum(1 for r in reactions if r["type"] == "emoji" and r["emoji"] == "👎")
-                    return likes, dislikes
-                return 0, 0
-            else:
-                logger.error(f"Ошибка при получении сообщения: {response.json()}")
-                return 0, 0
-        except Exception as e:
-            logger.error(f"Исключение при получении реакций: {str(e)}")
-            return 0, 0
-
     def forward_message(self, message_id: int, from_topic_id: int) -> bool:
         """
         Пересылает сообщение в тему для обучения бота
         """
         try:
-            response = requests.post(
+            response = sync_sender.request(
+                "POST",
                 f"{self.base_url}/forwardMessage",
+                chat_id=self.chat_id,
                 json={
                     "chat_id": self.chat_id,
                     "message_thread_id": self.learning_topic_id,
@@ -82,8 +54,10 @@ class ReactionAnalyzer:
         Отправляет новое сообщение в тему
         """
         try:
-            response = requests.post(
+            response = sync_sender.request(
+                "POST",
                 f"{self.base_url}/sendMessage",
+                chat_id=self.chat_id,
                 json={
                     "chat_id": self.chat_id,
                     "message_thread_id": topic_id,
@@ -101,59 +75,93 @@ class ReactionAnalyzer:
             logger.error(f"Исключение при отправке сообщения: {str(e)}")
             return None
 
-    def analyze_topic_messages(self, topic_id: int):
-        """
-        Анализирует сообщения в теме и обрабатывает их в зависимости от реакций
-        """
+    async def forward_message_async(self, message_id: int, from_topic_id: int) -> bool:
+        """Асинхронная версия forward_message через общий HTTP-пул"""
         try:
-            # Получаем обновления
-            response = requests.get(
-                f"{self.base_url}/getUpdates",
-                params={
-                    "offset": -1,  # Получаем последние обновления
-                    "limit": 100    # Максимальное количество сообщений
-                }
+            result = await telegram_request(self.base_url, "forwardMessage", {
+                "chat_id": self.chat_id,
+                "message_thread_id": self.learning_topic_id,
+                "from_chat_id": self.chat_id,
+                "message_id": message_id
+            }, priority=Priority.ANALYTICS)
+            if not result.get("ok"):
+                logger.error(f"Ошибка при пересылке сообщения: {result}")
+                return False
+
+            logger.info(f"Сообщение {message_id} переслано в тему обучения")
+            await self.send_message_async(
+                self.learning_topic_id,
+                f"⚠️ Это сообщение получило дизлайк в теме {from_topic_id}. Требуется анализ и улучшение."
             )
-            
-            if response.status_code == 200:
-                updates = response.json()["result"]
-                for update in updates:
-                    if "message" in update:
-                        msg = update["message"]
-                        if "message_thread_id" in msg and msg["message_thread_id"] == topic_id:
-                            message_id = msg["message_id"]
-                            likes, dislikes = self.get_message_reactions(message_id)
-                            
-                            if dislikes > likes:
-                                logger.info(f"Сообщение {message_id} получило больше дизлайков ({dislikes}>{likes})")
-                                self.forward_message(message_id, topic_id)
-            else:
-                logger.error(f"Ошибка при получении обновлений: {response.json()}")
+            return True
         except Exception as e:
-            logger.error(f"Исключение при анализе темы: {str(e)}")
+            logger.error(f"Исключение при пересылке сообщения: {str(e)}")
+            return False
+
+    async def send_message_async(self, topic_id: int, text: str) -> Optional[int]:
+        """Асинхронная версия send_message через общий HTTP-пул"""
+        try:
+            result = await telegram_request(self.base_url, "sendMessage", {
+                "chat_id": self.chat_id,
+                "message_thread_id": topic_id,
+                "text": text,
+                "parse_mode": "Markdown"
+            }, priority=Priority.ANALYTICS)
+            if result.get("ok"):
+                return result["result"]["message_id"]
+            logger.error(f"Ошибка при отправке сообщения: {result}")
+            return None
+        except Exception as e:
+            logger.error(f"Исключение при отправке сообщения: {str(e)}")
+            return None
+
+    async def on_threshold(self, tally) -> bool:
+        """Обработчик порога для ReactionConsumer: пересылка в тему обучения"""
+        return await self.forward_message_async(tally.message_id, tally.thread_id)
+
+    def forward_pending(self, db) -> int:
+        """
+        Досылает в тему обучения сообщения, у которых по сохраненным счетчикам
+        дизлайки обогнали лайки, а пересылка не удалась. Реакции не перечитываются
+        из Telegram: их считает ReactionConsumer бота в message_reaction_counts.
+        Запускать при остановленном боте, иначе он может переслать сообщение повторно.
+        """
+        rows = db.execute_query(
+            """
+            SELECT message_id, thread_id
+            FROM public.message_reaction_counts
+            WHERE chat_id = %s AND dislikes > likes AND NOT forwarded
+              AND thread_id IS DISTINCT FROM %s
+            ORDER BY updated_at
+            """,
+            (int(self.chat_id), self.learning_topic_id)
+        ) or []
+
+        forwarded = 0
+        for row in rows:
+            if not self.forward_message(row['message_id'], row['thread_id']):
+                continue
+            db.execute_query(
+                "UPDATE public.message_reaction_counts SET forwarded = TRUE "
+                "WHERE chat_id = %s AND message_id = %s",
+                (int(self.chat_id), row['message_id']),
+                fetch=False
+            )
+            forwarded += 1
+        logger.info(f"Дослано в тему обучения: {forwarded} из {len(rows)}")
+        return forwarded
 
 def main():
-    # Конфигурация
-    BOT_TOKEN = "5261424288:AAE2QYTnulLeyd6BdanhhzxLFnhAbXvBI7w"
-    CHAT_ID = "-1002349745989"
-    
-    analyzer = ReactionAnalyzer(BOT_TOKEN, CHAT_ID)
-    
-    # Список тем для анализа
-    topics = [
-        (143, "📝 Логи"),
-        (145, "🎓 Обучение бота"),
-        (147, "🐛 Ошибки и баги"),
-        (149, "📸 Instagram Support"),
-        (161, "📱 Telegram Support"),
-        (163, "💬 WhatsApp Support")
-    ]
-    
-    # Анализируем каждую тему
-    for topic_id, topic_name in topics:
-        logger.info(f"Анализ темы: {topic_name}")
-        analyzer.analyze_topic_messages(topic_id)
-        time.sleep(2)  # Пауза между темами
+    from services.supabase_service import supabase_service
+
+    # Токен и группа логов - из таблицы credentials
+    bot_token = supabase_service.get_credential('telegram', 'bot_token')
+    chat_id = supabase_service.get_credential('telegram', 'log_group_id')
+    if not bot_token or not chat_id:
+        logger.error("Не найдены bot_token или log_group_id сервиса telegram")
+        return
+
+    ReactionAnalyzer(bot_token, chat_id).forward_pending(supabase_service)
 
 if __name__ == "__main__":
     main()
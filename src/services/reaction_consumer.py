@@ -0,0 +1,240 @@
+"""
+Потребитель реакций на сообщения группы логов.
+Реакции приходят в обычном потоке обновлений бота (message_reaction от
+пользователей и message_reaction_count для анонимных реакций), поэтому
+обработка стоит O(новых событий): не нужно перечитывать getUpdates
+и запрашивать каждое сообщение заново.
+
+Счетчики копятся в памяти и сбрасываются в message_reaction_counts пачками.
+Пересылка в тему обучения срабатывает один раз - в момент, когда дизлайки
+обгоняют лайки на threshold.
+
+Повторы отсекаются не по update_id: Telegram начинает нумерацию заново
+после недели без обновлений, а polling стартует с drop_pending_updates.
+Вместо смещения для каждого сообщения хранится текущая реакция каждого
+пользователя - ключ (chat_id, message_id, user_id); повторно доставленное
+событие ничего не меняет.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LIKE = '👍'
+DISLIKE = '👎'
+
+# Ключ счетчика: (chat_id, message_id)
+TallyKey = Tuple[int, int]
+
+
+@dataclass
+class ReactionTally:
+    """Счетчик реакций одного сообщения"""
+    chat_id: int
+    message_id: int
+    thread_id: Optional[int] = None
+    likes: int = 0
+    dislikes: int = 0
+    forwarded: bool = False
+    # Текущие реакции по пользователям (user_id или id чата анонимного админа)
+    voters: Dict[int, FrozenSet[str]] = field(default_factory=dict)
+
+
+# Обработчик пересечения порога; True - сообщение переслано
+ThresholdHandler = Callable[[ReactionTally], Awaitable[bool]]
+
+
+def _emojis(reactions: Iterable[Any]) -> FrozenSet[str]:
+    return frozenset(getattr(reaction, 'emoji', None) for reaction in reactions or ())
+
+
+class ReactionConsumer:
+    """
+    Агрегатор реакций.
+
+    Args:
+        db: Сервис базы данных (PostgresService); по умолчанию создается при первом обращении
+        on_threshold: Что делать с сообщением, у которого дизлайки обогнали лайки
+        threshold: На сколько дизлайки должны превышать лайки
+        flush_interval: Как часто сбрасывать счетчики в базу, секунд
+        batch_size: После скольких измененных сообщений сбрасывать досрочно
+        max_tracked: Сколько сообщений держать в памяти
+        history_days: За сколько дней загружать счетчики при старте
+    """
+
+    def __init__(self, db=None, on_threshold: Optional[ThresholdHandler] = None, threshold: int = 1,
+                 flush_interval: float = 10.0, batch_size: int = 100, max_tracked: int = 10000,
+                 history_days: int = 7):
+        self._db = db
+        self.on_threshold = on_threshold
+        self.threshold = threshold
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_tracked = max_tracked
+        self.history_days = history_days
+
+        self.tallies: "OrderedDict[TallyKey, ReactionTally]" = OrderedDict()
+        self.dirty: set = set()
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'events': 0, 'duplicates': 0, 'flushes': 0, 'forwarded': 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            from services.postgres_service import PostgresService
+            self._db = PostgresService()
+        return self._db
+
+    def _tally(self, chat_id: int, message_id: int) -> ReactionTally:
+        key = (chat_id, message_id)
+        tally = self.tallies.get(key)
+        if tally is None:
+            tally = self.tallies[key] = ReactionTally(chat_id, message_id)
+            self._evict()
+        else:
+            self.tallies.move_to_end(key)
+        return tally
+
+    def _evict(self) -> None:
+        # Несохраненные счетчики не вытесняются: их заберет ближайший сброс
+        while len(self.tallies) > self.max_tracked:
+            key = next(iter(self.tallies))
+            if key in self.dirty:
+                break
+            del self.tallies[key]
+
+    def remember_thread(self, chat_id: int, message_id: int, thread_id: Optional[int]) -> None:
+        """Запоминает тему отправленного сообщения: в обновлениях реакций ее нет"""
+        self._tally(int(chat_id), message_id).thread_id = thread_id
+
+    async def load(self) -> None:
+        """Загружает недавние счетчики из базы"""
+        rows = await self.db.fetch_all(
+            """
+            SELECT chat_id, message_id, thread_id, likes, dislikes, forwarded
+            FROM public.message_reaction_counts
+            WHERE updated_at > NOW() - make_interval(days => $1)
+            ORDER BY updated_at
+            """,
+            self.history_days
+        )
+        for row in rows[-self.max_tracked:]:
+            self.tallies[(row['chat_id'], row['message_id'])] = ReactionTally(**row)
+        logger.info(f"Reaction consumer loaded: {len(self.tallies)} messages")
+
+    async def handle_update(self, update) -> Optional[ReactionTally]:
+        """Учитывает обновление message_reaction или message_reaction_count"""
+        if update.message_reaction:
+            event = update.message_reaction
+            tally = self._tally(event.chat.id, event.message_id)
+            voter = event.user.id if event.user else getattr(event.actor_chat, 'id', None)
+            new = _emojis(event.new_reaction)
+            if voter is not None and tally.voters.get(voter) == new:
+                # Повторная доставка того же события
+                self.stats['duplicates'] += 1
+                return None
+            # Известная текущая реакция пользователя надежнее old_reaction из события
+            old = tally.voters.get(voter, _emojis(event.old_reaction))
+            if voter is not None:
+                tally.voters[voter] = new
+            tally.likes = max(0, tally.likes + (LIKE in new) - (LIKE in old))
+            tally.dislikes = max(0, tally.dislikes + (DISLIKE in new) - (DISLIKE in old))
+        elif update.message_reaction_count:
+            # Анонимные реакции приходят сразу итоговыми числами
+            event = update.message_reaction_count
+            tally = self._tally(event.chat.id, event.message_id)
+            totals = {getattr(count.type, 'emoji', None): count.total_count for count in event.reactions}
+            tally.likes = totals.get(LIKE, 0)
+            tally.dislikes = totals.get(DISLIKE, 0)
+        else:
+            return None
+
+        self.stats['events'] += 1
+        self.dirty.add((tally.chat_id, tally.message_id))
+        await self._check_threshold(tally)
+
+        if len(self.dirty) >= self.batch_size:
+            self._wakeup.set()
+        return tally
+
+    async def _check_threshold(self, tally: ReactionTally) -> None:
+        if tally.forwarded or tally.dislikes - tally.likes < self.threshold or not self.on_threshold:
+            return
+        try:
+            if await self.on_threshold(tally):
+                tally.forwarded = True
+                self.stats['forwarded'] += 1
+        except Exception as e:
+            logger.error(f"Failed to handle reaction threshold for message {tally.message_id}: {e}")
+
+    async def flush(self) -> int:
+        """Сохраняет измененные счетчики одним запросом"""
+        async with self._lock:
+            if not self.dirty:
+                return 0
+            keys = list(self.dirty)
+            self.dirty.clear()
+            tallies = [self.tallies[key] for key in keys if key in self.tallies]
+
+            saved = await self.db.execute(
+                """
+                INSERT INTO public.message_reaction_counts
+                    (chat_id, message_id, thread_id, likes, dislikes, forwarded)
+                SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::bigint[],
+                                     $4::int[], $5::int[], $6::boolean[])
+                ON CONFLICT (chat_id, message_id) DO UPDATE
+                SET thread_id = COALESCE(EXCLUDED.thread_id, message_reaction_counts.thread_id),
+                    likes = EXCLUDED.likes,
+                    dislikes = EXCLUDED.dislikes,
+                    forwarded = message_reaction_counts.forwarded OR EXCLUDED.forwarded,
+                    updated_at = NOW()
+                """,
+                [t.chat_id for t in tallies], [t.message_id for t in tallies],
+                [t.thread_id for t in tallies], [t.likes for t in tallies],
+                [t.dislikes for t in tallies], [t.forwarded for t in tallies]
+            )
+            if not saved:
+                # Вернем в очередь до следующего сброса
+                self.dirty.update(keys)
+                return 0
+
+            self.stats['flushes'] += 1
+            self._evict()
+            return len(tallies)
+
+    async def run(self) -> None:
+        """Сброс счетчиков раз в flush_interval или при накоплении batch_size изменений"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Reaction consumer flush failed: {e}", exc_info=True)
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        """Останавливает фоновый сброс и сохраняет то, что накопилось"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'tracked': len(self.tallies), 'pending': len(self.dirty)}
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import math
 import time
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
@@ -8,16 +9,19 @@ from googleapiclient.discovery import build
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from services.config_service import config_service
-from utils.logger_config import get_logger
+from utils.logger_config import LazyJson, get_logger
 from typing import List, Optional
 import datetime
 import asyncio
 import json
 from services.config_service import ConfigService
 from services.postgres_service import PostgresService
+from services.catalog_index import CatalogIndex, get_catalog, inventory_version, parse_price
+from services.tracing import span
+from services.metrics import metrics
 
 # Setup logging
-logger = get_logger('sheets_service', logging.DEBUG)
+logger = get_logger('sheets_service')
 
 class SheetsService:
     def __init__(self):
@@ -27,6 +31,11 @@ class SheetsService:
         self.service = None
         self.spreadsheet_id = None
         self.update_interval = None
+        # Хеш последнего полученного инвентаря - меняется только при изменении данных
+        self.inventory_version: Optional[str] = None
+        # Когда inventory_version пересчитана в последний раз (time.monotonic)
+        self.inventory_version_at = float('-inf')
+        self._last_inventory: Optional[list] = None
 
     async def initialize(self):
         """Асинхронная инициализация"""
@@ -132,21 +141,29 @@ class SheetsService:
         """Get inventory data from Google Sheets."""
         try:
             # Пробуем получить данные из кэша
-            cached_data = await self._get_cached_data('inventory')
+            with span('cache_lookup', source='inventory') as stage:
+                cached_data = await self._get_cached_data('inventory')
+                stage.attrs['hit'] = bool(cached_data)
+            metrics.counter('cache_requests_total', labels={'cache': 'inventory', 'result': 'hit' if cached_data else 'miss'})
             if cached_data:
-                logger.info(f"Получены данные из кэша: {json.dumps(cached_data, ensure_ascii=False, indent=2)}")
+                logger.info("Получены данные из кэша: %s товаров", len(cached_data), extra={'sample': 'inventory_cache_hit'})
+                logger.debug("Инвентарь из кэша: %s", LazyJson(cached_data, indent=2))
+                self.inventory_version = self._get_inventory_version(cached_data)
+                self.inventory_version_at = time.monotonic()
+                self._last_inventory = cached_data
                 return cached_data
 
             logger.info("Данные в кэше не найдены, получаем из Google Sheets")
             
             # Если нет в кэше, получаем из таблицы
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range='Sheet1!A2:E'
-            ).execute()
+            with span('sheets_fetch'):
+                result = self.service.spreadsheets().values().get(
+                    spreadsheetId=self.spreadsheet_id,
+                    range='Sheet1!A2:E'
+                ).execute()
             
             values = result.get('values', [])
-            logger.info(f"Получены сырые данные из таблицы: {json.dumps(values, ensure_ascii=False, indent=2)}")
+            logger.debug("Получены сырые данные из таблицы: %s", LazyJson(values, indent=2))
             
             inventory = []
             
@@ -167,41 +184,69 @@ class SheetsService:
                             'category': category
                         }
                         inventory.append(item)
-                        logger.info(f"Обработан товар: {json.dumps(item, ensure_ascii=False)}")
                     except (ValueError, TypeError) as e:
                         logger.error(f"Ошибка обработки строки {row}: {str(e)}")
                         continue
                 else:
                     logger.warning(f"Пропущена строка с недостаточным количеством данных: {row}")
             
-            logger.info(f"Итоговый инвентарь: {json.dumps(inventory, ensure_ascii=False, indent=2)}")
+            logger.info("Получено из таблицы: %s товаров из %s строк", len(inventory), len(values))
+            logger.debug("Итоговый инвентарь: %s", LazyJson(inventory, indent=2))
+            self.inventory_version = self._get_inventory_version(inventory)
+            self.inventory_version_at = time.monotonic()
+            self._last_inventory = inventory
             return inventory
             
         except Exception as e:
             logger.error(f"Ошибка получения данных инвентаря: {str(e)}", exc_info=True)
             return []
 
+    async def current_inventory_version(self, max_age: float = 10.0) -> Optional[str]:
+        """Get the inventory version without re-reading inventory on every call.
+        
+        The version is recomputed by any get_inventory_data call; it is
+        re-read here only when it is older than max_age seconds.
+        
+        Args:
+            max_age (float): How long a computed version stays current, seconds
+            
+        Returns:
+            Optional[str]: Inventory version hash
+        """
+        if time.monotonic() - self.inventory_version_at > max_age:
+            await self.get_inventory_data()
+        return self.inventory_version
+
+    def get_catalog(self, inventory: list) -> CatalogIndex:
+        """Get the columnar catalog index for inventory data.
+        
+        The index is built once per inventory version; the version computed
+        by get_inventory_data is reused so the data is not hashed twice.
+        
+        Args:
+            inventory (list): Inventory items
+            
+        Returns:
+            CatalogIndex: Catalog with vectorized filters
+        """
+        inventory = inventory or []
+        version = self.inventory_version if inventory is self._last_inventory else None
+        return get_catalog(inventory, version)
+
     async def format_inventory_for_openai(self, inventory):
         """Format inventory data for OpenAI prompt."""
         if not inventory:
             logger.warning("Получен пустой инвентарь для форматирования")
             return "Информация о товарах временно недоступна."
 
-        logger.info("Начинаем форматирование инвентаря для OpenAI")
         formatted_text = "Текущий ассортимент:\n\n"
 
         # Группируем товары по категориям
-        categories = {}
-        for item in inventory:
-            category = item.get('category', 'Разное')
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(item)
+        categories = self.get_catalog(inventory).group_by_category()
         
-        logger.info(f"Товары сгруппированы по категориям: {list(categories.keys())}")
 
         # Форматируем каждую категорию
-        for category, items in categories.items():
+        for category, items in categories:
             formatted_text += f" {category}:\n"
             for item in items:
                 name = item.get('name', '')
@@ -217,7 +262,7 @@ class SheetsService:
                 formatted_text += item_text + "\n"
             formatted_text += "\n"
         
-        logger.info(f"Отформатированный текст для OpenAI:\n{formatted_text}")
+        logger.debug("Отформатированный текст для OpenAI:\n%s", formatted_text)
         return formatted_text
 
     async def update_inventory_item(self, item_name: str, updates: dict):
@@ -353,6 +398,17 @@ class SheetsService:
         row_str = '|'.join(str(cell) for cell in row)
         return hashlib.md5(row_str.encode()).hexdigest()
 
+    def _get_inventory_version(self, inventory: list) -> str:
+        """Generate a version hash for inventory data.
+        
+        Args:
+            inventory (list): Inventory items
+            
+        Returns:
+            str: Hash that changes only when inventory content changes
+        """
+        return inventory_version(inventory)
+
     def _get_version_sheet_name(self) -> str:
         """Get the name of the version tracking sheet."""
         from datetime import datetime
@@ -438,6 +494,49 @@ class SheetsService:
             logger.error(f"Failed to add inventory item: {str(e)}", exc_info=True)
             return False
     
+    def _append_order_rows(self, rows: List[list]):
+        """Append order rows to the Orders sheet, creating it on first use."""
+        sheet_name = 'Заказы'
+        if sheet_name not in self._get_sheet_names():
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}}]}
+            ).execute()
+            headers = [['№', 'Создан', 'Букет', 'Кол-во', 'Цена', 'Доставка',
+                        'Клиент', 'Телефон', 'Адрес', 'Время доставки']]
+            self.service.spreadsheets().values().update(
+                spreadsheetId=self.spreadsheet_id,
+                range=f'{sheet_name}!A1:J1',
+                valueInputOption='RAW',
+                body={'values': headers}
+            ).execute()
+
+        self.service.spreadsheets().values().append(
+            spreadsheetId=self.spreadsheet_id,
+            range=f'{sheet_name}!A2:J',
+            valueInputOption='RAW',
+            insertDataOption='INSERT_ROWS',
+            body={'values': rows}
+        ).execute()
+
+    async def append_order_rows(self, rows: List[list]) -> bool:
+        """Append a batch of orders to the Orders sheet in one API call.
+
+        Args:
+            rows (List[list]): Order rows
+
+        Returns:
+            bool: True if the rows were written
+        """
+        try:
+            # Клиент Google API синхронный - не блокируем цикл событий
+            await asyncio.to_thread(self._append_order_rows, rows)
+            logger.info(f"Appended {len(rows)} orders to sheet")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to append orders: {str(e)}", exc_info=True)
+            return False
+
     async def get_inventory_item(self, item_name: str):
         """Get details of a specific inventory item.
         
@@ -577,21 +676,20 @@ class SheetsService:
                 logger.warning("No data found in spreadsheet")
                 return None
 
+            catalog = get_catalog(values)
+
             # Если запрошены все цветы
             if 'все' in flower_types:
-                result = []
-                for row in values:
-                    if len(row) >= 2 and row[0].strip() and row[1].strip():
-                        result.append(f"{row[0].strip()} - {row[1].strip()} тг")
-                return "\n".join(result) if result else None
+                items = catalog.items
+            else:
+                # Если запрошены конкретные цветы - ищем по индексу слов в названиях
+                items = [catalog.items[row] for row in catalog.rows_matching_any(flower_types)]
 
-            # Если запрошены конкретные цветы
             result = []
-            for row in values:
-                if len(row) >= 2 and row[0].strip() and row[1].strip():
-                    name = row[0].strip().lower()
-                    if any(flower.lower() in name for flower in flower_types):
-                        result.append(f"{row[0].strip()} - {row[1].strip()} тг")
+            for item in items:
+                price = parse_price(item.get('price'))
+                if item.get('name') and not math.isnan(price):
+                    result.append(f"{item['name']} - {price:,.0f} тг".replace(',', ' '))
             
             return "\n".join(result) if result else None
 
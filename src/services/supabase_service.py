@@ -2,7 +2,7 @@ import os
 import logging
 import psycopg2
 from psycopg2.extras import DictCursor, Json
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Tuple, Union
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -148,6 +148,9 @@ class SupabaseService:
         """
         Обновление количества продукта
         
+        Изменение выполняется одним условным UPDATE, поэтому параллельные
+        заказы не могут увести остаток в минус или потерять обновление.
+        
         Args:
             product_name: Название продукта
             quantity_change: Изменение количества (положительное - добавить, отрицательное - убавить)
@@ -156,39 +159,143 @@ class SupabaseService:
             True если обновление успешно, False в противном случае
         """
         try:
-            # Проверяем текущее количество
             result = self.execute_query_single(
-                "SELECT quantity FROM products WHERE name = %s",
-                (product_name,)
+                """
+                UPDATE products 
+                SET quantity = quantity + %s 
+                WHERE name = %s AND quantity + %s >= 0
+                RETURNING quantity
+                """,
+                (quantity_change, product_name, quantity_change)
             )
             
             if not result:
-                logger.error(f"Product {product_name} not found")
+                logger.error(f"Product {product_name} not found or quantity would drop below 0")
                 return False
             
-            current_quantity = result['quantity']
-            new_quantity = current_quantity + quantity_change
-            
-            if new_quantity < 0:
-                logger.error(f"Cannot reduce quantity below 0 for {product_name}")
-                return False
-            
-            # Обновляем количество
-            self.execute_query(
-                """
-                UPDATE products 
-                SET quantity = %s 
-                WHERE name = %s
-                """,
-                (new_quantity, product_name),
-                fetch=False
-            )
             return True
             
         except Exception as e:
             logger.error(f"Failed to update product quantity: {str(e)}")
             return False
 
+    # Методы для резервирования товаров
+    def reserve_products(self, items: Dict[str, int], ttl_seconds: int = 900) -> Optional[str]:
+        """
+        Резервирование нескольких товаров за один запрос к базе
+        
+        Все позиции списываются атомарно: если хотя бы одной не хватает,
+        не резервируется ничего. Неподтвержденный резерв автоматически
+        возвращается на склад после истечения ttl_seconds.
+        
+        Args:
+            items: Словарь {название продукта: количество}
+            ttl_seconds: Время жизни резерва в секундах
+            
+        Returns:
+            ID резерва или None, если товара недостаточно
+        """
+        reservation_id, _ = self.reserve_products_with_stock(items, ttl_seconds)
+        return reservation_id
+
+    def reserve_products_with_stock(
+        self,
+        items: Dict[str, int],
+        ttl_seconds: int = 900
+    ) -> Tuple[Optional[str], Dict[str, Optional[int]]]:
+        """
+        Резервирование с остатками из того же запроса
+        
+        Args:
+            items: Словарь {название продукта: количество}
+            ttl_seconds: Время жизни резерва в секундах
+            
+        Returns:
+            (ID резерва или None, {название: остаток}). После резерва - остатки
+            всех товаров за вычетом резерва; если товара недостаточно - текущий
+            остаток того товара, которого не хватило (None - товара нет)
+        """
+        if not items or any(quantity <= 0 for quantity in items.values()):
+            logger.error(f"Invalid reservation items: {items}")
+            return None, {}
+        
+        rows = self.execute_query(
+            """
+            SELECT reservation, item_name, remaining
+            FROM public.reserve_products(%s::text[], %s::integer[], %s)
+            """,
+            (list(items.keys()), list(items.values()), ttl_seconds)
+        ) or []
+        
+        remaining = {row['item_name']: row['remaining'] for row in rows}
+        reservation_id = rows[0]['reservation'] if rows else None
+        if not reservation_id:
+            logger.warning(f"Not enough stock to reserve {items}")
+            return None, remaining
+        
+        return str(reservation_id), remaining
+
+    def confirm_reservation(self, reservation_id: str) -> bool:
+        """
+        Подтверждение резерва после оформления заказа
+        
+        Args:
+            reservation_id: ID резерва
+            
+        Returns:
+            True если резерв подтвержден, False если он не найден или истек
+        """
+        result = self.execute_query_single(
+            "SELECT public.confirm_reservation(%s::uuid) AS confirmed",
+            (reservation_id,)
+        )
+        return bool(result and result['confirmed'])
+
+    def release_reservation(self, reservation_id: str) -> bool:
+        """
+        Отмена резерва с возвратом товаров на склад
+        
+        Args:
+            reservation_id: ID резерва
+            
+        Returns:
+            True если резерв отменен, False если он уже не активен
+        """
+        result = self.execute_query_single(
+            "SELECT public.release_reservation(%s::uuid) AS released",
+            (reservation_id,)
+        )
+        return bool(result and result['released'])
+
+    def release_expired_reservations(self) -> int:
+        """
+        Возврат на склад товаров из просроченных резервов
+        
+        Returns:
+            Количество освобожденных резервов
+        """
+        result = self.execute_query_single(
+            "SELECT public.release_expired_reservations() AS released"
+        )
+        return result['released'] if result else 0
+
+    def get_product_quantity(self, product_name: str) -> Optional[int]:
+        """
+        Получение текущего остатка продукта по названию без учета регистра
+        (так же товар ищет reserve_products)
+        
+        Args:
+            product_name: Название продукта
+            
+        Returns:
+            Остаток или None, если продукт не найден
+        """
+        result = self.execute_query_single(
+            "SELECT quantity FROM products WHERE LOWER(name) = LOWER(%s)",
+            (product_name,)
+        )
+        return result['quantity'] if result else None
+
     # Методы для работы с историей разговоров
     def save_conversation(
         self, 
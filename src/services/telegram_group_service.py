@@ -1,14 +1,17 @@
-import requests
 import logging
 from typing import Optional, List, Dict
+from services.http_client import http_client
+from services.telegram_outbound import Priority, sync_sender, telegram_request
+from services.config_service import ConfigService
 
 logger = logging.getLogger(__name__)
 
 class TelegramGroupService:
-    def __init__(self, bot_token: str):
+    def __init__(self, bot_token: str, chat_id: Optional[str] = None):
         self.bot_token = bot_token
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
-        self.main_chat_id = "-1002349745989"
+        # ID группы берется из настроек, а не зашивается в код
+        self.main_chat_id = chat_id or ConfigService().get_config('log_group_id', 'telegram')
         self.topic_descriptions = {
             "📝 Логи": """🔍 *Тема для логов системы*
 
@@ -24,6 +27,12 @@ class TelegramGroupService:
 • Обсуждение качество ответов бота
 • Предложения по развитию""",
 
+            "🛒 Заказы": """📦 *Новые заказы от клиентов*
+
+• Уведомления о заказах из бота
+• Данные клиента и адрес доставки
+• Время доставки""",
+
             "🐛 Ошибки и баги": """🔧 *Отслеживание и исправление ошибок*
 
 • Сообщения об ошибках
@@ -58,8 +67,10 @@ class TelegramGroupService:
         Создает форум (супергруппу) с включенными темами
         """
         try:
-            response = requests.post(
+            response = sync_sender.request(
+                "POST",
                 f"{self.base_url}/createForumTopic",
+                chat_id=self.main_chat_id,
                 json={
                     "chat_id": self.main_chat_id,
                     "name": title,
@@ -84,8 +95,10 @@ class TelegramGroupService:
         Отправляет сообщение в конкретную тему форума
         """
         try:
-            response = requests.post(
+            response = sync_sender.request(
+                "POST",
                 f"{self.base_url}/sendMessage",
+                chat_id=self.main_chat_id,
                 json={
                     "chat_id": self.main_chat_id,
                     "message_thread_id": topic_id,
@@ -131,8 +144,10 @@ class TelegramGroupService:
         Удаляет тему форума
         """
         try:
-            response = requests.post(
+            response = sync_sender.request(
+                "POST",
                 f"{self.base_url}/deleteForumTopic",
+                chat_id=self.main_chat_id,
                 json={
                     "chat_id": self.main_chat_id,
                     "message_thread_id": topic_id
@@ -154,7 +169,8 @@ class TelegramGroupService:
         Получает список всех тем форума
         """
         try:
-            response = requests.post(
+            response = http_client.sync_request(
+                "POST",
                 f"{self.base_url}/getForumTopics",
                 json={
                     "chat_id": self.main_chat_id
@@ -170,6 +186,70 @@ class TelegramGroupService:
             logger.error(f"Исключение при получении списка тем: {str(e)}")
             return []
 
+    async def create_forum_async(self, title: str) -> Optional[int]:
+        """Асинхронная версия create_forum через общий HTTP-пул"""
+        try:
+            result = await telegram_request(self.base_url, "createForumTopic", {
+                "chat_id": self.main_chat_id,
+                "name": title,
+                "icon_color": 0x6FB9F0
+            }, priority=Priority.ANALYTICS)
+            if result.get("ok"):
+                topic_id = result["result"]["message_thread_id"]
+                logger.info(f"Создана тема форума: {title}, ID: {topic_id}")
+                return topic_id
+            logger.error(f"Ошибка при создании темы форума: {result}")
+            return None
+        except Exception as e:
+            logger.error(f"Исключение при создании темы форума: {str(e)}")
+            return None
+
+    async def send_message_to_topic_async(self, topic_id: int, message: str) -> bool:
+        """Асинхронная версия send_message_to_topic через общий HTTP-пул"""
+        try:
+            result = await telegram_request(self.base_url, "sendMessage", {
+                "chat_id": self.main_chat_id,
+                "message_thread_id": topic_id,
+                "text": message,
+                "parse_mode": "Markdown"
+            })
+            if result.get("ok"):
+                logger.info(f"Сообщение отправлено в тему {topic_id}")
+                return True
+            logger.error(f"Ошибка при отправке сообщения: {result}")
+            return False
+        except Exception as e:
+            logger.error(f"Исключение при отправке сообщения: {str(e)}")
+            return False
+
+    async def delete_topic_async(self, topic_id: int) -> bool:
+        """Асинхронная версия delete_topic через общий HTTP-пул"""
+        try:
+            result = await telegram_request(self.base_url, "deleteForumTopic", {
+                "chat_id": self.main_chat_id,
+                "message_thread_id": topic_id
+            }, priority=Priority.ANALYTICS)
+            if result.get("ok"):
+                logger.info(f"Тема {topic_id} успешно удалена")
+                return True
+            logger.error(f"Ошибка при удалении темы: {result}")
+            return False
+        except Exception as e:
+            logger.error(f"Исключение при удалении темы: {str(e)}")
+            return False
+
+    async def get_topics_async(self) -> List[Dict]:
+        """Асинхронная версия get_topics через общий HTTP-пул"""
+        try:
+            result = await telegram_request(self.base_url, "getForumTopics", {"chat_id": self.main_chat_id})
+            if result.get("ok"):
+                return result["result"]["topics"]
+            logger.error(f"Ошибка при получении списка тем: {result}")
+            return []
+        except Exception as e:
+            logger.error(f"Исключение при получении списка тем: {str(e)}")
+            return []
+
     def cleanup_duplicate_topics(self):
         """
         Удаляет дублирующиеся темы, оставляя только последние созданные
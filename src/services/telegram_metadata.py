@@ -0,0 +1,195 @@
+"""
+Реестр метаданных Telegram: темы форума, операторы и настройки чатов.
+Все запросы на пути обработки сообщения - обращения к словарю или множеству.
+Реестр обновляется в фоне раз в ttl секунд из таблицы forum_topics и настроек,
+сверяется с Telegram по служебным сообщениям о темах и создает недостающие темы.
+Темы создаются, только если последнее чтение из базы удалось: иначе пустой
+реестр после сбоя базы привел бы к дублям тем в группе.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, FrozenSet, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramMetadata:
+    """Кэш метаданных Telegram с периодическим обновлением"""
+
+    def __init__(self, config=None, db=None, ttl: float = 300.0):
+        self._config = config
+        self._db = db
+        self.ttl = ttl
+
+        self.log_group_id: Optional[str] = None
+        self.topics: Dict[str, int] = {}
+        self.topic_names: Dict[int, str] = {}
+        self.operators: FrozenSet[str] = frozenset()
+        self.loaded_at = 0.0
+        # Последнее обновление прочитало настройки и темы без ошибок
+        self.synced = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def config(self):
+        if self._config is None:
+            from services.config_service import ConfigService
+            self._config = ConfigService()
+        return self._config
+
+    @property
+    def db(self):
+        if self._db is None:
+            from services.postgres_service import PostgresService
+            self._db = PostgresService()
+        return self._db
+
+    def topic_id(self, name: str) -> Optional[int]:
+        """ID темы по имени"""
+        return self.topics.get(name)
+
+    def topic_name(self, thread_id: int) -> Optional[str]:
+        return self.topic_names.get(thread_id)
+
+    def is_operator(self, user_id) -> bool:
+        return str(user_id) in self.operators
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    def _set_topics(self, topics: Dict[str, int]) -> None:
+        # Словари заменяются целиком, чтобы читатели не видели полуобновленное состояние
+        self.topics = dict(topics)
+        self.topic_names = {thread_id: name for name, thread_id in topics.items()}
+
+    @staticmethod
+    def parse_operators(value: Optional[str]) -> FrozenSet[str]:
+        """Строка "123, 456" из настроек в множество ID"""
+        if not value:
+            return frozenset()
+        return frozenset(part.strip() for part in str(value).split(',') if part.strip())
+
+    async def refresh(self) -> bool:
+        """
+        Перечитывает настройки и темы из базы.
+        Возвращает False, если настройки или темы прочитать не удалось;
+        реестр тогда остается прежним.
+        """
+        ok = True
+        try:
+            # Настройки кэшируются в ConfigService навсегда - сбрасываем, чтобы увидеть изменения
+            self.config.invalidate_cache('telegram')
+            self.log_group_id = await self.config.get_config_async('log_group_id', service='telegram')
+            self.operators = self.parse_operators(
+                await self.config.get_config_async('operators', service='telegram')
+            )
+        except Exception as e:
+            logger.error(f"Failed to refresh Telegram config: {e}")
+            ok = False
+
+        if self.log_group_id:
+            try:
+                # Агрегат всегда дает одну строку, поэтому None означает ошибку базы,
+                # а не отсутствие тем (fetch_all в обоих случаях вернул бы [])
+                row = await self.db.fetch_one(
+                    "SELECT array_agg(thread_id) AS thread_ids, array_agg(name) AS names "
+                    "FROM forum_topics WHERE chat_id = $1",
+                    int(self.log_group_id)
+                )
+            except Exception as e:
+                logger.error(f"Failed to read forum topics: {e}")
+                row = None
+            if row is None:
+                ok = False
+            else:
+                self._set_topics(dict(zip(row['names'] or [], row['thread_ids'] or [])))
+
+        self.synced = ok
+        self.loaded_at = time.monotonic()
+        logger.info(f"Telegram metadata refreshed: {len(self.topics)} topics, {len(self.operators)} operators"
+                    + ("" if ok else " (database read failed)"))
+        return ok
+
+    async def ensure_loaded(self) -> None:
+        if not self.loaded_at:
+            await self.refresh()
+
+    async def remember_topic(self, chat_id, thread_id: int, name: str) -> None:
+        """Запоминает тему и сохраняет ее в forum_topics"""
+        if str(chat_id) != str(self.log_group_id):
+            return
+        if self.topics.get(name) == thread_id:
+            return
+
+        topics = {topic_name: topic_id for topic_name, topic_id in self.topics.items() if topic_id != thread_id}
+        topics[name] = thread_id
+        self._set_topics(topics)
+
+        await self.db.execute(
+            """
+            INSERT INTO forum_topics (thread_id, chat_id, name)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (thread_id) DO UPDATE
+            SET name = EXCLUDED.name, chat_id = EXCLUDED.chat_id
+            """,
+            thread_id, int(chat_id), name
+        )
+        logger.info(f"Topic '{name}' -> {thread_id} saved")
+
+    async def observe_message(self, message) -> None:
+        """Сверка с Telegram: служебные сообщения о создании и переименовании тем"""
+        if not message or not message.message_thread_id:
+            return
+        if message.forum_topic_created:
+            await self.remember_topic(message.chat_id, message.message_thread_id,
+                                      message.forum_topic_created.name)
+        elif message.forum_topic_edited and message.forum_topic_edited.name:
+            await self.remember_topic(message.chat_id, message.message_thread_id,
+                                      message.forum_topic_edited.name)
+
+    async def ensure_topics(self, bot, names: Iterable[str]) -> None:
+        """Создает в группе темы, которых нет в реестре"""
+        if not self.log_group_id:
+            return
+        if not self.synced:
+            logger.warning("Topics not loaded from database, skipping topic creation")
+            return
+        for name in names:
+            if name in self.topics:
+                continue
+            try:
+                topic = await bot.create_forum_topic(chat_id=self.log_group_id, name=name)
+                await self.remember_topic(self.log_group_id, topic.message_thread_id, topic.name)
+            except Exception as e:
+                logger.error(f"Failed to create topic '{name}': {e}")
+
+    async def _refresh_loop(self, bot=None, required_topics: Iterable[str] = ()) -> None:
+        required_topics = list(required_topics)
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                if await self.refresh() and bot and required_topics:
+                    await self.ensure_topics(bot, required_topics)
+            except Exception as e:
+                logger.error(f"Telegram metadata refresh failed: {e}", exc_info=True)
+
+    def start(self, bot=None, required_topics: Iterable[str] = ()) -> asyncio.Task:
+        """Запускает фоновое обновление раз в ttl секунд"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop(bot, required_topics))
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Создаем глобальный экземпляр
+telegram_metadata = TelegramMetadata()
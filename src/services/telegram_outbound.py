@@ -0,0 +1,354 @@
+"""
+Центральный планировщик исходящих запросов к Telegram Bot API.
+Подключается к боту как rate limiter python-telegram-bot, поэтому через него
+проходят все вызовы ExtBot: ответы клиентам, логи в группе, кнопки, пересылки.
+
+Лимиты: общий (30 сообщений в секунду на бота), на личный чат (1 в секунду)
+и на группу (20 в минуту). Ответы клиентам идут в приоритетной полосе
+впереди логов и аналитики; RetryAfter от Telegram блокирует чат на указанное время.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Union
+
+import requests
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые не отправляют сообщений и не подпадают под лимиты рассылки
+UNLIMITED_ENDPOINTS = {'answerCallbackQuery', 'setWebhook', 'deleteWebhook', 'setMyCommands', 'close', 'logOut'}
+
+
+class Priority(IntEnum):
+    """Полосы очереди: чем меньше значение, тем раньше отправка"""
+    CUSTOMER = 0    # ответы клиентам
+    STAFF = 1       # уведомления персоналу (заказы)
+    LOG = 2         # логи и кнопки оценки в группе
+    ANALYTICS = 3   # фоновые отчеты и пересылки
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до следующего токена (0 - можно отправлять)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """Блокировка после RetryAfter: запас сгорает, через seconds разрешен один запрос"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(1.0, self.capacity)
+        self.updated = self.blocked_until
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _Job:
+    __slots__ = ('chat_id', 'priority', 'enqueued', 'future')
+
+    def __init__(self, chat_id: Optional[Union[int, str]], priority: Priority, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.future = future
+
+
+class LaneStats:
+    """Задержка в очереди одной полосы"""
+
+    def __init__(self, window: int = 1000):
+        self.sent = 0
+        self.retries = 0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def record(self, wait_ms: float) -> None:
+        self.sent += 1
+        self.total_ms += wait_ms
+        self.max_ms = max(self.max_ms, wait_ms)
+        self.recent.append(wait_ms)
+
+    def to_dict(self, queued: int) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            'queued': queued,
+            'sent': self.sent,
+            'retries': self.retries,
+            'avg_ms': round(self.total_ms / self.sent, 1) if self.sent else 0.0,
+            'p95_ms': round(p95, 1),
+            'max_ms': round(self.max_ms, 1)
+        }
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Планировщик исходящих запросов.
+    Запрос ставится в полосу своего приоритета, диспетчер выдает разрешение
+    первому запросу из самой приоритетной полосы, чей чат не упирается в лимит.
+    Приоритет берется из rate_limit_args={'priority': Priority.X} или по типу чата:
+    личный чат - CUSTOMER, группа - LOG.
+    """
+
+    def __init__(self, global_rate: float = 30.0, private_rate: float = 1.0, private_burst: float = 3.0,
+                 group_rate: float = 20 / 60, group_burst: float = 1.0, max_retries: int = 3,
+                 scan_limit: int = 100):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.scan_limit = scan_limit
+
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.lanes: Dict[Priority, Deque[_Job]] = {priority: deque() for priority in Priority}
+        self.stats: Dict[Priority, LaneStats] = {priority: LaneStats() for priority in Priority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def initialize(self) -> None:
+        self._ensure_dispatcher()
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Ожидающие запросы не должны зависнуть навсегда
+        for lane in self.lanes.values():
+            while lane:
+                job = lane.popleft()
+                if not job.future.done():
+                    job.future.cancel()
+
+    def _ensure_dispatcher(self) -> None:
+        if self._task is None or self._task.done():
+            # Событие привязывается к циклу, в котором запущен диспетчер
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+
+    @staticmethod
+    def _is_group(chat_id: Union[int, str]) -> bool:
+        # У групп и каналов отрицательный ID или @username
+        return str(chat_id).startswith(('-', '@'))
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Простаивающие корзины ничего не ограничивают - удаляем
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_idle(now)}
+            if self._is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst, now)
+            self.chat_buckets[key] = bucket
+        return bucket
+
+    def _priority(self, data: Dict[str, Any], rate_limit_args: Optional[Dict[str, Any]]) -> Priority:
+        if rate_limit_args and 'priority' in rate_limit_args:
+            return Priority(rate_limit_args['priority'])
+        chat_id = data.get('chat_id')
+        if chat_id is not None and self._is_group(chat_id):
+            return Priority.LOG
+        return Priority.CUSTOMER
+
+    def _next_job(self, now: float) -> Union[_Job, float, None]:
+        """Следующий разрешенный запрос или время до ближайшего разрешения"""
+        global_delay = self.global_bucket.delay(now)
+        if global_delay > 0:
+            return global_delay
+
+        soonest = None
+        for priority in Priority:
+            lane = self.lanes[priority]
+            for position, job in enumerate(lane):
+                if position >= self.scan_limit:
+                    break
+                if job.future.done():
+                    continue
+                delay = self._chat_bucket(job.chat_id, now).delay(now) if job.chat_id is not None else 0.0
+                if delay <= 0:
+                    del lane[position]
+                    return job
+                soonest = delay if soonest is None else min(soonest, delay)
+        return soonest
+
+    def _drop_cancelled(self) -> None:
+        for lane in self.lanes.values():
+            while lane and lane[0].future.done():
+                lane.popleft()
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._drop_cancelled()
+            now = time.monotonic()
+            job = self._next_job(now)
+
+            if isinstance(job, _Job):
+                self.global_bucket.consume(now)
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id, now).consume(now)
+                self.stats[job.priority].record((now - job.enqueued) * 1000)
+                job.future.set_result(None)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=job)
+            except asyncio.TimeoutError:
+                pass
+
+    async def acquire(self, chat_id: Optional[Union[int, str]], priority: Priority = Priority.CUSTOMER) -> None:
+        """Ждет своей очереди на отправку в чат"""
+        self._ensure_dispatcher()
+        job = _Job(chat_id, priority, asyncio.get_running_loop().create_future())
+        self.lanes[priority].append(job)
+        self._wakeup.set()
+        await job.future
+
+    def block_chat(self, chat_id: Optional[Union[int, str]], seconds: float) -> None:
+        """Блокирует чат (или весь бот, если чат неизвестен) на seconds после RetryAfter"""
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now) if chat_id is not None else self.global_bucket
+        bucket.block(now, seconds)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        if endpoint in UNLIMITED_ENDPOINTS or endpoint.startswith('get'):
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get('chat_id')
+        priority = self._priority(data, rate_limit_args)
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = float(e.retry_after)
+                self.stats[priority].retries += 1
+                logger.warning(f"Telegram flood limit for chat {chat_id} ({endpoint}), retry in {retry_after}s")
+                self.block_chat(chat_id, retry_after)
+                if attempt == self.max_retries:
+                    raise
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Задержка в очереди по полосам"""
+        return {
+            priority.name.lower(): self.stats[priority].to_dict(len(self.lanes[priority]))
+            for priority in Priority
+        }
+
+
+class SyncTelegramSender:
+    """
+    Отправка через общий requests-пул для синхронных утилит (TelegramGroupService, ReactionAnalyzer).
+    Соблюдает те же лимиты на чат и повторяет запрос после 429 с retry_after.
+    """
+
+    def __init__(self, group_interval: float = 3.0, private_interval: float = 1.0, max_retries: int = 3):
+        self.group_interval = group_interval
+        self.private_interval = private_interval
+        self.max_retries = max_retries
+        self._last_sent: Dict[str, float] = {}
+
+    def request(self, method: str, url: str, chat_id: Optional[Union[int, str]] = None,
+                **kwargs) -> requests.Response:
+        # Импорт здесь, чтобы планировщик оставался независимым от пакета services
+        from services.http_client import http_client
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                interval = self.group_interval if OutboundScheduler._is_group(chat_id) else self.private_interval
+                wait = self._last_sent.get(str(chat_id), 0.0) + interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self._last_sent[str(chat_id)] = time.monotonic()
+
+            response = http_client.sync_request(method, url, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            except ValueError:
+                retry_after = 1
+            logger.warning(f"Telegram flood limit for chat {chat_id}, retry in {retry_after}s")
+            time.sleep(retry_after)
+        return response
+
+
+async def telegram_request(base_url: str, method: str, payload: Optional[Dict[str, Any]] = None,
+                           priority: Priority = Priority.LOG) -> Dict[str, Any]:
+    """
+    Асинхронный вызов Bot API в обход ExtBot для сервисных утилит.
+    Запрос идет через общий aiohttp-пул и тот же планировщик, что и бот,
+    поэтому делит с ним лимиты; 429 превращается в RetryAfter и блокирует чат.
+    Возвращает JSON ответа Telegram ({'ok': False, ...} при ошибке).
+    """
+    from services.http_client import http_client
+
+    payload = payload or {}
+
+    # Bot API принимает все методы через POST; повторять после 5xx можно только
+    # методы чтения (getMessage, getForumTopics) - повтор sendMessage отправит дубль
+    retries = http_client.max_retries if method.startswith('get') else 0
+
+    async def call():
+        # 429 повторяет планировщик, а не HTTP-клиент: он знает про лимиты чата
+        response = await http_client.post(f"{base_url}/{method}", json=payload, retries=retries,
+                                          retry_statuses=frozenset({500, 502, 503, 504}))
+        data = response.json() or {'ok': False, 'description': f"HTTP {response.status}"}
+        if response.status == 429:
+            raise RetryAfter(data.get('parameters', {}).get('retry_after', 1))
+        return data
+
+    return await outbound_scheduler.process_request(call, (), {}, method, payload, {'priority': priority})
+
+
+# Создаем глобальный экземпляр
+outbound_scheduler = OutboundScheduler()
+sync_sender = SyncTelegramSender()
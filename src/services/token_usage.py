@@ -0,0 +1,306 @@
+"""
+Учет расхода токенов по сценариям.
+Каждый ответ модели дает TokenUsage: токены запроса, ответа и взятые из кэша
+промптов OpenAI, стоимость и сценарий (тема вопроса). Запись в памяти ничего
+не стоит: строки копятся и пишутся в token_usage пачкой, и тем же запросом
+обновляются дневные и часовые сводки (token_usage_daily, token_usage_hourly) -
+суммировать всю таблицу для отчета не нужно.
+
+Для каждого сценария держится скользящая оценка обычного размера промпта;
+запрос, промпт которого заметно больше обычного, сразу дает предупреждение -
+разрастание промпта главная причина роста задержки и расходов.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Цены OpenAI, USD за 1 млн токенов: (запрос, запрос из кэша, ответ)
+PRICES: Dict[str, Tuple[float, float, float]] = {
+    'gpt-4o': (2.5, 1.25, 10.0),
+    'gpt-4o-mini': (0.15, 0.075, 0.6),
+    'gpt-4-turbo': (10.0, 10.0, 30.0),
+    'gpt-4-turbo-preview': (10.0, 10.0, 30.0),
+    'gpt-4': (30.0, 30.0, 60.0),
+    'gpt-3.5-turbo': (0.5, 0.5, 1.5),
+}
+
+# Сценарий запроса без определенной темы
+DEFAULT_SCENARIO = 'general'
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cost_usd: float
+    scenario: str
+    message_id: Optional[str]
+    # Часть prompt_tokens, взятая из кэша промптов (дешевле)
+    cached_tokens: int = 0
+    model: str = ''
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+@dataclass
+class PromptAlert:
+    """Промпт сценария вырос относительно обычного размера"""
+    scenario: str
+    prompt_tokens: int
+    baseline: float
+    message_id: Optional[str] = None
+
+    def text(self) -> str:
+        growth = (self.prompt_tokens / self.baseline - 1) * 100 if self.baseline else 0.0
+        return (
+            f"📈 Промпт сценария «{self.scenario}» вырос: {self.prompt_tokens} токенов "
+            f"при обычных ~{self.baseline:.0f} (+{growth:.0f}%)"
+        )
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Стоимость запроса в USD; для неизвестной модели - 0"""
+    prices = PRICES.get(model)
+    if prices is None:
+        # Версии с датой: gpt-4o-2024-08-06 -> gpt-4o
+        base = max((name for name in PRICES if model.startswith(name + '-')), key=len, default=None)
+        prices = PRICES.get(base)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+            + completion_tokens * completion_price) / 1_000_000
+
+
+def usage_from_response(usage, model: str, scenario: Optional[str] = None,
+                        message_id: Optional[str] = None) -> TokenUsage:
+    """TokenUsage из response.usage ответа OpenAI"""
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+    return TokenUsage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=usage.total_tokens or prompt_tokens + completion_tokens,
+        cost_usd=estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        scenario=scenario or DEFAULT_SCENARIO,
+        message_id=message_id,
+        cached_tokens=cached_tokens,
+        model=model
+    )
+
+
+class PromptRegressionDetector:
+    """
+    Обычный размер промпта сценария - экспоненциальное среднее.
+
+    Args:
+        alpha: Вес нового запроса в среднем
+        warmup: Сколько запросов сценария нужно, прежде чем сравнивать
+        ratio: Во сколько раз промпт должен превысить обычный
+        min_increase: Минимальный прирост в токенах (мелкие сценарии не шумят)
+        cooldown: Не чаще одного предупреждения на сценарий за столько секунд
+    """
+
+    def __init__(self, alpha: float = 0.05, warmup: int = 20, ratio: float = 1.5,
+                 min_increase: int = 200, cooldown: float = 600.0):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.ratio = ratio
+        self.min_increase = min_increase
+        self.cooldown = cooldown
+        self.baselines: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._alerted: Dict[str, float] = {}
+
+    def check(self, usage: TokenUsage, now: float) -> Optional[PromptAlert]:
+        scenario, tokens = usage.scenario, usage.prompt_tokens
+        baseline = self.baselines.get(scenario)
+        count = self.counts.get(scenario, 0) + 1
+        self.counts[scenario] = count
+        self.baselines[scenario] = tokens if baseline is None else baseline + self.alpha * (tokens - baseline)
+
+        if (baseline is None or count <= self.warmup or tokens < baseline * self.ratio
+                or tokens - baseline < self.min_increase):
+            return None
+        if now - self._alerted.get(scenario, float('-inf')) < self.cooldown:
+            return None
+        self._alerted[scenario] = now
+        return PromptAlert(scenario, tokens, baseline, usage.message_id)
+
+
+# Предупреждение о росте промпта: (alert) -> None
+AlertHandler = Callable[[PromptAlert], Awaitable[None]]
+
+
+class TokenUsageRecorder:
+    """
+    Args:
+        db: Сервис базы данных (PostgresService); None - только метрики и предупреждения
+        detector: Проверка роста промптов
+        on_alert: Куда отправить предупреждение (например, в тему ошибок)
+        flush_interval: Как часто записывать накопленные строки, секунд
+        max_buffer: Сколько строк держать до записи; лишние отбрасываются
+        report_timezone: Часовой пояс дневной сводки
+    """
+
+    def __init__(self, db=None, detector: Optional[PromptRegressionDetector] = None,
+                 on_alert: Optional[AlertHandler] = None, flush_interval: float = 5.0,
+                 max_buffer: int = 10000, report_timezone: str = 'Asia/Almaty'):
+        self.db = db
+        self.detector = detector or PromptRegressionDetector()
+        self.on_alert = on_alert
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.report_timezone = report_timezone
+        self._buffer: List[TokenUsage] = []
+        self._task: Optional[asyncio.Task] = None
+        self._alerts: Set[asyncio.Task] = set()
+        self.stats = {'recorded': 0, 'written': 0, 'dropped': 0, 'failures': 0, 'alerts': 0}
+
+    def record(self, usage: TokenUsage) -> Optional[PromptAlert]:
+        """Учитывает ответ модели; возвращает предупреждение, если промпт вырос"""
+        self.stats['recorded'] += 1
+        labels = {'model': usage.model, 'scenario': usage.scenario}
+        metrics.counter('llm_tokens_total', usage.prompt_tokens - usage.cached_tokens, {**labels, 'kind': 'prompt'})
+        metrics.counter('llm_tokens_total', usage.cached_tokens, {**labels, 'kind': 'cached'})
+        metrics.counter('llm_tokens_total', usage.completion_tokens, {**labels, 'kind': 'completion'})
+        metrics.counter('llm_cost_usd_total', usage.cost_usd, labels)
+        metrics.observe('llm_prompt_tokens', usage.prompt_tokens, {'scenario': usage.scenario})
+
+        if self.db is not None:
+            if len(self._buffer) < self.max_buffer:
+                self._buffer.append(usage)
+            else:
+                self.stats['dropped'] += 1
+
+        alert = self.detector.check(usage, time.monotonic())
+        if alert is not None:
+            self.stats['alerts'] += 1
+            logger.warning(alert.text())
+            if self.on_alert is not None:
+                task = asyncio.create_task(self._send_alert(alert))
+                self._alerts.add(task)
+                task.add_done_callback(self._alerts.discard)
+        return alert
+
+    async def _send_alert(self, alert: PromptAlert) -> None:
+        try:
+            await self.on_alert(alert)
+        except Exception as e:
+            logger.error(f"Failed to send prompt alert for {alert.scenario}: {e}")
+
+    async def flush(self) -> bool:
+        """Записывает строки и обновляет дневную и часовую сводки одним запросом"""
+        if not self._buffer or self.db is None:
+            return True
+        batch, self._buffer = self._buffer, []
+        saved = await self.db.execute(
+            """
+            WITH batch AS (
+                SELECT * FROM unnest($1::timestamptz[], $2::text[], $3::text[], $4::text[],
+                                     $5::int[], $6::int[], $7::int[], $8::float8[])
+                    AS t(created_at, scenario, model, message_id,
+                         prompt_tokens, completion_tokens, cached_tokens, cost_usd)
+            ), inserted AS (
+                INSERT INTO public.token_usage (
+                    created_at, scenario, model, message_id, prompt_tokens,
+                    completion_tokens, total_tokens, cached_tokens, cost_usd
+                )
+                SELECT created_at, scenario, model, message_id, prompt_tokens,
+                       completion_tokens, prompt_tokens + completion_tokens, cached_tokens, cost_usd
+                FROM batch
+            ), daily AS (
+                INSERT INTO public.token_usage_daily AS d (
+                    day, scenario, model, requests, prompt_tokens,
+                    completion_tokens, cached_tokens, cost_usd, max_prompt_tokens
+                )
+                SELECT (created_at AT TIME ZONE $9)::date, scenario, model, COUNT(*), SUM(prompt_tokens),
+                       SUM(completion_tokens), SUM(cached_tokens), SUM(cost_usd), MAX(prompt_tokens)
+                FROM batch
+                GROUP BY 1, 2, 3
+                ON CONFLICT (day, scenario, model) DO UPDATE SET
+                    requests = d.requests + EXCLUDED.requests,
+                    prompt_tokens = d.prompt_tokens + EXCLUDED.prompt_tokens,
+                    completion_tokens = d.completion_tokens + EXCLUDED.completion_tokens,
+                    cached_tokens = d.cached_tokens + EXCLUDED.cached_tokens,
+                    cost_usd = d.cost_usd + EXCLUDED.cost_usd,
+                    max_prompt_tokens = GREATEST(d.max_prompt_tokens, EXCLUDED.max_prompt_tokens)
+            )
+            INSERT INTO public.token_usage_hourly AS h (
+                hour, scenario, model, requests, prompt_tokens,
+                completion_tokens, cached_tokens, cost_usd, max_prompt_tokens
+            )
+            SELECT date_trunc('hour', created_at), scenario, model, COUNT(*), SUM(prompt_tokens),
+                   SUM(completion_tokens), SUM(cached_tokens), SUM(cost_usd), MAX(prompt_tokens)
+            FROM batch
+            GROUP BY 1, 2, 3
+            ON CONFLICT (hour, scenario, model) DO UPDATE SET
+                requests = h.requests + EXCLUDED.requests,
+                prompt_tokens = h.prompt_tokens + EXCLUDED.prompt_tokens,
+                completion_tokens = h.completion_tokens + EXCLUDED.completion_tokens,
+                cached_tokens = h.cached_tokens + EXCLUDED.cached_tokens,
+                cost_usd = h.cost_usd + EXCLUDED.cost_usd,
+                max_prompt_tokens = GREATEST(h.max_prompt_tokens, EXCLUDED.max_prompt_tokens)
+            """,
+            [usage.created_at for usage in batch],
+            [usage.scenario for usage in batch],
+            [usage.model for usage in batch],
+            [usage.message_id for usage in batch],
+            [usage.prompt_tokens for usage in batch],
+            [usage.completion_tokens for usage in batch],
+            [usage.cached_tokens for usage in batch],
+            [float(usage.cost_usd) for usage in batch],
+            self.report_timezone
+        )
+        if saved:
+            self.stats['written'] += len(batch)
+        else:
+            # Запрос выполняется целиком или никак: строки вернутся в следующую пачку
+            self.stats['failures'] += 1
+            keep = batch[:max(0, self.max_buffer - len(self._buffer))]
+            self.stats['dropped'] += len(batch) - len(keep)
+            self._buffer = keep + self._buffer
+        return saved
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.db is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._alerts:
+            await asyncio.gather(*self._alerts, return_exceptions=True)
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'buffered': len(self._buffer),
+            'baselines': {scenario: round(value) for scenario, value in self.detector.baselines.items()}
+        }
+
+
+# Создаем глобальный экземпляр
+token_recorder = TokenUsageRecorder()
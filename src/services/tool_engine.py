@@ -0,0 +1,242 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Соответствие типов JSON Schema типам Python
+JSON_TYPES = {
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+    'object': dict,
+    'array': list
+}
+
+
+class ToolArgumentError(ValueError):
+    """Аргументы вызова инструмента не прошли проверку"""
+
+
+@dataclass
+class Tool:
+    """Зарегистрированный инструмент"""
+    name: str
+    description: str
+    parameters: Dict[str, Any]
+    handler: Callable[..., Awaitable[Any]]
+    timeout: float = 5.0
+    cacheable: bool = False
+
+    def definition(self) -> Dict[str, Any]:
+        """Описание инструмента в формате OpenAI tools"""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters
+            }
+        }
+
+
+@dataclass
+class ToolStats:
+    """Статистика задержек одного инструмента"""
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    cache_hits: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        executed = self.calls - self.cache_hits
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cache_hits': self.cache_hits,
+            'avg_ms': round(self.total_ms / executed, 1) if executed else 0.0,
+            'max_ms': round(self.max_ms, 1)
+        }
+
+
+class ToolEngine:
+    """
+    Движок вызова инструментов для OpenAI.
+    Проверяет аргументы по схеме, выполняет все вызовы одного ответа модели
+    параллельно, у каждого вызова свой таймаут. Результаты cacheable-инструментов
+    запоминаются до смены версии инвентаря; версия запрашивается у version_provider
+    (функции или корутины) перед каждым поиском в кэше.
+    """
+
+    def __init__(self, version_provider: Optional[Callable[[], Any]] = None,
+                 cache_size: int = 256):
+        self.tools: Dict[str, Tool] = {}
+        self.version_provider = version_provider
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_version: Optional[str] = None
+        self.stats: Dict[str, ToolStats] = {}
+
+    def register(self, name: str, description: str, parameters: Dict[str, Any],
+                 handler: Callable[..., Awaitable[Any]], timeout: float = 5.0,
+                 cacheable: bool = False) -> None:
+        """Регистрирует инструмент"""
+        self.tools[name] = Tool(name, description, parameters, handler, timeout, cacheable)
+        self.stats.setdefault(name, ToolStats())
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """Список инструментов для параметра tools в chat.completions"""
+        return [tool.definition() for tool in self.tools.values()]
+
+    def validate(self, tool: Tool, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Проверяет и приводит аргументы к типам из схемы.
+        Неизвестные аргументы отбрасываются, числа в строках приводятся к числам.
+        """
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError("Аргументы должны быть объектом")
+
+        properties = tool.parameters.get('properties', {})
+        validated = {}
+
+        for key, value in arguments.items():
+            schema = properties.get(key)
+            if schema is None:
+                logger.warning(f"Tool {tool.name}: unknown argument {key} dropped")
+                continue
+            if value is None:
+                continue
+            validated[key] = self._coerce(key, value, schema)
+
+        missing = [key for key in tool.parameters.get('required', []) if key not in validated]
+        if missing:
+            raise ToolArgumentError(f"Не заполнены обязательные поля: {', '.join(missing)}")
+
+        return validated
+
+    def _coerce(self, key: str, value: Any, schema: Dict[str, Any]) -> Any:
+        """Приводит значение к типу из схемы"""
+        expected = schema.get('type')
+        if expected in ('number', 'integer') and isinstance(value, str):
+            try:
+                number = float(value.replace(' ', '').replace(',', '.'))
+            except ValueError:
+                raise ToolArgumentError(f"Поле {key} должно быть числом")
+            value = int(number) if expected == 'integer' else number
+
+        python_type = JSON_TYPES.get(expected)
+        # bool является подклассом int, поэтому проверяем его отдельно
+        if python_type and (not isinstance(value, python_type) or
+                            (isinstance(value, bool) and expected in ('number', 'integer'))):
+            raise ToolArgumentError(f"Поле {key} должно иметь тип {expected}")
+
+        if 'enum' in schema and value not in schema['enum']:
+            raise ToolArgumentError(f"Поле {key} должно быть одним из: {', '.join(map(str, schema['enum']))}")
+
+        return value
+
+    def _cache_key(self, name: str, arguments: Dict[str, Any]) -> str:
+        return f"{name}:{json.dumps(arguments, sort_keys=True, ensure_ascii=False)}"
+
+    async def _get_cached(self, key: str) -> Optional[str]:
+        version = self.version_provider() if self.version_provider else None
+        if inspect.isawaitable(version):
+            version = await version
+        if version is None or version != self._cache_version:
+            # Инвентарь изменился - старые результаты больше не верны
+            self._cache.clear()
+            self._cache_version = version
+            return None
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _put_cached(self, key: str, result: str) -> None:
+        if self._cache_version is None:
+            return
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _record(self, name: str, elapsed_ms: float, error: bool = False, timeout: bool = False) -> None:
+        stats = self.stats.setdefault(name, ToolStats())
+        stats.calls += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        if error:
+            stats.errors += 1
+        if timeout:
+            stats.timeouts += 1
+        logger.info(f"Tool {name} finished in {elapsed_ms:.1f} ms"
+                    f"{' (timeout)' if timeout else ' (error)' if error else ''}")
+
+    async def execute(self, name: str, arguments: Any) -> str:
+        """Выполняет один вызов инструмента и возвращает результат строкой для модели"""
+        tool = self.tools.get(name)
+        if not tool:
+            return f"Неизвестная функция: {name}"
+
+        try:
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments) if arguments else {}
+            arguments = self.validate(tool, arguments)
+        except (ToolArgumentError, json.JSONDecodeError) as e:
+            logger.warning(f"Tool {name}: invalid arguments {arguments}: {e}")
+            self.stats[name].calls += 1
+            self.stats[name].errors += 1
+            return json.dumps({"error": f"Некорректные аргументы: {e}"}, ensure_ascii=False)
+
+        cache_key = self._cache_key(name, arguments) if tool.cacheable else None
+        if cache_key:
+            cached = await self._get_cached(cache_key)
+            if cached is not None:
+                self.stats[name].calls += 1
+                self.stats[name].cache_hits += 1
+                return cached
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(tool.handler(**arguments), timeout=tool.timeout)
+        except asyncio.TimeoutError:
+            self._record(name, (time.perf_counter() - start) * 1000, timeout=True)
+            return json.dumps({"error": "Превышено время ожидания"}, ensure_ascii=False)
+        except Exception as e:
+            self._record(name, (time.perf_counter() - start) * 1000, error=True)
+            logger.error(f"Error executing function {name}: {str(e)}", exc_info=True)
+            return f"Произошла ошибка при выполнении функции: {str(e)}"
+
+        self._record(name, (time.perf_counter() - start) * 1000)
+
+        if not isinstance(result, str):
+            result = json.dumps(result, ensure_ascii=False)
+        if cache_key:
+            self._put_cached(cache_key, result)
+        return result
+
+    async def execute_tool_calls(self, tool_calls: List[Any]) -> List[Dict[str, str]]:
+        """
+        Параллельно выполняет все вызовы инструментов из одного ответа модели.
+        Возвращает сообщения с role=tool в порядке вызовов.
+        """
+        results = await asyncio.gather(*[
+            self.execute(call.function.name, call.function.arguments)
+            for call in tool_calls
+        ])
+        return [
+            {"role": "tool", "tool_call_id": call.id, "content": result}
+            for call, result in zip(tool_calls, results)
+        ]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика задержек по инструментам"""
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
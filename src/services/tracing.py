@@ -0,0 +1,262 @@
+"""
+Трассировка обработки сообщения по этапам.
+Трасса открывается на входящее обновление (trace_id = update_id), этапы внутри
+отмечаются span(...): получение остатков, поиск в базе знаний, кэш, вызов LLM,
+отправка в Telegram, запись в группу логов. Текущая трасса хранится в contextvar,
+поэтому этапы из параллельных задач (asyncio.gather) попадают в ту же трассу,
+а вне трассы span почти ничего не стоит.
+
+Длительность каждого этапа всегда пишется в гистограмму stage_seconds реестра
+метрик. Сами трассы сохраняются выборочно: TraceExporter оставляет долю
+sample_rate, а медленные и завершившиеся ошибкой - всегда, и пишет их пачками
+в JSONL-файл или таблицу bot_logs. Отчет по перцентилям этапов строит
+scripts/trace_report.py.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Категория записей трасс в bot_logs
+TRACE_CATEGORY = 'trace'
+
+
+@dataclass
+class Span:
+    """Этап трассы: начало - смещение от начала трассы"""
+    name: str
+    start_ms: float
+    duration_ms: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    name: str
+    trace_id: Any
+    started_at: float  # unix time
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    spans: List[Span] = field(default_factory=list)
+    duration_ms: float = 0.0
+    error: Optional[str] = None
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'time': self.started_at,
+            'duration_ms': round(self.duration_ms, 2),
+            'error': self.error,
+            'attrs': self.attrs,
+            'spans': [{'name': span.name, 'start_ms': round(span.start_ms, 2),
+                       'duration_ms': round(span.duration_ms, 2), **({'attrs': span.attrs} if span.attrs else {})}
+                      for span in self.spans]
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('trace', default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """Этап текущей трассы; атрибуты можно дописать внутри блока (span.attrs[...] = ...)"""
+    trace = _current.get()
+    start = time.perf_counter()
+    item = Span(name, (start - trace._start) * 1000 if trace else 0.0, attrs=attrs)
+    try:
+        yield item
+    except BaseException as e:
+        item.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        item.duration_ms = elapsed * 1000
+        metrics.observe('stage_seconds', elapsed, {'stage': name})
+        if trace is not None:
+            trace.spans.append(item)
+
+
+def add_span(name: str, duration: float, **attrs) -> None:
+    """Этап, измеренный заранее (например, задержка доставки обновления), в секундах"""
+    duration = max(duration, 0.0)
+    metrics.observe('stage_seconds', duration, {'stage': name})
+    trace = _current.get()
+    if trace is not None:
+        start_ms = (time.perf_counter() - trace._start - duration) * 1000
+        trace.spans.append(Span(name, start_ms, duration * 1000, attrs))
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль по рангу в отсортированном списке"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(len(values) * percent / 100))
+    return values[rank - 1]
+
+
+def stage_report(traces: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Перцентили длительности по этапам (и по трассе целиком - этап 'total'), мс"""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for trace in traces:
+        durations['total'].append(trace['duration_ms'])
+        for item in trace.get('spans', []):
+            durations[item['name']].append(item['duration_ms'])
+    report = {}
+    for name, values in durations.items():
+        values.sort()
+        report[name] = {'count': len(values), 'p50': percentile(values, 50),
+                        'p95': percentile(values, 95), 'p99': percentile(values, 99), 'max': values[-1]}
+    return report
+
+
+class JsonlTraceSink:
+    """Трассы построчно в JSONL-файл"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+
+    async def write(self, traces: List[Dict[str, Any]]) -> bool:
+        await asyncio.to_thread(self._write, [json.dumps(trace, ensure_ascii=False) + '\n' for trace in traces])
+        return True
+
+
+class BotLogsTraceSink:
+    """Трассы в таблицу bot_logs (category = 'trace', трасса - в metadata)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def write(self, traces: List[Dict[str, Any]]) -> bool:
+        return await self.db.execute(
+            """
+            INSERT INTO public.bot_logs (level, category, message, metadata, user_id, chat_id, created_at)
+            SELECT CASE WHEN t.metadata->>'error' IS NULL THEN 'INFO' ELSE 'ERROR' END,
+                   $1, t.message, t.metadata, (t.metadata->'attrs'->>'user_id')::bigint,
+                   (t.metadata->'attrs'->>'chat_id')::bigint, to_timestamp((t.metadata->>'time')::float8)
+            FROM unnest($2::text[], $3::jsonb[]) AS t(message, metadata)
+            """,
+            TRACE_CATEGORY,
+            [f"{trace['name']} {trace['trace_id']}: {trace['duration_ms']} ms" for trace in traces],
+            [json.dumps(trace, ensure_ascii=False) for trace in traces]
+        )
+
+
+class TraceExporter:
+    """
+    Выборочное сохранение трасс пачками.
+
+    Args:
+        sink: Куда писать (JsonlTraceSink, BotLogsTraceSink)
+        sample_rate: Доля сохраняемых обычных трасс
+        slow_ms: Трассы дольше этого сохраняются всегда
+        flush_interval: Как часто записывать накопленные трассы, секунд
+        max_buffer: Сколько трасс держать до записи; лишние отбрасываются
+    """
+
+    def __init__(self, sink, sample_rate: float = 0.1, slow_ms: float = 3000.0,
+                 flush_interval: float = 5.0, max_buffer: int = 1000):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'finished': 0, 'sampled': 0, 'dropped': 0, 'written': 0, 'failures': 0}
+
+    def should_keep(self, trace: Trace) -> bool:
+        return trace.error is not None or trace.duration_ms >= self.slow_ms or random.random() < self.sample_rate
+
+    def submit(self, trace: Trace) -> None:
+        self.stats['finished'] += 1
+        if not self.should_keep(trace):
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self.stats['dropped'] += 1
+            return
+        self.stats['sampled'] += 1
+        self._buffer.append(trace.to_dict())
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        traces, self._buffer = self._buffer, []
+        try:
+            saved = await self.sink.write(traces)
+        except Exception as e:
+            logger.error(f"Failed to write traces: {e}")
+            saved = False
+        if saved:
+            self.stats['written'] += len(traces)
+        else:
+            self.stats['failures'] += 1
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, 'buffered': len(self._buffer)}
+
+
+class Tracer:
+    """Открывает трассы; без экспортера трассы не сохраняются, но этапы попадают в метрики"""
+
+    def __init__(self, exporter: Optional[TraceExporter] = None):
+        self.exporter = exporter
+
+    @contextmanager
+    def trace(self, name: str, trace_id: Any = None, **attrs) -> Iterator[Trace]:
+        trace = Trace(name, trace_id, time.time(), attrs)
+        token = _current.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            trace.duration_ms = (time.perf_counter() - trace._start) * 1000
+            metrics.observe('trace_seconds', trace.duration_ms / 1000, {'trace': name})
+            if self.exporter is not None:
+                self.exporter.submit(trace)
+
+
+# Создаем глобальный экземпляр
+tracer = Tracer()
@@ -0,0 +1,187 @@
+"""
+Отсев повторных доставок вебхука по id сообщения (mid).
+Meta повторяет доставку, если не дождалась ответа, и после рестарта бота
+повторы тоже должны отсекаться, иначе клиент получит второй ответ.
+
+Недавние mid хранятся в фильтре Блума: для нового сообщения фильтр отвечает
+«точно не было» без обращения к базе, а mid записываются в Postgres пачками
+в фоне. Только если фильтр отвечает «возможно было», повтор подтверждается
+точной проверкой в базе - так ложное срабатывание фильтра не теряет сообщение.
+Фильтр состоит из двух поколений, которые сменяются раз в ttl секунд.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Args:
+        capacity: Сколько ключей рассчитан хранить
+        error_rate: Доля ложных срабатываний при заполнении до capacity
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Двойное хеширование: k позиций из двух половин одного дайджеста
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class WebhookDeduper:
+    """
+    Args:
+        db: Сервис базы данных (PostgresService); None - только фильтр в памяти
+        ttl: Сколько секунд помнить mid (не меньше ttl и не больше 2 * ttl)
+        capacity: Сколько mid ожидается за ttl
+        error_rate: Доля ложных срабатываний фильтра
+        flush_interval: Как часто записывать новые mid в базу, секунд
+    """
+
+    def __init__(self, db=None, ttl: float = 24 * 3600, capacity: int = 100000,
+                 error_rate: float = 0.001, flush_interval: float = 1.0):
+        self.db = db
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.flush_interval = flush_interval
+
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.rotated_at = time.monotonic()
+        # mid, еще не записанные в базу: по ним повтор подтверждается без запроса
+        self._pending: Dict[str, None] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'new': 0, 'duplicates': 0, 'filter_hits': 0, 'false_positives': 0, 'db_errors': 0}
+
+    def _rotate(self, now: float) -> None:
+        if now - self.rotated_at >= self.ttl:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+            self.rotated_at = now
+
+    async def load(self) -> None:
+        """Заполняет фильтр mid из базы за последние ttl секунд (после рестарта)"""
+        if self.db is None:
+            return
+        rows = await self.db.fetch_all(
+            """
+            SELECT mid FROM public.instagram_webhook_events
+            WHERE received_at > NOW() - make_interval(secs => $1)
+            """,
+            float(self.ttl)
+        )
+        for row in rows:
+            self.current.add(row['mid'])
+        logger.info(f"Webhook deduper loaded {len(rows)} recent message ids")
+
+    async def _confirm(self, mid: str) -> bool:
+        """Точная проверка в базе с одновременной записью; True - mid новый"""
+        row = await self.db.fetch_one(
+            """
+            WITH inserted AS (
+                INSERT INTO public.instagram_webhook_events (mid) VALUES ($1)
+                ON CONFLICT (mid) DO NOTHING
+                RETURNING 1
+            )
+            SELECT COUNT(*) AS inserted FROM inserted
+            """,
+            mid
+        )
+        if row is None:
+            # База недоступна: лучше ответить дважды, чем потерять сообщение
+            self.stats['db_errors'] += 1
+            return True
+        return row['inserted'] > 0
+
+    async def claim(self, mid: Optional[str]) -> bool:
+        """Отмечает mid как принятый; False - это повторная доставка"""
+        if not mid:
+            return True
+        self._rotate(time.monotonic())
+        if mid in self.current or mid in self.previous:
+            self.stats['filter_hits'] += 1
+            if mid in self._pending or self.db is None:
+                is_new = False
+            else:
+                is_new = await self._confirm(mid)
+                if is_new:
+                    self.stats['false_positives'] += 1
+            if not is_new:
+                self.stats['duplicates'] += 1
+                return False
+            self.current.add(mid)
+            self.stats['new'] += 1
+            return True
+
+        self.current.add(mid)
+        if self.db is not None:
+            self._pending[mid] = None
+        self.stats['new'] += 1
+        return True
+
+    async def flush(self) -> bool:
+        """Записывает накопленные mid одним запросом и удаляет устаревшие"""
+        if not self._pending or self.db is None:
+            return True
+        mids: List[str] = list(self._pending)
+        saved = await self.db.execute(
+            """
+            WITH expired AS (
+                DELETE FROM public.instagram_webhook_events
+                WHERE received_at < NOW() - make_interval(secs => $2)
+            )
+            INSERT INTO public.instagram_webhook_events (mid)
+            SELECT unnest($1::text[])
+            ON CONFLICT (mid) DO NOTHING
+            """,
+            mids, float(self.ttl) * 2
+        )
+        if saved:
+            for mid in mids:
+                self._pending.pop(mid, None)
+        else:
+            self.stats['db_errors'] += 1
+        return saved
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.db is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, 'pending': len(self._pending), 'filter_keys': self.current.count + self.previous.count}
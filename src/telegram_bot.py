@@ -1,14 +1,11 @@
 import logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('bot_output.log', mode='w', encoding='utf-8')
-    ]
-)
+from utils.logger_config import setup_logging, stop_logging
+
+# Настройка логирования: вывод в отдельном потоке через очередь
+setup_logging(logging.INFO, log_file='bot_output.log')
+# httpx пишет строку на каждый запрос к Bot API
+logging.getLogger('httpx').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +14,11 @@ import signal
 import sys
 import os
 import fcntl
+import hmac
+import html
+import math
 import time
+from functools import partial
 from typing import Optional
 from aiohttp import web
 
@@ -27,6 +28,7 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    MessageReactionHandler,
     filters,
     ContextTypes
 )
@@ -36,6 +38,36 @@ from services.docs_service import DocsService
 from services.config_service import ConfigService
 from services.openai_service import OpenAIService
 from services.feedback_service import FeedbackService
+from services.telegram_metadata import telegram_metadata
+from services.reaction_consumer import ReactionConsumer, ReactionTally
+from services.callback_processor import CallbackProcessor
+from services.answer_pipeline import AnswerPipeline
+from services.instagram_webhook import GraphSender, IncomingMessage, InstagramWebhook
+from services.instagram_tokens import instagram_tokens
+from services.webhook_dedupe import WebhookDeduper
+from services.order_service import (
+    OutboxDispatcher, ReservationReleaser, format_orders_message, order_service, order_sheet_row
+)
+from services.telegram_outbound import Priority, outbound_scheduler
+from services.http_client import http_client
+from services.tracing import BotLogsTraceSink, JsonlTraceSink, TraceExporter, add_span, span, tracer
+from services.metrics import (CloudMonitoringExporter, FileMetricsExporter, MetricsPublisher,
+                              MetricsRegistry, PostgresMetricsExporter, PROMETHEUS_CONTENT_TYPE, metrics,
+                              render_prometheus)
+from services.loop_monitor import loop_monitor
+from services.token_usage import PromptAlert, token_recorder
+from services.profiler import Profile, profiler
+from services.log_digest import CALLBACK_PREFIX as DIGEST_CALLBACK_PREFIX, LogDigest, mark_rated
+from services.log_digest import parse_callback as parse_digest_callback
+
+# Ответ оператору на нажатие кнопки оценки; отправляется сразу, до пересылки
+FEEDBACK_RESPONSES = {
+    'like': "Спасибо за положительную оценку! 👍",
+    'dislike': "Спасибо за отзыв! Мы улучшим ответы 👍"
+}
+
+# Темы группы логов, без которых бот не может разложить сообщения
+REQUIRED_TOPICS = ['📝 Логи', '🎓 Обучение бота', '🐛 Ошибки и баги', '🛒 Заказы']
 
 class SingleInstanceBot:
     """Ensure only one instance of the bot is running"""
@@ -90,11 +122,201 @@ class TelegramBot:
         self.lock = SingleInstanceBot()
         self.log_group_id: Optional[str] = None
         self.feedback: Optional[FeedbackService] = None
+        self.order_dispatcher: Optional[OutboxDispatcher] = None
+        self.reservation_releaser: Optional[ReservationReleaser] = None
+        self.log_digest = LogDigest(self.send_log)
+        # Реакции персонала на логи: дизлайкнутые ответы уходят в тему обучения
+        self.reactions = ReactionConsumer(on_threshold=self.forward_disliked)
+        # Фоновая обработка нажатий на кнопки оценки
+        self.callbacks = CallbackProcessor()
+        # Общий конвейер ответов для всех каналов
+        self.answers = AnswerPipeline(self.sheets, self.docs)
+        self.instagram: Optional[InstagramWebhook] = None
+        self.instagram_sender: Optional[GraphSender] = None
+        self.web_runner: Optional[web.AppRunner] = None
+        self.metrics_publisher: Optional[MetricsPublisher] = None
+        # Токен оператора для /debug/profile; без него эндпоинт выключен
+        self.debug_token: Optional[str] = None
 
     async def health_check(self, request):
         """Health check endpoint"""
         return web.Response(text='OK', status=200)
         
+    async def outbound_stats(self, request):
+        """Задержка очереди исходящих сообщений по полосам"""
+        return web.json_response(outbound_scheduler.get_stats())
+        
+    async def http_stats(self, request):
+        """Переиспользование соединений и задержка внешних HTTP-запросов по хостам"""
+        return web.json_response(http_client.get_stats())
+        
+    async def loop_stats(self, request):
+        """Задержка event loop и места, где его блокирует синхронный код"""
+        return web.json_response(loop_monitor.get_stats())
+        
+    async def prometheus_metrics(self, request):
+        """Метрики в текстовом формате Prometheus"""
+        return web.Response(body=render_prometheus(metrics).encode('utf-8'),
+                            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+        
+    def collect_runtime_metrics(self, registry: MetricsRegistry) -> None:
+        """Глубина очередей, пулы соединений и счетчики сервисов - снимаются в момент выгрузки"""
+        for lane, stats in outbound_scheduler.get_stats().items():
+            registry.gauge('telegram_outbound_queued', stats['queued'], {'priority': lane})
+            registry.set_counter('telegram_outbound_sent_total', stats['sent'], {'priority': lane})
+            # Повторы в планировщике бывают только после 429 (RetryAfter)
+            registry.set_counter('telegram_retry_after_total', stats['retries'], {'priority': lane})
+        for host, stats in http_client.stats.items():
+            registry.set_counter('http_requests_total', stats.requests, {'host': host})
+            registry.set_counter('http_errors_total', stats.errors, {'host': host})
+            registry.set_counter('http_retries_total', stats.retries, {'host': host})
+        if self.instagram:
+            registry.gauge('instagram_webhook_queued', self.instagram.pending)
+        registry.gauge('callbacks_running', self.callbacks.get_stats()['running'])
+        registry.gauge('reactions_pending', len(self.reactions.dirty))
+        if tracer.exporter:
+            registry.gauge('traces_buffered', tracer.exporter.get_stats()['buffered'])
+        registry.gauge('token_usage_buffered', token_recorder.get_stats()['buffered'])
+        for pool, db in (('reactions', self.reactions.db), ('orders', order_service.db), ('sheets', self.sheets.db)):
+            for name, value in db.get_pool_stats().items():
+                registry.gauge(f'db_pool_{name}', value, {'pool': pool})
+        
+    async def handle_instagram_message(self, message: IncomingMessage) -> None:
+        """Отвечает клиенту Instagram и пишет диалог в сводку логов"""
+        metrics.counter('updates_total', labels={'type': 'instagram'})
+        with tracer.trace('instagram', message.mid, sender_id=message.sender_id):
+            # Сколько сообщение ждало в очереди вебхука
+            add_span('receive', time.monotonic() - message.received_at)
+            answer = await self.answers.answer(message.text)
+            with span('instagram_send'):
+                sent = await self.instagram_sender.send_text(message.sender_id, answer.text)
+            
+            topic_id = telegram_metadata.topic_id('📸 Instagram Support') or telegram_metadata.topic_id('📝 Логи')
+            with span('log_post'):
+                await self.log_digest.add(
+                    topic_id,
+                    title=f"Instagram {message.sender_id}",
+                    text=(
+                        f"❓ Вопрос:\n{message.text}\n\n"
+                        f"📚 Использованные знания:\n{answer.knowledge}\n\n"
+                        f"✍️ Ответ бота:\n{answer.text}"
+                        + ("" if sent else "\n\n⚠️ Ответ не доставлен")
+                    )
+                )
+    
+    async def setup_instagram(self) -> None:
+        """Вебхук Instagram включается, если в базе есть его учетные данные"""
+        credentials = await instagram_tokens.credentials()
+        # Токен страницы запрашивается один раз и дальше обновляется в фоне до истечения
+        page_token = await instagram_tokens.page_token()
+        if not (credentials.get('app_secret') and credentials.get('verify_token') and page_token):
+            logger.warning("Instagram credentials not found, webhook disabled")
+            return
+        
+        self.instagram_sender = GraphSender(instagram_tokens)
+        # Повторные доставки отсекаются и после рестарта: mid хранятся в базе
+        deduper = WebhookDeduper(self.reactions.db)
+        await deduper.load()
+        self.instagram = InstagramWebhook(
+            self.handle_instagram_message, credentials['app_secret'], credentials['verify_token'],
+            deduper=deduper
+        )
+        self.instagram.start()
+        instagram_tokens.start()
+    
+    async def instagram_stats(self, request):
+        """Очередь вебхука Instagram"""
+        return web.json_response(self.instagram.get_stats() if self.instagram else {})
+    
+    async def setup_metrics(self) -> None:
+        """
+        Фоновая выгрузка метрик (в bot_metrics и, если настроен проект, в Cloud Monitoring)
+        и трасс обработки сообщений (в bot_logs)
+        """
+        metrics_file = os.getenv('METRICS_FILE')
+        if metrics_file:
+            # Локальная разработка: метрики пишутся в файл вместо внешних хранилищ
+            exporters = [FileMetricsExporter(metrics_file)]
+        else:
+            exporters = [PostgresMetricsExporter(self.reactions.db)]
+            project_id = await self.config.get_config_async('project_id', service='google')
+            if project_id:
+                exporters.append(CloudMonitoringExporter(project_id))
+        metrics.add_collector(self.collect_runtime_metrics)
+        self.metrics_publisher = MetricsPublisher(metrics, exporters)
+        self.metrics_publisher.start()
+        # Отчет о блокирующих вызовах раз в час уходит в тему ошибок
+        loop_monitor.on_report = self.report_blocking
+        loop_monitor.start()
+        
+        # Трассы этапов обработки: выборочно, медленные и с ошибками - всегда
+        trace_file = os.getenv('TRACE_FILE')
+        sink = JsonlTraceSink(trace_file) if trace_file else BotLogsTraceSink(self.reactions.db)
+        sample_rate = await self.config.get_config_async('trace_sample_rate', service='telegram')
+        tracer.exporter = TraceExporter(sink, sample_rate=float(sample_rate) if sample_rate else 0.1)
+        tracer.exporter.start()
+        
+        # Расход токенов пишется в token_usage пачками, рост промптов - в тему ошибок
+        token_recorder.db = self.reactions.db
+        token_recorder.on_alert = self.report_prompt_alert
+        token_recorder.start()
+    
+    async def report_prompt_alert(self, alert: PromptAlert) -> None:
+        """Предупреждение о разросшемся промпте сценария"""
+        await self.send_log(telegram_metadata.topic_id('🐛 Ошибки и баги'), alert.text())
+    
+    async def report_blocking(self, text: str) -> None:
+        """Периодический отчет о местах, где блокируется event loop"""
+        await self.send_log(telegram_metadata.topic_id('🐛 Ошибки и баги'), f"<pre>{html.escape(text)}</pre>")
+    
+    async def debug_profile(self, request):
+        """
+        Профиль потоков и asyncio-задач бота в свернутом формате (для flamegraph).
+        GET /debug/profile?seconds=30&interval=0.01, заголовок Authorization: Bearer <debug_token>
+        """
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {self.debug_token}".encode()):
+            return web.Response(status=403)
+        try:
+            seconds = float(request.query.get('seconds', '30'))
+            interval = float(request.query['interval']) if 'interval' in request.query else None
+            if not math.isfinite(seconds) or (interval is not None and not math.isfinite(interval)):
+                raise ValueError
+        except ValueError:
+            return web.Response(status=400, text='seconds and interval must be finite numbers')
+        if profiler.running:
+            return web.Response(status=409, text='profile capture is already running')
+        
+        profile = await profiler.capture(seconds, interval)
+        return web.Response(text=profile.collapsed(), headers={
+            'Content-Disposition': f'attachment; filename="{self.profile_filename()}"'
+        })
+        
+    @staticmethod
+    def profile_filename() -> str:
+        return f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed.txt"
+        
+    async def start_web_server(self) -> None:
+        """HTTP-сервер бота: health check, метрики, статистика, профилировщик и вебхук Instagram"""
+        app = web.Application()
+        app.router.add_get('/health', self.health_check)
+        app.router.add_get('/metrics', self.prometheus_metrics)
+        app.router.add_get('/stats/outbound', self.outbound_stats)
+        app.router.add_get('/stats/http', self.http_stats)
+        app.router.add_get('/stats/loop', self.loop_stats)
+        app.router.add_get('/stats/instagram', self.instagram_stats)
+        if self.instagram:
+            self.instagram.add_routes(app)
+        self.debug_token = await self.config.get_config_async('debug_token', service='telegram')
+        if self.debug_token:
+            app.router.add_get('/debug/profile', self.debug_profile)
+        
+        self.web_runner = web.AppRunner(app)
+        await self.web_runner.setup()
+        port = int(os.getenv('PORT', '8080'))
+        await web.TCPSite(self.web_runner, '0.0.0.0', port).start()
+        logger.info(f"Web server started on port {port}")
+        
     async def webhook_handler(self, request):
         """Handle incoming webhook requests"""
         try:
@@ -127,7 +349,8 @@ class TelegramBot:
     async def get_log_group_id(self):
         """Get log group ID from database"""
         try:
-            self.log_group_id = await self.config.get_config_async('log_group_id', service='telegram')
+            await telegram_metadata.refresh()
+            self.log_group_id = telegram_metadata.log_group_id
             logger.info(f"Log group ID loaded: {self.log_group_id}")
         except Exception as e:
             logger.error(f"Error loading log group ID: {e}")
@@ -140,81 +363,72 @@ class TelegramBot:
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle incoming messages"""
-        try:
-            message = update.message
-            if not message or not message.text:
-                return
-
-            text = message.text
-            user = message.from_user
-            
-            logger.info(
-                "\n=== НОВОЕ СООБЩЕНИЕ ===\n"
-                f"От: {user.first_name} ({user.id})\n"
-                f"Текст: {text}\n"
-                "======================="
-            )
-                
-            # Если это личное сообщение боту
-            if message.chat.type == 'private':
-                # Получаем ответ из документов/таблиц с использованием кэша
-                logger.info("\n=== ПОЛУЧЕНИЕ ДАННЫХ ИНВЕНТАРЯ ===")
-                inventory_data = await self.sheets.get_inventory_data()
-                logger.info(f"Получено товаров: {len(inventory_data) if inventory_data else 0}")
-                
-                # Получаем релевантные знания и ответ
-                logger.info("\n=== ПОИСК РЕЛЕВАНТНЫХ ЗНАНИЙ ===")
-                relevant_knowledge = await self.docs.get_relevant_knowledge(text)
-                logger.info(f"Найденные знания:\n{relevant_knowledge}")
-                
-                logger.info("\n=== ГЕНЕРАЦИЯ ОТВЕТА ===")
-                response = await self.docs.get_response(text, inventory_data)
-                logger.info(f"Ответ бота:\n{response}")
-                
-                await message.reply_text(response)
-                
-                # Логируем сообщение в группе
-                log_message = (
-                    f"*Новое сообщение от клиента*\n\n"
-                    f"👤 *Пользователь*:\n"
-                    f"ID: `{user.id}`\n"
-                    f"Имя: {user.first_name} {user.last_name if user.last_name else ''}\n"
-                    f"Username: @{user.username if user.username else 'Нет'}\n\n"
-                    f"❓ *Вопрос*:\n{text}\n\n"
-                    f"📚 *Использованные знания*:\n{relevant_knowledge}\n\n"
-                    f"✍️ *Ответ бота*:\n{response}"
-                )
-                
-                # Получаем ID темы для логов
-                logs_topic_id = await self.feedback.get_topic_id('📝 Логи')
-                
-                log_msg = await context.bot.send_message(
-                    chat_id=self.log_group_id,
-                    message_thread_id=logs_topic_id,
-                    text=log_message,
-                    parse_mode="Markdown"
-                )
-                
-                # Добавляем кнопки для оценки к логу
-                await self.feedback.add_feedback_buttons(
-                    chat_id=self.log_group_id,
-                    topic_id=logs_topic_id,
-                    message_id=log_msg.message_id
-                )
+        message = update.message
+        if not message or not message.text:
+            return
+        user = message.from_user
+        metrics.counter('updates_total', labels={'type': 'message'})
+        
+        with tracer.trace('message', update.update_id, chat_id=message.chat.id, user_id=user.id) as trace:
+            # Сколько обновление шло от Telegram до обработчика
+            add_span('receive', time.time() - message.date.timestamp())
+            try:
+                text = message.text
                 
-        except Exception as e:
-            logger.error(f"Error handling message: {e}", exc_info=True)
-            await message.reply_text("Извините, произошла ошибка. Попробуйте позже.")
+                logger.info("Новое сообщение от %s (%s): %s", user.first_name, user.id, text,
+                            extra={'user_id': user.id, 'chat_id': message.chat.id})
+                    
+                # Если это личное сообщение боту
+                if message.chat.type == 'private':
+                    # Получаем ответ из документов/таблиц с использованием кэша
+                    answer = await self.answers.answer(text)
+                    response, relevant_knowledge = answer.text, answer.knowledge
+                    
+                    with span('telegram_send'):
+                        await message.reply_text(response)
+                    
+                    # Логируем сообщение в группе: запись попадает в сводку темы логов
+                    # вместе с кнопками оценки
+                    log_text = (
+                        f"👤 ID: {user.id}, @{user.username if user.username else 'Нет'}\n"
+                        f"❓ Вопрос:\n{text}\n\n"
+                        f"📚 Использованные знания:\n{relevant_knowledge}\n\n"
+                        f"✍️ Ответ бота:\n{response}"
+                    )
+                    
+                    # Ответ уже отправлен: ошибка записи лога не должна вызывать извинение
+                    try:
+                        with span('log_post'):
+                            # Получаем ID темы для логов
+                            logs_topic_id = await self.feedback.get_topic_id('📝 Логи')
+                            
+                            await self.log_digest.add(
+                                logs_topic_id,
+                                title=f"{user.first_name} {user.last_name if user.last_name else ''}".strip(),
+                                text=log_text
+                            )
+                    except Exception as e:
+                        logger.error(f"Failed to add log entry: {e}", exc_info=True)
+                    
+            except Exception as e:
+                trace.error = f"{type(e).__name__}: {e}"
+                logger.error(f"Error handling message: {e}", exc_info=True)
+                await message.reply_text("Извините, произошла ошибка. Попробуйте позже.")
 
     async def handle_callback_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обрабатывает нажатия на кнопки"""
         query = update.callback_query
         data = query.data
         message = query.message
+        metrics.counter('updates_total', labels={'type': 'callback'})
         chat_id = str(message.chat_id)
         message_id = message.message_id
 
         try:
+            if data.startswith(f"{DIGEST_CALLBACK_PREFIX}:"):
+                await self.handle_digest_feedback(query)
+                return
+            
             action, topic_id_str, orig_message_id_str = data.split("_")
             
             # Проверяем и конвертируем topic_id
@@ -233,15 +447,21 @@ class TelegramBot:
                 await query.answer(text="Ошибка: некорректный ID сообщения")
                 return
 
-            if action == "dislike":
-                success, response_text = await self.feedback.handle_dislike(chat_id, orig_message_id, topic_id)
-                if success:
-                    await self.feedback.update_message_buttons(chat_id, message_id, topic_id, "dislike")
-            
-            elif action == "like":
-                success, response_text = await self.feedback.handle_like(chat_id, orig_message_id, topic_id)
-                if success:
-                    await self.feedback.update_message_buttons(chat_id, message_id, topic_id, "like")
+            if action in ("like", "dislike"):
+                # Одна оценка на сообщение: второе нажатие (в том числе другой кнопки) отсекается
+                key = f"fb:{chat_id}:{message_id}"
+                if not self.callbacks.claim(query.id, key):
+                    await query.answer(text="Вы уже оценили это сообщение")
+                    return
+                
+                # Сначала отвечаем оператору, пересылка и смена кнопок идут в фоне
+                await query.answer(text=FEEDBACK_RESPONSES[action])
+                self.callbacks.submit(
+                    key,
+                    lambda: self.feedback.apply_feedback(chat_id, message_id, orig_message_id, topic_id, action),
+                    on_error=partial(self.report_callback_error, message, message.reply_markup)
+                )
+                return
             
             elif action in ("liked", "done"):
                 response_text = "Вы уже оценили это сообщение"
@@ -257,6 +477,98 @@ class TelegramBot:
             logger.error(f"Ошибка при обработке callback query: {str(e)}")
             await query.answer(text="Произошла ошибка при обработке")
 
+    async def handle_digest_feedback(self, query: CallbackQuery) -> None:
+        """Оценка отдельной записи из сводки логов"""
+        parsed = parse_digest_callback(query.data)
+        if not parsed:
+            await query.answer(text="Вы уже оценили это сообщение")
+            return
+        
+        action, entry_id = parsed
+        entry = self.log_digest.get_entry(entry_id)
+        if not entry:
+            await query.answer(text="Запись устарела, оцените более свежее сообщение")
+            return
+        
+        key = f"{DIGEST_CALLBACK_PREFIX}:{entry_id}"
+        if not self.callbacks.claim(query.id, key):
+            await query.answer(text="Вы уже оценили это сообщение")
+            return
+        await query.answer(text=FEEDBACK_RESPONSES[action])
+        
+        message = query.message
+        original_markup = message.reply_markup
+        
+        async def apply() -> bool:
+            tasks = [self.feedback.handle_entry_feedback(str(message.chat_id), action, entry.render())]
+            if original_markup:
+                label = "✅ Хороший пример" if action == "like" else "❌ Отправлено на доработку"
+                tasks.append(query.edit_message_reply_markup(
+                    reply_markup=mark_rated(original_markup, entry_id, label)
+                ))
+            # Успех определяет только пересылка: ошибка смены кнопок не должна
+            # отменять уже выполненную пересылку и повторять ее через on_error
+            forwarded, *edits = await asyncio.gather(*tasks, return_exceptions=True)
+            for edit in edits:
+                if isinstance(edit, BaseException):
+                    logger.error(f"Failed to mark digest entry as rated: {edit}")
+            if isinstance(forwarded, BaseException):
+                raise forwarded
+            success, _ = forwarded
+            return success
+        
+        self.callbacks.submit(key, apply, on_error=partial(self.report_callback_error, message, original_markup))
+
+    async def report_callback_error(self, message, original_markup, error: str) -> None:
+        """Возвращает кнопки и сообщает об ошибке в ту же тему через очередь исходящих"""
+        bot = self.application.bot
+        if original_markup:
+            try:
+                await bot.edit_message_reply_markup(
+                    chat_id=message.chat_id,
+                    message_id=message.message_id,
+                    reply_markup=original_markup,
+                    rate_limit_args={'priority': Priority.STAFF}
+                )
+            except Exception as e:
+                logger.error(f"Failed to restore feedback buttons: {e}")
+        await bot.send_message(
+            chat_id=message.chat_id,
+            message_thread_id=message.message_thread_id,
+            reply_to_message_id=message.message_id,
+            text=f"⚠️ Не удалось обработать оценку: {error}. Попробуйте еще раз.",
+            rate_limit_args={'priority': Priority.STAFF}
+        )
+
+    async def send_log(self, topic_id: Optional[int], text: str, reply_markup=None) -> Optional[int]:
+        """Отправляет сводку логов в тему группы"""
+        log_msg = await self.application.bot.send_message(
+            chat_id=self.log_group_id,
+            message_thread_id=topic_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        )
+        self.reactions.remember_thread(self.log_group_id, log_msg.message_id, topic_id)
+        return log_msg.message_id
+
+    async def handle_reaction(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Учитывает реакцию на сообщение в группе логов"""
+        chat = update.effective_chat
+        metrics.counter('updates_total', labels={'type': 'reaction'})
+        if chat and str(chat.id) == str(self.log_group_id):
+            await self.reactions.handle_update(update)
+
+    async def forward_disliked(self, tally: ReactionTally) -> bool:
+        """Пересылает в тему обучения сообщение, у которого дизлайки обогнали лайки"""
+        learning_topic_id = telegram_metadata.topic_id('🎓 Обучение бота')
+        if not learning_topic_id or tally.thread_id == learning_topic_id:
+            return False
+        return await self.feedback.forward_message(
+            self.log_group_id, tally.message_id, tally.thread_id, learning_topic_id,
+            f"⚠️ Сообщение получило больше дизлайков ({tally.dislikes} > {tally.likes}). Требуется анализ и улучшение."
+        )
+
     async def handle_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /update command"""
         # Проверяем, что команда пришла от оператора
@@ -264,8 +576,7 @@ class TelegramBot:
             return
             
         # Проверяем, является ли пользователь оператором
-        is_operator = await self.config.get_config_async('operators', service='telegram')
-        if not is_operator or str(update.effective_user.id) not in is_operator.split(','):
+        if not telegram_metadata.is_operator(update.effective_user.id):
             await update.message.reply_text("❌ У вас нет прав для выполнения этой команды")
             return
 
@@ -277,6 +588,62 @@ class TelegramBot:
         else:
             await update.message.reply_text("❌ Ошибка при обновлении данных")
 
+    async def handle_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /profile [секунд] - профиль бота файлом в тему ошибок"""
+        if update.effective_chat.type != 'private':
+            return
+        if not telegram_metadata.is_operator(update.effective_user.id):
+            await update.message.reply_text("❌ У вас нет прав для выполнения этой команды")
+            return
+        
+        try:
+            seconds = float(context.args[0]) if context.args else 30.0
+            if not math.isfinite(seconds):
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text("Использование: /profile [секунд]")
+            return
+        if profiler.running:
+            await update.message.reply_text("⏳ Профиль уже снимается")
+            return
+        
+        await update.message.reply_text(f"⏱ Снимаю профиль за {seconds:.0f} с, файл придет в тему «🐛 Ошибки и баги»")
+        # Снимок идет в фоне: обработка обновлений не останавливается
+        self.callbacks.submit(
+            f"profile:{update.update_id}",
+            partial(self.upload_profile, seconds),
+            on_error=lambda error: update.message.reply_text(f"❌ Не удалось снять профиль: {error}")
+        )
+    
+    async def upload_profile(self, seconds: float) -> bool:
+        """Снимает профиль и отправляет его файлом в тему ошибок"""
+        profile: Profile = await profiler.capture(seconds)
+        await self.application.bot.send_document(
+            chat_id=self.log_group_id,
+            message_thread_id=telegram_metadata.topic_id('🐛 Ошибки и баги'),
+            document=profile.collapsed().encode('utf-8'),
+            filename=self.profile_filename(),
+            # Подпись документа в Telegram - не длиннее 1024 символов
+            caption=profile.summary()[:1024]
+        )
+        return True
+
+    async def send_orders_to_staff(self, orders: list):
+        """Отправляет часть пачки новых заказов в группу персонала одним сообщением"""
+        topic_id = await self.feedback.get_topic_id('🛒 Заказы') or await self.feedback.get_topic_id('📝 Логи')
+        await self.application.bot.send_message(
+            chat_id=self.log_group_id,
+            message_thread_id=topic_id,
+            text=format_orders_message(orders),
+            parse_mode="HTML",
+            rate_limit_args={'priority': Priority.STAFF}
+        )
+
+    async def append_orders_to_sheet(self, orders: list):
+        """Записывает пачку заказов в Google Sheets одним запросом"""
+        if not await self.sheets.append_order_rows([order_sheet_row(order) for order in orders]):
+            raise RuntimeError("Failed to append orders to sheet")
+
     def signal_handler(self, signum, frame):
         """Handle termination signals"""
         logger.info("Received termination signal")
@@ -289,8 +656,8 @@ class TelegramBot:
             # Get bot token
             await self.get_bot_token()
             
-            # Create application
-            self.application = Application.builder().token(self.token).build()
+            # Create application; все исходящие запросы идут через общий планировщик
+            self.application = Application.builder().token(self.token).rate_limiter(outbound_scheduler).build()
             
             # Get log group ID
             await self.get_log_group_id()
@@ -312,8 +679,19 @@ class TelegramBot:
         """Setup message handlers"""
         self.application.add_handler(CommandHandler("start", self.handle_start))
         self.application.add_handler(CommandHandler("update", self.handle_update))
+        self.application.add_handler(CommandHandler("profile", self.handle_profile))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.application.add_handler(CallbackQueryHandler(self.handle_callback_query))
+        self.application.add_handler(MessageReactionHandler(self.handle_reaction))
+        # Служебные сообщения о темах форума обновляют реестр метаданных
+        self.application.add_handler(MessageHandler(
+            filters.StatusUpdate.FORUM_TOPIC_CREATED | filters.StatusUpdate.FORUM_TOPIC_EDITED,
+            self.handle_forum_topic
+        ))
+
+    async def handle_forum_topic(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запоминает созданные и переименованные темы группы логов"""
+        await telegram_metadata.observe_message(update.effective_message)
 
     async def run(self):
         """Run the bot"""
@@ -325,26 +703,59 @@ class TelegramBot:
             await self.get_bot_token()
             await self.get_log_group_id()
             
-            # Initialize services
-            self.sheets = SheetsService()
+            # Initialize services (тот же экземпляр, что использует конвейер ответов)
             await self.sheets.initialize()
             
-            # Initialize bot and services
-            bot = Bot(token=self.token)
-            self.feedback = FeedbackService(bot)
-            await self.feedback.initialize()
+            # Create application; все исходящие запросы идут через общий планировщик
+            # с лимитами Telegram и приоритетом ответов клиентам
+            self.application = Application.builder().token(self.token).rate_limiter(outbound_scheduler).build()
             
-            # Create application
-            self.application = Application.builder().bot(bot).build()
+            # Initialize services
+            self.feedback = FeedbackService(self.application.bot)
+            await self.feedback.initialize()
             
             # Setup handlers
             await self.setup_handlers()
             
+            # Окно сводки логов в секундах; 0 - каждая запись отдельным сообщением
+            digest_window = await self.config.get_config_async('log_digest_window', service='telegram')
+            if digest_window is not None:
+                self.log_digest.window = float(digest_window)
+            
+            # Уведомления о заказах отправляются в фоне из outbox
+            # Не больше 10 заказов в сообщении, чтобы уложиться в лимит длины Telegram
+            self.order_dispatcher = OutboxDispatcher(order_service.db, {
+                'telegram': self.send_orders_to_staff,
+                'sheets': self.append_orders_to_sheet
+            }, chunk_sizes={'telegram': 10})
+            order_service.dispatcher = self.order_dispatcher
+            self.order_dispatcher.start()
+            
+            # Просроченные резервы возвращаются на склад и без новых заказов
+            self.reservation_releaser = ReservationReleaser(order_service.db)
+            self.reservation_releaser.start()
+            
+            # Фоновое обновление тем, операторов и настроек чатов;
+            # недостающие темы создаются в группе логов
+            await telegram_metadata.ensure_topics(self.application.bot, REQUIRED_TOPICS)
+            telegram_metadata.start(self.application.bot, REQUIRED_TOPICS)
+            
+            # Смещение и недавние счетчики реакций; дальше сброс в базу пачками
+            await self.reactions.load()
+            self.reactions.start()
+            
+            await self.setup_metrics()
+            
+            # Вебхук Instagram и служебные эндпоинты
+            await self.setup_instagram()
+            await self.start_web_server()
+            
             # Start polling
             logger.info("Starting bot in polling mode...")
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling(drop_pending_updates=True)
+            # Реакции (message_reaction, message_reaction_count) по умолчанию не приходят
+            await self.application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
             
             # Keep the bot running
             try:
@@ -360,6 +771,26 @@ class TelegramBot:
         finally:
             # Properly shut down
             try:
+                await self.log_digest.close()
+                await telegram_metadata.stop()
+                await self.reactions.stop()
+                await self.callbacks.drain()
+                await loop_monitor.stop()
+                await token_recorder.stop()
+                if tracer.exporter:
+                    await tracer.exporter.stop()
+                if self.metrics_publisher:
+                    await self.metrics_publisher.stop()
+                if self.web_runner:
+                    await self.web_runner.cleanup()
+                if self.instagram:
+                    await self.instagram.stop()
+                    await instagram_tokens.stop()
+                await http_client.close()
+                if self.order_dispatcher:
+                    await self.order_dispatcher.stop()
+                if self.reservation_releaser:
+                    await self.reservation_releaser.stop()
                 if self.application:
                     await self.application.updater.stop()
                     await self.application.stop()
@@ -379,3 +810,6 @@ if __name__ == '__main__':
     except Exception as e:
         logger.error(f"Bot stopped with error: {str(e)}", exc_info=True)
         sys.exit(1)
+    finally:
+        # Дописываем записи, оставшиеся в очереди логов
+        stop_logging()
@@ -1,50 +1,207 @@
+"""
+Настройка логирования.
+
+Записи из любых потоков кладутся в очередь (QueueHandler), а форматирование
+и вывод - консоль, файл - выполняет отдельный поток QueueListener, поэтому
+ввод-вывод обработчиков не занимает event loop. В Cloud Run записи выводятся
+в stdout одной строкой JSON: Cloud Run сам отправляет их в Cloud Logging
+со структурными полями (severity, message и поля из extra).
+
+Большие данные (инвентарь, промпты) логируются на уровне DEBUG через LazyJson:
+сериализация выполняется, только если запись действительно выводится.
+Частые однотипные записи прореживаются по ключу extra={'sample': ...}.
+"""
+import atexit
+import copy
+import json
 import logging
 import os
-import google.cloud.logging
-from google.cloud.logging.handlers import CloudLoggingHandler
-from datetime import datetime
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+# Атрибуты LogRecord; все остальное в записи пришло из extra и выводится как поля
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'sample'}
+
+
+class LazyJson:
+    """JSON для аргумента записи: сериализуется только при выводе"""
+    __slots__ = ('value', 'indent')
+
+    def __init__(self, value: Any, indent: Optional[int] = None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, ensure_ascii=False, indent=self.indent, default=str)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Запись одной строкой JSON в формате, который понимает Cloud Logging"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info:
+            # Трассировка в тексте сообщения - так ее находит Error Reporting
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        entry: Dict[str, Any] = {
+            'severity': record.levelname,
+            'message': message,
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'logger': record.name,
+            'logging.googleapis.com/sourceLocation': {
+                'file': record.pathname, 'line': record.lineno, 'function': record.funcName
+            },
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateSampler(logging.Filter):
+    """
+    Прореживание частых записей: по каждому ключу extra={'sample': key}
+    пропускается не больше limit записей за interval секунд. Следующая
+    пропущенная запись сообщает, сколько было отброшено (поле suppressed).
+    Записи без ключа и уровня WARNING и выше не прореживаются.
+
+    Args:
+        limit: Сколько записей с одним ключом пропускать за интервал
+        interval: Длина интервала, секунд
+    """
+
+    def __init__(self, limit: int = 1, interval: float = 10.0):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            started, passed, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, passed = now, 0
+            if passed >= self.limit:
+                self._windows[key] = (started, passed, suppressed + 1)
+                return False
+            self._windows[key] = (started, passed + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования: вызывающий поток только
+    подставляет аргументы в сообщение, время и трассировка форматируются
+    в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} похожих записей пропущено)"
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _build_handlers(log_level: int, log_file: Optional[str], structured: bool) -> List[logging.Handler]:
+    formatter = StructuredFormatter() if structured else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout if structured else sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode='w', encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(log_level)
+    return handlers
+
+
+def setup_logging(log_level: int = logging.INFO, log_file: Optional[str] = None,
+                  structured: Optional[bool] = None, sample_limit: int = 1,
+                  sample_interval: float = 10.0) -> QueueListener:
+    """
+    Переводит корневой логгер на очередь; повторный вызов заменяет обработчики.
+
+    Args:
+        log_level: Уровень корневого логгера
+        log_file: Файл, в который дублируются записи
+        structured: JSON вместо текста; по умолчанию - в Cloud Run (K_SERVICE) или при LOG_FORMAT=json
+        sample_limit: Сколько записей с одним ключом sample пропускать за интервал
+        sample_interval: Интервал прореживания, секунд
+    """
+    global _listener
+    if structured is None:
+        structured = bool(os.getenv('K_SERVICE')) or os.getenv('LOG_FORMAT') == 'json'
+
+    stop_logging()
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    queue_handler.addFilter(RateSampler(sample_limit, sample_interval))
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(records, *_build_handlers(log_level, log_file, structured),
+                              respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Дописывает записи из очереди и останавливает поток вывода"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
 
 def setup_logger(name: str, log_level=logging.INFO):
     """
-    Настройка логгера для работы с Cloud Logging
-    
+    Настройка логгера: уровень задается логгеру, записи уходят в обработчики
+    корневого логгера. Если корневой логгер еще не настроен (отдельный скрипт),
+    он переводится на очередь
+
     Args:
         name: Имя логгера
         log_level: Уровень логирования
-        
+
     Returns:
         logging.Logger: Настроенный логгер
     """
-    # Создаем форматтер для логов
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-    )
-    
-    # Получаем или создаем логгер
+    if _listener is None and not logging.getLogger().handlers:
+        setup_logging()
+
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
-    
-    # Очищаем существующие хендлеры
+
+    # Собственные обработчики не нужны: записи доходят до корневого логгера
     if logger.handlers:
         logger.handlers.clear()
-    
-    # Создаем консольный хендлер (для локальной разработки)
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    console_handler.setLevel(log_level)
-    logger.addHandler(console_handler)
-    
-    # В Cloud Run добавляем Cloud Logging
-    if os.getenv('K_SERVICE'):
-        try:
-            client = google.cloud.logging.Client()
-            cloud_handler = CloudLoggingHandler(client, name=name)
-            cloud_handler.setFormatter(formatter)
-            logger.addHandler(cloud_handler)
-            logger.info("Cloud Logging handler добавлен")
-        except Exception as e:
-            logger.error(f"Ошибка при настройке Cloud Logging: {e}")
-    
+    logger.propagate = True
+
     return logger
 
 # Словарь для хранения уже созданных логгеров
@@ -53,14 +210,14 @@ loggers = {}
 def get_logger(name: str, log_level=logging.INFO):
     """
     Получение логгера по имени
-    
+
     Args:
         name: Имя логгера
         log_level: Уровень логирования
-        
+
     Returns:
         logging.Logger: Логгер
     """
     if name not in loggers:
         loggers[name] = setup_logger(name, log_level)
-    return loggers[name]
\ No newline at end of file
+    return loggers[name]
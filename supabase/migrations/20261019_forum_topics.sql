@@ -0,0 +1,12 @@
+-- Темы форума группы логов.
+-- Таблица раньше создавалась скриптом scripts/track_forum_topics.py;
+-- теперь ее читает и пополняет реестр метаданных бота (services/telegram_metadata.py).
+CREATE TABLE IF NOT EXISTS public.forum_topics (
+    thread_id BIGINT PRIMARY KEY,
+    chat_id BIGINT,
+    name TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Реестр загружает темы одной группы
+CREATE INDEX IF NOT EXISTS idx_forum_topics_chat_id ON public.forum_topics (chat_id);
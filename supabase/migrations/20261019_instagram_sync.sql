@@ -0,0 +1,33 @@
+-- История диалогов Instagram и курсоры ее выгрузки.
+-- ConversationSync читает диалоги постранично и пишет сообщения пачками
+-- вместе с курсором диалога, поэтому прерванная выгрузка продолжается с места остановки.
+
+CREATE TABLE IF NOT EXISTS public.instagram_messages (
+    message_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    sender_id TEXT,
+    sender_name TEXT,
+    text TEXT,
+    created_time TIMESTAMP WITH TIME ZONE,
+    synced_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Лента диалога по времени
+CREATE INDEX IF NOT EXISTS idx_instagram_messages_conversation
+    ON public.instagram_messages (conversation_id, created_time DESC);
+
+-- Состояние выгрузки каждого диалога
+CREATE TABLE IF NOT EXISTS public.instagram_sync_state (
+    conversation_id TEXT PRIMARY KEY,
+    page_id TEXT NOT NULL,
+    -- Курсор следующей (более старой) страницы сообщений; NULL - начать с начала
+    cursor TEXT,
+    -- updated_time диалога на момент полной выгрузки; совпадает - диалог пропускается
+    updated_time TEXT,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    synced_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_instagram_sync_state_page
+    ON public.instagram_sync_state (page_id);
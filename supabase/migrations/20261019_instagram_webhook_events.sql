@@ -0,0 +1,12 @@
+-- Принятые сообщения вебхука Instagram (mid) для отсева повторных доставок.
+-- Бот держит недавние mid в фильтре Блума и записывает их сюда пачками;
+-- точная проверка по таблице нужна только при срабатывании фильтра.
+
+CREATE TABLE IF NOT EXISTS public.instagram_webhook_events (
+    mid TEXT PRIMARY KEY,
+    received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Загрузка недавних mid при старте и удаление устаревших
+CREATE INDEX IF NOT EXISTS idx_instagram_webhook_events_received_at
+    ON public.instagram_webhook_events (received_at);
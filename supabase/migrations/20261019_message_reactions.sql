@@ -0,0 +1,19 @@
+-- Счетчики реакций на сообщения в группе логов.
+-- Бот получает реакции из обычного потока обновлений (message_reaction,
+-- message_reaction_count), копит их в памяти и сбрасывает сюда пачками.
+
+CREATE TABLE IF NOT EXISTS public.message_reaction_counts (
+    chat_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    thread_id BIGINT,
+    likes INTEGER NOT NULL DEFAULT 0,
+    dislikes INTEGER NOT NULL DEFAULT 0,
+    -- Сообщение уже переслано в тему обучения, повторно не пересылается
+    forwarded BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (chat_id, message_id)
+);
+
+-- Загрузка недавних счетчиков при старте бота
+CREATE INDEX IF NOT EXISTS idx_message_reaction_counts_updated_at
+    ON public.message_reaction_counts (updated_at);
@@ -0,0 +1,145 @@
+-- Заказы с ключом идемпотентности и транзакционный outbox уведомлений.
+-- Заказ, резерв товара и строки outbox записываются одной функцией place_order
+-- в одной транзакции; уведомления персоналу рассылает фоновый диспетчер.
+
+CREATE TABLE IF NOT EXISTS public.orders (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    order_number BIGSERIAL UNIQUE,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    bouquet_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+    price NUMERIC(10,2),
+    delivery_price NUMERIC(10,2),
+    customer_name TEXT NOT NULL,
+    customer_phone TEXT NOT NULL,
+    delivery_address TEXT NOT NULL,
+    delivery_time TEXT,
+    reservation_id UUID REFERENCES public.product_reservations(id),
+    status TEXT NOT NULL DEFAULT 'new', -- 'new', 'confirmed', 'delivered', 'cancelled'
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS public.order_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    order_id UUID NOT NULL REFERENCES public.orders(id) ON DELETE CASCADE,
+    event_type TEXT NOT NULL, -- 'telegram', 'sheets'
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'processing', 'sent', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON public.orders(created_at);
+
+-- Частичный индекс: диспетчер выбирает только неотправленные события
+CREATE INDEX IF NOT EXISTS idx_order_outbox_pending
+    ON public.order_outbox(id)
+    WHERE status IN ('pending', 'processing');
+
+DROP TRIGGER IF EXISTS update_orders_updated_at ON public.orders;
+CREATE TRIGGER update_orders_updated_at
+    BEFORE UPDATE ON public.orders
+    FOR EACH ROW
+    EXECUTE FUNCTION public.update_updated_at_column();
+
+-- Оформляет заказ за один вызов: проверка ключа, резерв, заказ и outbox.
+-- Повторный вызов с тем же ключом возвращает уже созданный заказ (created = FALSE).
+-- При нехватке товара возвращает status = 'out_of_stock' и ничего не записывает.
+CREATE OR REPLACE FUNCTION public.place_order(
+    p_idempotency_key TEXT,
+    p_bouquet_name TEXT,
+    p_quantity INTEGER,
+    p_price NUMERIC,
+    p_delivery_price NUMERIC,
+    p_customer_name TEXT,
+    p_customer_phone TEXT,
+    p_delivery_address TEXT,
+    p_delivery_time TEXT,
+    p_event_types TEXT[] DEFAULT ARRAY['telegram', 'sheets']
+) RETURNS TABLE (order_id UUID, order_number BIGINT, status TEXT, created BOOLEAN) AS $$
+#variable_conflict use_column
+DECLARE
+    v_order public.orders%ROWTYPE;
+    v_reservation_id UUID;
+BEGIN
+    -- Параллельные вызовы с одним ключом выполняются по очереди: второй ждет здесь
+    -- коммита первого и находит его заказ. Без этого он ждал бы блокировки строки
+    -- товара в reserve_products и после списания последней единицы первым
+    -- вызовом получил бы 'out_of_stock' вместо уже оформленного заказа
+    PERFORM pg_advisory_xact_lock(hashtext(p_idempotency_key));
+
+    SELECT * INTO v_order FROM public.orders o WHERE o.idempotency_key = p_idempotency_key;
+    IF FOUND THEN
+        RETURN QUERY SELECT v_order.id, v_order.order_number, v_order.status, FALSE;
+        RETURN;
+    END IF;
+
+    SELECT r.reservation INTO v_reservation_id
+    FROM public.reserve_products(ARRAY[p_bouquet_name], ARRAY[p_quantity]) AS r;
+    IF v_reservation_id IS NULL THEN
+        RETURN QUERY SELECT NULL::UUID, NULL::BIGINT, 'out_of_stock'::TEXT, FALSE;
+        RETURN;
+    END IF;
+
+    -- После advisory-блокировки конфликт ключа невозможен; ON CONFLICT - страховка
+    -- от вставок в обход place_order
+    INSERT INTO public.orders (
+        idempotency_key, bouquet_name, quantity, price, delivery_price,
+        customer_name, customer_phone, delivery_address, delivery_time, reservation_id
+    ) VALUES (
+        p_idempotency_key, p_bouquet_name, p_quantity, p_price, p_delivery_price,
+        p_customer_name, p_customer_phone, p_delivery_address, p_delivery_time, v_reservation_id
+    )
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING * INTO v_order;
+
+    IF NOT FOUND THEN
+        PERFORM public.release_reservation(v_reservation_id);
+        SELECT * INTO v_order FROM public.orders o WHERE o.idempotency_key = p_idempotency_key;
+        RETURN QUERY SELECT v_order.id, v_order.order_number, v_order.status, FALSE;
+        RETURN;
+    END IF;
+
+    PERFORM public.confirm_reservation(v_reservation_id);
+
+    INSERT INTO public.order_outbox (order_id, event_type, payload)
+    SELECT v_order.id, e.event_type, to_jsonb(v_order)
+    FROM unnest(p_event_types) AS e(event_type);
+
+    RETURN QUERY SELECT v_order.id, v_order.order_number, v_order.status, TRUE;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Забирает пачку событий для отправки. Зависшие в 'processing' дольше
+-- p_lock_seconds события забираются повторно.
+CREATE OR REPLACE FUNCTION public.claim_order_outbox(
+    p_limit INTEGER DEFAULT 50,
+    p_lock_seconds INTEGER DEFAULT 60
+) RETURNS SETOF public.order_outbox AS $$
+BEGIN
+    RETURN QUERY
+    UPDATE public.order_outbox o
+    SET status = 'processing',
+        attempts = o.attempts + 1,
+        locked_until = NOW() + make_interval(secs => p_lock_seconds)
+    WHERE o.id IN (
+        SELECT id FROM public.order_outbox
+        WHERE (status = 'pending' AND available_at <= NOW())
+           OR (status = 'processing' AND locked_until < NOW())
+        ORDER BY id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT ALL ON public.orders TO postgres, service_role;
+GRANT ALL ON public.order_outbox TO postgres, service_role;
+GRANT USAGE, SELECT ON SEQUENCE public.orders_order_number_seq TO postgres, service_role;
+GRANT USAGE, SELECT ON SEQUENCE public.order_outbox_id_seq TO postgres, service_role;
@@ -0,0 +1,185 @@
+-- Резервирование товаров без гонок при одновременных заказах.
+-- Списание выполняется одним условным UPDATE (quantity >= n), поэтому два
+-- заказа на последний букет не могут пройти одновременно.
+-- Товар ищется по названию без учета регистра, как в get_product_quantity;
+-- в позициях резерва хранится название из products, поэтому возврат на склад
+-- находит товар точным совпадением.
+
+CREATE TABLE IF NOT EXISTS public.product_reservations (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    status TEXT NOT NULL DEFAULT 'pending', -- 'pending', 'confirmed', 'released', 'expired'
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS public.product_reservation_items (
+    reservation_id UUID NOT NULL REFERENCES public.product_reservations(id) ON DELETE CASCADE,
+    product_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    PRIMARY KEY (reservation_id, product_name)
+);
+
+-- Поиск товара по названию без учета регистра
+CREATE INDEX IF NOT EXISTS idx_products_name_lower
+    ON public.products (LOWER(name));
+
+-- Частичный индекс: фоновая очистка смотрит только на активные резервы
+CREATE INDEX IF NOT EXISTS idx_product_reservations_pending_expires
+    ON public.product_reservations(expires_at)
+    WHERE status = 'pending';
+
+DROP TRIGGER IF EXISTS update_product_reservations_updated_at ON public.product_reservations;
+CREATE TRIGGER update_product_reservations_updated_at
+    BEFORE UPDATE ON public.product_reservations
+    FOR EACH ROW
+    EXECUTE FUNCTION public.update_updated_at_column();
+
+-- Возвращает на склад товары из просроченных резервов.
+-- Вызывается из reserve_products и периодически из бота (ReservationReleaser),
+-- чтобы товар возвращался и тогда, когда новых заказов нет.
+-- SKIP LOCKED не дает параллельным вызовам ждать друг друга.
+CREATE OR REPLACE FUNCTION public.release_expired_reservations()
+RETURNS INTEGER AS $$
+DECLARE
+    v_released INTEGER;
+BEGIN
+    WITH expired AS (
+        UPDATE public.product_reservations r
+        SET status = 'expired'
+        WHERE r.id IN (
+            SELECT id FROM public.product_reservations
+            WHERE status = 'pending' AND expires_at < NOW()
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING r.id
+    ), items AS (
+        SELECT i.product_name, SUM(i.quantity) AS quantity
+        FROM public.product_reservation_items i
+        JOIN expired e ON e.id = i.reservation_id
+        GROUP BY i.product_name
+    ), restored AS (
+        UPDATE public.products p
+        SET quantity = p.quantity + items.quantity
+        FROM items
+        WHERE p.name = items.product_name
+        RETURNING p.id
+    )
+    SELECT COUNT(*) INTO v_released FROM expired;
+
+    RETURN v_released;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Резервирует несколько товаров за один вызов.
+-- Возвращает по строке на товар: ID резерва, название и остаток после списания
+-- (из UPDATE ... RETURNING, без отдельного запроса остатков). Если хотя бы
+-- одного товара не хватает, ни один не списывается, и возвращается одна строка
+-- с reservation = NULL и текущим остатком этого товара (NULL - товара нет).
+-- Тип результата раньше был UUID - CREATE OR REPLACE его не меняет.
+DROP FUNCTION IF EXISTS public.reserve_products(TEXT[], INTEGER[], INTEGER);
+CREATE OR REPLACE FUNCTION public.reserve_products(
+    p_names TEXT[],
+    p_quantities INTEGER[],
+    p_ttl_seconds INTEGER DEFAULT 900
+) RETURNS TABLE (reservation UUID, item_name TEXT, remaining INTEGER) AS $$
+DECLARE
+    v_reservation_id UUID := gen_random_uuid();
+    v_item RECORD;
+    v_product_name TEXT;
+    v_remaining INTEGER;
+    v_names TEXT[] := '{}';
+    v_left INTEGER[] := '{}';
+    v_failed TEXT;
+BEGIN
+    PERFORM public.release_expired_reservations();
+
+    BEGIN
+        INSERT INTO public.product_reservations (id, expires_at)
+        VALUES (v_reservation_id, NOW() + make_interval(secs => p_ttl_seconds));
+
+        -- Сортировка по имени задает единый порядок блокировок и исключает дедлоки
+        FOR v_item IN
+            SELECT LOWER(r.name) AS name, SUM(r.quantity)::INTEGER AS quantity
+            FROM unnest(p_names, p_quantities) AS r(name, quantity)
+            GROUP BY LOWER(r.name)
+            ORDER BY LOWER(r.name)
+        LOOP
+            UPDATE public.products p
+            SET quantity = p.quantity - v_item.quantity
+            WHERE p.id = (
+                SELECT id FROM public.products
+                WHERE LOWER(name) = v_item.name
+                ORDER BY id
+                LIMIT 1
+            ) AND p.quantity >= v_item.quantity
+            RETURNING p.name, p.quantity INTO v_product_name, v_remaining;
+
+            IF NOT FOUND THEN
+                v_failed := v_item.name;
+                RAISE EXCEPTION 'insufficient_stock: %', v_item.name;
+            END IF;
+
+            INSERT INTO public.product_reservation_items (reservation_id, product_name, quantity)
+            VALUES (v_reservation_id, v_product_name, v_item.quantity);
+            v_names := v_names || v_product_name;
+            v_left := v_left || v_remaining;
+        END LOOP;
+    EXCEPTION WHEN raise_exception THEN
+        -- Блок с EXCEPTION работает как savepoint: все списания выше откатываются
+        -- (переменные при этом сохраняют значения)
+        RETURN QUERY
+        SELECT NULL::UUID, COALESCE(p.name, v_failed), p.quantity
+        FROM (SELECT 1) AS one
+        LEFT JOIN LATERAL (
+            SELECT pr.name, pr.quantity FROM public.products pr
+            WHERE LOWER(pr.name) = v_failed
+            ORDER BY pr.id
+            LIMIT 1
+        ) AS p ON TRUE;
+        RETURN;
+    END;
+
+    RETURN QUERY SELECT v_reservation_id, r.name, r.quantity FROM unnest(v_names, v_left) AS r(name, quantity);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Подтверждает резерв (заказ оформлен). Просроченный резерв подтвердить нельзя.
+CREATE OR REPLACE FUNCTION public.confirm_reservation(p_reservation_id UUID)
+RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE public.product_reservations
+    SET status = 'confirmed'
+    WHERE id = p_reservation_id AND status = 'pending' AND expires_at >= NOW();
+
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Отменяет резерв и возвращает товары на склад
+CREATE OR REPLACE FUNCTION public.release_reservation(p_reservation_id UUID)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_released BOOLEAN;
+BEGIN
+    WITH released AS (
+        UPDATE public.product_reservations
+        SET status = 'released'
+        WHERE id = p_reservation_id AND status = 'pending'
+        RETURNING id
+    ), restored AS (
+        UPDATE public.products p
+        SET quantity = p.quantity + i.quantity
+        FROM public.product_reservation_items i
+        JOIN released r ON r.id = i.reservation_id
+        WHERE p.name = i.product_name
+        RETURNING p.id
+    )
+    SELECT EXISTS (SELECT 1 FROM released) INTO v_released;
+
+    RETURN v_released;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT ALL ON public.product_reservations TO postgres, service_role;
+GRANT ALL ON public.product_reservation_items TO postgres, service_role;
@@ -0,0 +1,47 @@
+-- Расход токенов OpenAI по запросам и сводки по дням и часам.
+-- Бот пишет строки пачками и тем же запросом прибавляет их к сводкам,
+-- поэтому отчеты читают сводки, а не суммируют всю token_usage.
+
+CREATE TABLE IF NOT EXISTS public.token_usage (
+    id BIGSERIAL PRIMARY KEY,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    scenario TEXT NOT NULL,
+    message_id TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Токены из кэша промптов и модель (таблица могла быть создана раньше без них)
+ALTER TABLE public.token_usage ADD COLUMN IF NOT EXISTS cached_tokens INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE public.token_usage ADD COLUMN IF NOT EXISTS model TEXT NOT NULL DEFAULT '';
+
+CREATE INDEX IF NOT EXISTS idx_token_usage_scenario_created_at
+    ON public.token_usage (scenario, created_at);
+
+CREATE TABLE IF NOT EXISTS public.token_usage_daily (
+    day DATE NOT NULL,
+    scenario TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    max_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, scenario, model)
+);
+
+CREATE TABLE IF NOT EXISTS public.token_usage_hourly (
+    hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    scenario TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    max_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, scenario, model)
+);
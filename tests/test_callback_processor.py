@@ -0,0 +1,62 @@
+"""
+Tests for background callback processing
+"""
+import asyncio
+
+from src.services.callback_processor import CallbackProcessor
+
+
+class TestCallbackProcessor:
+    def test_double_tap_is_deduplicated(self):
+        processor = CallbackProcessor()
+        assert processor.claim('q1', 'fb:-100:5')
+        # Второе нажатие - новый id запроса, та же кнопка
+        assert not processor.claim('q2', 'fb:-100:5')
+        # Повторная доставка того же запроса
+        assert not processor.claim('q1', 'fb:-100:6')
+        assert processor.get_stats()['duplicates'] == 2
+
+    def test_job_runs_after_answer(self):
+        async def scenario():
+            processor = CallbackProcessor()
+            events = []
+
+            async def job():
+                await asyncio.sleep(0.01)
+                events.append('forwarded')
+                return True
+
+            processor.claim('q1', 'key')
+            processor.submit('key', job)
+            events.append('answered')
+            await processor.drain()
+            return events, processor.get_stats()
+
+        events, stats = asyncio.run(scenario())
+        assert events == ['answered', 'forwarded']
+        assert stats['succeeded'] == 1
+
+    def test_failure_reported_and_button_released(self):
+        async def scenario():
+            processor = CallbackProcessor()
+            errors = []
+
+            async def job():
+                raise RuntimeError('forward failed')
+
+            async def on_error(error):
+                errors.append(error)
+
+            processor.claim('q1', 'key')
+            processor.submit('key', job, on_error=on_error)
+            await processor.drain()
+            return processor, errors
+
+        processor, errors = asyncio.run(scenario())
+        assert errors == ['forward failed']
+        assert processor.claim('q2', 'key')
+
+    def test_expired_keys_forgotten(self):
+        processor = CallbackProcessor(dedupe_ttl=0)
+        assert processor.claim('q1', 'key')
+        assert processor.claim('q2', 'key')
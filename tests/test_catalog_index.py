@@ -0,0 +1,81 @@
+"""
+Tests for the columnar catalog index
+"""
+import math
+
+import pytest
+
+from src.services.catalog_index import CatalogIndex, get_catalog, inventory_version, parse_price
+
+INVENTORY = [
+    {'name': 'Розы красные', 'price': '15 000 тг', 'quantity': 5,
+     'description': 'Букет на день рождения', 'category': 'Букеты'},
+    {'name': 'Тюльпаны', 'price': '8 000 тг', 'quantity': 0,
+     'description': 'Весенний букет', 'category': 'Букеты'},
+    {'name': 'Пионы', 'price': '25 000', 'quantity': 3,
+     'description': 'Букет на свадьбу', 'category': 'Моно букеты'},
+    {'name': 'Открытка', 'price': 'по запросу', 'quantity': 10,
+     'description': '', 'category': 'Разное'},
+    {'name': 'Роза белая', 'price': '1,500', 'quantity': 100,
+     'description': 'Поштучно', 'category': 'Моно букеты'},
+]
+
+
+class TestParsePrice:
+    @pytest.mark.parametrize('value, expected', [
+        ('1 500 тг', 1500.0),
+        ('1,500', 1500.0),
+        ('1500,5', 1500.5),
+        ('₸ 2 000', 2000.0),
+        (3000, 3000.0),
+    ])
+    def test_formats(self, value, expected):
+        assert parse_price(value) == expected
+
+    def test_unparseable_is_nan(self):
+        assert math.isnan(parse_price('по запросу'))
+        assert math.isnan(parse_price(None))
+
+
+class TestCatalogIndex:
+    @pytest.fixture
+    def catalog(self):
+        return CatalogIndex(INVENTORY)
+
+    def test_price_range(self, catalog):
+        """Диапазон цены включает границы, товары без цены не попадают"""
+        names = [item['name'] for item in catalog.query(price_min=8000, price_max=15000)]
+        assert names == ['Розы красные', 'Тюльпаны']
+
+    def test_word_forms_match(self, catalog):
+        """"розы" находит и "Розы красные", и "Роза белая" """
+        names = {item['name'] for item in catalog.query(flower_type='розы')}
+        assert names == {'Розы красные', 'Роза белая'}
+
+    def test_occasion_and_stock(self, catalog):
+        assert [item['name'] for item in catalog.query(occasion='свадьба')] == ['Пионы']
+        assert 'Тюльпаны' not in [item['name'] for item in catalog.query(in_stock=True)]
+
+    def test_sort_by_price(self, catalog):
+        prices = [parse_price(item['price']) for item in catalog.query(sort_by='price', price_min=0)]
+        assert prices == sorted(prices)
+        top = catalog.query(sort_by='price', descending=True, price_min=0, limit=1)
+        assert top[0]['name'] == 'Пионы'
+
+    def test_group_by_category_keeps_first_appearance_order(self, catalog):
+        groups = catalog.group_by_category()
+        assert [category for category, _ in groups] == ['Букеты', 'Моно букеты', 'Разное']
+        assert [item['name'] for item in groups[1][1]] == ['Пионы', 'Роза белая']
+
+    def test_find_by_name_and_names_in_text(self, catalog):
+        assert catalog.find_by_name('пионы')['name'] == 'Пионы'
+        assert catalog.find_by_name('Лилии') is None
+        found = catalog.names_in_text('Сколько стоят розы красные?')
+        assert [item['name'] for item in found] == ['Розы красные']
+
+
+def test_catalog_cached_per_version():
+    """Для одной версии инвентаря индекс строится один раз"""
+    first = get_catalog(INVENTORY)
+    assert get_catalog(list(INVENTORY)) is first
+    assert first.version == inventory_version(INVENTORY)
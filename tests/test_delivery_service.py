@@ -0,0 +1,83 @@
+"""
+Tests for the delivery zone engine
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from src.services.delivery_service import AddressBook, DeliveryService, DeliveryZone, ZoneGrid
+
+INNER = DeliveryZone('Центр', 1500, '1 час', [[1, 1], [1, 3], [3, 3], [3, 1]])
+OUTER = DeliveryZone('Город', 2000, '2 часа', [[0, 0], [0, 4], [4, 4], [4, 0]])
+TRIANGLE = DeliveryZone('Пригород', 3500, '3 часа', [[4, 4], [4, 8], [8, 4]])
+
+
+class TestZoneGrid:
+    @pytest.fixture
+    def grid(self):
+        return ZoneGrid([INNER, OUTER, TRIANGLE], cell_size=0.5)
+
+    def test_nested_zone_has_priority(self, grid):
+        assert grid.locate(2, 2) is INNER
+        assert grid.locate(0.5, 3.5) is OUTER
+
+    def test_outside_zones(self, grid):
+        assert grid.locate(7, 7) is None
+        assert grid.locate(-1, 2) is None
+
+    def test_batch_matches_single_lookup(self, grid):
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-1, 9, 2000)
+        lons = rng.uniform(-1, 9, 2000)
+        zones = grid.zones
+        expected = [zones.index(z) if (z := grid.locate(a, b)) else -1 for a, b in zip(lats, lons)]
+        assert grid.locate_many(lats, lons).tolist() == expected
+
+
+class TestAddressBook:
+    @pytest.fixture
+    def book(self):
+        return AddressBook([
+            {'street': 'Кабанбай батыра', 'aliases': ['кабанбай батыр'], 'lat': 51.115, 'lon': 71.416},
+            {'street': 'Косшы', 'lat': 51.0, 'lon': 71.35},
+        ])
+
+    @pytest.mark.parametrize('address', [
+        'ул. Кабанбай батыра, 11',
+        'Астана, проспект Кабанбай батыр 53/2, кв. 7',
+        'КАБАНБАЙ БАТЫРА',
+    ])
+    def test_street_variants(self, book, address):
+        assert book.geocode(address) == (51.115, 71.416)
+
+    def test_kazakh_letters_and_coordinates(self, book):
+        assert book.geocode('Қосшы') == (51.0, 71.35)
+        assert book.geocode('51.2, 71.3') == (51.2, 71.3)
+        assert book.geocode('Ленина 5') is None
+
+
+class TestDeliveryService:
+    @pytest.fixture
+    def service(self):
+        return DeliveryService()
+
+    def test_check_known_address(self, service):
+        result = service.check('ул. Кабанбай батыра, 11')
+        assert result['available'] is True
+        assert result['zone'] == 'Центр'
+
+    def test_unknown_address_is_not_refused(self, service):
+        assert service.check('Ленина 5')['available'] is None
+
+    def test_outside_working_hours(self, service):
+        result = service.check('Туран 1', '2099-01-01 23:30')
+        assert result['available'] is False
+
+    def test_past_time_uses_shop_timezone(self, service):
+        now = datetime.now(ZoneInfo('Asia/Almaty')).replace(second=0, microsecond=0)
+        earlier = (now - timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M')
+        later = (now + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M')
+        assert service._check_time(earlier) == "Указанное время уже прошло"
+        assert service._check_time(later) != "Указанное время уже прошло"
@@ -0,0 +1,155 @@
+"""
+Tests for the shared HTTP client
+"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from src.services.http_client import HttpClient
+
+
+async def start_server(routes):
+    app = web.Application()
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def run_with_server(routes, scenario):
+    async def main():
+        runner, base_url = await start_server(routes)
+        try:
+            return await scenario(base_url)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+async def ok(request):
+    return web.json_response({'ok': True})
+
+
+class TestHttpClient:
+    def test_connections_are_reused(self):
+        async def scenario(base_url):
+            client = HttpClient()
+            for _ in range(5):
+                response = await client.get(f"{base_url}/ok")
+                assert response.json() == {'ok': True}
+            await client.close()
+            return client.get_stats()['127.0.0.1']
+
+        stats = run_with_server([('GET', '/ok', ok)], scenario)
+        assert stats['requests'] == 5
+        assert stats['connections_created'] == 1
+        assert stats['connections_reused'] == 4
+        assert stats['reuse_rate'] == 0.8
+
+    def test_retries_server_errors_and_calls_hooks(self):
+        calls = []
+
+        async def flaky(request):
+            calls.append(1)
+            if len(calls) < 3:
+                return web.Response(status=503)
+            return web.json_response({'ok': True})
+
+        async def scenario(base_url):
+            client = HttpClient(backoff=0.01)
+            retries = []
+            client.add_retry_hook(lambda attempt, method, url, reason: retries.append((attempt, reason)))
+            response = await client.get(f"{base_url}/flaky")
+            await client.close()
+            return response, retries, client.get_stats()['127.0.0.1']
+
+        response, retries, stats = run_with_server([('GET', '/flaky', flaky)], scenario)
+        assert response.status == 200
+        assert retries == [(1, 'HTTP 503'), (2, 'HTTP 503')]
+        assert stats['retries'] == 2
+
+    def test_post_not_retried_by_default(self):
+        calls = []
+
+        async def flaky(request):
+            calls.append(1)
+            return web.Response(status=503)
+
+        async def scenario(base_url):
+            client = HttpClient(backoff=0.01)
+            response = await client.post(f"{base_url}/send", json={'text': 'hi'})
+            await client.close()
+            return response
+
+        response = run_with_server([('POST', '/send', flaky)], scenario)
+        assert response.status == 503
+        assert len(calls) == 1
+
+    def test_post_retried_when_caller_opts_in(self):
+        calls = []
+
+        async def flaky(request):
+            calls.append(1)
+            if len(calls) < 2:
+                return web.Response(status=503)
+            return web.json_response({'ok': True})
+
+        async def scenario(base_url):
+            client = HttpClient(backoff=0.01)
+            response = await client.post(f"{base_url}/send", retries=1)
+            await client.close()
+            return response
+
+        response = run_with_server([('POST', '/send', flaky)], scenario)
+        assert response.status == 200
+        assert len(calls) == 2
+
+    def test_error_status_returned_after_last_retry(self):
+        async def broken(request):
+            return web.Response(status=500, text='boom')
+
+        async def scenario(base_url):
+            client = HttpClient(max_retries=1, backoff=0.01)
+            response = await client.get(f"{base_url}/broken")
+            await client.close()
+            return response
+
+        response = run_with_server([('GET', '/broken', broken)], scenario)
+        assert response.status == 500
+        assert not response.ok
+        assert response.text == 'boom'
+        assert response.json() is None
+
+    def test_read_timeout_raises(self):
+        async def slow(request):
+            await asyncio.sleep(1)
+            return web.json_response({'ok': True})
+
+        async def scenario(base_url):
+            client = HttpClient(read_timeout=0.1, max_retries=0)
+            try:
+                with pytest.raises(asyncio.TimeoutError):
+                    await client.get(f"{base_url}/slow")
+            finally:
+                await client.close()
+            return client.get_stats()['127.0.0.1']
+
+        stats = run_with_server([('GET', '/slow', slow)], scenario)
+        assert stats['errors'] == 1
+
+    def test_new_session_per_event_loop(self):
+        """Утилиты вызывают asyncio.run несколько раз - сессия пересоздается"""
+        client = HttpClient()
+
+        async def scenario(base_url):
+            response = await client.get(f"{base_url}/ok")
+            return response.status
+
+        assert run_with_server([('GET', '/ok', ok)], scenario) == 200
+        assert run_with_server([('GET', '/ok', ok)], scenario) == 200
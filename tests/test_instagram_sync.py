@@ -0,0 +1,167 @@
+"""
+Tests for the streaming Instagram conversation sync
+"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from src.services.http_client import http_client
+from src.services.instagram_sync import ConversationSync, GraphPager, parse_graph_time
+
+
+def make_conversations(count, messages):
+    """Диалоги в порядке Graph API: сообщения от новых к старым"""
+    return {
+        f"c{c}": {
+            'updated_time': '2024-03-01T10:00:00+0000',
+            'messages': [
+                {'id': f"c{c}-m{m}", 'message': f"text {m}", 'from': {'id': f"u{c}", 'username': f"user{c}"},
+                 'created_time': '2024-03-01T10:00:00+0000'}
+                for m in range(messages, 0, -1)
+            ]
+        }
+        for c in range(count)
+    }
+
+
+class FakeGraph:
+    """Graph API с курсорной пагинацией: курсор - смещение в списке"""
+
+    def __init__(self, conversations):
+        self.conversations = conversations
+        self.message_requests = []
+        self.active = 0
+        self.max_active = 0
+
+    @staticmethod
+    def page(items, request):
+        limit = int(request.query['limit'])
+        offset = int(request.query.get('after', 0))
+        chunk = items[offset:offset + limit]
+        body = {'data': chunk}
+        if offset + limit < len(items):
+            body['paging'] = {'cursors': {'after': str(offset + limit)}, 'next': 'more'}
+        return web.json_response(body)
+
+    async def handle_conversations(self, request):
+        return self.page([{'id': cid, 'updated_time': c['updated_time']} for cid, c in self.conversations.items()],
+                         request)
+
+    async def handle_messages(self, request):
+        cid = request.match_info['conversation_id']
+        self.message_requests.append((cid, request.query.get('after')))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.001)
+            return self.page(self.conversations[cid]['messages'], request)
+        finally:
+            self.active -= 1
+
+
+class FakeDb:
+    """Таблицы instagram_messages и instagram_sync_state в памяти"""
+
+    def __init__(self, fail_on_write=None):
+        self.messages = {}
+        self.state = {}
+        self.writes = 0
+        self.fail_on_write = fail_on_write
+
+    async def fetch_all(self, query, *args):
+        return [dict(row, conversation_id=cid) for cid, row in self.state.items()]
+
+    async def fetch_one(self, query, *args):
+        if 'AS known' in query:
+            return {'known': sum(1 for mid in args[0] if mid in self.messages)}
+        self.writes += 1
+        if self.writes == self.fail_on_write:
+            return None
+        inserted = 0
+        for row in zip(*args[:7]):
+            if row[0] not in self.messages:
+                self.messages[row[0]] = row
+                inserted += 1
+        for cid, cursor, updated_time, completed in zip(*args[8:12]):
+            self.state[cid] = {'cursor': cursor, 'updated_time': updated_time, 'completed': completed}
+        return {'inserted': inserted}
+
+
+def run_sync(graph, db, concurrency=2, page_size=10, batch_size=20):
+    async def main():
+        app = web.Application()
+        app.router.add_get('/page/conversations', graph.handle_conversations)
+        app.router.add_get('/{conversation_id}/messages', graph.handle_messages)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        async def token():
+            return 'page-token'
+
+        pager = GraphPager(token, page_size=page_size, graph_url=f"http://127.0.0.1:{port}")
+        sync = ConversationSync(db, pager, 'page', concurrency=concurrency, batch_size=batch_size)
+        try:
+            return await sync.run()
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+class TestConversationSync:
+    def test_full_sync_writes_all_messages_in_batches(self):
+        graph = FakeGraph(make_conversations(5, 25))
+        db = FakeDb()
+        stats = run_sync(graph, db, concurrency=2)
+
+        assert len(db.messages) == 125
+        assert stats['inserted'] == 125
+        assert all(state['completed'] and state['cursor'] is None for state in db.state.values())
+        assert graph.max_active <= 2
+        # 15 страниц по 10 сообщений уложились в пачки по 20+ строк
+        assert stats['batches'] < stats['pages']
+
+    def test_interrupted_sync_resumes_from_cursor(self):
+        graph = FakeGraph(make_conversations(3, 40))
+        db = FakeDb(fail_on_write=3)
+        with pytest.raises(RuntimeError):
+            run_sync(graph, db, concurrency=1, batch_size=10)
+        saved = len(db.messages)
+        assert 0 < saved < 120
+
+        graph.message_requests.clear()
+        db.fail_on_write = None
+        run_sync(graph, db, concurrency=1, batch_size=10)
+
+        assert len(db.messages) == 120
+        assert all(state['completed'] for state in db.state.values())
+        # Диалог с сохраненным курсором не читается заново с первой страницы
+        assert len(graph.message_requests) < 12
+
+    def test_unchanged_conversations_are_skipped(self):
+        graph = FakeGraph(make_conversations(3, 30))
+        db = FakeDb()
+        run_sync(graph, db)
+
+        graph.message_requests.clear()
+        conversation = graph.conversations['c1']
+        conversation['updated_time'] = '2024-03-02T10:00:00+0000'
+        conversation['messages'][:0] = [{'id': 'c1-new', 'message': 'new', 'from': {'id': 'u1'},
+                                         'created_time': '2024-03-02T10:00:00+0000'}]
+        stats = run_sync(graph, db)
+
+        assert stats['skipped'] == 2
+        assert 'c1-new' in db.messages
+        # Новое сообщение на первой странице, вторая уже выгружена - дальше не читаем
+        assert graph.message_requests == [('c1', None), ('c1', '10')]
+        assert db.state['c1'] == {'cursor': None, 'updated_time': '2024-03-02T10:00:00+0000', 'completed': True}
+
+    def test_parse_graph_time(self):
+        assert parse_graph_time('2024-03-04T10:09:53+0000').hour == 10
+        assert parse_graph_time('bad') is None
+        assert parse_graph_time(None) is None
@@ -0,0 +1,141 @@
+"""
+Tests for the Instagram token cache
+"""
+import asyncio
+import time
+
+from aiohttp import web
+
+from src.services.instagram_tokens import CachedToken, InstagramTokenCache
+
+CREDENTIALS = {'access_token': 'user-token', 'page_id': '100', 'app_id': '1', 'app_secret': 's'}
+
+
+def run_graph(scenario, expires_in=None, exchanges_before_failure=None, **cache_kwargs):
+    calls = []
+
+    async def page(request):
+        calls.append(('page', request.query['fields']))
+        if request.query['fields'] == 'access_token':
+            if (exchanges_before_failure is not None
+                    and calls.count(('page', 'access_token')) > exchanges_before_failure):
+                return web.json_response({'error': {'code': 190}}, status=400)
+            return web.json_response({'access_token': f"page-token-{len(calls)}"})
+        return web.json_response({'instagram_business_account': {'id': 'ig-1'}})
+
+    async def debug_token(request):
+        calls.append(('debug', request.query['access_token']))
+        expires_at = int(time.time() + expires_in) if expires_in else 0
+        return web.json_response({'data': {'is_valid': True, 'expires_at': expires_at}})
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/debug_token', debug_token)
+        app.router.add_get('/{page_id}', page)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        loads = []
+
+        async def load():
+            loads.append(1)
+            return dict(CREDENTIALS)
+
+        cache = InstagramTokenCache(load, refresh_margin=3600, graph_url=f"http://127.0.0.1:{port}",
+                                    **cache_kwargs)
+        try:
+            return await scenario(cache), calls, loads
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+class TestInstagramTokenCache:
+    def test_token_fetched_once_for_concurrent_workers(self):
+        async def scenario(cache):
+            return await asyncio.gather(*[cache.page_token() for _ in range(10)])
+
+        tokens, calls, loads = run_graph(scenario)
+        assert len(set(tokens)) == 1
+        assert calls == [('page', 'access_token'), ('debug', '1|s')]
+        assert len(loads) == 1
+
+    def test_token_near_expiry_is_refreshed(self):
+        async def scenario(cache):
+            first = await cache.page_token()
+            second = await cache.page_token()
+            return first, second
+
+        (first, second), calls, _ = run_graph(scenario, expires_in=600, refresh_backoff=0)
+        # Срок меньше refresh_margin, паузы нет - запрос обновляет токен
+        assert first != second
+        assert calls.count(('page', 'access_token')) == 2
+
+    def test_unextended_refresh_backs_off(self):
+        """Доступ к данным истекает раньше токена: обмен не продлевает срок"""
+        async def scenario(cache):
+            tokens = [await cache.page_token() for _ in range(5)]
+            return tokens, cache.stats
+
+        (tokens, stats), calls, _ = run_graph(scenario, expires_in=600)
+        assert len(set(tokens)) == 1
+        assert calls.count(('page', 'access_token')) == 1
+        assert calls.count(('debug', '1|s')) == 1
+        assert stats['backoffs'] == 1
+
+    def test_failed_refresh_serves_cached_token_and_backs_off(self):
+        async def scenario(cache):
+            first = await cache.page_token()
+            # Пауза после первого обмена истекла - следующая попытка идет в Graph API и падает
+            cache._retry_at.clear()
+            return first, [await cache.page_token() for _ in range(3)]
+
+        (first, later), calls, _ = run_graph(scenario, expires_in=600, exchanges_before_failure=1)
+        assert later == [first] * 3
+        assert calls.count(('page', 'access_token')) == 2
+
+    def test_business_id_cached(self):
+        async def scenario(cache):
+            return [await cache.business_id() for _ in range(3)]
+
+        ids, calls, _ = run_graph(scenario)
+        assert ids == ['ig-1'] * 3
+        assert calls.count(('page', 'instagram_business_account')) == 1
+
+    def test_invalidate_reloads_credentials(self):
+        async def scenario(cache):
+            await cache.page_token()
+            cache.invalidate()
+            await cache.page_token()
+
+        _, calls, loads = run_graph(scenario)
+        assert len(loads) == 2
+        assert calls.count(('page', 'access_token')) == 2
+
+    def test_cached_page_token_respects_expiry(self):
+        async def scenario(cache):
+            before = cache.cached_page_token()
+            await cache.page_token()
+            fresh = cache.cached_page_token('100')
+            cache.page_tokens['100'].expires_at = time.time() - 1
+            return before, fresh, cache.cached_page_token('100')
+
+        (before, fresh, expired), calls, _ = run_graph(scenario, expires_in=7 * 24 * 3600)
+        assert before is None
+        assert fresh == 'page-token-1'
+        # Истекший токен синхронному коду не отдается
+        assert expired is None
+        assert calls.count(('page', 'access_token')) == 1
+
+
+class TestCachedToken:
+    def test_never_expiring_token(self):
+        assert not CachedToken('t').expires_within(10 ** 9)
+
+    def test_expires_within(self):
+        token = CachedToken('t', expires_at=1000.0)
+        assert token.expires_within(100, now=950.0)
+        assert not token.expires_within(10, now=950.0)
@@ -0,0 +1,164 @@
+"""
+Tests for the Instagram webhook receiver
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.services.instagram_webhook import GraphSender, InstagramWebhook, extract_messages
+
+SECRET = 'test-secret'
+
+
+def payload(*messages):
+    return json.dumps({
+        'object': 'instagram',
+        'entry': [{'messaging': [
+            {'sender': {'id': sender}, 'message': {'mid': mid, 'text': text}}
+            for sender, mid, text in messages
+        ]}]
+    }).encode()
+
+
+def sign(body):
+    return 'sha256=' + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def run_webhook(scenario, handler, **kwargs):
+    async def main():
+        webhook = InstagramWebhook(handler, SECRET, 'verify-me', **kwargs)
+        app = web.Application()
+        webhook.add_routes(app)
+        async with TestClient(TestServer(app)) as client:
+            result = await scenario(webhook, client)
+        await webhook.stop(timeout=1)
+        return result
+
+    return asyncio.run(main())
+
+
+class TestInstagramWebhook:
+    def test_acks_before_processing(self):
+        processed = []
+
+        async def slow_handler(message):
+            await asyncio.sleep(0.2)
+            processed.append(message.text)
+
+        async def scenario(webhook, client):
+            webhook.start()
+            body = payload(('1', 'm1', 'Привет'))
+            response = await client.post('/webhook/instagram', data=body,
+                                         headers={'X-Hub-Signature-256': sign(body)})
+            acked_before = list(processed)
+            await webhook.join()
+            return response.status, acked_before
+
+        status, acked_before = run_webhook(scenario, slow_handler)
+        assert status == 200
+        assert acked_before == []
+        assert processed == ['Привет']
+
+    def test_rejects_bad_signature(self):
+        async def scenario(webhook, client):
+            body = payload(('1', 'm1', 'Привет'))
+            response = await client.post('/webhook/instagram', data=body,
+                                         headers={'X-Hub-Signature-256': 'sha256=bad'})
+            return response.status, webhook.pending
+
+        assert run_webhook(scenario, None) == (403, 0)
+
+    def test_redelivery_is_deduplicated(self):
+        async def scenario(webhook, client):
+            body = payload(('1', 'm1', 'Привет'), ('2', 'm2', 'Сколько стоит?'))
+            for _ in range(2):
+                await client.post('/webhook/instagram', data=body, headers={'X-Hub-Signature-256': sign(body)})
+            return webhook.pending, webhook.get_stats()['duplicates']
+
+        assert run_webhook(scenario, None) == (2, 2)
+
+    def test_full_queue_asks_meta_to_retry(self):
+        async def scenario(webhook, client):
+            body = payload(('1', 'm1', 'a'), ('1', 'm2', 'b'))
+            response = await client.post('/webhook/instagram', data=body,
+                                         headers={'X-Hub-Signature-256': sign(body)})
+            return response.status, webhook.pending
+
+        assert run_webhook(scenario, None, queue_size=1) == (503, 0)
+
+    def test_senders_run_concurrently_in_order(self):
+        events = []
+
+        async def handler(message):
+            events.append(('start', message.text))
+            await asyncio.sleep(0.05)
+            events.append(('end', message.text))
+
+        async def scenario(webhook, client):
+            webhook.start()
+            body = payload(('1', 'm1', 'a1'), ('2', 'm2', 'b1'), ('1', 'm3', 'a2'))
+            await client.post('/webhook/instagram', data=body, headers={'X-Hub-Signature-256': sign(body)})
+            await webhook.join()
+            return webhook.get_stats()
+
+        stats = run_webhook(scenario, handler, workers=8)
+        # Клиенты обслуживаются параллельно
+        assert events.index(('start', 'b1')) < events.index(('end', 'a1'))
+        # Второе сообщение клиента начинается после ответа на первое
+        assert events.index(('end', 'a1')) < events.index(('start', 'a2'))
+        assert stats['processed'] == 3
+        assert stats['reply_p95_ms'] >= 50
+
+    def test_verify_subscription(self):
+        async def scenario(webhook, client):
+            ok = await client.get('/webhook/instagram', params={
+                'hub.mode': 'subscribe', 'hub.verify_token': 'verify-me', 'hub.challenge': '42'})
+            bad = await client.get('/webhook/instagram', params={
+                'hub.mode': 'subscribe', 'hub.verify_token': 'wrong', 'hub.challenge': '42'})
+            return ok.status, await ok.text(), bad.status
+
+        assert run_webhook(scenario, None) == (200, '42', 403)
+
+
+class TestGraphSender:
+    def test_recipient_interval_does_not_block_others(self):
+        sender = GraphSender(tokens=None, rate=100, per_recipient_interval=0.3)
+
+        async def timed(recipient_id, started):
+            await sender._acquire(recipient_id)
+            return time.monotonic() - started
+
+        async def scenario():
+            await sender._acquire('1')
+            started = time.monotonic()
+            return await asyncio.gather(timed('1', started), timed('2', started))
+
+        same, other = asyncio.run(scenario())
+        assert same >= 0.25
+        assert other < 0.1
+
+    def test_rate_limit_spaces_reserved_slots(self):
+        sender = GraphSender(tokens=None, rate=10, per_recipient_interval=0)
+        sender.bucket.tokens = 0
+
+        async def scenario():
+            started = time.monotonic()
+            await asyncio.gather(*(sender._acquire(str(i)) for i in range(3)))
+            return time.monotonic() - started
+
+        # Три отправки без запаса токенов - слоты через 0.1, 0.2 и 0.3 секунды
+        assert 0.25 <= asyncio.run(scenario()) < 0.5
+
+
+class TestExtractMessages:
+    def test_skips_echoes(self):
+        data = {'object': 'instagram', 'entry': [{'messaging': [
+            {'sender': {'id': 'page'}, 'message': {'mid': 'e', 'text': 'ответ', 'is_echo': True}},
+            {'sender': {'id': '7'}, 'message': {'mid': 'x', 'text': 'вопрос'}}
+        ]}]}
+        assert [m.text for m in extract_messages(data)] == ['вопрос']
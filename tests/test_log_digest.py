@@ -0,0 +1,135 @@
+"""
+Tests for log digest aggregation
+"""
+import asyncio
+
+from src.services.log_digest import LogDigest, LogEntry, mark_rated, parse_callback, split_text
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, topic_id, text, reply_markup):
+        self.messages.append((topic_id, text, reply_markup))
+        return len(self.messages)
+
+
+def run_digest(scenario, **kwargs):
+    async def main():
+        sent = Recorder()
+        digest = LogDigest(sent, **kwargs)
+        await scenario(digest)
+        await digest.close()
+        return digest, sent.messages
+
+    return asyncio.run(main())
+
+
+class TestBatching:
+    def test_first_entry_after_pause_is_sent_immediately(self):
+        """В тихие часы запись уходит сразу, следующие в окне копятся"""
+        async def scenario(digest):
+            await digest.add(7, 'Клиент 1', 'вопрос')
+            await digest.add(7, 'Клиент 2', 'вопрос')
+            await digest.add(7, 'Клиент 3', 'вопрос')
+            assert len(digest.pending[7]) == 2
+
+        digest, messages = run_digest(scenario, window=60)
+        assert len(messages) == 2
+        assert '#2 Клиент 3' in messages[1][1]
+        assert len(messages[1][2].inline_keyboard) == 2
+
+    def test_max_entries_flushes_early(self):
+        async def scenario(digest):
+            for i in range(6):
+                await digest.add(1, f'Клиент {i}', 'текст')
+            assert not digest.pending.get(1)
+
+        digest, messages = run_digest(scenario, window=60, max_entries=5)
+        assert len(messages) == 2
+        assert digest.get_stats()['entries'] == 6
+
+    def test_zero_window_posts_every_entry(self):
+        async def scenario(digest):
+            for i in range(3):
+                await digest.add(1, f'Клиент {i}', 'текст')
+
+        _, messages = run_digest(scenario, window=0)
+        assert len(messages) == 3
+
+
+    def test_add_does_not_wait_for_slow_send(self):
+        """Отправка под лимитом группы не задерживает вызывающего"""
+        sent = []
+
+        async def slow_send(topic_id, text, reply_markup):
+            await asyncio.sleep(0.2)
+            sent.append(text)
+            return len(sent)
+
+        async def main():
+            digest = LogDigest(slow_send, window=60, max_entries=2)
+            started = asyncio.get_running_loop().time()
+            for i in range(5):
+                await digest.add(1, f'Клиент {i}', 'текст')
+            elapsed = asyncio.get_running_loop().time() - started
+            await digest.close()
+            return elapsed
+
+        elapsed = asyncio.run(main())
+        assert elapsed < 0.05
+        assert len(sent) == 3
+
+    def test_send_errors_do_not_reach_caller(self):
+        async def broken_send(topic_id, text, reply_markup):
+            raise RuntimeError('Telegram 400')
+
+        async def main():
+            digest = LogDigest(broken_send, window=0)
+            await digest.add(1, 'Клиент', 'текст')
+            await digest.close()
+            return digest
+
+        digest = asyncio.run(main())
+        assert digest.get_stats() == {'entries': 1, 'messages': 0, 'pending': 0}
+
+
+class TestSplitting:
+    def test_digest_respects_message_limit(self):
+        digest = LogDigest(Recorder(), max_chars=300)
+        entries = [LogEntry(i, 1, f'Клиент {i}', 'x' * 100) for i in range(6)]
+        messages = digest.build_messages(entries)
+
+        assert all(len(text) <= 300 for text, _ in messages)
+        assert sum(len(batch) for _, batch in messages) == 6
+
+    def test_oversized_entry_split_on_lines(self):
+        text = '\n'.join(['строка' * 5] * 50)
+        parts = split_text(text, 200)
+        assert all(len(part) <= 200 for part in parts)
+        assert ''.join(parts).replace('\n', '') == text.replace('\n', '')
+
+    def test_split_keeps_html_entities(self):
+        parts = split_text('a' * 8 + '&amp;' + 'b' * 10, 10)
+        assert parts[0] == 'a' * 8
+        assert parts[1].startswith('&amp;')
+
+
+class TestCallbacks:
+    def test_callback_roundtrip_and_mark_rated(self):
+        async def scenario(digest):
+            await digest.add(1, 'Клиент', 'текст')
+
+        digest, messages = run_digest(scenario, window=60)
+        markup = messages[0][2]
+        data = markup.inline_keyboard[0][0].callback_data
+        assert len(data.encode()) <= 64
+
+        action, entry_id = parse_callback(data)
+        assert action == 'like'
+        assert digest.get_entry(entry_id).title == 'Клиент'
+
+        rated = mark_rated(markup, entry_id, '✅')
+        assert rated.inline_keyboard[0][0].text == '✅'
+        assert parse_callback(rated.inline_keyboard[0][0].callback_data) is None
@@ -0,0 +1,93 @@
+"""
+Tests for queued, sampled structured logging
+"""
+import json
+import logging
+import threading
+import time
+
+from src.utils.logger_config import LazyJson, RateSampler, StructuredFormatter, setup_logging, stop_logging
+
+
+class SlowHandler(logging.Handler):
+    """Обработчик с медленным выводом (как отправка по сети)"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+
+    def emit(self, record):
+        time.sleep(0.05)
+        self.threads.add(threading.get_ident())
+        self.records.append(self.format(record))
+
+
+class Counted:
+    """Считает, сколько раз объект превращали в строку"""
+    calls = 0
+
+    def __str__(self):
+        Counted.calls += 1
+        return 'counted'
+
+
+def record(message, level=logging.INFO, **extra):
+    entry = logging.LogRecord('bot', level, __file__, 1, message, None, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+class TestRateSampler:
+    def test_limits_per_key_and_reports_suppressed(self):
+        sampler = RateSampler(limit=1, interval=0.1)
+        assert sampler.filter(record('hit', sample='cache'))
+        assert not sampler.filter(record('hit', sample='cache'))
+        assert not sampler.filter(record('hit', sample='cache'))
+        # Другие ключи, записи без ключа и предупреждения не прореживаются
+        assert sampler.filter(record('hit', sample='config'))
+        assert sampler.filter(record('plain'))
+        assert sampler.filter(record('warn', logging.WARNING, sample='cache'))
+
+        time.sleep(0.12)
+        next_record = record('hit', sample='cache')
+        assert sampler.filter(next_record)
+        assert next_record.suppressed == 2
+
+
+class TestStructuredFormatter:
+    def test_json_line_with_extra_fields(self):
+        line = StructuredFormatter().format(record('Новое сообщение', user_id=42, sample='x'))
+        entry = json.loads(line)
+        assert entry['severity'] == 'INFO'
+        assert entry['message'] == 'Новое сообщение'
+        assert entry['user_id'] == 42
+        assert 'sample' not in entry
+
+
+class TestQueuedLogging:
+    def test_output_runs_off_the_calling_thread_and_debug_is_lazy(self):
+        root = logging.getLogger()
+        saved_handlers, saved_level = list(root.handlers), root.level
+        handler = SlowHandler()
+        try:
+            listener = setup_logging(logging.INFO, structured=False)
+            listener.handlers = (handler,)
+            logger = logging.getLogger('test_logger_config')
+            Counted.calls = 0
+
+            start = time.perf_counter()
+            for i in range(5):
+                logger.info("сообщение %s", i)
+                logger.debug("инвентарь: %s", LazyJson([Counted()]))
+            elapsed = time.perf_counter() - start
+            stop_logging()
+        finally:
+            root.handlers = saved_handlers
+            root.setLevel(saved_level)
+
+        # Пять медленных записей заняли бы 250 мс в вызывающем потоке
+        assert elapsed < 0.1
+        assert [line.endswith(f"сообщение {i}") for i, line in enumerate(handler.records)] == [True] * 5
+        assert handler.threads and threading.get_ident() not in handler.threads
+        assert Counted.calls == 0
@@ -0,0 +1,58 @@
+"""
+Tests for the event loop lag monitor
+"""
+import asyncio
+import time
+from collections import Counter
+
+from src.services.loop_monitor import LoopLagMonitor
+from src.services.metrics import metrics
+
+
+class TestLoopLagMonitor:
+    def test_blocking_call_is_measured(self):
+        async def main():
+            monitor = LoopLagMonitor(interval=0.01, warn_threshold=0.1)
+            monitor.start()
+            await asyncio.sleep(0.03)
+            time.sleep(0.2)  # Синхронный вызов держит цикл
+            await asyncio.sleep(0.03)
+            await monitor.stop()
+            return monitor.get_stats()
+
+        before = metrics.cumulative_histograms().get(('event_loop_lag_seconds', ()))
+        stats = asyncio.run(main())
+        after = metrics.cumulative_histograms()[('event_loop_lag_seconds', ())]
+        assert stats['slow'] == 1
+        assert stats['max_lag_ms'] >= 150
+        assert after.count - (before.count if before else 0) == stats['checks']
+
+    def test_blocking_site_is_named(self):
+        def blocking_helper():
+            time.sleep(0.25)
+
+        async def main():
+            monitor = LoopLagMonitor(interval=0.01, warn_threshold=1.0, block_threshold=0.05,
+                                     sample_interval=0.01)
+            monitor.start()
+            await asyncio.sleep(0.03)
+            blocking_helper()
+            await asyncio.sleep(0.03)
+            await monitor.stop()
+            return monitor
+
+        monitor = asyncio.run(main())
+        top = monitor.top(1)[0]
+        assert 'blocking_helper' in top.site
+        assert top.count == 1
+        assert top.blocked_seconds >= 0.15
+        assert 'blocking_helper' in monitor.report()
+        assert monitor.get_stats()['stack_samples'] >= 1
+
+    def test_time_is_split_between_sites_by_samples(self):
+        monitor = LoopLagMonitor()
+        monitor.attribute(1.0, Counter({'a (x.py:1)': 3, 'b (y.py:2)': 1}), {})
+        monitor.attribute(0.2, Counter(), {})
+        assert [entry.site for entry in monitor.top()] == ['a (x.py:1)', 'b (y.py:2)', 'unknown']
+        assert abs(monitor.sites['a (x.py:1)'].blocked_seconds - 0.75) < 1e-9
+        assert monitor.stats['blocks'] == 2
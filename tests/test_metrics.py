@@ -0,0 +1,155 @@
+"""
+Tests for the in-process metrics registry and publisher
+"""
+import asyncio
+import json
+import random
+
+from src.services.metrics import (FileMetricsExporter, Histogram, MetricsPublisher, MetricsRegistry,
+                                 render_prometheus)
+
+
+class RecordingExporter:
+    min_interval = 0.0
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def export(self, samples, timestamp):
+        if self.fail:
+            raise RuntimeError('unavailable')
+        self.calls.append(list(samples))
+
+
+class TestHistogram:
+    def test_percentiles_within_relative_error(self):
+        rng = random.Random(1)
+        values = [rng.lognormvariate(0, 2) for _ in range(20000)]
+        histogram = Histogram(subbuckets=32)
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for percent in (50, 95, 99):
+            exact = values[int(len(values) * percent / 100) - 1]
+            assert abs(histogram.percentile(percent) - exact) / exact < 0.05
+        assert histogram.count == 20000
+        assert histogram.max == values[-1]
+
+    def test_zero_and_merge(self):
+        first, second = Histogram(), Histogram()
+        for _ in range(3):
+            first.record(0)
+        second.record(10)
+        first.merge(second)
+        assert first.percentile(50) == 0
+        assert 9.5 < first.percentile(100) <= 10
+
+
+class TestMetricsRegistry:
+    def test_series_keyed_by_labels(self):
+        registry = MetricsRegistry()
+        registry.counter('updates', labels={'kind': 'message'})
+        registry.counter('updates', 2, labels={'kind': 'message'})
+        registry.counter('updates', labels={'kind': 'callback'})
+        registry.gauge('queue_depth', 5)
+        registry.observe('latency', 0.2, {'stage': 'llm'})
+
+        samples = {(s.name, tuple(s.labels.items())): s for s in registry.collect()}
+        assert samples[('updates', (('kind', 'message'),))].value == 3
+        assert samples[('updates', (('kind', 'callback'),))].value == 1
+        assert samples[('queue_depth', ())].value == 5
+        assert samples[('latency', (('stage', 'llm'),))].histogram.count == 1
+
+    def test_histograms_reset_per_interval_counters_accumulate(self):
+        registry = MetricsRegistry()
+        registry.counter('updates')
+        registry.observe('latency', 1.0)
+        registry.collect()
+        registry.counter('updates')
+
+        kinds = {s.name: s for s in registry.collect()}
+        assert kinds['updates'].value == 2
+        assert 'latency' not in kinds
+        assert registry.histograms[('latency', ())].count == 1
+
+
+class TestMetricsPublisher:
+    def test_one_batch_per_exporter_and_failures_isolated(self):
+        async def main():
+            registry = MetricsRegistry()
+            for i in range(100):
+                registry.observe('latency', i / 100, {'stage': 'llm'})
+            good, bad = RecordingExporter(), RecordingExporter(fail=True)
+            publisher = MetricsPublisher(registry, [good, bad], interval=0.01)
+            await publisher.flush()
+            await publisher.flush()  # Нечего выгружать
+            return good.calls, publisher.get_stats()
+
+        calls, stats = asyncio.run(main())
+        assert len(calls) == 1 and len(calls[0]) == 1
+        assert stats['flushes'] == 1 and stats['failures'] == 1
+
+    def test_interval_respects_strictest_exporter(self):
+        exporter = RecordingExporter()
+        exporter.min_interval = 5.0
+        assert MetricsPublisher(MetricsRegistry(), [exporter], interval=1).interval == 5.0
+
+    def test_file_exporter_writes_jsonl(self, tmp_path):
+        path = tmp_path / 'metrics.jsonl'
+
+        async def main():
+            registry = MetricsRegistry()
+            registry.counter('llm_tokens', 120, {'scenario': 'catalog'})
+            registry.observe('latency', 0.5)
+            publisher = MetricsPublisher(registry, [FileMetricsExporter(str(path))])
+            await publisher.stop()
+
+        asyncio.run(main())
+        records = {r['name']: r for r in map(json.loads, path.read_text(encoding='utf-8').splitlines())}
+        assert records['llm_tokens']['value'] == 120
+        assert records['llm_tokens']['labels'] == {'scenario': 'catalog'}
+        assert records['latency']['count'] == 1
+
+
+class TestPrometheus:
+    def test_counters_gauges_and_escaped_labels(self):
+        registry = MetricsRegistry()
+        registry.counter('updates_total', labels={'type': 'message'})
+        registry.counter('updates_total', labels={'type': 'message'})
+        registry.gauge('queue.depth', 3, {'lane': 'say "hi"\n'})
+
+        lines = render_prometheus(registry).splitlines()
+        assert '# TYPE updates_total counter' in lines
+        assert 'updates_total{type="message"} 2.0' in lines
+        assert 'queue_depth{lane="say \\"hi\\"\\n"} 3.0' in lines
+
+    def test_histogram_buckets_are_cumulative_and_survive_publishing(self):
+        registry = MetricsRegistry()
+        for value in (0.001, 0.01, 0.3, 2.0):
+            registry.observe('stage_seconds', value, {'stage': 'llm'})
+        registry.collect()  # Выгрузка не обнуляет гистограмму для Prometheus
+        registry.observe('stage_seconds', 100.0, {'stage': 'llm'})
+
+        lines = render_prometheus(registry).splitlines()
+        assert '# TYPE stage_seconds histogram' in lines
+        assert 'stage_seconds_bucket{stage="llm",le="0.015625"} 2' in lines
+        assert 'stage_seconds_bucket{stage="llm",le="1.0"} 3' in lines
+        assert 'stage_seconds_bucket{stage="llm",le="16.0"} 4' in lines
+        assert 'stage_seconds_bucket{stage="llm",le="+Inf"} 5' in lines
+        assert 'stage_seconds_count{stage="llm"} 5' in lines
+        # Снимок не меняет накопленную гистограмму
+        assert registry.histograms[('stage_seconds', (('stage', 'llm'),))].count == 4
+
+    def test_collectors_run_on_render_and_failures_are_isolated(self):
+        registry = MetricsRegistry()
+        queue = [1, 2, 3]
+
+        def broken(registry):
+            raise RuntimeError('no pool')
+
+        registry.add_collector(broken)
+        registry.add_collector(lambda registry: registry.gauge('queued', len(queue)))
+        assert 'queued 3.0' in render_prometheus(registry).splitlines()
+        queue.pop()
+        assert 'queued 2.0' in render_prometheus(registry).splitlines()
@@ -0,0 +1,182 @@
+"""
+Tests for order notifications: staff message formatting and the outbox dispatcher
+"""
+import asyncio
+import json
+
+from src.services.order_service import OrderService, OutboxDispatcher, ReservationReleaser, format_orders_message
+
+
+class FakeDb:
+    def __init__(self, events, mark_sent_results=None):
+        self.events = events
+        self.mark_sent_results = list(mark_sent_results or [])
+        self.sent = []
+        self.failed = []
+
+    async def fetch_all(self, query, *args):
+        events, self.events = self.events, []
+        return events
+
+    async def execute(self, query, *args):
+        if "status = 'sent'" in query:
+            ok = self.mark_sent_results.pop(0) if self.mark_sent_results else True
+            if ok:
+                self.sent.extend(args[0])
+            return ok
+        self.failed.append(args)
+        return True
+
+
+class RowDb:
+    """База, на каждый fetch_one отвечающая следующей строкой"""
+    def __init__(self, *rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    async def fetch_one(self, query, *args):
+        self.queries.append((query, args))
+        return self.rows.pop(0)
+
+
+ORDER = {'bouquet_name': 'Розы', 'quantity': 1, 'price': 15000, 'delivery_price': 2000,
+         'customer_name': 'Анна', 'customer_phone': '+7 701 000 00 00',
+         'delivery_address': 'ул. Абая 1', 'delivery_time': '18:00'}
+
+
+def event(event_id, order_number, event_type='telegram'):
+    return {'id': event_id, 'event_type': event_type,
+            'payload': json.dumps({'order_number': order_number, 'bouquet_name': 'Розы'})}
+
+
+class TestFormatOrdersMessage:
+    def test_escapes_customer_fields(self):
+        text = format_orders_message([{
+            'order_number': 7, 'bouquet_name': 'Розы <красные>', 'quantity': 2,
+            'customer_name': 'Анна_*Петрова*', 'customer_phone': '+7 701 000 00 00',
+            'delivery_address': 'ул. Абая & Сейфуллина, [кв. 5]', 'delivery_time': '18:00'
+        }])
+        assert text.startswith('🛒 <b>Новый заказ</b>')
+        assert '<b>№7</b> - Розы &lt;красные&gt; x2' in text
+        assert 'Анна_*Петрова*' in text
+        assert 'ул. Абая &amp; Сейфуллина, [кв. 5]' in text
+        assert '🕐 18:00' in text
+
+    def test_batch_header_and_optional_time(self):
+        text = format_orders_message([
+            {'order_number': 1, 'bouquet_name': 'Розы', 'customer_name': 'А', 'customer_phone': '1',
+             'delivery_address': 'X'},
+            {'order_number': 2, 'bouquet_name': 'Тюльпаны', 'customer_name': 'Б', 'customer_phone': '2',
+             'delivery_address': 'Y'}
+        ])
+        assert text.startswith('🛒 <b>Новые заказы: 2</b>')
+        assert '🕐' not in text
+        assert 'x1' in text
+
+
+class TestOutboxDispatcher:
+    def test_failed_chunk_does_not_resend_sent_chunks(self):
+        calls = []
+
+        async def handler(payloads):
+            calls.append([payload['order_number'] for payload in payloads])
+            if len(calls) == 2:
+                raise RuntimeError('Telegram 500')
+
+        db = FakeDb([event(i, i) for i in range(1, 6)])
+        dispatcher = OutboxDispatcher(db, {'telegram': handler}, chunk_sizes={'telegram': 2})
+        assert asyncio.run(dispatcher.run_once()) == 5
+
+        assert calls == [[1, 2], [3, 4]]
+        assert db.sent == [1, 2]
+        # В очередь вернулись только неотправленные события
+        assert db.failed[0][0] == [3, 4, 5]
+
+    def test_unmarked_events_are_not_delivered_again(self):
+        calls = []
+
+        async def handler(payloads):
+            calls.append([payload['order_number'] for payload in payloads])
+
+        db = FakeDb([event(1, 1), event(2, 2, 'sheets')], mark_sent_results=[False, True, False, True])
+        dispatcher = OutboxDispatcher(db, {'telegram': handler, 'sheets': handler})
+
+        async def scenario():
+            await dispatcher.run_once()
+            # База все еще недоступна для записи, блокировка истекла - событие забрано снова
+            db.events = [event(1, 1)]
+            await dispatcher.run_once()
+
+        asyncio.run(scenario())
+        assert calls == [[1], [2]]
+        assert sorted(db.sent) == [1, 2]
+        assert not dispatcher._unacked
+
+    def test_unknown_event_type_fails_without_retry(self):
+        db = FakeDb([event(1, 1, 'sms')])
+        dispatcher = OutboxDispatcher(db, {})
+        asyncio.run(dispatcher.run_once())
+        assert db.failed[0][0] == [1]
+        assert db.failed[0][1] is False
+
+
+class TestPlaceOrder:
+    def test_created_order_wakes_dispatcher(self):
+        db = RowDb({'order_id': 'a', 'order_number': 1, 'status': 'new', 'created': True})
+        service = OrderService(db)
+        service.dispatcher = OutboxDispatcher(db, {})
+        row = asyncio.run(service.place_order(ORDER))
+        assert row['order_number'] == 1
+        assert service.dispatcher._wakeup.is_set()
+        # Резерв, заказ и outbox - одним вызовом place_order
+        assert 'public.place_order' in db.queries[0][0]
+
+    def test_out_of_stock_and_duplicate_do_not_wake_dispatcher(self):
+        db = RowDb({'order_id': None, 'order_number': None, 'status': 'out_of_stock', 'created': False},
+                   {'order_id': 'a', 'order_number': 1, 'status': 'new', 'created': False})
+        service = OrderService(db)
+        service.dispatcher = OutboxDispatcher(db, {})
+
+        async def scenario():
+            return await service.place_order(ORDER), await service.place_order(ORDER)
+
+        out_of_stock, duplicate = asyncio.run(scenario())
+        assert out_of_stock['status'] == 'out_of_stock'
+        assert duplicate['order_number'] == 1
+        assert not service.dispatcher._wakeup.is_set()
+        # Повтор того же заказа дает тот же ключ идемпотентности
+        assert db.queries[0][1][0] == db.queries[1][1][0]
+
+    def test_database_error_returns_none(self):
+        assert asyncio.run(OrderService(RowDb(None)).place_order(ORDER)) is None
+
+
+class TestReservationReleaser:
+    def test_releases_expired_reservations(self):
+        db = RowDb({'released': 3}, {'released': 0})
+        releaser = ReservationReleaser(db)
+
+        async def scenario():
+            return await releaser.run_once(), await releaser.run_once()
+
+        assert asyncio.run(scenario()) == (3, 0)
+        assert 'release_expired_reservations' in db.queries[0][0]
+        assert releaser.get_stats() == {'runs': 2, 'released': 3, 'errors': 0}
+
+    def test_database_error_counted(self):
+        releaser = ReservationReleaser(RowDb(None))
+        assert asyncio.run(releaser.run_once()) is None
+        assert releaser.get_stats()['errors'] == 1
+
+    def test_background_loop_runs_periodically(self):
+        db = RowDb({'released': 1}, {'released': 1}, {'released': 0}, *[{'released': 0}] * 20)
+        releaser = ReservationReleaser(db, interval=0.01)
+
+        async def scenario():
+            releaser.start()
+            await asyncio.sleep(0.05)
+            await releaser.stop()
+
+        asyncio.run(scenario())
+        assert releaser.get_stats()['runs'] >= 3
+        assert releaser.get_stats()['released'] == 2
@@ -0,0 +1,70 @@
+"""
+Tests for the on-demand sampling profiler
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.services.profiler import SamplingProfiler
+
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSamplingProfiler:
+    def test_sees_blocked_loop_worker_threads_and_waiting_tasks(self):
+        async def waiting_for_reply():
+            await asyncio.sleep(10)
+
+        async def main():
+            waiter = asyncio.create_task(waiting_for_reply(), name='reply')
+            worker = threading.Thread(target=spin, args=(0.3,), name='sheets-worker')
+            worker.start()
+
+            async def block_loop():
+                await asyncio.sleep(0.05)
+                spin(0.15)  # Синхронный вызов держит event loop
+
+            profiler = SamplingProfiler(interval=0.005)
+            profile, _ = await asyncio.gather(profiler.capture(0.3), block_loop())
+            worker.join()
+            waiter.cancel()
+            return profile
+
+        profile = asyncio.run(main())
+        lines = profile.collapsed().splitlines()
+        assert profile.samples > 10
+        # Каждая строка - стек и число снимков через последний пробел
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+        assert any(line.startswith('thread:MainThread;') and ';block_loop ' in line and ';spin ' in line
+                   for line in lines)
+        assert any(line.startswith('thread:sheets-worker;') and ';spin ' in line for line in lines)
+        assert any(line.startswith('task:reply;waiting_for_reply ') for line in lines)
+        top = dict(profile.top_frames())
+        assert any(frame.startswith('spin ') for frame in top)
+
+    def test_one_capture_at_a_time(self):
+        async def main():
+            profiler = SamplingProfiler(interval=0.01)
+            first = asyncio.create_task(profiler.capture(0.1))
+            await asyncio.sleep(0.01)
+            running = profiler.running
+            second = await profiler.capture(0.05)
+            first = await first
+            return running, first, second, profiler.running
+
+        running, first, second, still_running = asyncio.run(main())
+        assert running is True and still_running is False
+        assert first.samples and second.samples
+
+    def test_rejects_non_finite_duration(self):
+        profiler = SamplingProfiler()
+        for seconds, interval in ((float('nan'), None), (float('inf'), None), (1.0, float('nan'))):
+            with pytest.raises(ValueError):
+                asyncio.run(profiler.capture(seconds, interval))
+        assert profiler.running is False
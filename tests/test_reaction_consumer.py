@@ -0,0 +1,135 @@
+"""
+Tests for the reaction event consumer
+"""
+import asyncio
+from datetime import datetime
+
+from telegram import (
+    Chat, MessageReactionCountUpdated, MessageReactionUpdated, ReactionCount, ReactionTypeEmoji, Update, User
+)
+
+from src.services.reaction_consumer import ReactionConsumer
+
+CHAT = Chat(-100123, Chat.SUPERGROUP)
+NOW = datetime(2026, 10, 19)
+
+
+class FakeDb:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.executed = []
+
+    async def fetch_all(self, query, *args):
+        return self.rows
+
+    async def execute(self, query, *args):
+        self.executed.append(args)
+        return True
+
+
+def reaction(update_id, message_id, user_id, old=(), new=()):
+    return Update(update_id, message_reaction=MessageReactionUpdated(
+        CHAT, message_id, NOW,
+        tuple(ReactionTypeEmoji(emoji) for emoji in old),
+        tuple(ReactionTypeEmoji(emoji) for emoji in new),
+        user=User(user_id, 'user', False)
+    ))
+
+
+def reaction_count(update_id, message_id, likes, dislikes):
+    return Update(update_id, message_reaction_count=MessageReactionCountUpdated(
+        CHAT, message_id, NOW,
+        (ReactionCount(ReactionTypeEmoji('👍'), likes), ReactionCount(ReactionTypeEmoji('👎'), dislikes))
+    ))
+
+
+class TestReactionConsumer:
+    def test_forwards_once_on_threshold_crossing(self):
+        async def scenario():
+            forwarded = []
+
+            async def on_threshold(tally):
+                forwarded.append(tally.message_id)
+                return True
+
+            consumer = ReactionConsumer(db=FakeDb(), on_threshold=on_threshold)
+            consumer.remember_thread(CHAT.id, 10, 143)
+            await consumer.handle_update(reaction(1, 10, 1, new=['👍']))
+            await consumer.handle_update(reaction(2, 10, 2, new=['👎']))
+            await consumer.handle_update(reaction(3, 10, 3, new=['👎']))
+            await consumer.handle_update(reaction(4, 10, 4, new=['👎']))
+            return forwarded, consumer.tallies[(CHAT.id, 10)]
+
+        forwarded, tally = asyncio.run(scenario())
+        assert forwarded == [10]
+        assert (tally.likes, tally.dislikes, tally.thread_id) == (1, 3, 143)
+
+    def test_changed_reaction_moves_vote(self):
+        async def scenario():
+            consumer = ReactionConsumer(db=FakeDb())
+            await consumer.handle_update(reaction(1, 5, 1, new=['👍']))
+            await consumer.handle_update(reaction(2, 5, 1, old=['👍'], new=['👎']))
+            return consumer.tallies[(CHAT.id, 5)]
+
+        tally = asyncio.run(scenario())
+        assert (tally.likes, tally.dislikes) == (0, 1)
+
+    def test_anonymous_counts_replace_totals(self):
+        async def scenario():
+            consumer = ReactionConsumer(db=FakeDb())
+            await consumer.handle_update(reaction_count(1, 7, likes=4, dislikes=2))
+            await consumer.handle_update(reaction_count(2, 7, likes=5, dislikes=2))
+            return consumer.tallies[(CHAT.id, 7)]
+
+        tally = asyncio.run(scenario())
+        assert (tally.likes, tally.dislikes) == (5, 2)
+
+    def test_redelivered_reaction_counted_once(self):
+        async def scenario():
+            consumer = ReactionConsumer(db=FakeDb())
+            await consumer.handle_update(reaction(1, 1, 1, new=['👎']))
+            assert await consumer.handle_update(reaction(1, 1, 1, new=['👎'])) is None
+            await consumer.handle_update(reaction(2, 1, 2, new=['👎']))
+            return consumer.tallies[(CHAT.id, 1)], consumer.get_stats()
+
+        tally, stats = asyncio.run(scenario())
+        assert (tally.likes, tally.dislikes) == (0, 2)
+        assert stats['duplicates'] == 1
+
+    def test_update_id_reset_does_not_drop_reactions(self):
+        """После недели без обновлений Telegram начинает update_id заново"""
+        async def scenario():
+            consumer = ReactionConsumer(db=FakeDb())
+            await consumer.handle_update(reaction(500000, 1, 1, new=['👍']))
+            assert await consumer.handle_update(reaction(1, 1, 2, new=['👍'])) is not None
+            return consumer.tallies[(CHAT.id, 1)]
+
+        tally = asyncio.run(scenario())
+        assert tally.likes == 2
+
+    def test_flush_writes_batch(self):
+        async def scenario():
+            db = FakeDb()
+            consumer = ReactionConsumer(db=db)
+            for i in range(3):
+                await consumer.handle_update(reaction(i + 1, i, 1, new=['👍']))
+            assert await consumer.flush() == 3
+            assert await consumer.flush() == 0
+            return db.executed
+
+        executed = asyncio.run(scenario())
+        assert len(executed) == 1
+        chat_ids, message_ids = executed[0][0], executed[0][1]
+        assert chat_ids == [CHAT.id] * 3
+        assert sorted(message_ids) == [0, 1, 2]
+
+    def test_clean_tallies_evicted_first(self):
+        async def scenario():
+            consumer = ReactionConsumer(db=FakeDb(), max_tracked=2)
+            await consumer.handle_update(reaction(1, 1, 1, new=['👍']))
+            consumer.remember_thread(CHAT.id, 2, 143)
+            consumer.remember_thread(CHAT.id, 3, 143)
+            return list(consumer.tallies)
+
+        # Несохраненный счетчик сообщения 1 не вытесняется
+        assert (CHAT.id, 1) in asyncio.run(scenario())
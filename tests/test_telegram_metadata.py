@@ -0,0 +1,73 @@
+"""
+Tests for the Telegram metadata registry
+"""
+import asyncio
+from types import SimpleNamespace
+
+from src.services.telegram_metadata import TelegramMetadata
+
+
+class FakeConfig:
+    def invalidate_cache(self, service):
+        pass
+
+    async def get_config_async(self, key, service=None):
+        return {'log_group_id': '-100123', 'operators': '1, 2'}.get(key)
+
+
+class FakeDb:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    async def fetch_one(self, query, *args):
+        return self.row
+
+    async def execute(self, query, *args):
+        self.executed.append(args)
+        return True
+
+
+class FakeBot:
+    def __init__(self):
+        self.created = []
+
+    async def create_forum_topic(self, chat_id, name):
+        self.created.append(name)
+        return SimpleNamespace(message_thread_id=100 + len(self.created), name=name)
+
+
+class TestTelegramMetadata:
+    def test_refresh_loads_topics_and_operators(self):
+        metadata = TelegramMetadata(FakeConfig(), FakeDb({'thread_ids': [5, 7], 'names': ['📝 Логи', '🛒 Заказы']}))
+        assert asyncio.run(metadata.refresh()) is True
+        assert metadata.topic_id('🛒 Заказы') == 7
+        assert metadata.topic_name(5) == '📝 Логи'
+        assert metadata.is_operator(2)
+
+    def test_db_failure_skips_topic_creation(self):
+        """Сбой базы не должен выглядеть как пустой реестр и плодить дубли тем"""
+        async def scenario():
+            metadata = TelegramMetadata(FakeConfig(), FakeDb(None))
+            bot = FakeBot()
+            ok = await metadata.refresh()
+            await metadata.ensure_topics(bot, ['📝 Логи'])
+            return ok, bot.created
+
+        ok, created = asyncio.run(scenario())
+        assert ok is False
+        assert created == []
+
+    def test_missing_topics_created_after_successful_refresh(self):
+        async def scenario():
+            db = FakeDb({'thread_ids': None, 'names': None})
+            metadata = TelegramMetadata(FakeConfig(), db)
+            bot = FakeBot()
+            await metadata.refresh()
+            await metadata.ensure_topics(bot, ['📝 Логи'])
+            return metadata, bot.created, db.executed
+
+        metadata, created, executed = asyncio.run(scenario())
+        assert created == ['📝 Логи']
+        assert metadata.topic_id('📝 Логи') == 101
+        assert executed == [(101, -100123, '📝 Логи')]
@@ -0,0 +1,101 @@
+"""
+Tests for the outbound Telegram scheduler
+"""
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from src.services.telegram_outbound import OutboundScheduler, Priority, TokenBucket
+
+GROUP = -100123
+CUSTOMER = 42
+
+
+async def send(scheduler, chat_id, sent, label, priority=None, endpoint='sendMessage'):
+    async def callback():
+        sent.append(label)
+        return True
+
+    rate_limit_args = {'priority': priority} if priority is not None else None
+    return await scheduler.process_request(callback, (), {}, endpoint, {'chat_id': chat_id}, rate_limit_args)
+
+
+class TestTokenBucket:
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2.0, capacity=2.0, now=0.0)
+        bucket.consume(0.0)
+        bucket.consume(0.0)
+        assert bucket.delay(0.0) == 0.5
+        assert bucket.delay(0.5) == 0.0
+
+    def test_block_after_retry_after(self):
+        bucket = TokenBucket(rate=10.0, capacity=10.0, now=0.0)
+        bucket.block(0.0, 3.0)
+        assert bucket.delay(1.0) == 2.0
+        assert bucket.delay(3.1) == 0.0
+
+
+class TestOutboundScheduler:
+    def test_customer_lane_goes_first(self):
+        """При исчерпанном общем лимите ответ клиенту обгоняет логи"""
+        async def scenario():
+            scheduler = OutboundScheduler(global_rate=20.0)
+            scheduler.global_bucket.block(time.monotonic(), 0.1)
+            sent = []
+            await asyncio.gather(
+                *[send(scheduler, f"-100{i}", sent, f"log{i}") for i in range(3)],
+                send(scheduler, CUSTOMER, sent, 'customer')
+            )
+            await scheduler.shutdown()
+            return sent, scheduler.get_stats()
+
+        sent, stats = asyncio.run(scenario())
+        assert sent[0] == 'customer'
+        assert stats['customer']['sent'] == 1
+        assert stats['log']['sent'] == 3
+
+    def test_limited_group_does_not_block_other_chats(self):
+        """Группа, упершаяся в лимит, не задерживает личные чаты"""
+        async def scenario():
+            scheduler = OutboundScheduler(group_rate=1.0)
+            sent = []
+            first = asyncio.gather(send(scheduler, GROUP, sent, 'group1'), send(scheduler, GROUP, sent, 'group2'))
+            await asyncio.sleep(0.05)
+            await send(scheduler, CUSTOMER, sent, 'customer', priority=Priority.ANALYTICS)
+            order = list(sent)
+            await first
+            await scheduler.shutdown()
+            return order
+
+        assert asyncio.run(scenario()) == ['group1', 'customer']
+
+    def test_retry_after_is_honored(self):
+        async def scenario():
+            scheduler = OutboundScheduler()
+            calls = []
+
+            async def callback():
+                calls.append(time.monotonic())
+                if len(calls) == 1:
+                    raise RetryAfter(1)
+                return True
+
+            result = await scheduler.process_request(callback, (), {}, 'sendMessage', {'chat_id': GROUP}, None)
+            await scheduler.shutdown()
+            return result, calls, scheduler.get_stats()
+
+        result, calls, stats = asyncio.run(scenario())
+        assert result is True
+        assert 0.9 <= calls[1] - calls[0] < 2
+        assert stats['log']['retries'] == 1
+
+    def test_get_methods_bypass_queue(self):
+        async def scenario():
+            scheduler = OutboundScheduler()
+            sent = []
+            await send(scheduler, GROUP, sent, 'me', endpoint='getMe')
+            return scheduler.get_stats()
+
+        stats = asyncio.run(scenario())
+        assert all(lane['sent'] == 0 for lane in stats.values())
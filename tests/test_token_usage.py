@@ -0,0 +1,96 @@
+"""
+Tests for token usage accounting
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.token_usage import (PromptRegressionDetector, TokenUsage, TokenUsageRecorder,
+                                      estimate_cost, usage_from_response)
+
+
+class FakeDb:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def execute(self, query, *args):
+        self.calls.append(args)
+        return not self.fail
+
+
+def usage(prompt, scenario='доставка', completion=50):
+    return TokenUsage(prompt, completion, prompt + completion, 0.0, scenario, None, model='gpt-4o')
+
+
+class TestUsageFromResponse:
+    def test_cached_tokens_are_cheaper(self):
+        response_usage = SimpleNamespace(prompt_tokens=2000, completion_tokens=100, total_tokens=2100,
+                                         prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+        result = usage_from_response(response_usage, 'gpt-4o-2024-08-06', 'оплата')
+        assert result.cached_tokens == 1024
+        assert result.scenario == 'оплата'
+        assert result.cost_usd == pytest.approx((976 * 2.5 + 1024 * 1.25 + 100 * 10.0) / 1e6)
+        assert result.cost_usd < estimate_cost('gpt-4o', 2000, 100)
+
+    def test_missing_details_and_unknown_model(self):
+        response_usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        result = usage_from_response(response_usage, 'local-model')
+        assert (result.cached_tokens, result.cost_usd, result.scenario) == (0, 0.0, 'general')
+
+
+class TestPromptRegressionDetector:
+    def test_alerts_once_per_cooldown_after_warmup(self):
+        detector = PromptRegressionDetector(warmup=5, cooldown=60)
+        # До прогрева большой промпт не считается регрессией
+        assert detector.check(usage(5000, 'акции'), 0) is None
+        for _ in range(10):
+            assert detector.check(usage(1000), 0) is None
+
+        alert = detector.check(usage(2500), 1)
+        assert alert is not None and alert.baseline == pytest.approx(1000)
+        assert detector.check(usage(2500), 2) is None  # Не чаще раза за cooldown
+        assert detector.check(usage(1100), 100) is None  # Небольшой рост не шумит
+        assert detector.check(usage(2500), 100) is not None
+
+
+class TestTokenUsageRecorder:
+    def test_batches_rows_and_reports_alerts(self):
+        alerts = []
+
+        async def on_alert(alert):
+            alerts.append(alert.text())
+
+        async def main():
+            db = FakeDb()
+            recorder = TokenUsageRecorder(db, PromptRegressionDetector(warmup=3), on_alert=on_alert)
+            for _ in range(5):
+                recorder.record(usage(800))
+            recorder.record(usage(3000))
+            await recorder.stop()
+            return db.calls, recorder.get_stats()
+
+        calls, stats = asyncio.run(main())
+        # Все строки - одной пачкой, одним запросом вместе со сводками
+        assert len(calls) == 1
+        assert calls[0][4] == [800] * 5 + [3000]
+        assert calls[0][8] == 'Asia/Almaty'
+        assert stats['written'] == 6 and stats['alerts'] == 1
+        assert len(alerts) == 1 and 'доставка' in alerts[0]
+
+    def test_failed_write_keeps_rows_for_next_batch(self):
+        async def main():
+            db = FakeDb(fail=True)
+            recorder = TokenUsageRecorder(db)
+            recorder.record(usage(100))
+            first = await recorder.flush()
+            recorder.record(usage(200))
+            db.fail = False
+            second = await recorder.flush()
+            return first, second, db.calls[-1][4], recorder.get_stats()
+
+        first, second, prompts, stats = asyncio.run(main())
+        assert (first, second) == (False, True)
+        assert prompts == [100, 200]
+        assert stats['failures'] == 1 and stats['written'] == 2
@@ -0,0 +1,140 @@
+"""
+Tests for the OpenAI tool-calling engine
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.services.tool_engine import ToolEngine, ToolArgumentError
+
+PRICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "price_max": {"type": "number"},
+        "flower_type": {"type": "string"}
+    },
+    "required": ["price_max"]
+}
+
+
+def tool_call(call_id, name, arguments):
+    return SimpleNamespace(
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    )
+
+
+class TestValidation:
+    @pytest.fixture
+    def engine(self):
+        async def search(price_max, flower_type=""):
+            return {"price_max": price_max, "flower_type": flower_type}
+
+        engine = ToolEngine()
+        engine.register("search", "Поиск", PRICE_SCHEMA, search)
+        return engine
+
+    def test_coerces_numeric_strings_and_drops_unknown(self, engine):
+        """Числа в строках приводятся к числам, лишние поля отбрасываются"""
+        args = engine.validate(engine.tools["search"], {"price_max": "15 000", "color": "red"})
+        assert args == {"price_max": 15000.0}
+
+    def test_missing_required_argument(self, engine):
+        """Отсутствие обязательного поля - ошибка"""
+        with pytest.raises(ToolArgumentError):
+            engine.validate(engine.tools["search"], {"flower_type": "розы"})
+
+    def test_invalid_arguments_are_reported_to_model(self, engine):
+        """Ошибка валидации возвращается модели, а не бросается"""
+        result = asyncio.run(engine.execute("search", {"price_max": "дорого"}))
+        assert "error" in json.loads(result)
+        assert engine.get_stats()["search"]["errors"] == 1
+
+
+class TestExecution:
+    def test_tool_calls_run_concurrently(self):
+        """Вызовы из одного ответа модели выполняются параллельно"""
+        async def slow(price_max, flower_type=""):
+            await asyncio.sleep(0.2)
+            return "ok"
+
+        engine = ToolEngine()
+        engine.register("slow", "Медленный", PRICE_SCHEMA, slow)
+        calls = [tool_call(str(i), "slow", {"price_max": i}) for i in range(5)]
+
+        start = time.perf_counter()
+        messages = asyncio.run(engine.execute_tool_calls(calls))
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert [m["tool_call_id"] for m in messages] == ["0", "1", "2", "3", "4"]
+        assert all(m["role"] == "tool" and m["content"] == "ok" for m in messages)
+
+    def test_timeout_is_per_tool(self):
+        """Зависший инструмент не задерживает остальные"""
+        async def hang(price_max, flower_type=""):
+            await asyncio.sleep(10)
+
+        async def fast(price_max, flower_type=""):
+            return "fast"
+
+        engine = ToolEngine()
+        engine.register("hang", "Зависает", PRICE_SCHEMA, hang, timeout=0.1)
+        engine.register("fast", "Быстрый", PRICE_SCHEMA, fast)
+        messages = asyncio.run(engine.execute_tool_calls([
+            tool_call("1", "hang", {"price_max": 1}),
+            tool_call("2", "fast", {"price_max": 1})
+        ]))
+
+        assert "error" in json.loads(messages[0]["content"])
+        assert messages[1]["content"] == "fast"
+        assert engine.get_stats()["hang"]["timeouts"] == 1
+
+    def test_results_memoized_per_inventory_version(self):
+        """Кэш результатов сбрасывается при смене версии инвентаря"""
+        version = {"value": "v1"}
+        calls = []
+
+        async def search(price_max, flower_type=""):
+            calls.append(price_max)
+            return f"result-{version['value']}"
+
+        engine = ToolEngine(version_provider=lambda: version["value"])
+        engine.register("search", "Поиск", PRICE_SCHEMA, search, cacheable=True)
+
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-v1"
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-v1"
+        assert len(calls) == 1
+
+        version["value"] = "v2"
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-v2"
+        assert len(calls) == 2
+        assert engine.get_stats()["search"]["cache_hits"] == 1
+
+    def test_inventory_change_between_cached_calls(self):
+        """Версия читается перед каждым поиском в кэше, а не только при выполнении инструмента"""
+        inventory = {"data": "A"}
+        state = {"version": None}
+        calls = []
+
+        async def current_version():
+            # Как чтение остатков: версия пересчитывается по текущим данным
+            state["version"] = inventory["data"]
+            return state["version"]
+
+        async def search(price_max, flower_type=""):
+            calls.append(price_max)
+            return f"result-{inventory['data']}"
+
+        engine = ToolEngine(version_provider=current_version)
+        engine.register("search", "Поиск", PRICE_SCHEMA, search, cacheable=True)
+
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-A"
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-A"
+        inventory["data"] = "B"
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-B"
+        assert asyncio.run(engine.execute("search", {"price_max": 100})) == "result-B"
+        assert len(calls) == 2
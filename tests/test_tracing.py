@@ -0,0 +1,90 @@
+"""
+Tests for per-stage message tracing
+"""
+import asyncio
+import json
+
+from src.services.metrics import metrics
+from src.services.tracing import JsonlTraceSink, TraceExporter, Tracer, add_span, span, stage_report
+
+
+class RecordingSink:
+    def __init__(self):
+        self.traces = []
+
+    async def write(self, traces):
+        self.traces.extend(traces)
+        return True
+
+
+class TestTracer:
+    def test_spans_from_concurrent_tasks_join_the_trace(self):
+        sink = RecordingSink()
+        exporter = TraceExporter(sink, sample_rate=1.0)
+        tracer = Tracer(exporter)
+
+        async def stage(name, delay):
+            with span(name):
+                await asyncio.sleep(delay)
+
+        async def main():
+            with tracer.trace('message', 42, chat_id=1):
+                add_span('receive', 0.5)
+                await asyncio.gather(stage('inventory', 0.02), stage('kb', 0.01))
+                with span('llm') as llm:
+                    llm.attrs['prompt_tokens'] = 900
+            await exporter.flush()
+
+        asyncio.run(main())
+        trace = sink.traces[0]
+        spans = {item['name']: item for item in trace['spans']}
+        assert trace['trace_id'] == 42 and trace['attrs'] == {'chat_id': 1}
+        assert set(spans) == {'receive', 'inventory', 'kb', 'llm'}
+        assert spans['receive']['duration_ms'] == 500
+        assert spans['inventory']['duration_ms'] >= 20
+        assert spans['llm']['attrs'] == {'prompt_tokens': 900}
+        # Этапы попадают в гистограммы метрик независимо от выборки
+        assert metrics.interval[('stage_seconds', (('stage', 'kb'),))].count >= 1
+
+    def test_span_outside_trace_is_harmless(self):
+        with span('cache_lookup') as stage:
+            stage.attrs['hit'] = True
+        assert stage.duration_ms >= 0
+
+    def test_sampling_keeps_errors_and_slow_traces(self):
+        exporter = TraceExporter(RecordingSink(), sample_rate=0.0, slow_ms=50)
+        tracer = Tracer(exporter)
+        with tracer.trace('message', 1):
+            pass
+        try:
+            with tracer.trace('message', 2):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+        with tracer.trace('message', 3) as slow:
+            slow._start -= 0.1
+
+        assert [trace['trace_id'] for trace in exporter._buffer] == [2, 3]
+        assert exporter._buffer[0]['error'] == 'ValueError: boom'
+
+
+class TestStageReport:
+    def test_jsonl_round_trip_and_percentiles(self, tmp_path):
+        path = tmp_path / 'traces.jsonl'
+        exporter = TraceExporter(JsonlTraceSink(str(path)), sample_rate=1.0)
+        tracer = Tracer(exporter)
+
+        async def main():
+            for i in range(1, 101):
+                with tracer.trace('message', i):
+                    add_span('llm', i / 1000)
+            await exporter.stop()
+
+        asyncio.run(main())
+        traces = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        report = stage_report(traces)
+        assert report['llm']['count'] == 100
+        assert report['llm']['p50'] == 50
+        assert report['llm']['p95'] == 95
+        assert report['llm']['p99'] == 99
+        assert report['total']['count'] == 100
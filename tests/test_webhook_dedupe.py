@@ -0,0 +1,76 @@
+"""
+Tests for webhook redelivery deduplication
+"""
+import asyncio
+
+from src.services.webhook_dedupe import BloomFilter, WebhookDeduper
+
+
+class FakeDb:
+    """Таблица instagram_webhook_events в памяти"""
+
+    def __init__(self, mids=()):
+        self.mids = set(mids)
+        self.queries = []
+
+    async def fetch_all(self, query, *args):
+        return [{'mid': mid} for mid in self.mids]
+
+    async def fetch_one(self, query, *args):
+        self.queries.append('confirm')
+        inserted = args[0] not in self.mids
+        self.mids.add(args[0])
+        return {'inserted': int(inserted)}
+
+    async def execute(self, query, *args):
+        self.queries.append('flush')
+        self.mids.update(args[0])
+        return True
+
+
+class TestBloomFilter:
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(f"mid-{i}")
+        assert all(f"mid-{i}" in bloom for i in range(10000))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+
+class TestWebhookDeduper:
+    def test_new_messages_do_not_query_db(self):
+        async def main():
+            db = FakeDb()
+            deduper = WebhookDeduper(db)
+            first = [await deduper.claim(f"m{i}") for i in range(100)]
+            repeat = await deduper.claim('m5')
+            await deduper.flush()
+            return first, repeat, db
+
+        first, repeat, db = asyncio.run(main())
+        assert all(first) and repeat is False
+        # Повтор еще не записанного mid отсекается без запроса, mid пишутся одной пачкой
+        assert db.queries == ['flush']
+        assert len(db.mids) == 100
+
+    def test_redelivery_after_restart_is_confirmed_in_db(self):
+        async def main():
+            db = FakeDb({'old'})
+            deduper = WebhookDeduper(db)
+            await deduper.load()
+            return await deduper.claim('old'), await deduper.claim('fresh'), db.queries
+
+        assert asyncio.run(main()) == (False, True, ['confirm'])
+
+    def test_false_positive_is_not_dropped(self):
+        async def main():
+            db = FakeDb()
+            deduper = WebhookDeduper(db)
+            # Фильтр помнит mid, которого нет в базе (после смены поколения или коллизии)
+            deduper.current.add('collision')
+            return await deduper.claim('collision'), deduper.get_stats()
+
+        is_new, stats = asyncio.run(main())
+        assert is_new is True
+        assert stats['false_positives'] == 1